@@ -1,160 +1,328 @@
-"""
-analyze_data.py  
-Procesador de análisis de frames EN TIEMPO REAL.
-Este módulo NO usa sesiones, NO usa base de datos y NO exporta CSV.
-La API enviará los frames y este archivo devolverá el análisis.
-
-Requiere:
-    - pandas
-    - numpy
-"""
-
-import pandas as pd
-import numpy as np
-from datetime import timedelta
-
-
-# ============================================================
-# 1. Analizar un lote de frames enviados por el frontend
-# ============================================================
-
-def analyze_frames(frames: list) -> dict:
-    """
-    Recibe una lista de diccionarios donde cada uno representa un frame.
-
-    EJEMPLO DEL FRAME ESPERADO:
-    {
-        "frame_number": 1,
-        "timestamp": 0.033,
-        "elapsed_seconds": 0.033,
-        "attention_score": 0.82,
-        "attention_level": "concentrado",
-        "ear_avg": 0.29,
-        "perclos": 0.12,
-        "blinks_per_minute": 18,
-        "head_yaw": -5.2,
-        "head_pitch": 3.1,
-        "gaze_focus_ratio": 0.90,
-        "gaze_dispersion": 0.08,
-        "mar": 0.21,
-        "is_blink": False,
-        "is_yawn": False
-    }
-    """
-
-    if not frames or len(frames) == 0:
-        raise ValueError("No se recibieron frames para analizar.")
-
-    df = pd.DataFrame(frames)
-
-    duration = df["elapsed_seconds"].max()
-    total_frames = len(df)
-
-    attention_dist = df["attention_level"].value_counts(normalize=True) * 100
-
-    score_stats = {
-        "mean": df["attention_score"].mean(),
-        "std": df["attention_score"].std(),
-        "min": df["attention_score"].min(),
-        "max": df["attention_score"].max(),
-        "median": df["attention_score"].median(),
-    }
-
-    blinks = df["is_blink"].sum()
-    yawns = df["is_yawn"].sum()
-
-    severe_periods = find_distraction_periods(df)
-
-    metric_means = {
-        "ear_avg": df["ear_avg"].mean(),
-        "perclos": df["perclos"].mean(),
-        "blinks_per_minute": df["blinks_per_minute"].mean(),
-        "head_yaw": df["head_yaw"].abs().mean(),
-        "head_pitch": df["head_pitch"].abs().mean(),
-        "gaze_focus_ratio": df["gaze_focus_ratio"].mean(),
-        "gaze_dispersion": df["gaze_dispersion"].mean(),
-        "mar": df["mar"].mean(),
-    }
-
-    return {
-        "duration_seconds": float(duration),
-        "duration_formatted": str(timedelta(seconds=int(duration))),
-        "total_frames": total_frames,
-        "fps_average": total_frames / duration if duration > 0 else 0,
-        "attention_distribution": attention_dist.to_dict(),
-        "score_statistics": score_stats,
-        "total_blinks": int(blinks),
-        "total_yawns": int(yawns),
-        "distraction_periods": severe_periods,
-        "metric_averages": metric_means,
-    }
-
-
-# ============================================================
-# 2. Detectar períodos severos de desconcentración
-# ============================================================
-
-def find_distraction_periods(df: pd.DataFrame, min_duration_frames: int = 30) -> list:
-
-    periods = []
-    in_period = False
-    start_idx = 0
-
-    for idx, row in df.iterrows():
-        severe = row["attention_level"] == "desconcentracion_severa"
-
-        if severe and not in_period:
-            in_period = True
-            start_idx = idx
-
-        elif not severe and in_period:
-            in_period = False
-            duration = idx - start_idx
-
-            if duration >= min_duration_frames:
-                periods.append({
-                    "start_frame": int(df.loc[start_idx, "frame_number"]),
-                    "end_frame": int(df.loc[idx - 1, "frame_number"]),
-                    "duration_frames": int(duration),
-                    "start_time": float(df.loc[start_idx, "elapsed_seconds"]),
-                    "end_time": float(df.loc[idx - 1, "elapsed_seconds"]),
-                })
-
-    # Caso final si termina en severo
-    if in_period:
-        duration = len(df) - start_idx
-        if duration >= min_duration_frames:
-            periods.append({
-                "start_frame": int(df.loc[start_idx, "frame_number"]),
-                "end_frame": int(df.loc[len(df) - 1, "frame_number"]),
-                "duration_frames": int(duration),
-                "start_time": float(df.loc[start_idx, "elapsed_seconds"]),
-                "end_time": float(df["elapsed_seconds"].max()),
-            })
-
-    return periods
-
-
-# ============================================================
-# (Opcional) Generar texto de reporte si se necesita
-# ============================================================
-
-def generate_report(analysis: dict) -> str:
-    report = []
-    report.append("=" * 60)
-    report.append(f"📊 REPORTE DE ATENCIÓN — Análisis en tiempo real")
-    report.append("=" * 60)
-    report.append("")
-
-    report.append("Duración:")
-    report.append(f"  {analysis['duration_formatted']}")
-    report.append(f"Frames totales: {analysis['total_frames']}")
-    report.append(f"FPS promedio: {analysis['fps_average']:.1f}")
-    report.append("")
-
-    report.append("Distribución de atención:")
-    for level, pct in analysis["attention_distribution"].items():
-        report.append(f"  {level}: {pct:.1f}%")
-    report.append("")
-
-    return "\n".join(report)
+"""
+analyze_data.py  
+Procesador de análisis de frames EN TIEMPO REAL.
+Este módulo NO usa sesiones, NO usa base de datos y NO exporta CSV.
+La API enviará los frames y este archivo devolverá el análisis.
+
+analyze_frames y find_distraction_periods también aceptan una sesión
+columnar (directorio de frame_store o ColumnarSession): se recorre por
+bloques de filas mapeados en memoria, leyendo solo las columnas que
+cada cálculo usa, sin armar un DataFrame.
+
+Requiere:
+    - pandas
+    - numpy
+"""
+
+import os
+
+import pandas as pd
+import numpy as np
+from datetime import timedelta
+
+from src.analysis.sketches import RunningStats
+from src.infrastructure.frame_store import CHUNK_ROWS, ColumnarSession
+
+NIVEL_SEVERO = "desconcentracion_severa"
+
+METRIC_COLUMNS = (
+    "ear_avg", "perclos", "blinks_per_minute", "head_yaw", "head_pitch",
+    "gaze_focus_ratio", "gaze_dispersion", "mar",
+)
+ABS_METRICS = ("head_yaw", "head_pitch")
+
+
+# ============================================================
+# 1. Analizar un lote de frames enviados por el frontend
+# ============================================================
+
+def analyze_frames(frames: list) -> dict:
+    """
+    Recibe una lista de diccionarios donde cada uno representa un frame.
+
+    EJEMPLO DEL FRAME ESPERADO:
+    {
+        "frame_number": 1,
+        "timestamp": 0.033,
+        "elapsed_seconds": 0.033,
+        "attention_score": 0.82,
+        "attention_level": "concentrado",
+        "ear_avg": 0.29,
+        "perclos": 0.12,
+        "blinks_per_minute": 18,
+        "head_yaw": -5.2,
+        "head_pitch": 3.1,
+        "gaze_focus_ratio": 0.90,
+        "gaze_dispersion": 0.08,
+        "mar": 0.21,
+        "is_blink": False,
+        "is_yawn": False
+    }
+    """
+
+    if isinstance(frames, (str, os.PathLike)):
+        frames = ColumnarSession(os.fspath(frames))
+    if isinstance(frames, ColumnarSession):
+        return _analyze_columnar(frames)
+
+    if frames is None or len(frames) == 0:
+        raise ValueError("No se recibieron frames para analizar.")
+
+    df = frames if isinstance(frames, pd.DataFrame) else pd.DataFrame(frames)
+
+    duration = df["elapsed_seconds"].max()
+    total_frames = len(df)
+
+    attention_dist = df["attention_level"].value_counts(normalize=True) * 100
+
+    score_stats = {
+        "mean": df["attention_score"].mean(),
+        "std": df["attention_score"].std(),
+        "min": df["attention_score"].min(),
+        "max": df["attention_score"].max(),
+        "median": df["attention_score"].median(),
+    }
+
+    blinks = df["is_blink"].sum()
+    yawns = df["is_yawn"].sum()
+
+    severe_periods = find_distraction_periods(df)
+
+    metric_means = {
+        "ear_avg": df["ear_avg"].mean(),
+        "perclos": df["perclos"].mean(),
+        "blinks_per_minute": df["blinks_per_minute"].mean(),
+        "head_yaw": df["head_yaw"].abs().mean(),
+        "head_pitch": df["head_pitch"].abs().mean(),
+        "gaze_focus_ratio": df["gaze_focus_ratio"].mean(),
+        "gaze_dispersion": df["gaze_dispersion"].mean(),
+        "mar": df["mar"].mean(),
+    }
+
+    return {
+        "duration_seconds": float(duration),
+        "duration_formatted": str(timedelta(seconds=int(duration))),
+        "total_frames": total_frames,
+        "fps_average": total_frames / duration if duration > 0 else 0,
+        "attention_distribution": attention_dist.to_dict(),
+        "score_statistics": score_stats,
+        "total_blinks": int(blinks),
+        "total_yawns": int(yawns),
+        "distraction_periods": severe_periods,
+        "metric_averages": metric_means,
+    }
+
+
+# ============================================================
+# 2. Detectar períodos severos de desconcentración
+# ============================================================
+
+def find_distraction_periods(df, min_duration_frames: int = 30, chunk_rows: int = CHUNK_ROWS) -> list:
+    """
+    Períodos de al menos `min_duration_frames` frames seguidos en
+    desconcentración severa. `df` puede ser un DataFrame o una sesión
+    columnar (se recorre por bloques).
+    """
+    if isinstance(df, (str, os.PathLike)):
+        df = ColumnarSession(os.fspath(df))
+
+    if isinstance(df, ColumnarSession):
+        severe_code = df.code_of("attention_level", NIVEL_SEVERO)
+        chunks = (
+            (c["attention_level"] == severe_code, c["frame_number"], c["elapsed_seconds"])
+            for c in df.iter_chunks(("attention_level", "frame_number", "elapsed_seconds"), chunk_rows)
+        )
+    else:
+        chunks = [(
+            (df["attention_level"] == NIVEL_SEVERO).to_numpy(),
+            df["frame_number"].to_numpy(),
+            df["elapsed_seconds"].to_numpy(),
+        )]
+
+    return _severe_periods(chunks, min_duration_frames)
+
+
+def _severe_periods(chunks, min_duration_frames: int) -> list:
+    """
+    Recorre bloques (severo, frame_number, elapsed_seconds) llevando el
+    estado entre bloques: un período puede empezar en uno y terminar en
+    otro.
+    """
+    periods = []
+    in_period = False
+    start_row = start_frame = 0
+    start_time = 0.0
+    last_frame, last_time = 0, 0.0
+    max_time = -np.inf
+    offset = 0
+
+    def close(end_row, end_frame, end_time):
+        duration = end_row - start_row
+        if duration >= min_duration_frames:
+            periods.append({
+                "start_frame": int(start_frame),
+                "end_frame": int(end_frame),
+                "duration_frames": int(duration),
+                "start_time": float(start_time),
+                "end_time": float(end_time),
+            })
+
+    for severe, frame_number, elapsed in chunks:
+        n = len(severe)
+        if n == 0:
+            continue
+        severe = np.asarray(severe, dtype=bool)
+        if not np.all(np.isnan(elapsed)):
+            max_time = max(max_time, float(np.nanmax(elapsed)))
+
+        # Cambios de estado respecto de la fila anterior (incluida la del bloque previo)
+        changes = np.flatnonzero(np.diff(np.concatenate(([in_period], severe)).astype(np.int8)))
+        for i in changes:
+            if severe[i]:
+                in_period = True
+                start_row = offset + i
+                start_frame, start_time = frame_number[i], elapsed[i]
+            else:
+                in_period = False
+                if i > 0:
+                    close(offset + i, frame_number[i - 1], elapsed[i - 1])
+                else:
+                    close(offset, last_frame, last_time)
+
+        last_frame, last_time = frame_number[n - 1], elapsed[n - 1]
+        offset += n
+
+    # Caso final si termina en severo
+    if in_period:
+        close(offset, last_frame, max_time)
+
+    return periods
+
+
+# ============================================================
+# 3. Análisis por bloques de una sesión columnar
+# ============================================================
+
+def _chunked_median(session: ColumnarSession, name: str, stats: RunningStats,
+                    chunk_rows: int, bins: int = 4096) -> float:
+    """
+    Mediana exacta sin cargar la columna: un histograma ubica el bin de
+    cada posición central y una segunda pasada toma solo esos valores.
+    """
+    n = stats.count
+    if n == 0:
+        return float("nan")
+    lo, hi = stats.min, stats.max
+    if lo == hi:
+        return lo
+
+    def bin_of(values):
+        return np.clip(((values - lo) / (hi - lo) * bins).astype(np.int64), 0, bins - 1)
+
+    hist = np.zeros(bins, dtype=np.int64)
+    for chunk in session.iter_chunks((name,), chunk_rows):
+        values = np.asarray(chunk[name], dtype=np.float64)
+        values = values[~np.isnan(values)]
+        hist += np.bincount(bin_of(values), minlength=bins)
+    cum = np.cumsum(hist)
+
+    ranks = sorted({(n - 1) // 2, n // 2})
+    targets = {}
+    for k in ranks:
+        b = int(np.searchsorted(cum, k, side="right"))
+        targets[k] = (b, k - (int(cum[b - 1]) if b > 0 else 0))
+
+    wanted = {b for b, _ in targets.values()}
+    selected = {b: [] for b in wanted}
+    for chunk in session.iter_chunks((name,), chunk_rows):
+        values = np.asarray(chunk[name], dtype=np.float64)
+        values = values[~np.isnan(values)]
+        idx = bin_of(values)
+        for b in wanted:
+            selected[b].append(values[idx == b])
+    sorted_bins = {b: np.sort(np.concatenate(v)) for b, v in selected.items()}
+
+    return float(np.mean([sorted_bins[b][r] for b, r in targets.values()]))
+
+
+def _analyze_columnar(session: ColumnarSession, chunk_rows: int = CHUNK_ROWS) -> dict:
+    """Mismo resultado que analyze_frames() sobre una sesión columnar, por bloques."""
+    total_frames = len(session)
+    if total_frames == 0:
+        raise ValueError("No se recibieron frames para analizar.")
+
+    levels = session.categories("attention_level")
+    level_counts = np.zeros(max(len(levels), 1), dtype=np.int64)
+    score = RunningStats()
+    metrics = {name: RunningStats() for name in METRIC_COLUMNS if name in session}
+    duration = -np.inf
+    blinks = yawns = 0
+
+    columns = ["attention_level", "attention_score", "elapsed_seconds", "is_blink", "is_yawn", *metrics]
+    for chunk in session.iter_chunks(columns, chunk_rows):
+        codes = np.asarray(chunk["attention_level"])
+        level_counts += np.bincount(codes[codes >= 0], minlength=len(level_counts))[:len(level_counts)]
+        score.add(np.asarray(chunk["attention_score"], dtype=np.float64))
+        elapsed = np.asarray(chunk["elapsed_seconds"], dtype=np.float64)
+        if not np.all(np.isnan(elapsed)):
+            duration = max(duration, float(np.nanmax(elapsed)))
+        blinks += int(np.count_nonzero(chunk["is_blink"]))
+        yawns += int(np.count_nonzero(chunk["is_yawn"]))
+        for name, stats in metrics.items():
+            values = np.asarray(chunk[name], dtype=np.float64)
+            stats.add(np.abs(values) if name in ABS_METRICS else values)
+
+    duration = duration if np.isfinite(duration) else float("nan")
+
+    # Mismo orden que value_counts(): de más a menos frecuente
+    known = level_counts.sum()
+    order = sorted(range(len(levels)), key=lambda i: -level_counts[i])
+    attention_dist = {
+        levels[i]: float(level_counts[i] / known * 100) for i in order if level_counts[i] > 0
+    }
+
+    score_stats = {
+        "mean": score.result(),
+        "std": score.std(),
+        "min": score.min if score.count else float("nan"),
+        "max": score.max if score.count else float("nan"),
+        "median": _chunked_median(session, "attention_score", score, chunk_rows),
+    }
+
+    return {
+        "duration_seconds": float(duration),
+        "duration_formatted": str(timedelta(seconds=int(duration))) if np.isfinite(duration) else "0:00:00",
+        "total_frames": total_frames,
+        "fps_average": total_frames / duration if duration > 0 else 0,
+        "attention_distribution": attention_dist,
+        "score_statistics": score_stats,
+        "total_blinks": blinks,
+        "total_yawns": yawns,
+        "distraction_periods": find_distraction_periods(session, chunk_rows=chunk_rows),
+        "metric_averages": {name: stats.result() for name, stats in metrics.items()},
+    }
+
+
+# ============================================================
+# (Opcional) Generar texto de reporte si se necesita
+# ============================================================
+
+def generate_report(analysis: dict) -> str:
+    report = []
+    report.append("=" * 60)
+    report.append(f"📊 REPORTE DE ATENCIÓN — Análisis en tiempo real")
+    report.append("=" * 60)
+    report.append("")
+
+    report.append("Duración:")
+    report.append(f"  {analysis['duration_formatted']}")
+    report.append(f"Frames totales: {analysis['total_frames']}")
+    report.append(f"FPS promedio: {analysis['fps_average']:.1f}")
+    report.append("")
+
+    report.append("Distribución de atención:")
+    for level, pct in analysis["attention_distribution"].items():
+        report.append(f"  {level}: {pct:.1f}%")
+    report.append("")
+
+    return "\n".join(report)
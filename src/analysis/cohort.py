@@ -0,0 +1,493 @@
+"""
+cohort.py
+Análisis de una cohorte (curso, cuatrimestre): miles de sesiones
+columnares (ver infrastructure/frame_store.py) resumidas en un solo
+reporte.
+
+Cada sesión se reduce, en un pool de procesos, a un resumen parcial
+combinable: conteos por nivel, momentos del score y de las métricas
+(RunningStats), un t-digest del score y la cantidad de períodos de
+desconcentración severa. Los parciales se combinan en el proceso
+principal por cohorte y por estudiante; ninguna sesión se carga
+entera en memoria y ninguna se analiza dos veces.
+
+Los parciales se guardan en una caché por hash del contenido de la
+sesión (meta.json + columnas usadas). Un índice ruta → (tamaños,
+mtimes, hash) evita volver a leer las sesiones que no cambiaron: al
+repetir el reporte del cuatrimestre solo se procesan las sesiones
+nuevas o modificadas.
+
+El estudiante de cada sesión es `user_id` (o `student_id`) de su
+meta.json; si no está, el primer directorio bajo la raíz
+(raiz/<estudiante>/<sesion>/) o, en último caso, el nombre de la
+sesión.
+
+Uso:
+    python -m src.analysis.cohort sesiones/ --workers 8 --json cohorte.json
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.analysis.analyze_data import ABS_METRICS, METRIC_COLUMNS, NIVEL_SEVERO, find_distraction_periods
+from src.analysis.sketches import RunningStats, TDigest, percentiles
+from src.infrastructure.frame_store import CHUNK_ROWS, META_FILE, ColumnarSession, read_meta
+
+# Cambiarlo invalida la caché (cambió lo que guarda cada parcial)
+PARTIAL_VERSION = 1
+
+DEFAULT_CACHE_DIR = ".cohort_cache"
+INDEX_FILE = "index.json"
+
+# Columnas que lee el parcial (las que falten se ignoran)
+PARTIAL_COLUMNS = ("attention_level", "attention_score", "elapsed_seconds", "frame_number", *METRIC_COLUMNS)
+
+
+# ============================================================
+# 1. Parcial por sesión
+# ============================================================
+
+def session_partial(directory: str, chunk_rows: int = CHUNK_ROWS) -> dict:
+    """Resumen combinable de una sesión columnar (serializable a JSON)."""
+    session = ColumnarSession(directory)
+
+    levels = session.categories("attention_level")
+    level_counts = np.zeros(max(len(levels), 1), dtype=np.int64)
+    score = RunningStats()
+    digest = TDigest()
+    metrics = {name: RunningStats() for name in METRIC_COLUMNS if name in session}
+    duration = -math.inf
+
+    for chunk in session.iter_chunks(["attention_level", "attention_score", "elapsed_seconds", *metrics], chunk_rows):
+        codes = np.asarray(chunk["attention_level"])
+        level_counts += np.bincount(codes[codes >= 0], minlength=len(level_counts))[:len(level_counts)]
+        values = np.asarray(chunk["attention_score"], dtype=np.float64)
+        score.add(values)
+        digest.add(values)
+        elapsed = np.asarray(chunk["elapsed_seconds"], dtype=np.float64)
+        if not np.all(np.isnan(elapsed)):
+            duration = max(duration, float(np.nanmax(elapsed)))
+        for name, stats in metrics.items():
+            values = np.asarray(chunk[name], dtype=np.float64)
+            stats.add(np.abs(values) if name in ABS_METRICS else values)
+
+    periods = find_distraction_periods(session, chunk_rows=chunk_rows)
+
+    return {
+        "version": PARTIAL_VERSION,
+        "frames": len(session),
+        "duration_seconds": duration if math.isfinite(duration) else 0.0,
+        "levels": {levels[i]: int(c) for i, c in enumerate(level_counts) if i < len(levels) and c > 0},
+        "score": score.to_dict(),
+        "score_digest": digest.to_dict(),
+        "metrics": {name: stats.to_dict() for name, stats in metrics.items()},
+        "distraction_periods": len(periods),
+        "distraction_seconds": float(sum(p["end_time"] - p["start_time"] for p in periods)),
+    }
+
+
+# ============================================================
+# 2. Caché por hash de contenido
+# ============================================================
+
+def _session_files(directory: str) -> List[str]:
+    meta = read_meta(directory)
+    names = [c for c in PARTIAL_COLUMNS if c in meta["columns"]]
+    return [META_FILE] + [f"{name}.npy" for name in names]
+
+
+def file_signature(directory: str) -> list:
+    """Tamaño y mtime de los archivos que usa el parcial (chequeo barato)."""
+    sig = []
+    for name in _session_files(directory):
+        st = os.stat(os.path.join(directory, name))
+        sig.append([name, st.st_size, st.st_mtime_ns])
+    return sig
+
+
+def content_hash(directory: str, block: int = 1 << 20) -> str:
+    """Hash del contenido de la sesión: meta.json y las columnas usadas."""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"v{PARTIAL_VERSION}".encode())
+    for name in _session_files(directory):
+        h.update(name.encode() + b"\0")
+        with open(os.path.join(directory, name), "rb") as f:
+            while True:
+                data = f.read(block)
+                if not data:
+                    break
+                h.update(data)
+    return h.hexdigest()
+
+
+class PartialCache:
+    """
+    Parciales en `<dir>/<hash>.json` e índice ruta → firma y hash.
+    Los parciales se escriben desde los workers (escritura atómica);
+    el índice solo lo escribe el proceso principal.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._index_path = os.path.join(directory, INDEX_FILE)
+        try:
+            with open(self._index_path, encoding="utf-8") as f:
+                self.index: Dict[str, dict] = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+
+    def path_of(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def lookup(self, session_dir: str, signature: list) -> Optional[Tuple[str, dict]]:
+        """(hash, parcial) si la sesión no cambió desde la última vez."""
+        entry = self.index.get(os.path.abspath(session_dir))
+        if entry is None or entry["signature"] != signature:
+            return None
+        partial = load_partial(self.path_of(entry["hash"]))
+        return (entry["hash"], partial) if partial is not None else None
+
+    def remember(self, session_dir: str, signature: list, key: str) -> None:
+        self.index[os.path.abspath(session_dir)] = {"signature": signature, "hash": key}
+
+    def save(self) -> None:
+        tmp = self._index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self._index_path)
+
+
+def load_partial(path: str) -> Optional[dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            partial = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return partial if partial.get("version") == PARTIAL_VERSION else None
+
+
+def _analyze_session(task: Tuple[str, Optional[str]]) -> Tuple[str, str, dict, bool]:
+    """Worker: hash del contenido, parcial de la caché o calculado. → (dir, hash, parcial, de_caché)"""
+    directory, cache_dir = task
+    key = content_hash(directory)
+    if cache_dir:
+        path = os.path.join(cache_dir, f"{key}.json")
+        partial = load_partial(path)
+        if partial is not None:
+            return directory, key, partial, True
+
+    partial = session_partial(directory)
+    if cache_dir:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(partial, f)
+        os.replace(tmp, path)
+    return directory, key, partial, False
+
+
+# ============================================================
+# 3. Combinar parciales
+# ============================================================
+
+class _Group:
+    """Acumulador de parciales (la cohorte entera o un estudiante)."""
+
+    def __init__(self):
+        self.sessions = 0
+        self.frames = 0
+        self.duration = 0.0
+        self.levels: Dict[str, int] = {}
+        self.score = RunningStats()
+        self.digest = TDigest()
+        self.metrics: Dict[str, RunningStats] = {}
+        self.periods = 0
+        self.period_seconds = 0.0
+
+    def add(self, partial: dict) -> None:
+        self.sessions += 1
+        self.frames += partial["frames"]
+        self.duration += partial["duration_seconds"]
+        for level, count in partial["levels"].items():
+            self.levels[level] = self.levels.get(level, 0) + count
+        self.score.merge(RunningStats.from_dict(partial["score"]))
+        self.digest.merge(TDigest.from_dict(partial["score_digest"]))
+        for name, stats in partial["metrics"].items():
+            self.metrics.setdefault(name, RunningStats()).merge(RunningStats.from_dict(stats))
+        self.periods += partial["distraction_periods"]
+        self.period_seconds += partial["distraction_seconds"]
+
+    def distribution(self) -> Dict[str, float]:
+        known = sum(self.levels.values())
+        return {
+            level: count / known * 100
+            for level, count in sorted(self.levels.items(), key=lambda kv: -kv[1])
+        } if known else {}
+
+
+def merge_partials(partials: Dict[str, Tuple[str, dict]]) -> dict:
+    """
+    Combina los parciales {directorio: (estudiante, parcial)} en el
+    reporte de la cohorte.
+    """
+    cohort = _Group()
+    students: Dict[str, _Group] = {}
+    session_means = []
+    session_periods = []
+
+    for directory in sorted(partials):
+        student, partial = partials[directory]
+        cohort.add(partial)
+        students.setdefault(student, _Group()).add(partial)
+        if partial["score"]["count"]:
+            session_means.append(partial["score"]["mean"])
+        session_periods.append(partial["distraction_periods"])
+
+    hours = cohort.duration / 3600
+
+    per_student = {}
+    for student in sorted(students):
+        g = students[student]
+        per_student[student] = {
+            "sessions": g.sessions,
+            "frames": g.frames,
+            "hours": g.duration / 3600,
+            "mean_score": g.score.result(),
+            "median_score": g.digest.quantile(0.5),
+            "severe_pct": g.distribution().get(NIVEL_SEVERO, 0.0),
+            "distraction_periods": g.periods,
+            "distraction_periods_per_hour": g.periods / (g.duration / 3600) if g.duration > 0 else 0.0,
+        }
+
+    student_means = [s["mean_score"] for s in per_student.values() if not math.isnan(s["mean_score"])]
+
+    return {
+        "sessions": cohort.sessions,
+        "students": len(students),
+        "total_frames": cohort.frames,
+        "total_hours": hours,
+        "attention_distribution": cohort.distribution(),
+        "score_statistics": {
+            "mean": cohort.score.result(),
+            "std": cohort.score.std(),
+            "min": cohort.score.min if cohort.score.count else math.nan,
+            "max": cohort.score.max if cohort.score.count else math.nan,
+            **percentiles(cohort.digest),
+        },
+        # Exactos: un valor por sesión o por estudiante
+        "session_mean_score_percentiles": _exact_percentiles(session_means),
+        "student_mean_score_percentiles": _exact_percentiles(student_means),
+        "distraction_periods": {
+            "total": cohort.periods,
+            "seconds": cohort.period_seconds,
+            "per_session_mean": cohort.periods / cohort.sessions if cohort.sessions else 0.0,
+            "per_hour": cohort.periods / hours if hours > 0 else 0.0,
+            "per_session_percentiles": _exact_percentiles(session_periods),
+        },
+        "metric_averages": {name: stats.result() for name, stats in sorted(cohort.metrics.items())},
+        "per_student": per_student,
+    }
+
+
+def _exact_percentiles(values: list, qs=(0.10, 0.25, 0.50, 0.75, 0.90, 0.95)) -> dict:
+    if not values:
+        return {f"p{int(round(q * 100))}": math.nan for q in qs}
+    result = np.quantile(np.asarray(values, dtype=np.float64), qs)
+    return {f"p{int(round(q * 100))}": float(v) for q, v in zip(qs, result)}
+
+
+# ============================================================
+# 4. Orquestación
+# ============================================================
+
+def find_sessions(roots: List[str]) -> Iterator[Tuple[str, str]]:
+    """(directorio de sesión, raíz) de cada sesión bajo `roots`."""
+    for root in roots:
+        if os.path.exists(os.path.join(root, META_FILE)):
+            yield root, os.path.dirname(os.path.abspath(root))
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            if META_FILE in filenames:
+                dirnames.clear()   # una sesión no contiene otras
+                yield dirpath, root
+            dirnames.sort()
+
+
+def student_of(directory: str, root: str) -> str:
+    try:
+        meta = read_meta(directory)
+    except (OSError, ValueError):
+        meta = {}
+    student = meta.get("user_id") or meta.get("student_id")
+    if student:
+        return str(student)
+    parts = os.path.relpath(directory, root).split(os.sep)
+    return parts[0] if len(parts) > 1 else os.path.basename(os.path.normpath(directory))
+
+
+def analyze_cohort(
+    roots: List[str],
+    workers: Optional[int] = None,
+    cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+) -> dict:
+    """
+    Analiza todas las sesiones bajo `roots` y devuelve el reporte de la
+    cohorte. Con `cache_dir=None` no se usa caché.
+    """
+    t0 = time.time()
+    cache = PartialCache(cache_dir) if cache_dir else None
+
+    partials: Dict[str, Tuple[str, dict]] = {}
+    students: Dict[str, str] = {}
+    signatures: Dict[str, list] = {}
+    pending: List[str] = []
+    failed: Dict[str, str] = {}
+    unchanged = 0
+
+    for directory, root in find_sessions(roots):
+        try:
+            students[directory] = student_of(directory, root)
+            signatures[directory] = file_signature(directory)
+        except (OSError, ValueError, KeyError) as e:
+            failed[directory] = str(e)
+            continue
+        hit = cache.lookup(directory, signatures[directory]) if cache else None
+        if hit is not None:
+            partials[directory] = (students[directory], hit[1])
+            unchanged += 1
+        else:
+            pending.append(directory)
+
+    total = len(partials) + len(pending) + len(failed)
+    print(f"📚 {total} sesiones: {unchanged} sin cambios, {len(pending)} a procesar")
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pending) or 1))
+    tasks = [(d, cache_dir) for d in pending]
+    counts = {"cache_hits": 0, "computed": 0}
+
+    def collect(result):
+        directory, key, partial, from_cache = result
+        partials[directory] = (students[directory], partial)
+        counts["cache_hits" if from_cache else "computed"] += 1
+        if cache:
+            cache.remember(directory, signatures[directory], key)
+
+    # Sin MediaPipe en los workers: el contexto por defecto (fork en Linux) alcanza
+    if workers == 1:
+        for i, task in enumerate(tasks, start=1):
+            try:
+                collect(_analyze_session(task))
+            except Exception as e:
+                failed[task[0]] = str(e)
+            _progress(i, len(tasks), t0)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_analyze_session, task): task[0] for task in tasks}
+            for i, future in enumerate(as_completed(futures), start=1):
+                try:
+                    collect(future.result())
+                except Exception as e:
+                    failed[futures[future]] = str(e)
+                _progress(i, len(tasks), t0)
+
+    if cache:
+        cache.save()
+
+    for directory, error in sorted(failed.items()):
+        print(f"⚠️  {directory}: {error}")
+
+    report = merge_partials(partials)
+    report["processing"] = {
+        "seconds": time.time() - t0,
+        "workers": workers,
+        "unchanged": unchanged,
+        **counts,
+        "failed": sorted(failed),
+    }
+    print(f"✅ {report['sessions']} sesiones en {report['processing']['seconds']:.1f}s "
+          f"({report['processing']['computed']} calculadas)")
+    return report
+
+
+def _progress(done: int, total: int, t0: float, every: int = 100) -> None:
+    if done % every == 0 or done == total:
+        print(f"  {done}/{total} sesiones ({time.time() - t0:.1f}s)")
+
+
+def generate_cohort_report(report: dict, top: int = 10) -> str:
+    score = report["score_statistics"]
+    periods = report["distraction_periods"]
+    text = (
+        "\n========== REPORTE DE COHORTE ==========\n"
+        f"Sesiones: {report['sessions']}  Estudiantes: {report['students']}\n"
+        f"Horas analizadas: {report['total_hours']:.1f}  Frames: {report['total_frames']}\n\n"
+        "Distribución de atención:\n"
+    )
+    for level, pct in report["attention_distribution"].items():
+        text += f"  - {level}: {pct:.2f}%\n"
+
+    text += (
+        "\nScore de atención:\n"
+        f"  media {score['mean']:.3f} ± {score['std']:.3f}\n"
+        f"  p10 {score['p10']:.3f}  p25 {score['p25']:.3f}  p50 {score['p50']:.3f}  "
+        f"p75 {score['p75']:.3f}  p90 {score['p90']:.3f}\n"
+        f"\nPeríodos de desconcentración severa: {periods['total']} "
+        f"({periods['per_session_mean']:.2f} por sesión, {periods['per_hour']:.2f} por hora)\n"
+    )
+
+    students = sorted(report["per_student"].items(), key=lambda kv: kv[1]["mean_score"])
+    if students:
+        text += f"\nEstudiantes con menor score medio (hasta {top}):\n"
+        for student, s in students[:top]:
+            text += (f"  - {student}: {s['mean_score']:.3f} en {s['sessions']} sesiones, "
+                     f"{s['severe_pct']:.1f}% severo, {s['distraction_periods']} períodos\n")
+
+    return text
+
+
+def _json_default(o):
+    if hasattr(o, "item"):
+        return o.item()
+    return str(o)
+
+
+# ============================================================
+# 5. CLI
+# ============================================================
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Estadísticas de atención de una cohorte de sesiones columnares."
+    )
+    parser.add_argument("roots", nargs="+", help="Directorios de sesiones (se recorren recursivamente)")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos en paralelo (por defecto: núcleos)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Caché de parciales por sesión")
+    parser.add_argument("--no-cache", action="store_true", help="Procesar todas las sesiones sin caché")
+    parser.add_argument("--json", dest="json_path", default=None, help="Guardar el reporte completo en JSON")
+    args = parser.parse_args(argv)
+
+    report = analyze_cohort(
+        args.roots,
+        workers=args.workers,
+        cache_dir=None if args.no_cache else args.cache_dir,
+    )
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=_json_default)
+
+    print(generate_cohort_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
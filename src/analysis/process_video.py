@@ -0,0 +1,276 @@
+"""
+process_video.py
+Procesamiento offline de videos grabados (p. ej. clases en MP4).
+
+El video se divide en tramos de tiempo que se procesan en paralelo,
+cada uno en su propio proceso con su propio FaceMesh y MetricsCalculator.
+Para que las métricas temporales (PERCLOS, parpadeos/min, calibración EAR)
+sean correctas en los bordes, cada tramo arranca `warmup` segundos antes
+de su inicio: esos frames alimentan los buffers pero no se emiten.
+
+Los frames se leen con un generador (nunca se carga el video completo en
+memoria). El resultado por frame se guarda en formato columnar
+(ver infrastructure/frame_store.py) a medida que terminan los tramos, y
+al final se imprime el resumen de analyze_data calculado por bloques
+sobre esas columnas.
+
+Uso:
+    python -m src.analysis.process_video clase.mp4 -o salida/ --workers 8
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from src.analysis.analyze_data import analyze_frames, generate_report
+from src.infrastructure.frame_store import ColumnWriter
+
+
+# Columnas con el mismo esquema que espera analyze_frames()
+FLOAT_COLUMNS = [
+    "timestamp",
+    "elapsed_seconds",
+    "attention_score",
+    "ear_avg",
+    "perclos",
+    "blinks_per_minute",
+    "head_yaw",
+    "head_pitch",
+    "gaze_focus_ratio",
+    "gaze_dispersion",
+    "mar",
+]
+BOOL_COLUMNS = ["face_detected", "is_blink", "is_yawn"]
+
+NIVEL_SIN_ROSTRO = "sin_rostro"
+
+
+# ============================================================
+# 1. Lectura del video
+# ============================================================
+
+def video_info(path: str) -> Tuple[int, float]:
+    """Devuelve (total_frames, fps) del video."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"No se pudo abrir el video: {path}")
+
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.release()
+    return total, fps
+
+
+def iter_video_frames(path: str, start: int, end: int, stride: int = 1) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Generador de (índice, frame BGR) entre `start` (incluido) y `end`
+    (excluido). Los frames que no caen en el `stride` se saltan con
+    grab(), sin decodificarlos.
+    """
+    cap = cv2.VideoCapture(path)
+    try:
+        if start > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+        for idx in range(start, end):
+            if (idx - start) % stride:
+                if not cap.grab():
+                    return
+                continue
+
+            ok, frame = cap.read()
+            if not ok:
+                return
+            yield idx, frame
+    finally:
+        cap.release()
+
+
+def plan_chunks(total_frames: int, fps: float, chunk_seconds: float, warmup_seconds: float) -> List[Tuple[int, int, int]]:
+    """
+    Divide el video en tramos (inicio_calentamiento, inicio, fin),
+    en índices de frame.
+    """
+    chunk = max(int(round(chunk_seconds * fps)), 1)
+    warmup = max(int(round(warmup_seconds * fps)), 0)
+
+    chunks = []
+    for start in range(0, total_frames, chunk):
+        end = min(start + chunk, total_frames)
+        chunks.append((max(start - warmup, 0), start, end))
+    return chunks
+
+
+# ============================================================
+# 2. Procesamiento de un tramo (se ejecuta en un worker)
+# ============================================================
+
+def _process_chunk(args) -> Dict[str, np.ndarray]:
+    path, warm_start, start, end, fps, stride = args
+
+    # Cada worker tiene su propio grafo y buffers; un hilo por proceso
+    # para no competir con los demás workers.
+    cv2.setNumThreads(1)
+
+    from src.domain.attention_processor import AttentionProcessor
+    from src.domain.classifier import nivel_desde_estado
+
+    processor = AttentionProcessor()
+
+    n = math.ceil((end - start) / stride)
+    cols = {name: np.full(n, np.nan, dtype=np.float32) for name in FLOAT_COLUMNS}
+    cols["timestamp"] = np.full(n, np.nan, dtype=np.float64)
+    cols["elapsed_seconds"] = np.full(n, np.nan, dtype=np.float64)
+    cols.update({name: np.zeros(n, dtype=bool) for name in BOOL_COLUMNS})
+    cols["frame_number"] = np.zeros(n, dtype=np.int64)
+    levels = np.full(n, NIVEL_SIN_ROSTRO, dtype=object)
+
+    # El calentamiento se alinea al stride para que el primer frame
+    # emitido sea exactamente `start`.
+    warm_start = start - ((start - warm_start) // stride) * stride
+
+    row = 0
+    for idx, frame in iter_video_frames(path, warm_start, end, stride):
+        t = idx / fps
+        result = processor.process_frame(frame, timestamp=t)
+
+        if idx < start:
+            continue
+
+        cols["frame_number"][row] = idx
+        cols["timestamp"][row] = t
+        cols["elapsed_seconds"][row] = t
+
+        if result is not None:
+            m = result["metrics"]
+            a = result["attention_result"]
+
+            cols["face_detected"][row] = True
+            levels[row] = nivel_desde_estado(a.get("estado"))
+            cols["attention_score"][row] = a.get("score", 0.0)
+            cols["ear_avg"][row] = m.get("ear", 0.0)
+            cols["perclos"][row] = m.get("perclos", 0.0)
+            cols["blinks_per_minute"][row] = m.get("parpadeos_min", 0.0)
+            cols["head_yaw"][row] = m.get("yaw", 0.0)
+            cols["head_pitch"][row] = m.get("pitch", 0.0)
+            cols["gaze_focus_ratio"][row] = m.get("gaze_focus", 0.0)
+            cols["gaze_dispersion"][row] = m.get("gaze_dispersion", 0.0)
+            cols["mar"][row] = m.get("mar", 0.0)
+            cols["is_blink"][row] = bool(m.get("es_parpadeo", False))
+            cols["is_yawn"][row] = bool(m.get("es_bostezo", False))
+
+        row += 1
+
+    # El video puede traer menos frames que los anunciados
+    out = {name: values[:row] for name, values in cols.items()}
+    out["attention_level"] = levels[:row]
+    return out
+
+
+# ============================================================
+# 3. Orquestación
+# ============================================================
+
+def process_video(
+    path: str,
+    out_dir: str,
+    workers: Optional[int] = None,
+    chunk_seconds: float = 300.0,
+    warmup_seconds: float = 60.0,
+    stride: int = 1,
+) -> dict:
+    """
+    Procesa el video completo, guarda los resultados por frame en
+    `out_dir` y devuelve el análisis de analyze_frames().
+    """
+    total_frames, fps = video_info(path)
+    chunks = plan_chunks(total_frames, fps, chunk_seconds, warmup_seconds)
+    workers = workers or os.cpu_count() or 1
+
+    print(f"🎬 {path}: {total_frames} frames a {fps:.1f} fps "
+          f"→ {len(chunks)} tramos, {workers} workers")
+
+    t0 = time.time()
+    tasks = [(path, w, s, e, fps, stride) for w, s, e in chunks]
+
+    # Cada tramo se escribe apenas llega (en orden): la sesión nunca se junta en memoria
+    writer = ColumnWriter(out_dir)
+
+    # "spawn": MediaPipe no es seguro tras fork()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        for i, part in enumerate(pool.map(_process_chunk, tasks), start=1):
+            writer.append(part)
+            done_seconds = chunks[i - 1][2] / fps
+            elapsed = time.time() - t0
+            print(f"  tramo {i}/{len(chunks)} listo "
+                  f"({done_seconds / max(elapsed, 1e-6):.1f}x tiempo real)")
+
+    elapsed = time.time() - t0
+    duration = total_frames / fps if fps else 0.0
+    writer.meta.update({
+        "source": os.path.abspath(path),
+        "fps": fps,
+        "stride": stride,
+        "processing_seconds": elapsed,
+    })
+    writer.close()
+
+    analysis = analyze_frames(out_dir)
+
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(analysis, f, indent=2, default=_json_default)
+
+    print(f"✅ {duration:.0f}s de video en {elapsed:.1f}s "
+          f"({duration / max(elapsed, 1e-6):.1f}x tiempo real)")
+    return analysis
+
+
+def _json_default(o):
+    if hasattr(o, "item"):
+        return o.item()
+    return str(o)
+
+
+# ============================================================
+# 4. CLI
+# ============================================================
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Calcula métricas de atención sobre un video grabado."
+    )
+    parser.add_argument("video", help="Ruta del video (MP4, WebM, ...)")
+    parser.add_argument("-o", "--out", required=True, help="Directorio de salida (formato columnar)")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos en paralelo (por defecto: núcleos)")
+    parser.add_argument("--chunk-seconds", type=float, default=300.0, help="Duración de cada tramo")
+    parser.add_argument("--warmup-seconds", type=float, default=60.0,
+                        help="Solapamiento previo de cada tramo para las métricas temporales")
+    parser.add_argument("--stride", type=int, default=1, help="Procesar 1 de cada N frames")
+    args = parser.parse_args(argv)
+
+    if args.stride < 1:
+        parser.error("--stride debe ser >= 1")
+
+    analysis = process_video(
+        args.video,
+        args.out,
+        workers=args.workers,
+        chunk_seconds=args.chunk_seconds,
+        warmup_seconds=args.warmup_seconds,
+        stride=args.stride,
+    )
+    print(generate_report(analysis))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
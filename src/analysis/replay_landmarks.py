@@ -0,0 +1,176 @@
+"""
+replay_landmarks.py
+Reproducción de grabaciones de landmarks (.lmk) sin MediaPipe.
+
+Recorre la grabación mapeada en memoria chunk por chunk, corre
+MetricsCalculator y AttentionClassifier sobre cada frame con rostro y
+compara el resultado con el que se grabó en producción (golden): por
+campo, la diferencia máxima y cuántos frames superan la tolerancia, y
+la concordancia del estado final.
+
+Como en producción, parte del estado de métricas grabado al abrir (o
+rehidratar) la sesión, usa el perfil de pipeline grabado y extiende
+las ventanas temporales con los frames omitidos (FLAG_STALE).
+
+Las grabaciones en float16 difieren en décimas de píxel de los
+landmarks originales: usar una tolerancia acorde, o grabar en float32
+(LANDMARK_RECORD_DTYPE) para comparaciones exactas.
+
+Uso:
+    python -m src.analysis.replay_landmarks grabaciones/sesion.lmk
+    python -m src.analysis.replay_landmarks sesion.lmk --profile lite --tolerance 0.05 --json out.json
+"""
+
+import argparse
+import base64
+import json
+import sys
+import time
+from typing import Optional
+
+import numpy as np
+
+from src.domain.classifier import AttentionClassifier
+from src.domain.metrics import MetricsCalculator
+from src.domain.pipeline_profiles import get_profile
+from src.infrastructure.data_collector import ESTADOS, FLAG_STALE, RESULT_FIELDS, LandmarkRecording
+
+
+def replay(recording: LandmarkRecording, profile: Optional[str] = None) -> dict:
+    """
+    Re-ejecuta métricas y clasificación sobre toda la grabación.
+    Devuelve los resultados con el mismo esquema que los grabados.
+    `profile` reemplaza al perfil grabado.
+    """
+    perfil = get_profile(profile) if profile else None
+    calc = MetricsCalculator()
+    classifier = AttentionClassifier()
+    meta = list(recording.meta)
+
+    n = len(recording)
+    results = np.full((n, len(RESULT_FIELDS)), np.nan, dtype=np.float32)
+    estados = np.full(n, -1, dtype=np.int8)
+
+    start = time.perf_counter()
+    i = 0
+    for chunk in recording.iter_chunks():
+        t, points = chunk["t"], chunk["points"]
+        width, height, flags = chunk["width"], chunk["height"], chunk["flags"]
+        for j in range(len(t)):
+            while meta and meta[0][0] <= i:
+                values = meta.pop(0)[1]
+                if "estado" in values:
+                    calc = MetricsCalculator()
+                    calc.cargar_estado(base64.b64decode(values["estado"]))
+                if "profile" in values and not profile:
+                    perfil = get_profile(values["profile"])
+            if flags[j] & FLAG_STALE:
+                calc.registrar_frame_omitido(float(t[j]))
+                i += 1
+                continue
+            if points.shape[1] == 0 or np.isnan(points[j, 0, 0]):
+                i += 1
+                continue
+            w, h = int(width[j]), int(height[j])
+            puntos = (points[j].astype(np.float64) * (w, h, w)).tolist()
+
+            metrics = calc.procesar_frame(puntos, w, h, timestamp=float(t[j]), perfil=perfil)
+            attention = classifier.clasificar(metrics, perfil)
+
+            for k, field in enumerate(RESULT_FIELDS[:-1]):
+                if field in metrics:
+                    results[i, k] = metrics[field]
+            results[i, -1] = attention["score"]
+            estados[i] = ESTADOS.index(attention["estado"])
+            i += 1
+    elapsed = time.perf_counter() - start
+
+    return {
+        "frames": n,
+        "face_frames": int(np.count_nonzero(estados >= 0)),
+        "elapsed_s": elapsed,
+        "fps": n / elapsed if elapsed else 0.0,
+        "results": results,
+        "estados": estados,
+    }
+
+
+def compare_golden(recording: LandmarkRecording, replayed: dict, tolerance: float = 1e-3) -> dict:
+    """Diferencias por campo entre lo reproducido y lo grabado."""
+    golden = np.concatenate([c["results"] for c in recording.iter_chunks()]) if recording.chunks \
+        else np.empty((0, len(RESULT_FIELDS)), dtype=np.float32)
+    golden_estados = np.concatenate([c["estado"] for c in recording.iter_chunks()]) if recording.chunks \
+        else np.empty(0, dtype=np.int8)
+
+    fields = {}
+    for k, field in enumerate(RESULT_FIELDS):
+        both = ~np.isnan(golden[:, k]) & ~np.isnan(replayed["results"][:, k])
+        if not np.any(both):
+            continue
+        diff = np.abs(golden[both, k].astype(np.float64) - replayed["results"][both, k])
+        fields[field] = {
+            "compared": int(both.sum()),
+            "max_diff": float(diff.max()),
+            "mean_diff": float(diff.mean()),
+            "over_tolerance": int(np.count_nonzero(diff > tolerance)),
+        }
+
+    both = (golden_estados >= 0) & (replayed["estados"] >= 0)
+    agreement = float(np.mean(golden_estados[both] == replayed["estados"][both])) if np.any(both) else None
+    return {
+        "tolerance": tolerance,
+        "fields": fields,
+        "estado_agreement": agreement,
+        "ok": agreement in (None, 1.0) and all(f["over_tolerance"] == 0 for f in fields.values()),
+    }
+
+
+def format_report(path: str, replayed: dict, comparison: dict) -> str:
+    lines = [
+        "=" * 70,
+        f"🔁 REPLAY — {path}",
+        "=" * 70,
+        f"Frames: {replayed['frames']} ({replayed['face_frames']} con rostro) "
+        f"en {replayed['elapsed_s']:.2f}s → {replayed['fps']:.0f} fps",
+        "",
+        f"  {'campo':<15}{'frames':>8}{'máx |Δ|':>12}{'media |Δ|':>12}{'> tol':>8}",
+    ]
+    for field, f in comparison["fields"].items():
+        lines.append(f"  {field:<15}{f['compared']:>8}{f['max_diff']:>12.5f}"
+                     f"{f['mean_diff']:>12.5f}{f['over_tolerance']:>8}")
+    agreement = comparison["estado_agreement"]
+    lines.append("")
+    lines.append(f"Estado igual al grabado: {agreement * 100:.2f}%" if agreement is not None
+                 else "Sin estados grabados para comparar")
+    lines.append("✅ Coincide con lo grabado" if comparison["ok"]
+                 else f"⚠️  Difiere de lo grabado (tolerancia {comparison['tolerance']})")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Reproduce una grabación de landmarks y la compara con lo grabado.")
+    parser.add_argument("recording", help="Archivo .lmk (LandmarkRecorder)")
+    parser.add_argument("--profile", help="Perfil de pipeline para la reproducción (por defecto: el grabado)")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="Diferencia máxima aceptada por campo")
+    parser.add_argument("--json", help="Guardar la comparación en JSON")
+    args = parser.parse_args(argv)
+
+    recording = LandmarkRecording(args.recording)
+    try:
+        replayed = replay(recording, args.profile)
+        comparison = compare_golden(recording, replayed, args.tolerance)
+    finally:
+        recording.close()
+
+    print(format_report(args.recording, replayed, comparison))
+
+    if args.json:
+        summary = {k: v for k, v in replayed.items() if k not in ("results", "estados")}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({**summary, **comparison}, f, indent=2)
+
+    return 0 if comparison["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
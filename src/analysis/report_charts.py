@@ -0,0 +1,151 @@
+"""
+report_charts.py
+Reporte con gráficos de una sesión columnar (ver
+infrastructure/frame_store.py).
+
+Una imagen PNG con:
+    - el score de atención en el tiempo (media por tramo y banda
+      mínimo–máximo) con los períodos de desconcentración severa
+      sombreados,
+    - una franja con el nivel predominante de cada tramo,
+    - la distribución de niveles de toda la sesión.
+
+La serie se reduce a `points` tramos recorriendo la sesión por
+bloques: el costo de dibujar no depende de la duración.
+
+Usa el backend Agg (sin ventana). Pensado para correr en los
+procesos de infrastructure/report_service.py, nunca en un hilo
+que atiende frames.
+"""
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+
+from src.analysis.analyze_data import analyze_frames, generate_report  # noqa: E402
+from src.infrastructure.frame_store import CHUNK_ROWS, ColumnarSession  # noqa: E402
+
+LEVEL_COLORS = {
+    "concentrado": "#2e7d32",
+    "baja_atencion": "#f9a825",
+    "desconcentracion_severa": "#c62828",
+    "sin_rostro": "#9e9e9e",
+}
+OTHER_COLOR = "#5c6bc0"
+
+
+def score_timeline(session: ColumnarSession, points: int = 2000, chunk_rows: int = CHUNK_ROWS) -> dict:
+    """
+    Reduce la sesión a `points` tramos de filas consecutivas: tiempo
+    medio, media, mínimo y máximo del score y conteo por nivel.
+    """
+    rows = len(session)
+    points = max(1, min(points, rows))
+    levels = session.categories("attention_level")
+
+    t_sum = np.zeros(points)
+    t_n = np.zeros(points)
+    s_sum = np.zeros(points)
+    s_n = np.zeros(points)
+    s_min = np.full(points, np.inf)
+    s_max = np.full(points, -np.inf)
+    counts = np.zeros((points, max(len(levels), 1)), dtype=np.int64)
+
+    offset = 0
+    for chunk in session.iter_chunks(("elapsed_seconds", "attention_score", "attention_level"), chunk_rows):
+        n = len(chunk["attention_score"])
+        bucket = (np.arange(offset, offset + n, dtype=np.int64) * points) // rows
+        starts = np.flatnonzero(np.diff(bucket, prepend=-1))
+        ids = bucket[starts]
+
+        elapsed = np.asarray(chunk["elapsed_seconds"], dtype=np.float64)
+        ok = ~np.isnan(elapsed)
+        t_sum[ids] += np.add.reduceat(np.where(ok, elapsed, 0.0), starts)
+        t_n[ids] += np.add.reduceat(ok, starts)
+
+        score = np.asarray(chunk["attention_score"], dtype=np.float64)
+        ok = ~np.isnan(score)
+        s_sum[ids] += np.add.reduceat(np.where(ok, score, 0.0), starts)
+        s_n[ids] += np.add.reduceat(ok, starts)
+        s_min[ids] = np.minimum(s_min[ids], np.minimum.reduceat(np.where(ok, score, np.inf), starts))
+        s_max[ids] = np.maximum(s_max[ids], np.maximum.reduceat(np.where(ok, score, -np.inf), starts))
+
+        codes = np.asarray(chunk["attention_level"], dtype=np.int64)
+        known = codes >= 0
+        np.add.at(counts, (bucket[known], codes[known]), 1)
+        offset += n
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "time": t_sum / t_n,
+            "mean": s_sum / s_n,
+            "min": np.where(s_n > 0, s_min, np.nan),
+            "max": np.where(s_n > 0, s_max, np.nan),
+            "levels": levels,
+            "level_counts": counts,
+        }
+
+
+def render_session_report(session_dir: str, png_path: str, points: int = 2000, dpi: int = 100) -> dict:
+    """
+    Dibuja el reporte de la sesión en `png_path` y devuelve el análisis
+    de analyze_frames() y su versión en texto.
+    """
+    session = ColumnarSession(session_dir)
+    analysis = analyze_frames(session)
+    timeline = score_timeline(session, points)
+
+    fig, (ax_score, ax_level, ax_dist) = plt.subplots(
+        3, 1, figsize=(12, 7), gridspec_kw={"height_ratios": [4, 0.6, 2]}
+    )
+    t = timeline["time"]
+    minutes = t / 60
+
+    # 1. Score en el tiempo con los períodos severos sombreados
+    for p in analysis["distraction_periods"]:
+        ax_score.axvspan(p["start_time"] / 60, p["end_time"] / 60,
+                         color=LEVEL_COLORS["desconcentracion_severa"], alpha=0.15, lw=0)
+    ax_score.fill_between(minutes, timeline["min"], timeline["max"], color="#90caf9", alpha=0.5, lw=0)
+    ax_score.plot(minutes, timeline["mean"], color="#1565c0", lw=1)
+    ax_score.set_ylim(0, 1)
+    ax_score.set_ylabel("Score de atención")
+    ax_score.set_title(
+        f"Sesión {analysis['duration_formatted']} — score medio "
+        f"{analysis['score_statistics']['mean']:.2f}, "
+        f"{len(analysis['distraction_periods'])} períodos de desconcentración severa"
+    )
+    ax_score.grid(alpha=0.3)
+
+    # 2. Nivel predominante de cada tramo
+    levels = timeline["levels"]
+    if levels:
+        counts = timeline["level_counts"]
+        dominant = np.where(counts.sum(axis=1) > 0, counts.argmax(axis=1), -1)
+        colors = np.array([matplotlib.colors.to_rgb(LEVEL_COLORS.get(l, OTHER_COLOR)) for l in levels]
+                          + [(1.0, 1.0, 1.0)])
+        finite = np.isfinite(minutes)
+        extent = (np.nanmin(minutes), np.nanmax(minutes), 0, 1) if finite.any() else None
+        ax_level.imshow(colors[dominant][np.newaxis], aspect="auto", extent=extent, interpolation="nearest")
+    ax_level.set_yticks([])
+    ax_level.set_xlabel("Minutos")
+    ax_score.sharex(ax_level)
+    ax_score.tick_params(labelbottom=False)
+
+    # 3. Distribución de niveles
+    dist = analysis["attention_distribution"]
+    names = list(dist)
+    ax_dist.barh(names, [dist[n] for n in names], color=[LEVEL_COLORS.get(n, OTHER_COLOR) for n in names])
+    for i, n in enumerate(names):
+        ax_dist.text(dist[n] + 0.5, i, f"{dist[n]:.1f}%", va="center", fontsize=9)
+    ax_dist.set_xlim(0, 100)
+    ax_dist.invert_yaxis()
+    ax_dist.set_xlabel("% de frames")
+
+    fig.tight_layout()
+    fig.savefig(png_path, dpi=dpi, format="png")
+    plt.close(fig)
+
+    return {"analysis": analysis, "text": generate_report(analysis)}
@@ -0,0 +1,156 @@
+"""
+sketches.py
+Resúmenes combinables para estadísticas sobre muchos frames o sesiones.
+
+- RunningStats: cantidad, media y varianza (Welford, combinadas por
+  bloques con la fórmula de Chan), mínimo y máximo, ignorando NaN.
+- TDigest: cuantiles aproximados con memoria acotada (~compresión/2
+  centroides). Los centroides se agrupan en el espacio k1
+  (k = δ/2π · asin(2q − 1)), que los hace chicos en las colas, donde
+  más importan los percentiles extremos.
+
+Ambos se combinan con `merge` (el resultado no depende del orden) y
+se serializan con `to_dict` / `from_dict` para guardarlos en JSON.
+"""
+
+import math
+from typing import Optional
+
+import numpy as np
+
+
+class RunningStats:
+    """Cantidad, media, varianza, mínimo y máximo sin NaN, combinables."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values: np.ndarray) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        n = len(values)
+        if n == 0:
+            return
+        mean = float(values.mean())
+        other = RunningStats()
+        other.count, other.mean = n, mean
+        other.m2 = float(((values - mean) ** 2).sum())
+        other.min, other.max = float(values.min()), float(values.max())
+        self.merge(other)
+
+    def merge(self, other: "RunningStats") -> "RunningStats":
+        if other.count == 0:
+            return self
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else math.nan
+
+    def result(self, default=math.nan) -> float:
+        return self.mean if self.count else default
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count, "mean": self.mean, "m2": self.m2,
+            "min": self.min if self.count else None, "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "RunningStats":
+        s = cls()
+        s.count, s.mean, s.m2 = int(d["count"]), float(d["mean"]), float(d["m2"])
+        if s.count:
+            s.min, s.max = float(d["min"]), float(d["max"])
+        return s
+
+
+class TDigest:
+    """t-digest combinable (variante de fusión, vectorizada con NumPy)."""
+
+    def __init__(self, compression: float = 200.0):
+        self.compression = compression
+        self.means = np.empty(0, dtype=np.float64)
+        self.weights = np.empty(0, dtype=np.float64)
+        self.min = math.inf
+        self.max = -math.inf
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def add(self, values: np.ndarray) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._compress(np.concatenate((self.means, values)),
+                       np.concatenate((self.weights, np.ones(len(values)))))
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        if len(other.means):
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self._compress(np.concatenate((self.means, other.means)),
+                           np.concatenate((self.weights, other.weights)))
+        return self
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray) -> None:
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+
+        # Centroide de cada punto: piso de k en el punto medio de su peso
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * math.pi) * np.arcsin(2 * q - 1)
+        bucket = np.floor(k - k[0]).astype(np.int64)
+        starts = np.flatnonzero(np.diff(bucket, prepend=-1))
+
+        w = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / w
+        self.weights = w
+
+    def quantile(self, q: float) -> float:
+        if len(self.means) == 0:
+            return math.nan
+        if len(self.means) == 1:
+            return float(self.means[0])
+        total = self.weights.sum()
+        mids = np.cumsum(self.weights) - self.weights / 2
+        xs = np.concatenate(([0.0], mids, [total]))
+        ys = np.concatenate(([self.min], self.means, [self.max]))
+        return float(np.interp(q * total, xs, ys))
+
+    def to_dict(self) -> dict:
+        return {
+            "compression": self.compression,
+            "means": self.means.tolist(),
+            "weights": self.weights.tolist(),
+            "min": self.min if len(self.means) else None,
+            "max": self.max if len(self.means) else None,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "TDigest":
+        t = cls(d.get("compression", 200.0))
+        t.means = np.asarray(d["means"], dtype=np.float64)
+        t.weights = np.asarray(d["weights"], dtype=np.float64)
+        if len(t.means):
+            t.min, t.max = float(d["min"]), float(d["max"])
+        return t
+
+
+def percentiles(digest: Optional[TDigest], qs=(0.10, 0.25, 0.50, 0.75, 0.90, 0.95)) -> dict:
+    return {f"p{int(round(q * 100))}": digest.quantile(q) if digest is not None else math.nan for q in qs}
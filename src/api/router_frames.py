@@ -1,68 +1,439 @@
 # backend/DESDECERO/src/api/router_frames.py
 
-from fastapi import APIRouter, HTTPException
+import time
+from typing import Union
 
-from ..domain.attention_processor import attention_processor
-from .schemas import ProcessFrameRequest, ProcessFrameResponse
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+
+from ..domain import config
+from ..domain.attention_processor import attention_processor, session_key
+from ..domain.classifier import nivel_desde_estado
+from ..domain.pacing import Pacer, build_pacing_controller
+from ..infrastructure.result_cache import FrameResultCache
+from ..infrastructure.scheduler import FairScheduler
+from ..infrastructure.tracing import record_span, span
+from ..infrastructure.video_segments import SegmentDecodeError, decode_segment, ffmpeg_available
+from .router_profiles import request_profiler, tracer
+from .router_sessions import session_broker, timeline_store, webm_headers
+from .schemas import (
+    CacheStatsResponse,
+    CompactFrameResponse,
+    MemoryStatsResponse,
+    PacingHintResponse,
+    PacingStatsResponse,
+    ProcessFrameRequest,
+    ProcessFrameResponse,
+    ProcessSegmentParams,
+    SchedulerStatsResponse,
+    SegmentResponse,
+)
 
 router = APIRouter()
 
+# Reintentos del mismo frame (misma sesión, número y payload) se sirven
+# desde aquí sin volver a ejecutar el pipeline ni tocar los buffers.
+result_cache = FrameResultCache(max_entries=config.RESULT_CACHE_MAX_ENTRIES)
+
+# Reparte los workers entre sesiones: ninguna se lleva más que su parte
+# por mandar más fps que las demás.
+frame_scheduler = FairScheduler(
+    workers=config.SCHEDULER_WORKERS,
+    target_fps=config.SCHEDULER_TARGET_FPS,
+    burst=config.SCHEDULER_BURST,
+    session_depth=config.SCHEDULER_SESSION_DEPTH,
+    max_queued=config.SCHEDULER_MAX_QUEUED,
+    quantum_ms=config.SCHEDULER_QUANTUM_MS,
+    hard_cap=config.SCHEDULER_HARD_CAP,
+    max_wait=config.SCHEDULER_MAX_WAIT_SECONDS,
+)
+
+# Ritmo sugerido en cada respuesta (intervalo, resolución y calidad JPEG)
+# según la carga del planificador y la estabilidad de la sesión
+pacer = Pacer(
+    build_pacing_controller(),
+    target_fps=config.SCHEDULER_TARGET_FPS,
+    load=frame_scheduler.load if config.SCHEDULER_ENABLED else None,
+    max_sessions=config.MAX_SESIONES,
+)
 
-@router.post("/process", response_model=ProcessFrameResponse)
-def process_frame(payload: ProcessFrameRequest):
+
+@router.post("/process", response_model=Union[ProcessFrameResponse, CompactFrameResponse])
+def process_frame(payload: ProcessFrameRequest, response: Response, request: Request):
     """
     Recibe un frame en base64 desde el frontend,
     calcula métricas de atención y devuelve resultados.
 
     NOTA:
     - No guarda en BD
-    - No usa session_id
+    - session_id separa el estado temporal de cada cliente y permite
+      reconocer reintentos del mismo frame
+    - user_id precarga/guarda la calibración EAR del usuario
     - Solo funciona como API de procesamiento de frames en tiempo real
+
+    Con output="rollup" u output="events" la respuesta solo trae los
+    registros a reenviar (uno por ventana, o uno por cambio de nivel /
+    evento); la mayoría de los frames devuelve `records` vacío.
+
+    La cabecera Server-Timing trae la duración de cada etapa (ms).
+
+    `pacing` sugiere cuándo mandar el próximo frame, con qué ancho máximo
+    y calidad JPEG (ver GET /process/pacing).
+
+    Con `X-Profile: 1` (o ?profile=1) y un X-Profile-Token válido el
+    request se ejecuta bajo cProfile; el id del perfil vuelve en la
+    cabecera X-Profile-Id (ver GET /profiles/{id}).
+
+    Un `traceparent` (W3C) entrante aporta el trace-id; si el request
+    queda trazado, el id vuelve en X-Trace-Id (ver GET /traces/{id}).
     """
+    profile_requested = _profile_requested(request)
+    if profile_requested and not request_profiler.authorized(
+        request.headers.get("x-profile-token") or request.query_params.get("profile_token")
+    ):
+        raise HTTPException(status_code=403, detail="Token de perfilado inválido o deshabilitado")
+
+    trace = tracer.start(
+        "POST /process",
+        request.headers.get("traceparent"),
+        session_id=payload.session_id,
+        frame_number=payload.frame_number,
+        output=payload.output,
+    )
     try:
-        # Procesar imagen base64 con MediaPipe
-        result = attention_processor.process_base64_frame(payload.image_base64)
-
-        # No se detectó rostro
-        if result is None:
-            return ProcessFrameResponse(
-                frame_number=payload.frame_number,
-                face_detected=False,
-            )
+        start = time.perf_counter()
+        timings = {}
+        # Misma clave de sesión que el procesador y el planificador. Sin
+        # sesión no hay caché: clientes distintos pueden mandar el mismo frame
+        owner = session_key(payload.session_id, payload.user_id)
+        key = None if owner is None else FrameResultCache.make_key(
+            owner, payload.frame_number, payload.image_base64,
+            payload.output, payload.profile, payload.rollup_window,
+        )
+        # Un frame omitido (cola, compuerta, etc.) se reintenta de verdad
+        result, profile_id = request_profiler.run(
+            lambda: _respond(payload, timings) if key is None else result_cache.get_or_compute(
+                key, lambda: _respond(payload, timings), cacheable=lambda r: not r.skipped
+            ),
+            requested=profile_requested,
+            meta={"session_id": payload.session_id, "frame_number": payload.frame_number},
+        )
+
+        if not timings:
+            timings["cache"] = 0.0
+        with span("pacing"):
+            hint = pacer.hint(payload.session_id, timings, payload.capture_ts)
+        if hint is not None:
+            # Copia: la respuesta guardada en la caché de reintentos no cambia
+            result = result.model_copy(update={"pacing": PacingHintResponse(**hint)})
+        timings["total"] = (time.perf_counter() - start) * 1000
+        response.headers["Server-Timing"] = _server_timing(timings)
+        if profile_id:
+            response.headers["X-Profile-Id"] = profile_id
+        if trace is not None:
+            trace.set(cached="cache" in timings, skipped=result.skipped, face_detected=result.face_detected)
+            response.headers["X-Trace-Id"] = trace.trace_id
+        return result
+
+    except Exception as e:
+        if trace is not None:
+            trace.fail(e)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        tracer.finish(trace)
+
+
+@router.get("/process/cache", response_model=CacheStatsResponse)
+def cache_stats():
+    """Contadores de aciertos, fallos y desalojos de la caché de reintentos."""
+    return result_cache.stats()
+
+
+@router.get("/process/scheduler", response_model=SchedulerStatsResponse)
+def scheduler_stats():
+    """
+    fps pedidos y servidos por sesión (últimos segundos), descartes por
+    motivo e índice de equidad de Jain sobre la fracción servida de lo que
+    cada sesión pidió hasta el tope (1.0 = reparto perfectamente parejo).
+    """
+    return {"enabled": config.SCHEDULER_ENABLED, **frame_scheduler.stats()}
+
+
+@router.get("/process/pacing", response_model=PacingStatsResponse)
+def pacing_stats():
+    """
+    Controlador de ritmo activo, decisiones por motivo (normal, steady,
+    no_face, load, overload), intervalo medio sugerido, carga actual y
+    la última sugerencia de cada sesión.
+    """
+    return pacer.stats()
+
+
+@router.get("/process/memory", response_model=MemoryStatsResponse)
+def memory_stats():
+    """
+    Memoria del nodo: bytes estimados de las sesiones vivas frente al
+    presupuesto, las que más ocupan, las hibernadas (y dónde) y la
+    memoria residente del proceso.
+    """
+    return attention_processor.memory_stats()
+
+
+@router.post("/process/segment", response_model=SegmentResponse)
+async def process_segment(request: Request, response: Response, params: ProcessSegmentParams = Depends()):
+    """
+    Recibe un segmento corto de video (WebM/MP4 de MediaRecorder) en el
+    cuerpo del request y procesa sus frames con el mismo pipeline que
+    /process, remuestreados a `sample_fps` (por defecto
+    SEGMENT_DEFAULT_FPS).
+
+    El frame i del segmento se toma en `start_ts + i / sample_fps` y
+    numera `first_frame_number + i`. Conviene mandar `start_ts` (instante
+    de captura del inicio del segmento); si falta se usa la llegada.
+    Los fragmentos de MediaRecorder sin cabecera WebM usan la del primer
+    fragmento de la sesión.
+    """
+    data = await request.body()
+    if not data:
+        raise HTTPException(status_code=400, detail="Segmento vacío")
+    if len(data) > config.SEGMENT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Segmento demasiado grande")
+    if not ffmpeg_available(config.FFMPEG_BINARY):
+        raise HTTPException(status_code=503, detail="ffmpeg no está disponible en el servidor")
+
+    trace = tracer.start(
+        "POST /process/segment",
+        request.headers.get("traceparent"),
+        session_id=params.session_id,
+        segment_number=params.segment_number,
+        bytes=len(data),
+    )
+    try:
+        result = await run_in_threadpool(_process_segment, data, params)
+        if trace is not None:
+            trace.set(frames=result.frames, decode_ms=round(result.decode_ms, 2))
+            response.headers["X-Trace-Id"] = trace.trace_id
+        return result
+    except SegmentDecodeError as e:
+        if trace is not None:
+            trace.fail(e)
+        raise HTTPException(status_code=422, detail=f"No se pudo decodificar el segmento: {e}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        if trace is not None:
+            trace.fail(e)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        tracer.finish(trace)
+
+
+def _profile_requested(request: Request) -> bool:
+    flag = request.headers.get("x-profile") or request.query_params.get("profile")
+    return flag is not None and flag.lower() in ("1", "true", "yes")
+
+
+def _server_timing(timings: dict) -> str:
+    return ", ".join(f"{name};dur={ms:.2f}" for name, ms in timings.items())
+
+
+def _respond(payload: ProcessFrameRequest, timings: dict = None):
+    """Respuesta en el modo de salida pedido."""
+    result = _schedule(payload, timings)
+    t = payload.capture_ts if payload.capture_ts is not None else time.time()
+    frame = result.model_dump()
+    if not result.skipped:
+        pacer.observe(payload.session_id, frame, payload.capture_ts)
+        timeline_store.add(payload.session_id, t, frame)
+    if payload.session_id and not result.skipped and session_broker.has_subscribers(payload.session_id):
+        session_broker.publish(payload.session_id, result.model_dump(exclude_none=True))
+
+    if payload.output == "full":
+        return result
+
+    records = attention_processor.summarize(
+        payload.output,
+        t,
+        frame,
+        session_id=payload.session_id,
+        user_id=payload.user_id,
+        window=payload.rollup_window,
+    ) if not result.skipped else []
+    return CompactFrameResponse(
+        frame_number=result.frame_number,
+        face_detected=result.face_detected,
+        records=records,
+        skipped=result.skipped,
+    )
 
-        metrics = result["metrics"]
-        attention_result = result["attention_result"]
 
-        # Convertir estado interno → niveles textuales
-        estado = attention_result.get("estado", "NO_CONCENTRADO")
+def _schedule(payload: ProcessFrameRequest, timings: dict = None) -> ProcessFrameResponse:
+    """Pasa el frame por el planificador; si lo descarta, responde sin procesar."""
+    # Sin session_id ni user_id no hay sesión que repartir: cada request
+    # es independiente y no compite por una cola compartida
+    key = session_key(payload.session_id, payload.user_id)
+    if not config.SCHEDULER_ENABLED or key is None:
+        return _process_payload(payload, timings)
 
-        if estado == "CONCENTRADO":
-            attention_level = "concentrado"
-        elif estado == "BAJA_ATENCION":
-            attention_level = "baja_atencion"
-        else:
-            attention_level = "desconcentracion_severa"
+    queued_at = time.perf_counter_ns()
 
-        # Respuesta directa sin base de datos
+    def process():
+        now = time.perf_counter_ns()
+        record_span("scheduler.queue", queued_at, now)
+        if timings is not None:
+            timings["queue"] = (now - queued_at) / 1e6
+        return _process_payload(payload, timings)
+
+    status, result = frame_scheduler.run(key, process)
+    if status != "ok":
         return ProcessFrameResponse(
             frame_number=payload.frame_number,
-            face_detected=True,
-            attention_level=attention_level,
-            attention_score=float(attention_result.get("score", 0.0)),
-            is_concentrated=bool(attention_result.get("concentrado", False)),
-
-            # Métricas faciales procesadas
-            ear=float(metrics.get("ear", 0.0)),
-            perclos=float(metrics.get("perclos", 0.0)),
-            blinks_per_minute=float(metrics.get("parpadeos_min", 0.0)),
-            head_yaw=float(metrics.get("yaw", 0.0)),
-            head_pitch=float(metrics.get("pitch", 0.0)),
-            gaze_focus=float(metrics.get("gaze_focus", 0.0)),
-            gaze_dispersion=float(metrics.get("gaze_dispersion", 0.0)),
-            mar=float(metrics.get("mar", 0.0)),
-            is_blink=bool(metrics.get("es_parpadeo", False)),
-            is_yawn=bool(metrics.get("es_bostezo", False)),
+            face_detected=False,
+            skipped=True,
+            skip_reason=status,
         )
+    return result
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+
+def _process_segment(data: bytes, params: ProcessSegmentParams) -> SegmentResponse:
+    """Decodifica el segmento como generador y procesa cada frame al salir de ffmpeg."""
+    fps = min(params.sample_fps or config.SEGMENT_DEFAULT_FPS, config.SEGMENT_MAX_FPS)
+    start_ts = params.start_ts if params.start_ts is not None else time.time()
+    data = webm_headers.complete(params.session_id, data)
+
+    frames = decode_segment(
+        data, fps,
+        max_width=config.SEGMENT_MAX_WIDTH,
+        binary=config.FFMPEG_BINARY,
+        timeout=config.SEGMENT_DECODE_TIMEOUT,
+        max_seconds=config.SEGMENT_MAX_SECONDS,
+    )
+    results, records = [], []
+    decode_ms = process_ms = 0.0
+    last = None
+    i = face_frames = 0
+    while True:
+        t0 = time.perf_counter()
+        frame = next(frames, None)
+        decode_ms += (time.perf_counter() - t0) * 1000
+        if frame is None:
+            break
+
+        t0 = time.perf_counter()
+        t = start_ts + i / fps
+        frame_number = params.first_frame_number + i
+        result = _process_segment_frame(frame, t, frame_number, params)
+        if params.output == "full":
+            results.append(result)
+        elif not result.skipped:
+            records += attention_processor.summarize(
+                params.output, t, result.model_dump(),
+                session_id=params.session_id, user_id=params.user_id, window=params.rollup_window,
+            )
+        if not result.skipped:
+            last = result
+            frame_dict = result.model_dump()
+            pacer.observe(params.session_id, frame_dict, t)
+            timeline_store.add(params.session_id, t, frame_dict)
+        face_frames += result.face_detected
+        process_ms += (time.perf_counter() - t0) * 1000
+        i += 1
+
+    if last is not None and params.session_id and session_broker.has_subscribers(params.session_id):
+        session_broker.publish(params.session_id, last.model_dump(exclude_none=True))
+
+    hint = pacer.hint(params.session_id, {"decode": decode_ms / max(i, 1)}, start_ts + i / fps)
+
+    return SegmentResponse(
+        segment_number=params.segment_number,
+        frames=i,
+        face_frames=face_frames,
+        fps=fps,
+        decode_ms=decode_ms,
+        process_ms=process_ms,
+        results=results,
+        records=records,
+        pacing=PacingHintResponse(**hint) if hint is not None else None,
+    )
+
+
+def _process_segment_frame(frame, t: float, frame_number: int, params: ProcessSegmentParams) -> ProcessFrameResponse:
+    def process():
+        return _frame_response(frame_number, attention_processor.process_frame(
+            frame, t, session_id=params.session_id, user_id=params.user_id, profile=params.profile,
+        ))
+
+    key = session_key(params.session_id, params.user_id)
+    if not config.SCHEDULER_ENABLED or key is None:
+        return process()
+
+    # Los frames de un segmento llegan juntos: no cuentan contra el tope de
+    # fps, pero cada uno espera su turno frente a las demás sesiones
+    status, result = frame_scheduler.run(key, process, rate_limited=False)
+    if status != "ok":
+        return ProcessFrameResponse(frame_number=frame_number, face_detected=False,
+                                    skipped=True, skip_reason=status)
+    return result
+
+
+def _process_payload(payload: ProcessFrameRequest, timings: dict = None) -> ProcessFrameResponse:
+    """Ejecuta el pipeline completo y arma la respuesta."""
+    # Procesar imagen base64 con MediaPipe
+    result = attention_processor.process_base64_frame(
+        payload.image_base64,
+        session_id=payload.session_id,
+        user_id=payload.user_id,
+        timings=timings,
+        frame_number=payload.frame_number,
+        capture_ts=payload.capture_ts,
+        profile=payload.profile,
+    )
+
+    return _frame_response(payload.frame_number, result)
+
+
+def _frame_response(frame_number: int, result) -> ProcessFrameResponse:
+    """Respuesta por frame a partir del resultado de AttentionProcessor."""
+    # Frame viejo: atendido sin inferencia
+    if result is not None and "skipped" in result:
+        return ProcessFrameResponse(
+            frame_number=frame_number,
+            face_detected=False,
+            skipped=True,
+            skip_reason=result["skipped"],
+        )
+
+    # No se detectó rostro
+    if result is None:
+        return ProcessFrameResponse(
+            frame_number=frame_number,
+            face_detected=False,
+        )
+
+    metrics = result["metrics"]
+    attention_result = result["attention_result"]
+
+    # Convertir estado interno → niveles textuales
+    estado = attention_result.get("estado", "NO_CONCENTRADO")
+    attention_level = nivel_desde_estado(estado)
+
+    # Respuesta directa sin base de datos
+    return ProcessFrameResponse(
+        frame_number=frame_number,
+        face_detected=True,
+        attention_level=attention_level,
+        attention_score=float(attention_result.get("score", 0.0)),
+        is_concentrated=bool(attention_result.get("concentrado", False)),
+
+        # Métricas faciales procesadas
+        ear=float(metrics.get("ear", 0.0)),
+        perclos=float(metrics.get("perclos", 0.0)),
+        blinks_per_minute=float(metrics.get("parpadeos_min", 0.0)),
+        head_yaw=float(metrics.get("yaw", 0.0)),
+        head_pitch=float(metrics.get("pitch", 0.0)),
+        gaze_focus=float(metrics.get("gaze_focus", 0.0)),
+        gaze_dispersion=float(metrics.get("gaze_dispersion", 0.0)),
+        mar=float(metrics.get("mar", 0.0)),
+        is_blink=bool(metrics.get("es_parpadeo", False)),
+        is_yawn=bool(metrics.get("es_bostezo", False)),
+    )
@@ -0,0 +1,78 @@
+# backend/DESDECERO/src/api/router_profiles.py
+
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException
+
+from ..domain import config
+from ..infrastructure.profiling import RequestProfiler
+from ..infrastructure.tracing import Tracer, format_waterfall
+
+router = APIRouter()
+
+# Perfilador compartido con router_frames (ver /process con X-Profile)
+request_profiler = RequestProfiler(
+    token=config.PROFILE_TOKEN,
+    sample_rate=config.PROFILE_SAMPLE_RATE,
+    slow_ms=config.PROFILE_SLOW_MS,
+    directory=config.PROFILE_DIR,
+    max_stored=config.PROFILE_MAX_STORED,
+)
+
+# Trazas por request (spans); los lentos y muestreados se exportan al log
+tracer = Tracer(
+    sample_rate=config.TRACE_SAMPLE_RATE,
+    slow_ms=config.TRACE_SLOW_MS,
+    log_path=config.TRACE_LOG_PATH,
+    otlp_path=config.TRACE_OTLP_PATH,
+    max_bytes=config.TRACE_LOG_MAX_BYTES,
+    backups=config.TRACE_LOG_BACKUPS,
+    service_name=config.TRACE_SERVICE_NAME,
+    max_spans=config.TRACE_MAX_SPANS,
+    recent=config.TRACE_RECENT,
+)
+
+
+def _check_token(token: Optional[str]) -> None:
+    if not request_profiler.authorized(token):
+        raise HTTPException(status_code=403, detail="Token de perfilado inválido o deshabilitado")
+
+
+@router.get("/profiles")
+def list_profiles(x_profile_token: Optional[str] = Header(None)):
+    """Perfiles guardados (más recientes primero)."""
+    _check_token(x_profile_token)
+    return request_profiler.list_profiles()
+
+
+@router.get("/profiles/{profile_id}")
+def get_profile(profile_id: str, x_profile_token: Optional[str] = Header(None)):
+    """
+    Perfil completo: desglose por etapa (AttentionProcessor,
+    MetricsCalculator, AttentionClassifier) y funciones/pilas más costosas.
+    """
+    _check_token(x_profile_token)
+    profile = request_profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return profile
+
+
+@router.get("/traces")
+def list_traces(limit: int = 50, x_profile_token: Optional[str] = Header(None)):
+    """Últimas trazas exportadas (lentas o muestreadas) y contadores del tracer."""
+    _check_token(x_profile_token)
+    return {"stats": tracer.stats(), "traces": tracer.recent(limit)}
+
+
+@router.get("/traces/{trace_id}")
+def get_trace(trace_id: str, x_profile_token: Optional[str] = Header(None)):
+    """
+    Traza completa: spans con inicio relativo y duración (ms), más la
+    cascada en texto (`waterfall`).
+    """
+    _check_token(x_profile_token)
+    trace = tracer.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Traza no encontrada")
+    return {**trace, "waterfall": format_waterfall(trace)}
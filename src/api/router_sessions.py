@@ -1,20 +1,263 @@
 # backend/DESDECERO/src/api/router_sessions.py
 
-from fastapi import APIRouter
+import asyncio
+import hmac
+import json
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+
+from ..domain import config
+from ..domain.attention_processor import attention_processor
+from ..infrastructure.pubsub import SessionBroker
+from ..infrastructure.report_service import ReportQueueFull, ReportService
+from ..infrastructure.timeline_store import TimelineStore
+from ..infrastructure.video_segments import WebmInitCache
+from .schemas import ReportJobResponse, ReportResponse, SessionEndResponse, TimelineResponse
 
 router = APIRouter()
 
-"""
-Este router ya NO maneja sesiones.
-Se mantiene vacío únicamente para evitar errores
-si aún está referenciado en main.py.
+# Difusión del último estado de cada sesión; router_frames publica aquí
+# cada frame procesado con session_id.
+session_broker = SessionBroker(max_subscribers=config.SSE_MAX_SUBSCRIBERS)
+
+# Cabecera WebM del primer fragmento de cada sesión (MediaRecorder con
+# timeslice); router_frames la usa y viaja con el traspaso de la sesión.
+webm_headers = WebmInitCache(max_sessions=config.MAX_SESIONES)
+
+# Los registros con que se cierran las salidas compactas de una sesión
+# (fin, hibernación o traspaso) también llegan a sus observadores
+attention_processor.on_flush = lambda session_id, records: session_broker.publish(
+    session_id, {"records": records, "closed": True}
+)
+
+# Reportes con gráficos: se dibujan en procesos aparte, nunca en estos hilos
+report_service = ReportService(
+    sessions_dir=config.REPORT_SESSIONS_DIR,
+    cache_dir=config.REPORT_CACHE_DIR,
+    workers=config.REPORT_WORKERS,
+    max_pending=config.REPORT_MAX_PENDING,
+    job_ttl=config.REPORT_JOB_TTL_SECONDS,
+    nice=config.REPORT_NICE,
+    points=config.REPORT_TIMELINE_POINTS,
+    dpi=config.REPORT_DPI,
+)
+
+# Línea de tiempo de cada sesión (pirámide de tramos); router_frames agrega
+# aquí cada frame procesado con session_id.
+timeline_store = TimelineStore(
+    raw_rows=config.TIMELINE_RAW_ROWS,
+    base_seconds=config.TIMELINE_BASE_SECONDS,
+    factor=config.TIMELINE_LEVEL_FACTOR,
+    levels=config.TIMELINE_LEVELS,
+    max_bytes=config.TIMELINE_MEMORY_MB * 1024 * 1024,
+    oversample=config.TIMELINE_OVERSAMPLE,
+)
+
+
+@router.get("/sessions/{session_id}/events")
+async def session_events(
+    session_id: str,
+    request: Request,
+    max_rate: Optional[float] = Query(None, gt=0, description="Envíos por segundo como máximo"),
+):
+    """
+    Server-Sent Events con el estado de atención de la sesión.
+
+    Cada evento `state` trae la última respuesta de /process de la sesión.
+    Los estados que llegan más rápido que `max_rate` se coalescen: el
+    observador siempre recibe el más reciente, nunca una cola atrasada.
+    """
+    rate = min(max_rate or config.SSE_DEFAULT_RATE, config.SSE_MAX_RATE)
+    sub = session_broker.subscribe(session_id)
+    if sub is None:
+        raise HTTPException(status_code=503, detail="Demasiados observadores")
+
+    async def stream():
+        min_interval = 1.0 / rate
+        last_sent = 0.0
+        try:
+            yield "retry: 2000\n\n"
+            while not await request.is_disconnected():
+                item = await sub.next(timeout=config.SSE_KEEPALIVE_SECONDS)
+                if item is None:
+                    yield ": keepalive\n\n"
+                    continue
+
+                version, state = item
+                yield f"id: {version}\nevent: state\ndata: {json.dumps(state)}\n\n"
+                last_sent = time.monotonic()
+
+                # Límite de ritmo: lo que llegue mientras tanto se coalesce
+                wait = last_sent + min_interval - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+        finally:
+            sub.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.delete("/sessions/{session_id}", response_model=SessionEndResponse)
+def end_session(session_id: str):
+    """
+    Termina la sesión en este worker: guarda su calibración, libera su
+    línea de tiempo y devuelve los registros que cierran sus salidas
+    compactas (la ventana de rollup abierta, un período de
+    desconcentración en curso).
+    """
+    webm_headers.forget(session_id)
+    timeline_store.forget(session_id)
+    return SessionEndResponse(session_id=session_id, records=attention_processor.end_session(session_id))
+
+
+@router.get("/sessions/events/stats")
+def session_events_stats():
+    """Sesiones observadas, observadores conectados y estados publicados."""
+    return session_broker.stats()
+
+
+@router.get("/sessions/{session_id}/timeline", response_model=TimelineResponse)
+def session_timeline(
+    session_id: str,
+    from_: Optional[float] = Query(None, alias="from", description="Desde (segundos epoch)"),
+    to: Optional[float] = Query(None, description="Hasta (segundos epoch)"),
+    points: int = Query(config.TIMELINE_DEFAULT_POINTS, ge=2, le=config.TIMELINE_MAX_POINTS),
+    method: str = Query("lttb", pattern="^(lttb|minmax)$", description="lttb: forma; minmax: extremos por tramo"),
+    fields: Optional[str] = Query(None, description="Series separadas por coma (por defecto todas)"),
+):
+    """
+    Score, EAR, yaw y pitch de la sesión entre `from` y `to`, con
+    `points` puntos por serie como mucho. El tamaño y el costo de la
+    respuesta no dependen de la duración de la sesión.
+
+    La línea de tiempo vive en la memoria del worker: pasa con la sesión
+    cuando el gateway la traspasa, pero se pierde si el worker se reinicia.
+    """
+    try:
+        result = timeline_store.query(
+            session_id, from_, to, points, method,
+            fields=[f.strip() for f in fields.split(",") if f.strip()] if fields else None,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Sesión sin línea de tiempo en este proceso")
+    return result
+
+
+@router.get("/sessions/timeline/stats")
+def session_timeline_stats():
+    """Sesiones con línea de tiempo, memoria ocupada y consultas."""
+    return timeline_store.stats()
+
+
+@router.get(
+    "/sessions/{session_id}/report",
+    response_model=ReportResponse,
+    responses={202: {"model": ReportJobResponse}},
+)
+def session_report(session_id: str):
+    """
+    Reporte de una sesión guardada (REPORT_SESSIONS_DIR): análisis,
+    texto y gráfico. Si todavía no está dibujado responde 202 con el
+    trabajo encolado; volver a pedirlo cuando el trabajo termine.
+    """
+    if not report_service.enabled:
+        raise HTTPException(status_code=503, detail="Reportes deshabilitados (REPORT_SESSIONS_DIR)")
+    try:
+        result = report_service.request(session_id)
+    except ReportQueueFull:
+        raise HTTPException(status_code=503, detail="Demasiados reportes pendientes", headers={"Retry-After": "5"})
+    if result is None:
+        raise HTTPException(status_code=404, detail="Sesión no encontrada")
+
+    if result["status"] != "ready":
+        return JSONResponse(status_code=202, content=result, headers={"Retry-After": "1"})
+    return ReportResponse(
+        session_id=session_id,
+        key=result["key"],
+        chart_url=f"/sessions/{session_id}/report/chart.png",
+        analysis=result["analysis"],
+        text=result["text"],
+    )
+
+
+@router.get("/sessions/{session_id}/report/chart.png")
+def session_report_chart(session_id: str):
+    """Gráfico del reporte vigente (pedir antes /sessions/{id}/report)."""
+    path = report_service.chart_path(session_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Reporte no generado")
+    return FileResponse(path, media_type="image/png", headers={"Cache-Control": "private, max-age=3600"})
+
+
+@router.get("/reports/jobs/{job_id}", response_model=ReportJobResponse)
+def report_job(job_id: str):
+    job = report_service.job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+
+@router.get("/reports/stats")
+def report_stats():
+    """Trabajos por estado, aciertos de caché y reportes dibujados."""
+    return report_service.stats()
+
+
+def _check_handoff_token(token: Optional[str]) -> None:
+    if not (config.HANDOFF_TOKEN and token is not None and hmac.compare_digest(token, config.HANDOFF_TOKEN)):
+        raise HTTPException(status_code=403, detail="Token de traspaso inválido o deshabilitado")
+
 
-Si lo deseas, puedes eliminarlo completamente.
-"""
+@router.post("/sessions/{session_id}/state/export")
+def export_session_state(session_id: str, x_handoff_token: Optional[str] = Header(None)):
+    """
+    Traspaso de sesión (lo usa src/gateway.py): saca la sesión de este
+    worker y devuelve su estado serializado para instalarlo en otro con
+    PUT /sessions/{id}/state. Incluye la cabecera WebM de la sesión, así
+    los fragmentos siguientes de MediaRecorder se decodifican en el worker
+    nuevo, y su línea de tiempo. Requiere HANDOFF_TOKEN.
+    """
+    _check_handoff_token(x_handoff_token)
+    attachments = {}
+    header = webm_headers.get(session_id)
+    if header is not None:
+        attachments["webm_header"] = header
+    timeline = timeline_store.export(session_id)
+    if timeline is not None:
+        attachments["timeline"] = timeline
+    blob = attention_processor.export_session(session_id, attachments=attachments)
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Sesión no encontrada")
+    webm_headers.forget(session_id)
+    timeline_store.forget(session_id)
+    return Response(content=blob, media_type="application/octet-stream")
 
 
-@router.get("/info")
-def session_info():
-    return {
-        "message": "El sistema ya no utiliza sesiones. Todas las operaciones se hacen en tiempo real por frame."
-    }
+@router.put("/sessions/{session_id}/state", status_code=204)
+async def import_session_state(session_id: str, request: Request, x_handoff_token: Optional[str] = Header(None)):
+    """Instala en este worker el estado exportado por otro. Requiere HANDOFF_TOKEN."""
+    _check_handoff_token(x_handoff_token)
+    blob = await request.body()
+    try:
+        attachments = await run_in_threadpool(attention_processor.import_session, session_id, blob)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if "webm_header" in attachments:
+        webm_headers.put(session_id, attachments["webm_header"])
+    if "timeline" in attachments:
+        try:
+            timeline_store.install(session_id, attachments["timeline"])
+        except ValueError as e:
+            # Otra configuración de la pirámide: la sesión sigue sin su historia
+            print(f"⚠️ Línea de tiempo descartada para {session_id}:", e)
+    return Response(status_code=204)
@@ -1,6 +1,6 @@
 # backend/DESDECERO/src/api/schemas.py
 
-from typing import Optional
+from typing import Any, Dict, List, Literal, Optional
 from pydantic import BaseModel, Field
 
 
@@ -11,12 +11,43 @@ from pydantic import BaseModel, Field
 class ProcessFrameRequest(BaseModel):
     frame_number: int = Field(..., description="Número de frame enviado por el frontend")
     image_base64: str = Field(..., description="Imagen enviada en base64 desde la cámara")
+    session_id: Optional[str] = Field(None, description="Identificador de la sesión del cliente")
+    user_id: Optional[str] = Field(None, description="Usuario dueño del perfil de calibración EAR")
+    capture_ts: Optional[float] = Field(None, description="Instante de captura en el cliente (segundos epoch)")
+    output: Literal["full", "rollup", "events"] = Field(
+        "full", description="full: respuesta por frame; rollup: un registro por ventana; events: solo cambios"
+    )
+    profile: Optional[Literal["full", "balanced", "lite"]] = Field(
+        None, description="Perfil de pipeline para la sesión (por defecto el del despliegue)"
+    )
+    rollup_window: Optional[float] = Field(None, gt=0, description="Segundos por ventana en modo rollup")
+
+
+class ProcessSegmentParams(BaseModel):
+    """Parámetros (query) de POST /process/segment; el cuerpo es el video."""
+    session_id: Optional[str] = Field(None, description="Identificador de la sesión del cliente")
+    user_id: Optional[str] = Field(None, description="Usuario dueño del perfil de calibración EAR")
+    segment_number: int = Field(0, ge=0, description="Número de segmento enviado por el frontend")
+    first_frame_number: int = Field(0, description="frame_number del primer frame del segmento")
+    start_ts: Optional[float] = Field(None, description="Instante de captura del inicio del segmento (segundos epoch)")
+    sample_fps: Optional[float] = Field(None, gt=0, description="Frames por segundo a procesar del segmento")
+    output: Literal["full", "rollup", "events"] = "full"
+    profile: Optional[Literal["full", "balanced", "lite"]] = None
+    rollup_window: Optional[float] = Field(None, gt=0)
 
 
 # =========================
 #   Frames — Salida
 # =========================
 
+class PacingHintResponse(BaseModel):
+    """Ritmo sugerido para el próximo frame de la sesión."""
+    next_interval_ms: float
+    max_width: int
+    jpeg_quality: int
+    reason: str
+
+
 class ProcessFrameResponse(BaseModel):
     frame_number: int
     face_detected: bool
@@ -37,3 +68,158 @@ class ProcessFrameResponse(BaseModel):
     mar: Optional[float] = None
     is_blink: Optional[bool] = None
     is_yawn: Optional[bool] = None
+
+    # Frame atendido sin inferencia ("stale": había uno más nuevo en cola;
+    # "out_of_order": llegó después de uno posterior)
+    skipped: Optional[bool] = None
+    skip_reason: Optional[str] = None
+
+    pacing: Optional[PacingHintResponse] = None
+
+
+class CompactFrameResponse(BaseModel):
+    """Respuesta de los modos rollup/events: solo los registros emitidos."""
+    frame_number: int
+    face_detected: bool
+    records: List[Dict[str, Any]] = []
+    skipped: Optional[bool] = None
+    pacing: Optional[PacingHintResponse] = None
+
+
+class SegmentResponse(BaseModel):
+    """Resultados de un segmento: por frame (output=full) o los registros emitidos."""
+    segment_number: int
+    frames: int
+    face_frames: int
+    fps: float
+    decode_ms: float
+    process_ms: float
+    results: List[ProcessFrameResponse] = []
+    records: List[Dict[str, Any]] = []
+    pacing: Optional[PacingHintResponse] = None
+
+
+class SessionEndResponse(BaseModel):
+    """Cierre de una sesión: los registros que cierran sus salidas compactas."""
+    session_id: str
+    records: List[Dict[str, Any]] = []
+
+
+# =========================
+#   Caché — Estadísticas
+# =========================
+
+class CacheStatsResponse(BaseModel):
+    entries: int
+    max_entries: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
+
+
+class PacingStatsResponse(BaseModel):
+    enabled: bool
+    controller: str
+    target_fps: float
+    decisions: int
+    by_reason: Dict[str, int]
+    mean_interval_ms: Optional[float] = None
+    mean_recommended_fps: Optional[float] = None
+    load: Dict[str, Any]
+    sessions: Dict[str, PacingHintResponse]
+
+
+class SchedulerSessionStats(BaseModel):
+    weight: float
+    offered_fps: float
+    served_fps: float
+    served: int
+    dropped: int
+    queued: int
+    cost_ms: float
+
+
+class SchedulerStatsResponse(BaseModel):
+    enabled: bool
+    workers: int
+    target_fps: float
+    running: int
+    queued: int
+    dropped: Dict[str, int]
+    fairness_jain: Optional[float] = None
+    utilization: Optional[float] = None
+    queue_ms: Optional[float] = None
+    sessions: Dict[str, SchedulerSessionStats]
+
+
+class SessionMemoryEntry(BaseModel):
+    session_id: str
+    bytes: int
+
+
+class HibernationStoreStats(BaseModel):
+    kind: str
+    sessions: int
+    bytes: int
+    dropped: int
+
+
+class MemoryStatsResponse(BaseModel):
+    budget_bytes: int
+    session_bytes: int
+    live_sessions: int
+    max_sessions: int
+    mean_session_bytes: Optional[float] = None
+    largest_sessions: List[SessionMemoryEntry]
+    hibernating: int
+    store: Optional[HibernationStoreStats] = None
+    idle_seconds: float
+    landmark_graphs: int
+    process_rss_bytes: Optional[int] = None
+    hibernated: int
+    rehydrated: int
+    retired: int
+    restore_errors: int
+
+
+# =========================
+#   Reportes con gráficos
+# =========================
+
+class ReportJobResponse(BaseModel):
+    """Reporte encolado: consultar GET /reports/jobs/{job_id} y volver a pedirlo."""
+    job_id: str
+    session_id: str
+    status: Literal["pending", "done", "error"]
+    error: Optional[str] = None
+    submitted_at: float
+    finished_at: Optional[float] = None
+
+
+class ReportResponse(BaseModel):
+    status: Literal["ready"] = "ready"
+    session_id: str
+    key: str
+    chart_url: str
+    analysis: Dict[str, Any]
+    text: str
+
+
+class TimelineSeries(BaseModel):
+    t: List[float]          # segundos epoch
+    v: List[float]
+
+
+class TimelineResponse(BaseModel):
+    """Series de la sesión en [from, to] reducidas a `points` puntos como mucho."""
+    session_id: str
+    from_: float = Field(..., alias="from")
+    to: float
+    start: float
+    end: float
+    frames: int
+    points: int
+    method: Literal["lttb", "minmax"]
+    resolution_seconds: float   # 0 = frames sin agregar; si no, ancho de los tramos
+    series: Dict[str, TimelineSeries]
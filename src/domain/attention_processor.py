@@ -1,46 +1,731 @@
 # backend/DESDECERO/src/domain/attention_processor.py
 
 import base64
+import json
+import os
+import re
+import struct
+import sys
+import threading
 import time
-from typing import Optional, Dict, Any
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Callable, List
 
 import cv2
 import numpy as np
 import mediapipe as mp
 
+from src.domain import config
 from src.domain.metrics import MetricsCalculator
 from src.domain.classifier import AttentionClassifier
+from src.domain.landmark_backends import FaceMeshBackend, LandmarkBackend, build_landmark_backend
+from src.domain.pipeline_profiles import PipelineProfile, get_profile
+from src.domain.presence import PresenceGate
+from src.domain.rollups import build_emitter, emitter_from_dict
+from src.infrastructure.calibration_store import CalibrationProfileStore
+from src.infrastructure.data_collector import FLAG_STALE, LandmarkRecorder
+from src.infrastructure.session_hibernation import HibernationStore, build_hibernation_store, process_rss_bytes
+from src.infrastructure.tracing import span, traced
+from src.infrastructure.session_state import (
+    InProcessSessionStateBackend,
+    SessionStateBackend,
+    build_session_state_backend,
+)
+
+
+# Factor de reducción → bandera de imdecode (decodificación reducida de JPEG)
+_REDUCED_DECODE = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Cambiarlo invalida las sesiones hibernadas (cambió lo que se guarda)
+_HIBERNATION_FORMAT = 2
+# Cabecera del blob: marca, formato y largo del JSON de metadatos
+_HIBERNATION_MAGIC = b"AMSH"
+_HIBERNATION_HEADER = struct.Struct("<4sHI")
+# Tope del blob descomprimido (el historial ocupa unos pocos cientos de KB)
+_HIBERNATION_MAX_BYTES = 16 * 1024 * 1024
+# Emisores compactos por sesión (modo × ventana)
+_MAX_EMITTERS = 8
+
+# Objeto SessionContext, lock y diccionarios vacíos (aproximado)
+_CONTEXT_BYTES = 1024
+
+
+def _rollup_window(window: Optional[float]) -> Optional[float]:
+    """Ventana de rollup acotada y redondeada (None = la del despliegue)."""
+    if window is None:
+        return None
+    step = config.ROLLUP_WINDOW_STEP_SECONDS
+    window = min(max(window, config.ROLLUP_WINDOW_MIN_SECONDS), config.ROLLUP_WINDOW_MAX_SECONDS)
+    return max(round(round(window / step) * step, 6), step)
+
+
+def session_key(session_id: Optional[str], user_id: Optional[str]) -> Optional[str]:
+    """Clave de la sesión: session_id, o el usuario si no vino; None = sesión por defecto."""
+    return session_id or (f"user:{user_id}" if user_id else None)
+
+
+class SessionContext:
+    """
+    Estado temporal de una sesión (un cliente/cámara): su propio
+    MetricsCalculator y el usuario al que pertenece la calibración.
+    """
+
+    __slots__ = (
+        "session_id", "user_id", "metrics", "frames", "last_seen", "lock", "state_token",
+        "last_frame_number", "latest_frame_number", "last_timestamp", "skipped",
+        "emitters", "presence", "profile", "recorder", "footprint", "pins",
+    )
+
+    def __init__(self, session_id: Optional[str], user_id: Optional[str] = None):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.metrics = MetricsCalculator()
+        self.frames = 0
+        self.last_seen = time.time()
+        # Serializa los frames de la sesión: los que esperan aquí son su cola
+        self.lock = threading.RLock()
+        # Versión del estado compartido que refleja `metrics` (ver session_state)
+        self.state_token: Optional[bytes] = None
+
+        # Orden de llegada (frame_number del cliente)
+        self.last_frame_number = -1     # último frame atendido (procesado u omitido)
+        self.latest_frame_number = -1   # frame más nuevo que llegó
+        self.last_timestamp: Optional[float] = None
+        self.skipped = 0
+
+        # Salidas compactas (ver rollups): (modo, ventana) → emisor
+        self.emitters: Dict[tuple, Any] = {}
+
+        # Chequeo barato mientras no hay nadie frente a la cámara
+        self.presence = PresenceGate()
+
+        # Perfil de pipeline elegido por la sesión (None = el del despliegue)
+        self.profile: Optional[str] = None
+
+        # Grabación de landmarks (config.LANDMARK_RECORD_DIR)
+        self.recorder: Optional[LandmarkRecorder] = None
+
+        # Última medición de memory_bytes() y requests que la están usando
+        # (una sesión en uso no se elige para hibernar)
+        self.footprint = 0
+        self.pins = 0
+
+    def memory_bytes(self) -> int:
+        """Memoria aproximada del estado de la sesión (bytes)."""
+        n = _CONTEXT_BYTES + self.metrics.memory_bytes() + self.presence.memory_bytes()
+        for emitter in list(self.emitters.values()):
+            n += sys.getsizeof(emitter) + sys.getsizeof(getattr(emitter, "__dict__", {}))
+        return n
+
+    def flush_emitters(self) -> List[dict]:
+        """Cierra los emisores compactos (ventana abierta, distracción en curso)."""
+        records = []
+        for emitter in self.emitters.values():
+            records += emitter.flush()
+        self.emitters.clear()
+        return records
+
+    def hibernate(self, attachments: Optional[Dict[str, bytes]] = None) -> bytes:
+        """
+        Estado completo de la sesión, serializado y comprimido: métricas
+        (exportar_estado, binario), y en JSON el orden de frames, la
+        compuerta de presencia, los emisores compactos y el perfil. La
+        grabación no se incluye. Sin pickle: el blob puede venir de disco
+        o de otro worker y leerlo no ejecuta nada.
+
+        `attachments` (nombre → bytes) viaja sin interpretar: estado de la
+        sesión que vive fuera del procesador (p. ej. la cabecera WebM).
+        """
+        meta = {
+            "user_id": self.user_id,
+            "frames": self.frames,
+            "state_token": self.state_token.hex() if self.state_token is not None else None,
+            "last_frame_number": self.last_frame_number,
+            "latest_frame_number": self.latest_frame_number,
+            "last_timestamp": self.last_timestamp,
+            "skipped": self.skipped,
+            "profile": self.profile,
+            "presence": self.presence.to_dict(),
+            "emitters": [
+                {"mode": mode, "window": window, "state": emitter.to_dict()}
+                for (mode, window), emitter in self.emitters.items()
+            ],
+        }
+        if attachments:
+            meta["attachments"] = {k: base64.b64encode(v).decode("ascii") for k, v in attachments.items()}
+        meta_raw = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+        raw = _HIBERNATION_HEADER.pack(_HIBERNATION_MAGIC, _HIBERNATION_FORMAT, len(meta_raw))
+        return zlib.compress(raw + meta_raw + self.metrics.exportar_estado(), 1)
+
+    @classmethod
+    def from_hibernated(
+        cls, session_id: str, blob: bytes, attachments: Optional[Dict[str, bytes]] = None
+    ) -> "SessionContext":
+        """
+        Inversa de hibernate(); si se pasa `attachments`, se le agregan los
+        del blob. Lanza ValueError si el blob no es válido.
+        """
+        inflater = zlib.decompressobj()
+        try:
+            raw = inflater.decompress(blob, _HIBERNATION_MAX_BYTES)
+        except zlib.error as e:
+            raise ValueError(f"Sesión hibernada dañada: {e}") from e
+        if inflater.unconsumed_tail:
+            raise ValueError("Sesión hibernada demasiado grande")
+        if len(raw) < _HIBERNATION_HEADER.size:
+            raise ValueError("Sesión hibernada truncada")
+        magic, formato, meta_len = _HIBERNATION_HEADER.unpack_from(raw, 0)
+        if magic != _HIBERNATION_MAGIC or formato != _HIBERNATION_FORMAT:
+            raise ValueError(f"Formato de sesión hibernada desconocido: {formato}")
+
+        offset = _HIBERNATION_HEADER.size
+        try:
+            meta = json.loads(raw[offset:offset + meta_len].decode("utf-8"))
+            ctx = cls(session_id, meta["user_id"])
+            ctx.metrics.cargar_estado(raw[offset + meta_len:])
+            ctx.frames = int(meta["frames"])
+            token = meta["state_token"]
+            ctx.state_token = bytes.fromhex(token) if token is not None else None
+            ctx.last_frame_number = int(meta["last_frame_number"])
+            ctx.latest_frame_number = int(meta["latest_frame_number"])
+            ctx.last_timestamp = None if meta["last_timestamp"] is None else float(meta["last_timestamp"])
+            ctx.skipped = int(meta["skipped"])
+            ctx.profile = meta["profile"]
+            ctx.presence = PresenceGate.from_dict(meta["presence"])
+            for entry in meta["emitters"][:_MAX_EMITTERS]:
+                window = None if entry["window"] is None else float(entry["window"])
+                ctx.emitters[(entry["mode"], window)] = emitter_from_dict(entry["mode"], entry["state"])
+            if attachments is not None:
+                for name, value in meta.get("attachments", {}).items():
+                    attachments[str(name)] = base64.b64decode(value, validate=True)
+        except ValueError:
+            raise
+        except (KeyError, TypeError, AttributeError, struct.error) as e:
+            raise ValueError(f"Sesión hibernada inválida: {type(e).__name__}: {e}") from e
+        return ctx
 
 
 class AttentionProcessor:
     """
     Procesa un frame individual enviado por el frontend:
     - Decodifica base64
-    - Detecta rostro con MediaPipe FaceMesh
+    - Detecta rostro con el motor de landmarks configurado
+      (MediaPipe FaceMesh por defecto, ver landmark_backends.py)
     - Calcula métricas faciales (EAR, MAR, PERCLOS, etc.)
     - Clasifica nivel de atención según métricas
+
+    Cada session_id tiene su propio MetricsCalculator; los frames sin
+    session_id comparten la sesión por defecto (comportamiento histórico).
+    Si llega un user_id, la calibración EAR se precarga y se guarda en
+    `calibration_store`.
+
+    Con un `state_backend` externo el estado de cada sesión se sincroniza
+    antes de cada frame y se publica como delta después, así cualquier
+    réplica puede atender cualquier frame.
+
+    Las sesiones vivas respetan `memory_budget` (bytes, 0 = sin tope) y
+    config.MAX_SESIONES: al pasarse, y cuando una sesión lleva
+    `idle_seconds` sin frames, las más frías se hibernan en
+    `hibernation_store` y se rehidratan con su próximo frame. Sin
+    almacén se descartan (guardando la calibración).
+
+    Al terminar, traspasarse, o hibernarse por inactividad una sesión,
+    sus emisores compactos se cierran; los registros finales van a
+    `on_flush` (session_id, registros), si está configurado.
     """
 
-    def __init__(self):
-        self.metrics_calculator = MetricsCalculator()
+    def __init__(
+        self,
+        calibration_store: Optional[CalibrationProfileStore] = None,
+        state_backend: Optional[SessionStateBackend] = None,
+        landmark_backend: Optional[LandmarkBackend] = None,
+        hibernation_store: Optional[HibernationStore] = None,
+        memory_budget: int = 0,
+        idle_seconds: float = 0.0,
+        sweep_seconds: float = 5.0,
+        on_flush: Optional[Callable[[str, List[dict]], None]] = None,
+    ):
         self.classifier = AttentionClassifier()
+        self.calibration_store = calibration_store
+        self.state_backend = state_backend or InProcessSessionStateBackend()
+
+        # Presupuesto de memoria de las sesiones vivas
+        self.hibernation_store = hibernation_store
+        self.memory_budget = memory_budget
+        self.idle_seconds = idle_seconds
+        self.sweep_seconds = sweep_seconds
+        self._session_bytes = 0
+        self._hibernating: Dict[str, SessionContext] = {}
+        # Sesiones que un hilo está cargando en frío (ver _get_session)
+        self._loading: Dict[str, threading.Event] = {}
+        self._sweep_lock = threading.Lock()
+        self._last_sweep = time.time()
+        self.memory_counters = {"hibernated": 0, "rehydrated": 0, "retired": 0, "restore_errors": 0}
+        self.on_flush = on_flush
 
-        # MediaPipe FaceMesh (instancia única para todo el servidor)
-        self.mp_face = mp.solutions.face_mesh
-        self.face_mesh = self.mp_face.FaceMesh(
-            max_num_faces=1,
-            refine_landmarks=True,
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5,
-        )
+        # Sesión por defecto (frames sin session_id)
+        self.default_session = SessionContext(None)
+        self.metrics_calculator = self.default_session.metrics
+
+        # Sesiones vivas (LRU acotado por config.MAX_SESIONES)
+        self.sessions: "OrderedDict[str, SessionContext]" = OrderedDict()
+        self._sessions_lock = threading.Lock()
+        self._detector_lock = threading.Lock()
+
+        # Motor de landmarks (instancia única para todo el servidor).
+        # El grafo se crea al primer frame: importar el módulo no lo levanta.
+        self.landmarks = landmark_backend or build_landmark_backend()
+        self._lite_landmarks = None
+        self._face_detector = None
+
+    @property
+    def face_detector(self):
+        # Detector de corto alcance para la compuerta de presencia
+        if self._face_detector is None:
+            self._face_detector = mp.solutions.face_detection.FaceDetection(
+                model_selection=0,
+                min_detection_confidence=0.5,
+            )
+        return self._face_detector
+
+    # ---------------------------------------------------------
+    # Sesiones
+    # ---------------------------------------------------------
+    def get_session(self, session_id: Optional[str] = None, user_id: Optional[str] = None) -> SessionContext:
+        """
+        Devuelve (o crea) el contexto de la sesión. Sin session_id pero con
+        user_id, la sesión se identifica por el usuario.
+        """
+        return self._get_session(session_id, user_id, pin=False)
+
+    @contextmanager
+    def _using_session(self, session_id: Optional[str], user_id: Optional[str]):
+        """get_session que además impide hibernar la sesión mientras se usa."""
+        ctx = self._get_session(session_id, user_id, pin=True)
+        try:
+            yield ctx
+        finally:
+            if ctx is not self.default_session:
+                with self._sessions_lock:
+                    ctx.pins -= 1
+
+    def _get_session(self, session_id: Optional[str], user_id: Optional[str], pin: bool) -> SessionContext:
+        key = session_key(session_id, user_id)
+        if key is None:
+            return self.default_session
+
+        cold: List[SessionContext] = []
+        while True:
+            with self._sessions_lock:
+                ctx = self.sessions.get(key)
+                if ctx is not None:
+                    self.sessions.move_to_end(key)
+                    ctx.last_seen = time.time()
+                    ctx.pins += pin
+                    break
+                # Si se estaba hibernando, vuelve tal cual (la hibernación se cancela)
+                ctx = self._hibernating.pop(key, None)
+                if ctx is not None:
+                    cold = self._install(key, ctx, pin)
+                    break
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    break
+            # Otro hilo la está cargando: esperar y volver a buscarla
+            loading.wait()
+
+        if ctx is None:
+            # Carga en frío (almacén de hibernación, calibración, grabador)
+            # fuera de _sessions_lock: no frena a las demás sesiones
+            try:
+                loaded = self._new_session(key, user_id)
+                with self._sessions_lock:
+                    ctx = self.sessions.get(key)
+                    if ctx is None:
+                        ctx = loaded
+                        cold = self._install(key, ctx, pin)
+                    else:
+                        # Otro hilo la instaló mientras tanto (import_session): gana esa
+                        self.sessions.move_to_end(key)
+                        ctx.last_seen = time.time()
+                        ctx.pins += pin
+            finally:
+                with self._sessions_lock:
+                    del self._loading[key]
+                loading.set()
+            if ctx is not loaded and loaded.recorder is not None:
+                loaded.recorder.save()
+
+        for old in cold:
+            self._hibernate(old)
+        if time.time() - self._last_sweep >= self.sweep_seconds:
+            self.sweep()
+        return ctx
+
+    def _install(self, key: str, ctx: SessionContext, pin: bool) -> List[SessionContext]:
+        """Agrega la sesión a la tabla (con _sessions_lock); devuelve las que sobran."""
+        ctx.last_seen = time.time()
+        ctx.pins += pin
+        ctx.footprint = ctx.memory_bytes()
+        self.sessions[key] = ctx
+        self._session_bytes += ctx.footprint
+        return self._over_budget()
+
+    def _wait_loading(self, key: str) -> None:
+        """Espera a que termine la carga en frío de la sesión, si hay una en curso."""
+        while True:
+            with self._sessions_lock:
+                loading = self._loading.get(key)
+            if loading is None:
+                return
+            loading.wait()
+
+    def end_session(self, session_id: str) -> List[dict]:
+        """
+        Descarta la sesión guardando antes su calibración. Devuelve los
+        registros que cierran sus emisores compactos.
+        """
+        self._wait_loading(session_id)
+        with self._sessions_lock:
+            ctx = self._drop(session_id)
+        if ctx is None:
+            # Hibernada: se rehidrata solo para cerrarla
+            ctx = self._rehydrate(session_id)
+        elif self.hibernation_store is not None:
+            self.hibernation_store.discard(session_id)
+        if ctx is None:
+            return []
+        with ctx.lock:
+            records = self._flush(ctx)
+        self._retire(ctx)
+        return records
+
+    def _flush(self, ctx: SessionContext) -> List[dict]:
+        """Cierra los emisores de la sesión (con ctx.lock) y entrega los registros."""
+        return self._deliver(ctx, ctx.flush_emitters())
+
+    def _deliver(self, ctx: SessionContext, records: List[dict]) -> List[dict]:
+        if records and self.on_flush is not None and ctx.session_id is not None:
+            try:
+                self.on_flush(ctx.session_id, records)
+            except Exception as e:
+                print(f"⚠️ on_flush falló para la sesión {ctx.session_id}:", e)
+        return records
+
+    def _retire(self, ctx: SessionContext) -> None:
+        self._save_calibration(ctx)
+        if ctx.recorder is not None:
+            ctx.recorder.save()
+
+    # ---------------------------------------------------------
+    # Presupuesto de memoria e hibernación
+    # ---------------------------------------------------------
+    def _over_budget(self) -> List[SessionContext]:
+        """Saca de la tabla las sesiones más frías que sobran (con _sessions_lock)."""
+        cold = []
+        for key, ctx in list(self.sessions.items()):
+            if not (
+                len(self.sessions) > config.MAX_SESIONES
+                or (self.memory_budget and self._session_bytes > self.memory_budget)
+            ):
+                break
+            if ctx.pins == 0:
+                self._detach(key, ctx)
+                cold.append(ctx)
+        return cold
+
+    def _drop(self, key: str) -> Optional[SessionContext]:
+        """Quita la sesión de la tabla sin guardarla (con _sessions_lock)."""
+        ctx = self._hibernating.pop(key, None)
+        live = self.sessions.pop(key, None)
+        if live is not None:
+            self._session_bytes -= live.footprint
+        return live or ctx
+
+    def _detach(self, key: str, ctx: SessionContext) -> None:
+        del self.sessions[key]
+        self._session_bytes -= ctx.footprint
+        self._hibernating[key] = ctx
+
+    def sweep(self) -> None:
+        """
+        Vuelve a medir las sesiones vivas e hiberna las que llevan
+        `idle_seconds` sin frames y las que sobran del presupuesto.
+        """
+        if not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            now = time.time()
+            self._last_sweep = now
+            idle, cold = [], []
+            with self._sessions_lock:
+                self._session_bytes = 0
+                for ctx in self.sessions.values():
+                    ctx.footprint = ctx.memory_bytes()
+                    self._session_bytes += ctx.footprint
+                if self.idle_seconds > 0:
+                    # Orden LRU: las primeras son las que hace más que no se usan
+                    for key, ctx in list(self.sessions.items()):
+                        if now - ctx.last_seen < self.idle_seconds:
+                            break
+                        if ctx.pins == 0:
+                            self._detach(key, ctx)
+                            idle.append(ctx)
+                cold += self._over_budget()
+            # El cliente de una sesión inactiva probablemente ya no está
+            for ctx in idle:
+                self._hibernate(ctx, flush=True)
+            for ctx in cold:
+                self._hibernate(ctx)
+        finally:
+            self._sweep_lock.release()
+
+    def _hibernate(self, ctx: SessionContext, flush: bool = False) -> None:
+        """
+        Serializa la sesión al almacén cuando termina su frame en curso.
+        Si un frame la reclama mientras tanto (get_session), queda viva
+        y el blob se descarta.
+
+        Los emisores compactos se cierran con `flush` (sesión inactiva) o
+        si no hay almacén; si no viajan en el blob y siguen al volver.
+        """
+        key = ctx.session_id
+        with ctx.lock:
+            with self._sessions_lock:
+                if self._hibernating.get(key) is not ctx:
+                    return
+            self._save_calibration(ctx)
+            if flush or self.hibernation_store is None:
+                self._flush(ctx)
+            if self.hibernation_store is not None:
+                self.hibernation_store.put(key, ctx.hibernate())
+
+            with self._sessions_lock:
+                committed = self._hibernating.get(key) is ctx
+                if committed:
+                    del self._hibernating[key]
+                    self.memory_counters["hibernated" if self.hibernation_store is not None else "retired"] += 1
+            if not committed:
+                if self.hibernation_store is not None:
+                    self.hibernation_store.discard(key)
+                return
+
+            if ctx.recorder is not None:
+                ctx.recorder.save()
+
+    def _rehydrate(self, session_id: str) -> Optional[SessionContext]:
+        if self.hibernation_store is None:
+            return None
+        blob = self.hibernation_store.take(session_id)
+        if blob is None:
+            return None
+        try:
+            ctx = SessionContext.from_hibernated(session_id, blob)
+        except Exception as e:
+            # Formato viejo o archivo dañado: la sesión empieza de cero
+            print(f"⚠️ No se pudo rehidratar la sesión {session_id}:", e)
+            self.memory_counters["restore_errors"] += 1
+            return None
+        self.memory_counters["rehydrated"] += 1
+        return ctx
+
+    # ---------------------------------------------------------
+    # Traspaso de sesiones entre workers (ver src/gateway.py)
+    # ---------------------------------------------------------
+    def export_session(
+        self, session_id: str, wait: float = 5.0, attachments: Optional[Dict[str, bytes]] = None
+    ) -> Optional[bytes]:
+        """
+        Saca la sesión de este proceso y devuelve su estado en el formato
+        de hibernación, con `attachments` (ver SessionContext.hibernate).
+        Espera (hasta `wait` s) a que terminen los frames en curso. None si
+        este proceso no tiene la sesión.
+        """
+        deadline = time.monotonic() + wait
+        self._wait_loading(session_id)
+        while True:
+            with self._sessions_lock:
+                ctx = self.sessions.get(session_id)
+                if ctx is None or ctx.pins == 0 or time.monotonic() >= deadline:
+                    if ctx is not None:
+                        self._detach(session_id, ctx)
+                    else:
+                        ctx = self._hibernating.get(session_id)
+                    break
+            time.sleep(0.005)
+
+        if ctx is None:
+            blob = self.hibernation_store.take(session_id) if self.hibernation_store is not None else None
+            if blob is None or not attachments:
+                return blob
+            try:
+                ctx = SessionContext.from_hibernated(session_id, blob)
+            except ValueError:
+                return blob
+            return ctx.hibernate(attachments)
+
+        with ctx.lock:
+            with self._sessions_lock:
+                if self._hibernating.get(session_id) is not ctx:
+                    return None
+                del self._hibernating[session_id]
+            self._flush(ctx)
+            blob = ctx.hibernate(attachments)
+        self._retire(ctx)
+        return blob
+
+    def import_session(self, session_id: str, blob: bytes) -> Dict[str, bytes]:
+        """
+        Instala una sesión exportada por otro worker. Reemplaza lo que
+        este proceso tuviera de ella (estado más viejo) y devuelve los
+        attachments del blob. Lanza ValueError si el blob no es válido.
+        """
+        attachments: Dict[str, bytes] = {}
+        try:
+            ctx = SessionContext.from_hibernated(session_id, blob, attachments)
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Estado de sesión inválido: {e}") from e
+        self._wait_loading(session_id)
+        if self.hibernation_store is not None:
+            self.hibernation_store.discard(session_id)
+        with self._sessions_lock:
+            old = self._drop(session_id)
+        if old is not None and old.recorder is not None:
+            old.recorder.save()
+        self._attach_recorder(ctx)
+
+        with self._sessions_lock:
+            self._drop(session_id)
+            cold = self._install(session_id, ctx, pin=False)
+        for c in cold:
+            self._hibernate(c)
+        return attachments
+
+    def memory_stats(self) -> dict:
+        """Memoria del nodo: sesiones vivas, hibernadas y proceso."""
+        with self._sessions_lock:
+            live = len(self.sessions)
+            session_bytes = self._session_bytes
+            largest = sorted(
+                ((ctx.footprint, key) for key, ctx in self.sessions.items()), reverse=True
+            )[:5]
+            hibernating = len(self._hibernating)
+        graphs = 1 + (self._lite_landmarks is not None)
+        return {
+            "budget_bytes": self.memory_budget,
+            "session_bytes": session_bytes,
+            "live_sessions": live,
+            "max_sessions": config.MAX_SESIONES,
+            "mean_session_bytes": session_bytes / live if live else None,
+            "largest_sessions": [{"session_id": key, "bytes": n} for n, key in largest],
+            "hibernating": hibernating,
+            "store": self.hibernation_store.stats() if self.hibernation_store is not None else None,
+            "idle_seconds": self.idle_seconds,
+            "landmark_graphs": graphs,
+            "process_rss_bytes": process_rss_bytes(),
+            **self.memory_counters,
+        }
+
+    def _new_session(self, session_id: str, user_id: Optional[str]) -> SessionContext:
+        ctx = self._rehydrate(session_id)
+        if ctx is not None:
+            if user_id and ctx.user_id is None:
+                ctx.user_id = user_id
+            self._attach_recorder(ctx)
+            return ctx
+
+        ctx = SessionContext(session_id, user_id)
+
+        if user_id and self.calibration_store is not None:
+            ctx.metrics.recalibracion_continua = True
+            profile = self.calibration_store.get(user_id)
+            if profile is not None:
+                ctx.metrics.aplicar_perfil(profile.to_dict())
+
+        self._attach_recorder(ctx)
+        return ctx
+
+    @staticmethod
+    def _attach_recorder(ctx: SessionContext) -> None:
+        # Al rehidratar, el grabador reabre el archivo y sigue agregando chunks
+        if config.LANDMARK_RECORD_DIR:
+            name = re.sub(r"[^A-Za-z0-9_.-]", "_", ctx.session_id)
+            ctx.recorder = LandmarkRecorder(
+                os.path.join(config.LANDMARK_RECORD_DIR, f"{name}.lmk"),
+                dtype=config.LANDMARK_RECORD_DTYPE,
+            )
+            # Punto de partida para replay_landmarks: calibración precargada
+            # o estado rehidratado, y el perfil de pipeline vigente
+            ctx.recorder.annotate(
+                estado=base64.b64encode(ctx.metrics.exportar_estado()).decode("ascii"),
+                calibracion=ctx.metrics.exportar_perfil(),
+                recalibracion_continua=ctx.metrics.recalibracion_continua,
+                profile=get_profile(ctx.profile).name,
+            )
+
+    @staticmethod
+    def _record(ctx: SessionContext, perfil: PipelineProfile, *args, **kwargs) -> None:
+        if ctx.recorder is None:
+            return
+        if ctx.recorder.meta.get("profile") != perfil.name:
+            ctx.recorder.annotate(profile=perfil.name)
+        ctx.recorder.record(*args, **kwargs)
+
+    def _save_calibration(self, ctx: SessionContext) -> None:
+        if not ctx.user_id or self.calibration_store is None:
+            return
+        perfil = ctx.metrics.exportar_perfil()
+        if perfil is not None:
+            self.calibration_store.save(ctx.user_id, perfil)
+
+    def summarize(
+        self,
+        mode: str,
+        t: float,
+        frame: Dict[str, Any],
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        window: Optional[float] = None,
+    ) -> List[dict]:
+        """
+        Pasa el resultado del frame por el emisor compacto de la sesión
+        ("rollup" o "events") y devuelve los registros a reenviar.
+
+        La ventana se acota a [ROLLUP_WINDOW_MIN_SECONDS,
+        ROLLUP_WINDOW_MAX_SECONDS] y se redondea a ROLLUP_WINDOW_STEP_SECONDS;
+        con más de _MAX_EMITTERS combinaciones se cierra la menos reciente.
+        """
+        key = (mode, _rollup_window(window) if mode == "rollup" else None)
+        with self._using_session(session_id, user_id) as ctx:
+            with ctx.lock:
+                emitter = ctx.emitters.pop(key, None)
+                if emitter is None:
+                    emitter = build_emitter(*key)
+                    while len(ctx.emitters) >= _MAX_EMITTERS:
+                        oldest = next(iter(ctx.emitters))
+                        self._deliver(ctx, ctx.emitters.pop(oldest).flush())
+                # Al final: el orden del dict es el de uso
+                ctx.emitters[key] = emitter
+                return emitter.add(t, frame)
 
     # ---------------------------------------------------------
     # Decodificar imagen base64 a frame OpenCV
     # ---------------------------------------------------------
-    def _decode_base64_image(self, image_base64: str) -> Optional[np.ndarray]:
+    @traced("_decode_base64_image")
+    def _decode_base64_image(self, image_base64: str, flags: int = cv2.IMREAD_COLOR) -> Optional[np.ndarray]:
         """
         Recibe un string Base64 (con o sin prefijo data:image/...) y
-        devuelve un frame en formato BGR.
+        devuelve un frame en formato BGR (reducido si `flags` lo pide).
         """
         try:
             # Eliminar prefijo si viene como data:image/jpeg;base64,...
@@ -49,7 +734,7 @@ class AttentionProcessor:
 
             img_bytes = base64.b64decode(image_base64)
             np_buffer = np.frombuffer(img_bytes, np.uint8)
-            img = cv2.imdecode(np_buffer, cv2.IMREAD_COLOR)
+            img = cv2.imdecode(np_buffer, flags)
             return img
         except Exception:
             return None
@@ -57,7 +742,17 @@ class AttentionProcessor:
     # ---------------------------------------------------------
     # Procesar frame completo
     # ---------------------------------------------------------
-    def process_base64_frame(self, image_base64: str) -> Optional[Dict[str, Any]]:
+    @traced("process_base64_frame")
+    def process_base64_frame(
+        self,
+        image_base64: str,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        timings: Optional[Dict[str, float]] = None,
+        frame_number: Optional[int] = None,
+        capture_ts: Optional[float] = None,
+        profile: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
         """
         Procesa un frame individual y devuelve:
         {
@@ -66,41 +761,269 @@ class AttentionProcessor:
         }
 
         Si NO se detecta rostro → devuelve None.
+
+        Si se pasa `timings`, se completa con la duración (ms) de cada
+        etapa: decode, landmarks, metrics, classify (y presence mientras
+        la sesión está en modo ausente, ver presence.py).
+
+        Con session_id y frame_number los frames de la sesión se atienden
+        en orden. Devuelve {"skipped": motivo} cuando el frame:
+        - "out_of_order": es anterior a uno ya atendido (se descarta), o
+        - "stale": ya hay uno más nuevo en cola; no se corre la inferencia,
+          pero su instante igual extiende las ventanas temporales.
+
+        `capture_ts` es el instante de captura en el cliente (segundos);
+        si no llega se usa la hora de llegada.
+
+        `profile` elige el perfil de pipeline (ver pipeline_profiles.py);
+        con session_id queda fijado para los frames siguientes.
         """
+        with self._using_session(session_id, user_id) as ctx:
+            perfil = self._profile_for(ctx, profile)
+            # único propósito: PERCLOS y parpadeos
+            timestamp = capture_ts if capture_ts is not None else time.time()
+
+            if ctx.session_id is None or frame_number is None:
+                return self._decode_and_process(ctx, image_base64, timestamp, timings, perfil)
+
+            self._note_arrival(ctx, frame_number)
+            with ctx.lock:
+                if self._is_out_of_order(ctx, frame_number, timestamp):
+                    ctx.skipped += 1
+                    return {"skipped": "out_of_order"}
+
+                ctx.last_frame_number = frame_number
+                ctx.last_timestamp = timestamp
+
+                if config.STALE_FRAME_SKIP and ctx.latest_frame_number > frame_number:
+                    ctx.skipped += 1
+                    self._run_metrics(ctx, lambda calc: calc.registrar_frame_omitido(timestamp))
+                    self._record(ctx, perfil, timestamp, 0, 0, flags=FLAG_STALE)
+                    return {"skipped": "stale"}
 
-        frame = self._decode_base64_image(image_base64)
+                return self._decode_and_process(ctx, image_base64, timestamp, timings, perfil)
+
+    def _decode_and_process(self, ctx, image_base64, timestamp, timings, perfil):
+        if self._gate_applies(ctx):
+            # Sesión ausente: decodificar reducido y chequear barato primero
+            t0 = time.perf_counter()
+            with span("presence"):
+                small = self._decode_base64_image(image_base64, _REDUCED_DECODE[config.PRESENCE_SCALE])
+                present = small is not None and self._likely_present(ctx, small, timestamp)
+            if timings is not None:
+                timings["presence"] = (time.perf_counter() - t0) * 1000
+            if not present:
+                return None
+
+        t0 = time.perf_counter()
+        frame = self._decode_base64_image(image_base64, _REDUCED_DECODE[perfil.decode_scale])
+        if timings is not None:
+            timings["decode"] = (time.perf_counter() - t0) * 1000
         if frame is None:
             return None
 
+        return self._process_decoded(ctx, frame, timestamp, timings, perfil)
+
+    # ---------------------------------------------------------
+    # Orden de frames por sesión
+    # ---------------------------------------------------------
+    def _note_arrival(self, ctx: SessionContext, frame_number: int) -> None:
+        with self._sessions_lock:
+            if ctx.latest_frame_number - frame_number > config.FRAME_NUMBER_RESET_GAP:
+                # El cliente reinició la numeración
+                ctx.latest_frame_number = frame_number
+            else:
+                ctx.latest_frame_number = max(ctx.latest_frame_number, frame_number)
+
+    def _is_out_of_order(self, ctx: SessionContext, frame_number: int, timestamp: float) -> bool:
+        if ctx.last_frame_number - frame_number > config.FRAME_NUMBER_RESET_GAP:
+            ctx.last_frame_number = -1
+            ctx.last_timestamp = None
+            return False
+        if frame_number <= ctx.last_frame_number:
+            return True
+        return ctx.last_timestamp is not None and timestamp < ctx.last_timestamp
+
+    # ---------------------------------------------------------
+    # Procesar frame ya decodificado (BGR)
+    # ---------------------------------------------------------
+    @traced("process_frame")
+    def process_frame(
+        self,
+        frame: np.ndarray,
+        timestamp: Optional[float] = None,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        timings: Optional[Dict[str, float]] = None,
+        profile: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Igual que process_base64_frame pero recibe un frame BGR ya
+        decodificado (p. ej. leído de un video con OpenCV).
+
+        `timestamp` es el instante del frame en segundos; si no se indica
+        se usa la hora de llegada.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self._using_session(session_id, user_id) as ctx:
+            perfil = self._profile_for(ctx, profile)
+            if perfil.decode_scale > 1:
+                scale = 1.0 / perfil.decode_scale
+                frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            if self._gate_applies(ctx):
+                scale = 1.0 / config.PRESENCE_SCALE
+                small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                if not self._likely_present(ctx, small, timestamp):
+                    return None
+            return self._process_decoded(ctx, frame, timestamp, timings, perfil)
+
+    # ---------------------------------------------------------
+    # Perfiles de pipeline (ver pipeline_profiles.py)
+    # ---------------------------------------------------------
+    def _profile_for(self, ctx: SessionContext, profile: Optional[str]) -> PipelineProfile:
+        if profile is not None and ctx.session_id is not None:
+            ctx.profile = profile
+        return get_profile(profile or ctx.profile)
+
+    def _landmarks_for(self, perfil: PipelineProfile) -> LandmarkBackend:
+        # Sin refinamiento de iris: FaceMesh aparte (los demás motores no lo distinguen)
+        if perfil.refine_landmarks or not isinstance(self.landmarks, FaceMeshBackend) \
+                or not self.landmarks.refine_landmarks:
+            return self.landmarks
+        if self._lite_landmarks is None:
+            self._lite_landmarks = FaceMeshBackend(refine_landmarks=False)
+        return self._lite_landmarks
+
+    # ---------------------------------------------------------
+    # Compuerta de presencia (ver presence.py)
+    # ---------------------------------------------------------
+    def _gate_applies(self, ctx: SessionContext) -> bool:
+        # La sesión por defecto mezcla clientes: sin compuerta
+        return config.PRESENCE_GATE and ctx.session_id is not None and ctx.presence.gated
+
+    def _likely_present(self, ctx: SessionContext, small: np.ndarray, timestamp: float) -> bool:
+        with ctx.lock:
+            return ctx.presence.needs_landmarks(small, timestamp, detect=self._detect_face)
+
+    def _detect_face(self, small: np.ndarray) -> bool:
+        rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        with self._detector_lock:
+            results = self.face_detector.process(rgb)
+        return bool(results.detections)
+
+    def _process_decoded(self, ctx, frame, timestamp, timings, perfil):
         h, w = frame.shape[:2]
+        t0 = time.perf_counter()
         rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 
-        # Procesar landmarks
-        results = self.face_mesh.process(rgb)
-        if not results.multi_face_landmarks:
+        # Procesar landmarks (el motor serializa sus llamadas)
+        with span("landmarks", backend=type(self.landmarks).__name__):
+            detected = self._landmarks_for(perfil).detect(rgb, timestamp)
+        if timings is not None:
+            timings["landmarks"] = (time.perf_counter() - t0) * 1000
+
+        found = detected is not None
+        if ctx.session_id is not None:
+            with ctx.lock:
+                ctx.presence.record(found, timestamp)
+        if not found:
+            self._record(ctx, perfil, timestamp, w, h)
             return None
 
-        landmarks = results.multi_face_landmarks[0].landmark
-        puntos = [(lm.x * w, lm.y * h, lm.z * w) for lm in landmarks]
-        timestamp = time.time()  # único propósito: PERCLOS y parpadeos
+        # Normalizados → píxeles (z en escala del ancho)
+        puntos = (detected.points * (w, h, w)).tolist()
 
-        # 1) Calcular métricas crudas
-        #    ⚠️ IMPORTANTE: usar argumentos POSICIONALES para coincidir con MetricsCalculator
-        metrics = self.metrics_calculator.procesar_frame(
-            puntos,  # lm
-            w,       # ancho
-            h,       # alto
-            timestamp=timestamp,
-        )
+        t0 = time.perf_counter()
+        with ctx.lock:
+            calibrado_antes = ctx.metrics.calibracion_completa
+
+            # 1) Calcular métricas crudas
+            #    ⚠️ IMPORTANTE: usar argumentos POSICIONALES para coincidir con MetricsCalculator
+            metrics = self._run_metrics(
+                ctx,
+                lambda calc: calc.procesar_frame(
+                    puntos,  # lm
+                    w,       # ancho
+                    h,       # alto
+                    timestamp=timestamp,
+                    perfil=perfil,
+                ),
+            )
+            ctx.frames += 1
+            ctx.last_seen = time.time()
+
+            # Guardar el perfil al terminar la calibración y luego periódicamente
+            if ctx.user_id and metrics.get("calibrado") and (
+                not calibrado_antes or ctx.frames % config.CALIBRATION_SAVE_EVERY == 0
+            ):
+                self._save_calibration(ctx)
+
+        t1 = time.perf_counter()
 
         # 2) Clasificar nivel de atención mediante reglas/ML
-        attention_result = self.classifier.clasificar(metrics)
+        attention_result = self.classifier.clasificar(metrics, perfil)
+
+        if timings is not None:
+            timings["metrics"] = (t1 - t0) * 1000
+            timings["classify"] = (time.perf_counter() - t1) * 1000
+
+        self._record(ctx, perfil, timestamp, w, h, detected.points, metrics, attention_result)
 
         return {
             "metrics": metrics,
             "attention_result": attention_result,
         }
 
+    def _run_metrics(self, ctx: SessionContext, step):
+        """
+        Ejecuta `step(calculadora)` sobre el estado vigente de la sesión.
+        Con backend externo: sincroniza, ejecuta y publica el delta con
+        compare-and-swap; si otra réplica ganó, recarga y reintenta.
+        """
+        if ctx.session_id is None:
+            return step(ctx.metrics)
+
+        for _ in range(config.SESSION_STATE_MAX_RETRIES):
+            with span("state.sync"):
+                ctx.state_token = self.state_backend.sync(ctx.session_id, ctx.metrics, ctx.state_token)
+            desde_total = ctx.metrics.historial.total
+
+            result = step(ctx.metrics)
+
+            with span("state.commit"):
+                token = self.state_backend.commit(ctx.session_id, ctx.metrics, ctx.state_token, desde_total)
+            if token is not None:
+                ctx.state_token = token
+                return result
+
+            # Conflicto: el estado local quedó adelantado sobre una versión vieja
+            ctx.state_token = None
+            ctx.metrics = MetricsCalculator()
+
+        raise RuntimeError(f"Conflicto persistente de estado en la sesión {ctx.session_id}")
+
 
 # Instancia global para todo el backend
-attention_processor = AttentionProcessor()
+attention_processor = AttentionProcessor(
+    calibration_store=CalibrationProfileStore(
+        config.CALIBRATION_DB_PATH or None,
+        ttl_seconds=config.CALIBRATION_TTL_SECONDS,
+        max_profiles=config.CALIBRATION_MAX_PROFILES,
+    ),
+    state_backend=build_session_state_backend(
+        config.SESSION_STATE_BACKEND,
+        path=config.SESSION_STATE_PATH,
+        snapshot_every=config.SESSION_STATE_SNAPSHOT_EVERY,
+    ),
+    hibernation_store=build_hibernation_store(
+        config.SESSION_HIBERNATION_STORE,
+        directory=config.SESSION_HIBERNATION_DIR,
+        max_bytes=int(config.SESSION_HIBERNATION_MEMORY_MB * 1024 * 1024),
+        ttl_seconds=config.SESSION_HIBERNATION_TTL_SECONDS,
+    ),
+    memory_budget=int(config.SESSION_MEMORY_BUDGET_MB * 1024 * 1024),
+    idle_seconds=config.SESSION_IDLE_SECONDS,
+    sweep_seconds=config.SESSION_MEMORY_SWEEP_SECONDS,
+)
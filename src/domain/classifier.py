@@ -15,6 +15,33 @@ Mejoras aplicadas:
 """
 
 from src.domain import config
+from src.infrastructure.tracing import traced
+
+
+def nivel_desde_estado(estado):
+    """
+    Convierte el estado interno del clasificador en el nivel textual
+    expuesto por la API (AttentionLevel).
+    """
+    if estado == "CONCENTRADO":
+        return config.AttentionLevel.CONCENTRADO.value
+    if estado == "BAJA_ATENCION":
+        return config.AttentionLevel.BAJA_ATENCION.value
+    return config.AttentionLevel.DESCONCENTRACION_SEVERA.value
+
+
+# Detalle → peso en config.PESOS (yaw y pitch comparten el de pose)
+_PESO_DETALLE = {
+    "ear": "ear",
+    "perclos": "perclos",
+    "parpadeos": "parpadeos_min",
+    "yaw": "pose",
+    "pitch": "pose",
+    "gaze_focus": "gaze_focus",
+    "gaze_dispersion": "gaze_dispersion",
+    "eye_opening": "eye_opening",
+    "mar": "mar",
+}
 
 
 class AttentionClassifier:
@@ -189,11 +216,22 @@ class AttentionClassifier:
     #  CLASIFICACIÓN FINAL
     # =========================================================================
 
-    def clasificar(self, m):
+    @traced("clasificar")
+    def clasificar(self, m, perfil=None):
         """
         Recibe las métricas crudas y devuelve una clasificación general
         por frame.
+
+        Con un `perfil` (PipelineProfile) solo se evalúan las métricas que
+        ese perfil calcula (el score se re-escala a los pesos usados) y el
+        resultado lleva el nivel de detalle del perfil.
         """
+        metricas = perfil.metricas if perfil is not None else None
+        usa_gaze = perfil.gaze if perfil is not None else True
+
+        def usa(nombre):
+            return metricas is None or nombre in metricas
+
         # Accesos seguros
         ear = m.get("ear", 0.30)
         ear_base = m.get("ear_base", 0.30)
@@ -214,42 +252,41 @@ class AttentionClassifier:
         estado_ear, score_ear, desc = self.clasificar_ear(ear, calibrado, ear_base)
         detalles["ear"] = {"estado": estado_ear, "score": score_ear, "desc": desc}
 
-        estado_p, score_p, desc = self.clasificar_perclos(perclos)
-        detalles["perclos"] = {"estado": estado_p, "score": score_p, "desc": desc}
+        if usa("temporales"):
+            estado_p, score_p, desc = self.clasificar_perclos(perclos)
+            detalles["perclos"] = {"estado": estado_p, "score": score_p, "desc": desc}
 
-        estado_b, score_b, desc = self.clasificar_parpadeos(bpm)
-        detalles["parpadeos"] = {"estado": estado_b, "score": score_b, "desc": desc}
+            estado_b, score_b, desc = self.clasificar_parpadeos(bpm)
+            detalles["parpadeos"] = {"estado": estado_b, "score": score_b, "desc": desc}
 
-        estado_y, score_y, desc = self.clasificar_yaw(yaw)
-        detalles["yaw"] = {"estado": estado_y, "score": score_y, "desc": desc}
+        if usa("pose"):
+            estado_y, score_y, desc = self.clasificar_yaw(yaw)
+            detalles["yaw"] = {"estado": estado_y, "score": score_y, "desc": desc}
 
-        estado_pitch, score_pitch, desc = self.clasificar_pitch(pitch)
-        detalles["pitch"] = {"estado": estado_pitch, "score": score_pitch, "desc": desc}
+            estado_pitch, score_pitch, desc = self.clasificar_pitch(pitch)
+            detalles["pitch"] = {"estado": estado_pitch, "score": score_pitch, "desc": desc}
 
-        estado_focus, score_focus, desc = self.clasificar_gaze_focus(gaze_focus)
-        detalles["gaze_focus"] = {"estado": estado_focus, "score": score_focus, "desc": desc}
+        if usa("temporales") and usa_gaze:
+            estado_focus, score_focus, desc = self.clasificar_gaze_focus(gaze_focus)
+            detalles["gaze_focus"] = {"estado": estado_focus, "score": score_focus, "desc": desc}
 
-        estado_disp, score_disp, desc = self.clasificar_gaze_dispersion(gaze_dispersion)
-        detalles["gaze_dispersion"] = {"estado": estado_disp, "score": score_disp, "desc": desc}
+            estado_disp, score_disp, desc = self.clasificar_gaze_dispersion(gaze_dispersion)
+            detalles["gaze_dispersion"] = {"estado": estado_disp, "score": score_disp, "desc": desc}
 
-        estado_ap, score_ap, desc = self.clasificar_eye_opening(apertura)
-        detalles["eye_opening"] = {"estado": estado_ap, "score": score_ap, "desc": desc}
+        if usa("apertura"):
+            estado_ap, score_ap, desc = self.clasificar_eye_opening(apertura)
+            detalles["eye_opening"] = {"estado": estado_ap, "score": score_ap, "desc": desc}
 
-        estado_mar, score_mar, desc = self.clasificar_mar(mar, es_bostezo)
-        detalles["mar"] = {"estado": estado_mar, "score": score_mar, "desc": desc}
+        if usa("mar"):
+            estado_mar, score_mar, desc = self.clasificar_mar(mar, es_bostezo)
+            detalles["mar"] = {"estado": estado_mar, "score": score_mar, "desc": desc}
 
-        # Score final ponderado
-        score_final = (
-            score_ear * self.pesos["ear"] +
-            score_p * self.pesos["perclos"] +
-            score_b * self.pesos["parpadeos_min"] +
-            score_y * self.pesos["pose"] +
-            score_pitch * self.pesos["pose"] +
-            score_focus * self.pesos["gaze_focus"] +
-            score_disp * self.pesos["gaze_dispersion"] +
-            score_ap * self.pesos["eye_opening"] +
-            score_mar * self.pesos["mar"]
-        )
+        # Score final ponderado (re-escalado si se evaluaron menos métricas)
+        score_final = sum(d["score"] * self.pesos[_PESO_DETALLE[k]] for k, d in detalles.items())
+        if len(detalles) < len(_PESO_DETALLE):
+            total = sum(self.pesos[p] for p in _PESO_DETALLE.values())
+            usados = sum(self.pesos[_PESO_DETALLE[k]] for k in detalles)
+            score_final *= total / usados
 
         # Evaluación final
         estados = [d["estado"] for d in detalles.values()]
@@ -257,8 +294,8 @@ class AttentionClassifier:
         bajos = estados.count("BAJO")
 
         mirando_fuera = (
-            detalles["yaw"]["estado"] == "SEVERO" or
-            detalles["pitch"]["estado"] == "SEVERO"
+            detalles.get("yaw", {}).get("estado") == "SEVERO" or
+            detalles.get("pitch", {}).get("estado") == "SEVERO"
         )
 
         if mirando_fuera:
@@ -274,6 +311,18 @@ class AttentionClassifier:
         else:
             estado_final = "CONCENTRADO"
 
+        detalle = perfil.detalle_clasificador if perfil is not None else "full"
+        if detalle == "minimal":
+            return {
+                "estado": estado_final,
+                "concentrado": estado_final == "CONCENTRADO",
+                "score": score_final,
+                "mirando_fuera": mirando_fuera,
+            }
+        if detalle == "compact":
+            for d in detalles.values():
+                del d["desc"]
+
         return {
             "estado": estado_final,
             "concentrado": estado_final == "CONCENTRADO",
@@ -11,6 +11,7 @@ Incluye:
 ===============================================================================
 """
 
+import os
 from dataclasses import dataclass
 from enum import Enum
 
@@ -120,6 +121,293 @@ class ProcessingConfig:
     buffer_size: int = 1800
 
 
+# ==============================================================================
+# CACHÉ DE RESULTADOS (reintentos idempotentes de /process)
+# ==============================================================================
+
+RESULT_CACHE_MAX_ENTRIES = 4096
+
+
+# ==============================================================================
+# SESIONES Y PERFILES DE CALIBRACIÓN PERSISTENTES
+# ==============================================================================
+
+# Calculadoras vivas por proceso (LRU; la sesión más antigua se hiberna)
+MAX_SESIONES = 1000
+
+# Ruta SQLite de los perfiles por usuario ("" = solo en memoria, por defecto:
+# importar el módulo no crea archivos en el directorio de trabajo)
+CALIBRATION_DB_PATH = os.getenv("CALIBRATION_DB_PATH", "")
+CALIBRATION_TTL_SECONDS = 30 * 24 * 3600
+# Perfiles en memoria (LRU; con SQLite los desalojados se releen de disco)
+CALIBRATION_MAX_PROFILES = 10000
+
+# Cada cuántos frames se vuelve a guardar el perfil de una sesión calibrada
+CALIBRATION_SAVE_EVERY = 900
+
+# Estado de sesión compartido entre réplicas:
+#   "memory" → solo en el proceso (requiere sesiones "pegajosas")
+#   "sqlite" → archivo compartido por los workers del host (SESSION_STATE_PATH)
+SESSION_STATE_BACKEND = os.getenv("SESSION_STATE_BACKEND", "memory")
+SESSION_STATE_PATH = os.getenv("SESSION_STATE_PATH", "session_state.db")
+# Versiones entre snapshots completos (el resto son deltas)
+SESSION_STATE_SNAPSHOT_EVERY = 300
+# Reintentos ante conflicto de compare-and-swap
+SESSION_STATE_MAX_RETRIES = 3
+
+# Memoria de las sesiones vivas por proceso (MB; 0 = solo MAX_SESIONES).
+# Al pasarse, y tras SESSION_IDLE_SECONDS sin frames, las sesiones más frías
+# se hibernan (estado serializado y comprimido) y se rehidratan con su
+# próximo frame.
+SESSION_MEMORY_BUDGET_MB = float(os.getenv("SESSION_MEMORY_BUDGET_MB", "256"))
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "300"))
+SESSION_MEMORY_SWEEP_SECONDS = 5.0
+
+# Dónde quedan las sesiones hibernadas:
+#   "memory" → en el proceso, hasta SESSION_HIBERNATION_MEMORY_MB
+#   "disk"   → un archivo por sesión en SESSION_HIBERNATION_DIR (sobrevive reinicios)
+#   "off"    → las sesiones frías se descartan (solo queda la calibración)
+SESSION_HIBERNATION_STORE = os.getenv("SESSION_HIBERNATION_STORE", "memory")
+SESSION_HIBERNATION_DIR = os.getenv("SESSION_HIBERNATION_DIR", "hibernated_sessions")
+SESSION_HIBERNATION_MEMORY_MB = 64
+SESSION_HIBERNATION_TTL_SECONDS = 24 * 3600
+
+# Frames de una sesión: omitir la inferencia de los que ya tienen uno más
+# nuevo en cola. Un salto hacia atrás mayor que el GAP se toma como reinicio
+# de la numeración del cliente.
+STALE_FRAME_SKIP = True
+FRAME_NUMBER_RESET_GAP = 300
+
+# Compuerta de presencia: tras N frames seguidos sin rostro se usa un
+# chequeo barato ("motion" o "detector") sobre el frame reducido
+# (PRESENCE_SCALE: 1, 2, 4 u 8) y FaceMesh corre solo si parece haber
+# alguien, o al menos cada PRESENCE_RECHECK_SECONDS.
+PRESENCE_GATE = True
+PRESENCE_MISSES_TO_GATE = 15
+PRESENCE_RECHECK_SECONDS = 1.0
+PRESENCE_CHECK = os.getenv("PRESENCE_CHECK", "motion")
+PRESENCE_MOTION_THRESHOLD = 4.0     # diferencia media de gris (0-255)
+PRESENCE_SCALE = 4
+
+# Salidas compactas de /process (output="rollup" / "events")
+ROLLUP_WINDOW_SECONDS = 1.0
+# rollup_window pedido por el cliente: se acota y se redondea al paso, para
+# que una sesión no acumule un emisor por cada valor distinto
+ROLLUP_WINDOW_MIN_SECONDS = 0.1
+ROLLUP_WINDOW_MAX_SECONDS = 3600.0
+ROLLUP_WINDOW_STEP_SECONDS = 0.1
+DISTRACTION_MIN_SECONDS = 1.0       # severo sostenido para abrir un período
+
+# Planificador justo de /process (deficit round-robin entre sesiones).
+# Cada sesión se atiende hasta SCHEDULER_TARGET_FPS; lo que supere ese ritmo
+# solo se procesa con capacidad libre y es lo primero que se descarta.
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1").lower() in ("1", "true", "yes")
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "0")) or (os.cpu_count() or 2)
+SCHEDULER_TARGET_FPS = float(os.getenv("SCHEDULER_TARGET_FPS", "15"))
+SCHEDULER_BURST = 2.0               # frames seguidos permitidos sobre el ritmo
+SCHEDULER_HARD_CAP = False          # True: descartar siempre lo que supere el tope
+SCHEDULER_SESSION_DEPTH = 1         # frames en espera por sesión (gana el más nuevo)
+SCHEDULER_MAX_QUEUED = 256          # frames en espera en total
+SCHEDULER_QUANTUM_MS = 10.0
+SCHEDULER_MAX_WAIT_SECONDS = 2.0
+
+
+# ==============================================================================
+# MOTOR DE LANDMARKS
+# ==============================================================================
+
+# Motor de landmarks: "facemesh", "facemesh_lite", "tasks" o "replay"
+# (ver landmark_backends.py). "tasks" necesita el modelo face_landmarker.task;
+# LANDMARK_RUNNING_MODE: "image", "video" o "live_stream".
+LANDMARK_BACKEND = os.getenv("LANDMARK_BACKEND", "facemesh")
+LANDMARK_MODEL_PATH = os.getenv("LANDMARK_MODEL_PATH", "face_landmarker.task")
+LANDMARK_RUNNING_MODE = os.getenv("LANDMARK_RUNNING_MODE", "video")
+LANDMARK_REPLAY_PATH = os.getenv("LANDMARK_REPLAY_PATH", "")
+
+# Perfil de pipeline del despliegue: "full", "balanced" o "lite"
+# (ver pipeline_profiles.py; cada sesión puede pedir otro)
+PIPELINE_PROFILE = os.getenv("PIPELINE_PROFILE", "full")
+
+# Grabación de landmarks por sesión ({dir}/{session_id}.lmk, ver
+# data_collector.LandmarkRecorder). Vacío = sin grabar.
+LANDMARK_RECORD_DIR = os.getenv("LANDMARK_RECORD_DIR", "")
+LANDMARK_RECORD_DTYPE = os.getenv("LANDMARK_RECORD_DTYPE", "float16")
+
+
+# ==============================================================================
+# SEGMENTOS DE VIDEO (POST /process/segment, ffmpeg)
+# ==============================================================================
+
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+# Frames por segundo que se decodifican si el request no pide otro ritmo
+SEGMENT_DEFAULT_FPS = 15.0
+SEGMENT_MAX_FPS = 30.0
+SEGMENT_MAX_WIDTH = 640
+# Duración máxima que se decodifica de un segmento (el resto se ignora) y
+# plazo de reloj para decodificar y procesar el segmento completo
+SEGMENT_MAX_SECONDS = 10.0
+SEGMENT_DECODE_TIMEOUT = 30.0
+
+
+# ==============================================================================
+# RITMO SUGERIDO A LOS CLIENTES (campo `pacing` de las respuestas)
+# ==============================================================================
+
+# "adaptive" (según carga y estabilidad de la sesión), "fixed" u "off"
+PACING_CONTROLLER = os.getenv("PACING_CONTROLLER", "adaptive")
+
+# Resolución y calidad JPEG sugeridas (sin carga / con el nodo saturado)
+PACING_MAX_WIDTH = 640
+PACING_MIN_WIDTH = 320
+PACING_JPEG_QUALITY = 80
+PACING_MIN_JPEG_QUALITY = 50
+PACING_MIN_FPS = 2.0
+# Cadencia base si SCHEDULER_TARGET_FPS <= 0 (planificador sin tope de fps)
+PACING_BASE_INTERVAL_MS = 100.0
+
+# Presión: ocupación de los workers, espera en cola y decodificación (ms)
+PACING_HIGH_LOAD = 0.8
+PACING_QUEUE_BUDGET_MS = 50.0
+PACING_DECODE_BUDGET_MS = 8.0
+
+# Sesión estable (mismo nivel, score y pose) durante este tiempo → cadencia × factor
+PACING_STEADY_SECONDS = 10.0
+PACING_STEADY_FACTOR = 2.0
+PACING_NO_FACE_FACTOR = 1.5
+
+
+# ==============================================================================
+# PERFILADO BAJO DEMANDA
+# ==============================================================================
+
+# Token para pedir un perfil por request (X-Profile + X-Profile-Token).
+# Vacío = perfilado bajo demanda deshabilitado.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+
+# Modo de fondo: fracción de requests muestreados y/o umbral de latencia (ms)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_STORED = 200
+
+
+# ==============================================================================
+# TRAZAS POR REQUEST (spans)
+# ==============================================================================
+
+# Fracción de requests que se exportan siempre (además de los que llegan con
+# traceparent muestreado) y umbral de latencia (ms) para exportar los lentos.
+# Con ambos en 0 no se registran spans.
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "500"))
+
+# Log rotativo (una línea JSON por traza) y archivo OTLP/JSON; vacío = no se escribe
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", "traces/slow.jsonl")
+TRACE_OTLP_PATH = os.getenv("TRACE_OTLP_PATH", "")
+TRACE_LOG_MAX_BYTES = 10 * 1024 * 1024
+TRACE_LOG_BACKUPS = 5
+
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "attention-monitor-api")
+TRACE_MAX_SPANS = 512      # por traza (un segmento de video puede tener cientos)
+TRACE_RECENT = 200         # trazas exportadas que quedan en memoria
+
+
+# ==============================================================================
+# OBSERVADORES DE SESIÓN (SSE)
+# ==============================================================================
+
+# Envíos por segundo a cada observador (por defecto y tope pedible)
+SSE_DEFAULT_RATE = 5.0
+SSE_MAX_RATE = 30.0
+
+# Comentario de keepalive cuando la sesión no publica
+SSE_KEEPALIVE_SECONDS = 15.0
+
+SSE_MAX_SUBSCRIBERS = 1000
+
+
+# ==============================================================================
+# REPORTES CON GRÁFICOS (GET /sessions/{id}/report)
+# ==============================================================================
+
+# Sesiones columnares ({dir}/{session_id}/, ver frame_store). Vacío = sin reportes.
+REPORT_SESSIONS_DIR = os.getenv("REPORT_SESSIONS_DIR", "")
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", "reports")
+
+# Procesos que dibujan (con prioridad baja) y trabajos en espera como máximo
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "1"))
+REPORT_MAX_PENDING = 32
+REPORT_NICE = 10
+# Cuánto se recuerda el estado de un trabajo terminado
+REPORT_JOB_TTL_SECONDS = 600.0
+
+# Tramos de la serie de score y resolución del PNG
+REPORT_TIMELINE_POINTS = 2000
+REPORT_DPI = 100
+
+
+# ==============================================================================
+# LÍNEA DE TIEMPO DE LAS SESIONES (GET /sessions/{id}/timeline)
+# ==============================================================================
+
+# Últimos frames guardados tal cual (~1 min a 30 fps)
+TIMELINE_RAW_ROWS = 2048
+# Pirámide: tramos de 1 s, 4 s, 16 s, ... (cada nivel junta FACTOR del anterior)
+TIMELINE_BASE_SECONDS = 1.0
+TIMELINE_LEVEL_FACTOR = 4
+TIMELINE_LEVELS = 6
+# Tope de memoria de todas las líneas de tiempo (~0,9 MB por sesión de 2 h)
+TIMELINE_MEMORY_MB = 128
+# Puntos por serie en la respuesta
+TIMELINE_DEFAULT_POINTS = 500
+TIMELINE_MAX_POINTS = 5000
+# Filas de la fuente elegida por punto pedido, como mucho
+TIMELINE_OVERSAMPLE = 4
+
+
+# ==============================================================================
+# SUPERVISOR PREFORK (python -m src.supervisor)
+# ==============================================================================
+
+SUPERVISOR_WORKERS = int(os.getenv("SUPERVISOR_WORKERS", "0")) or (os.cpu_count() or 2)
+# Cada cuánto se registra el RSS/PSS de cada worker ("" = sin archivo de estado)
+SUPERVISOR_REPORT_SECONDS = 30.0
+SUPERVISOR_STATUS_PATH = os.getenv("SUPERVISOR_STATUS_PATH", "")
+# Reinicio de workers caídos: espera creciente si mueren apenas arrancan
+SUPERVISOR_MIN_UPTIME_SECONDS = 10.0
+SUPERVISOR_MAX_BACKOFF_SECONDS = 30.0
+SUPERVISOR_GRACEFUL_TIMEOUT = 20.0
+
+
+# ==============================================================================
+# GATEWAY CON AFINIDAD DE SESIÓN (python -m src.gateway)
+# ==============================================================================
+
+# Token compartido entre el gateway y los workers para traspasar el estado de
+# una sesión (POST /sessions/{id}/state/export, PUT /sessions/{id}/state).
+# Nunca sale del gateway hacia los clientes ni se acepta de ellos.
+# Vacío = traspaso deshabilitado (las sesiones que cambian de worker empiezan
+# de cero, salvo con un SESSION_STATE_BACKEND compartido).
+HANDOFF_TOKEN = os.getenv("HANDOFF_TOKEN", "")
+# Token de administración del gateway (X-Gateway-Token en /gateway/*).
+# Vacío = administración deshabilitada.
+GATEWAY_ADMIN_TOKEN = os.getenv("GATEWAY_ADMIN_TOKEN", "")
+
+# Workers iniciales (URLs separadas por coma)
+GATEWAY_WORKERS = os.getenv("GATEWAY_WORKERS", "")
+# Puntos por worker en el anillo y tope de carga (× la media de sesiones)
+GATEWAY_VNODES = 160
+GATEWAY_LOAD_FACTOR = 1.25
+# Una sesión sin requests por este tiempo libera su lugar en el anillo
+GATEWAY_SESSION_TTL_SECONDS = 600.0
+GATEWAY_HEALTH_SECONDS = 2.0
+GATEWAY_TIMEOUT_SECONDS = 30.0
+# Conexiones keep-alive por worker
+GATEWAY_POOL_SIZE = 32
+
+
 # ==============================================================================
 # OBJETOS PRINCIPALES
 # ==============================================================================
@@ -162,6 +450,14 @@ EAR_CONCENTRADO_PCT = 0.85
 EAR_BAJO_PCT = 0.70
 EAR_SEVERO_PCT = 0.55
 
+# Refinamiento continuo (EMA) de ear_base, solo con frames estables de ojos
+# abiertos (sin parpadeos ni ojos bajo el umbral en los últimos N segundos).
+# Alpha bajo: ~1000 frames (1 min a 15 fps) para mover la base; el piso es
+# una fracción de la base del perfil cargado o de la calibración inicial.
+EAR_RECALIBRACION_ALPHA = 0.001
+EAR_RECALIBRACION_ESTABLE_SECONDS = 5.0
+EAR_RECALIBRACION_PISO = 0.90
+
 # Boca (MAR) – índices
 BOCA_SUPERIOR = LANDMARKS.mouth_top
 BOCA_INFERIOR = LANDMARKS.mouth_bottom
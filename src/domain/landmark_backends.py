@@ -0,0 +1,256 @@
+"""
+================================================================================
+LANDMARK_BACKENDS.PY — Motores de landmarks faciales intercambiables
+================================================================================
+AttentionProcessor solo necesita, por frame, los landmarks del rostro como
+array NumPy (N, 3) en coordenadas normalizadas de MediaPipe (x, y en [0, 1],
+z relativa al ancho) y, si el motor la da, la matriz de transformación facial
+4×4.
+
+Motores (config.LANDMARK_BACKEND):
+- "facemesh":      mp.solutions.face_mesh con refine_landmarks=True (478 puntos,
+                   iris incluido). Motor histórico.
+- "facemesh_lite": el mismo grafo sin refinamiento (468 puntos, sin iris: la
+                   mirada queda en el centro).
+- "tasks":         MediaPipe Tasks FaceLandmarker (modelo .task) en modo IMAGE,
+                   VIDEO o LIVE_STREAM; entrega la matriz de transformación.
+- "replay":        reproduce landmarks grabados (determinista, para pruebas y
+                   comparaciones sin cámara).
+
+Los grafos se crean en la primera detección, no al construir el motor. Cada
+motor serializa sus llamadas: los grafos de MediaPipe no son thread-safe.
+================================================================================
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from src.infrastructure.tracing import span
+
+from . import config
+
+
+@dataclass
+class LandmarkResult:
+    points: np.ndarray                     # (N, 3) normalizados
+    matrix: Optional[np.ndarray] = None    # (4, 4) o None
+
+
+class LandmarkBackend:
+    """Interfaz: `detect` recibe un frame RGB y devuelve el primer rostro o None."""
+
+    name = "base"
+
+    def detect(self, rgb: np.ndarray, timestamp: float) -> Optional[LandmarkResult]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+# ==============================================================================
+# MediaPipe FaceMesh (API solutions)
+# ==============================================================================
+
+class FaceMeshBackend(LandmarkBackend):
+
+    def __init__(self, refine_landmarks: bool = True):
+        self.refine_landmarks = refine_landmarks
+        self.name = "facemesh" if refine_landmarks else "facemesh_lite"
+        self._mesh = None
+        self._lock = threading.Lock()
+
+    def _graph(self):
+        if self._mesh is None:
+            import mediapipe as mp
+
+            self._mesh = mp.solutions.face_mesh.FaceMesh(
+                max_num_faces=1,
+                refine_landmarks=self.refine_landmarks,
+                min_detection_confidence=0.5,
+                min_tracking_confidence=0.5,
+            )
+        return self._mesh
+
+    def detect(self, rgb, timestamp):
+        with self._lock, span("face_mesh.process"):
+            results = self._graph().process(rgb)
+        if not results.multi_face_landmarks:
+            return None
+        landmarks = results.multi_face_landmarks[0].landmark
+        return LandmarkResult(np.array([(lm.x, lm.y, lm.z) for lm in landmarks], dtype=np.float64))
+
+    def close(self):
+        if self._mesh is not None:
+            self._mesh.close()
+            self._mesh = None
+
+
+# ==============================================================================
+# MediaPipe Tasks FaceLandmarker
+# ==============================================================================
+
+class TasksFaceLandmarkerBackend(LandmarkBackend):
+    """
+    FaceLandmarker de MediaPipe Tasks. En VIDEO y LIVE_STREAM los
+    timestamps deben ser estrictamente crecientes para la instancia, así
+    que se derivan del instante del frame forzando el avance.
+
+    LIVE_STREAM es asíncrono (resultado por callback); aquí se espera el
+    callback de cada frame hasta `live_timeout` segundos. Si el grafo
+    descarta el frame por estar ocupado se devuelve None.
+    """
+
+    name = "tasks"
+
+    def __init__(self, model_path: str, running_mode: str = "video", live_timeout: float = 0.5):
+        self.model_path = model_path
+        self.running_mode = running_mode.lower()
+        self.live_timeout = live_timeout
+        self._landmarker = None
+        self._lock = threading.Lock()
+        self._last_ms = -1
+
+        # LIVE_STREAM: timestamp → [evento, resultado]
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+
+    def _graph(self):
+        if self._landmarker is None:
+            from mediapipe.tasks.python import BaseOptions, vision
+
+            modes = {
+                "image": vision.RunningMode.IMAGE,
+                "video": vision.RunningMode.VIDEO,
+                "live_stream": vision.RunningMode.LIVE_STREAM,
+            }
+            if self.running_mode not in modes:
+                raise ValueError(f"Modo de FaceLandmarker desconocido: {self.running_mode}")
+
+            options = vision.FaceLandmarkerOptions(
+                base_options=BaseOptions(model_asset_path=self.model_path),
+                running_mode=modes[self.running_mode],
+                num_faces=1,
+                min_face_detection_confidence=0.5,
+                min_face_presence_confidence=0.5,
+                min_tracking_confidence=0.5,
+                output_facial_transformation_matrixes=True,
+                result_callback=self._on_result if self.running_mode == "live_stream" else None,
+            )
+            self._landmarker = vision.FaceLandmarker.create_from_options(options)
+        return self._landmarker
+
+    def _next_ms(self, timestamp):
+        self._last_ms = max(int(timestamp * 1000), self._last_ms + 1)
+        return self._last_ms
+
+    def detect(self, rgb, timestamp):
+        import mediapipe as mp
+
+        image = mp.Image(image_format=mp.ImageFormat.SRGB, data=np.ascontiguousarray(rgb))
+
+        if self.running_mode == "live_stream":
+            return self._detect_live(image, timestamp)
+
+        with self._lock, span("face_landmarker.detect", mode=self.running_mode):
+            landmarker = self._graph()
+            if self.running_mode == "image":
+                result = landmarker.detect(image)
+            else:
+                result = landmarker.detect_for_video(image, self._next_ms(timestamp))
+        return self._convert(result)
+
+    def _detect_live(self, image, timestamp):
+        event = threading.Event()
+        with self._lock:
+            landmarker = self._graph()
+            ts = self._next_ms(timestamp)
+            with self._pending_lock:
+                self._pending[ts] = [event, None]
+            landmarker.detect_async(image, ts)
+
+        event.wait(self.live_timeout)
+        with self._pending_lock:
+            _, result = self._pending.pop(ts, (None, None))
+        return self._convert(result) if result is not None else None
+
+    def _on_result(self, result, image, timestamp_ms):
+        with self._pending_lock:
+            slot = self._pending.get(timestamp_ms)
+            if slot is not None:
+                slot[1] = result
+                slot[0].set()
+
+    @staticmethod
+    def _convert(result):
+        if not result.face_landmarks:
+            return None
+        points = np.array([(lm.x, lm.y, lm.z) for lm in result.face_landmarks[0]], dtype=np.float64)
+        matrix = None
+        if result.facial_transformation_matrixes:
+            matrix = np.asarray(result.facial_transformation_matrixes[0], dtype=np.float64)
+        return LandmarkResult(points, matrix)
+
+    def close(self):
+        if self._landmarker is not None:
+            self._landmarker.close()
+            self._landmarker = None
+
+
+# ==============================================================================
+# Reproducción de landmarks grabados
+# ==============================================================================
+
+class ReplayBackend(LandmarkBackend):
+    """
+    Devuelve, en orden y en ciclo, los landmarks de un array (F, N, 3),
+    de un .npy con ese array o de una grabación .lmk (LandmarkRecorder).
+    Un frame con NaN en su primer punto cuenta como "sin rostro". De un
+    .lmk se saltean los frames omitidos (no pasaron por el motor). El
+    frame RGB recibido se ignora.
+    """
+
+    name = "replay"
+
+    def __init__(self, frames):
+        rows = None
+        if isinstance(frames, str) and frames.endswith(".lmk"):
+            from src.infrastructure.data_collector import LandmarkRecording
+
+            frames = LandmarkRecording(frames)
+            rows = np.flatnonzero(frames.flags() == 0)
+        elif isinstance(frames, str):
+            frames = np.load(frames, mmap_mode="r")
+        self.frames = frames
+        self._rows = rows
+        self._index = 0
+        self._lock = threading.Lock()
+
+    def detect(self, rgb, timestamp):
+        n = len(self.frames) if self._rows is None else len(self._rows)
+        if n == 0:
+            return None
+        with self._lock:
+            i = self._index % n
+            self._index += 1
+        points = self.frames[i if self._rows is None else int(self._rows[i])]
+        if np.isnan(points[0, 0]):
+            return None
+        return LandmarkResult(np.asarray(points, dtype=np.float64))
+
+
+def build_landmark_backend(kind: Optional[str] = None) -> LandmarkBackend:
+    """Crea el motor indicado (por defecto config.LANDMARK_BACKEND)."""
+    kind = kind or config.LANDMARK_BACKEND
+    if kind == "facemesh":
+        return FaceMeshBackend(refine_landmarks=True)
+    if kind == "facemesh_lite":
+        return FaceMeshBackend(refine_landmarks=False)
+    if kind == "tasks":
+        return TasksFaceLandmarkerBackend(config.LANDMARK_MODEL_PATH, config.LANDMARK_RUNNING_MODE)
+    if kind == "replay":
+        return ReplayBackend(config.LANDMARK_REPLAY_PATH)
+    raise ValueError(f"Motor de landmarks desconocido: {kind}")
@@ -2,15 +2,47 @@
 ================================================================================
 METRICS.PY — Cálculo de métricas fisiológicas y comportamentales
 Versión optimizada para API en tiempo real (sin sesiones)
+
+Los historiales temporales viven en RingBuffer columnares (array estructurado
+preasignado) en lugar de deques de tuplas: ~21 bytes por frame en vez de
+cientos, lo que permite muchas más sesiones vivas por nodo.
 ================================================================================
 """
 
+import struct
+import sys
+import time
+
 import numpy as np
 import cv2
-from collections import deque
-import time
 
 from . import config
+from .pipeline_profiles import POSE_SOLVERS, TODAS_LAS_METRICAS
+from .ring_buffer import RingBuffer
+from src.infrastructure.tracing import traced
+
+
+# Historial temporal por frame (PERCLOS, parpadeos/min, mirada).
+# El tiempo va en float64: en float32 un timestamp epoch pierde la resolución
+# de segundos.
+HISTORIAL_DTYPE = np.dtype([
+    ("t", np.float64),
+    ("ear", np.float32),
+    ("parpadeo", np.int8),
+    ("gaze_x", np.float32),
+    ("gaze_y", np.float32),
+])
+
+POSE_DTYPE = np.dtype([
+    ("yaw", np.float32),
+    ("pitch", np.float32),
+])
+
+# Estado serializado: tipo ('S' snapshot / 'D' delta) + escalares + bloques
+# crudos (calibración, pose, EAR suave, historial). En un delta el bloque del
+# historial solo trae las filas nuevas.
+_ESTADO_ESCALARES = struct.Struct("<cBiiidBidddddBq")
+_ESTADO_FORMATO = 2
 
 
 class MetricsCalculator:
@@ -23,39 +55,151 @@ class MetricsCalculator:
     - Métricas de mirada (foco y dispersión)
     """
 
+    __slots__ = (
+        "historial",
+        "frames_bajo_umbral", "total_parpadeos",
+        "mar_alto_inicio", "total_bostezos",
+        "calibracion_completa", "ear_calibracion", "n_calibracion", "ear_base",
+        "ear_base_referencia",
+        "ear_umbral_concentrado", "ear_umbral_bajo", "ear_umbral_severo",
+        "recalibracion_continua",
+        "buffer_pose", "buffer_ear_suave",
+        "gaze_centro",
+    )
+
     def __init__(self):
-        # Buffers temporales
-        self.buffer_ear = deque(maxlen=config.BUFFER_SIZE)
-        self.buffer_parpadeos = deque(maxlen=config.BUFFER_SIZE)
-        self.buffer_gaze = deque(maxlen=config.BUFFER_SIZE)
-        self.buffer_timestamps = deque(maxlen=config.BUFFER_SIZE)
+        # Historial temporal (t, ear, parpadeo, gaze_x, gaze_y)
+        self.historial = RingBuffer(config.BUFFER_SIZE, HISTORIAL_DTYPE)
 
         # Parpadeos
         self.frames_bajo_umbral = 0
         self.total_parpadeos = 0
 
         # Bostezo
-        self.mar_buffer = deque(maxlen=60)
         self.mar_alto_inicio = None
         self.total_bostezos = 0
 
         # Calibración EAR
         self.calibracion_completa = False
-        self.ear_calibracion = []
+        self.ear_calibracion = np.zeros(config.EAR_CALIBRACION_FRAMES, dtype=np.float32)
+        self.n_calibracion = 0
         self.ear_base = 0.30
+        # ear_base del perfil cargado (o de la calibración inicial): piso del refinamiento
+        self.ear_base_referencia = 0.0
 
         self.ear_umbral_concentrado = config.EAR_CONCENTRADO
         self.ear_umbral_bajo = config.EAR_BAJO_MIN
         self.ear_umbral_severo = config.EAR_SEVERO
 
-        # Pose suavizada
-        self.buffer_yaw = deque(maxlen=7)
-        self.buffer_pitch = deque(maxlen=7)
-        self.buffer_ear_suave = deque(maxlen=5)
+        # Solo las sesiones con perfil persistente siguen refinando ear_base
+        self.recalibracion_continua = False
+
+        # Pose y EAR suavizados
+        self.buffer_pose = RingBuffer(7, POSE_DTYPE)
+        self.buffer_ear_suave = RingBuffer(5, np.float32)
 
         # Mirada (foco central)
         self.gaze_centro = None
-        self.frames_calibracion_gaze = []
+
+    # ----------------------------------------------------------------------
+    # MEMORIA
+    # ----------------------------------------------------------------------
+
+    def memory_bytes(self):
+        """Memoria aproximada que ocupa el estado de esta sesión (bytes)."""
+        return (
+            sys.getsizeof(self)
+            + self.historial.nbytes
+            + self.buffer_pose.nbytes
+            + self.buffer_ear_suave.nbytes
+            + self.ear_calibracion.nbytes
+        )
+
+    # ----------------------------------------------------------------------
+    # ESTADO SERIALIZABLE (sesiones externas / hibernación)
+    # ----------------------------------------------------------------------
+
+    def exportar_estado(self):
+        """Snapshot compacto (bytes) de todo el estado temporal."""
+        return self._serializar(b"S", self.historial.to_bytes())
+
+    def exportar_delta(self, desde_total):
+        """
+        Cambios desde que el historial tenía `desde_total` filas agregadas:
+        escalares y buffers chicos completos + solo las filas nuevas.
+        """
+        nuevas = self.historial.total - desde_total
+        return self._serializar(b"D", self.historial.tail(nuevas).tobytes())
+
+    def cargar_estado(self, raw):
+        """Aplica un snapshot o un delta producido por exportar_*()."""
+        esc = _ESTADO_ESCALARES.unpack_from(raw, 0)
+        tipo, formato = esc[0], esc[1]
+        if formato != _ESTADO_FORMATO:
+            raise ValueError(f"Formato de estado desconocido: {formato}")
+
+        bloques = []
+        offset = _ESTADO_ESCALARES.size
+        for _ in range(4):
+            (n,) = struct.unpack_from("<I", raw, offset)
+            offset += 4
+            bloques.append(raw[offset:offset + n])
+            offset += n
+        calib, pose, ear_suave, historial = bloques
+
+        historial_total = esc[14]
+        filas = np.frombuffer(historial, dtype=HISTORIAL_DTYPE)
+        if tipo == b"S":
+            self.historial.load_bytes(historial, total=historial_total)
+        elif self.historial.total + len(filas) == historial_total:
+            self.historial.extend(filas)
+        else:
+            raise ValueError("Delta no aplicable: el historial local no coincide")
+
+        (self.frames_bajo_umbral, self.total_parpadeos, self.total_bostezos,
+         mar_alto_inicio, calibracion_completa, self.n_calibracion,
+         self.ear_base, self.ear_base_referencia, self.ear_umbral_concentrado,
+         self.ear_umbral_bajo, self.ear_umbral_severo,
+         recalibracion_continua) = esc[2:14]
+
+        self.mar_alto_inicio = None if np.isnan(mar_alto_inicio) else mar_alto_inicio
+        self.calibracion_completa = bool(calibracion_completa)
+        self.recalibracion_continua = bool(recalibracion_continua)
+
+        if calib:
+            self.ear_calibracion[:] = np.frombuffer(calib, dtype=np.float32)
+        self.buffer_pose.load_bytes(pose)
+        self.buffer_ear_suave.load_bytes(ear_suave)
+
+    def _serializar(self, tipo, historial):
+        partes = [_ESTADO_ESCALARES.pack(
+            tipo,
+            _ESTADO_FORMATO,
+            self.frames_bajo_umbral,
+            self.total_parpadeos,
+            self.total_bostezos,
+            np.nan if self.mar_alto_inicio is None else self.mar_alto_inicio,
+            self.calibracion_completa,
+            self.n_calibracion,
+            self.ear_base,
+            self.ear_base_referencia,
+            self.ear_umbral_concentrado,
+            self.ear_umbral_bajo,
+            self.ear_umbral_severo,
+            self.recalibracion_continua,
+            self.historial.total,
+        )]
+        # Ya calibrado, las muestras de calibración no se necesitan
+        calib = b"" if self.calibracion_completa else self.ear_calibracion.tobytes()
+        for bloque in (
+            calib,
+            self.buffer_pose.to_bytes(),
+            self.buffer_ear_suave.to_bytes(),
+            historial,
+        ):
+            partes.append(struct.pack("<I", len(bloque)))
+            partes.append(bloque)
+        return b"".join(partes)
 
     # ----------------------------------------------------------------------
     # UTILIDADES
@@ -70,6 +214,7 @@ class MetricsCalculator:
     # EAR (Eye Aspect Ratio)
     # ----------------------------------------------------------------------
 
+    @traced("calcular_ear")
     def calcular_ear(self, landmarks, eye_idx):
         """EAR por Soukupová & Čech, 2016."""
         try:
@@ -93,26 +238,83 @@ class MetricsCalculator:
         if self.calibracion_completa:
             return
 
-        self.ear_calibracion.append(ear)
-        if len(self.ear_calibracion) < config.EAR_CALIBRACION_FRAMES:
+        self.ear_calibracion[self.n_calibracion] = ear
+        self.n_calibracion += 1
+        if self.n_calibracion < config.EAR_CALIBRACION_FRAMES:
             return
 
         # Promedio de los valores más altos = ojos abiertos
-        vals = sorted(self.ear_calibracion, reverse=True)
+        vals = np.sort(self.ear_calibracion)[::-1]
         top = vals[: int(len(vals) * 0.7)]
-        self.ear_base = max(np.mean(top), 0.20)
+        self.ear_base = max(float(np.mean(top)), 0.20)
+        self.ear_base_referencia = self.ear_base
 
         # Nuevos umbrales personalizados
+        self._actualizar_umbrales()
+
+        self.calibracion_completa = True
+
+    def _actualizar_umbrales(self):
         self.ear_umbral_concentrado = self.ear_base * config.EAR_CONCENTRADO_PCT
         self.ear_umbral_bajo = self.ear_base * config.EAR_BAJO_PCT
         self.ear_umbral_severo = self.ear_base * config.EAR_SEVERO_PCT
 
+    def _refinar_calibracion(self, ear, t):
+        """
+        Ajuste incremental (EMA) de ear_base con frames de ojos abiertos,
+        para que un perfil guardado se adapte a la luz/cámara actuales
+        sin repetir la calibración desde cero.
+
+        Solo cuentan los frames estables: EAR en zona de concentración y
+        ningún parpadeo ni ojo bajo el umbral en los últimos
+        EAR_RECALIBRACION_ESTABLE_SECONDS. Así la somnolencia (ojos
+        entornados, PERCLOS en alza) no arrastra la base hacia abajo; además
+        nunca baja de EAR_RECALIBRACION_PISO × la base de referencia.
+        """
+        if ear < self.ear_umbral_concentrado or self.frames_bajo_umbral:
+            return
+        recientes = self.historial.since(t - config.EAR_RECALIBRACION_ESTABLE_SECONDS)
+        if np.count_nonzero(recientes["parpadeo"]) or np.any(recientes["ear"] < self.ear_umbral_bajo):
+            return
+
+        alpha = config.EAR_RECALIBRACION_ALPHA
+        piso = max(self.ear_base_referencia * config.EAR_RECALIBRACION_PISO, 0.20)
+        self.ear_base = max(self.ear_base + alpha * (ear - self.ear_base), piso)
+        self._actualizar_umbrales()
+
+    # ----------------------------------------------------------------------
+    # Perfiles de calibración persistentes
+    # ----------------------------------------------------------------------
+
+    def exportar_perfil(self):
+        """Valores de calibración de la sesión, o None si aún no calibró."""
+        if not self.calibracion_completa:
+            return None
+        return {
+            "ear_base": self.ear_base,
+            "ear_umbral_concentrado": self.ear_umbral_concentrado,
+            "ear_umbral_bajo": self.ear_umbral_bajo,
+            "ear_umbral_severo": self.ear_umbral_severo,
+        }
+
+    def aplicar_perfil(self, perfil):
+        """
+        Precarga una calibración previa: los umbrales personalizados
+        rigen desde el primer frame y se siguen refinando.
+        """
+        self.ear_base = float(perfil["ear_base"])
+        self.ear_base_referencia = self.ear_base
+        self.ear_umbral_concentrado = float(perfil["ear_umbral_concentrado"])
+        self.ear_umbral_bajo = float(perfil["ear_umbral_bajo"])
+        self.ear_umbral_severo = float(perfil["ear_umbral_severo"])
         self.calibracion_completa = True
+        self.recalibracion_continua = True
 
     # ----------------------------------------------------------------------
     # MAR (Apertura de boca) y bostezo
     # ----------------------------------------------------------------------
 
+    @traced("calcular_mar")
     def calcular_mar(self, lm):
         try:
             top = lm[config.BOCA_SUPERIOR][:2]
@@ -170,7 +372,8 @@ class MetricsCalculator:
     # Pose de cabeza: yaw / pitch / roll
     # ----------------------------------------------------------------------
 
-    def calcular_pose(self, lm, w, h):
+    @traced("calcular_pose")
+    def calcular_pose(self, lm, w, h, solver=cv2.SOLVEPNP_ITERATIVE):
 
         try:
             pts_2d = np.array([
@@ -201,7 +404,7 @@ class MetricsCalculator:
 
             _, rot, trans = cv2.solvePnP(
                 pts_3d, pts_2d, camera, np.zeros((4, 1)),
-                flags=cv2.SOLVEPNP_ITERATIVE
+                flags=solver
             )
 
             rot_mtx, _ = cv2.Rodrigues(rot)
@@ -213,10 +416,9 @@ class MetricsCalculator:
             roll = float(euler[2][0])
 
             # Suavizado
-            self.buffer_yaw.append(yaw)
-            self.buffer_pitch.append(pitch)
+            self.buffer_pose.append((yaw, pitch))
 
-            return np.mean(self.buffer_yaw), np.mean(self.buffer_pitch), roll
+            return self.buffer_pose.mean("yaw"), self.buffer_pose.mean("pitch"), roll
 
         except:
             return 0.0, 0.0, 0.0
@@ -225,6 +427,7 @@ class MetricsCalculator:
     # Mirada (gaze)
     # ----------------------------------------------------------------------
 
+    @traced("calcular_mirada")
     def calcular_mirada(self, lm, w, h):
         try:
             irisL = lm[config.IRIS_IZQUIERDO_CENTRO][:2]
@@ -260,9 +463,21 @@ class MetricsCalculator:
     # PROCESO PRINCIPAL: procesar un frame completo
     # ----------------------------------------------------------------------
 
-    def procesar_frame(self, lm, w, h, timestamp=None):
+    @traced("procesar_frame")
+    def procesar_frame(self, lm, w, h, timestamp=None, perfil=None):
+        """
+        `perfil` (PipelineProfile) limita qué métricas se calculan y con
+        qué solver de pose; sin perfil se calcula todo. Las métricas no
+        calculadas no aparecen en el resultado.
+        """
         try:
-            t = timestamp or time.time()
+            # timestamp=0.0 es válido (primer frame de un video)
+            t = timestamp if timestamp is not None else time.time()
+
+            if perfil is None:
+                metricas, usa_gaze, solver = TODAS_LAS_METRICAS, True, cv2.SOLVEPNP_ITERATIVE
+            else:
+                metricas, usa_gaze, solver = perfil.metricas, perfil.gaze, POSE_SOLVERS[perfil.pose_solver]
 
             # --- EAR ---
             earL = self.calcular_ear(lm, config.OJO_IZQUIERDO)
@@ -271,93 +486,119 @@ class MetricsCalculator:
 
             # Suavizado
             self.buffer_ear_suave.append(ear)
-            ear_suave = np.mean(self.buffer_ear_suave)
+            ear_suave = self.buffer_ear_suave.mean()
 
             # Calibración
             self.calibrar_ear(ear_suave)
 
+            resultado = {
+                "timestamp": t,
+                "ear": ear_suave,
+                "ear_raw": ear,
+                "ear_base": self.ear_base,
+                "calibrado": self.calibracion_completa,
+            }
+
             # MAR
-            mar = self.calcular_mar(lm)
-            es_bostezo = self.detectar_bostezo(mar, t)
+            es_bostezo = False
+            if "mar" in metricas:
+                mar = self.calcular_mar(lm)
+                es_bostezo = self.detectar_bostezo(mar, t)
+                resultado["mar"] = mar
 
             # Apertura de los ojos
-            apL = self.calcular_apertura_ocular(lm, config.OJO_IZQUIERDO)
-            apR = self.calcular_apertura_ocular(lm, config.OJO_DERECHO)
-            apertura = (apL + apR) / 2
+            if "apertura" in metricas:
+                apL = self.calcular_apertura_ocular(lm, config.OJO_IZQUIERDO)
+                apR = self.calcular_apertura_ocular(lm, config.OJO_DERECHO)
+                resultado["apertura"] = (apL + apR) / 2
 
             # Pose
-            yaw, pitch, roll = self.calcular_pose(lm, w, h)
-
-            # Mirada
-            gaze_x, gaze_y = self.calcular_mirada(lm, w, h)
+            if "pose" in metricas:
+                yaw, pitch, roll = self.calcular_pose(lm, w, h, solver)
+                resultado.update(yaw=yaw, pitch=pitch, roll=roll)
+
+            # Mirada (sin ella el historial guarda el centro)
+            gaze_x, gaze_y = 0.5, 0.5
+            if usa_gaze:
+                gaze_x, gaze_y = self.calcular_mirada(lm, w, h)
+                resultado.update(gaze_x=gaze_x, gaze_y=gaze_y)
             es_parpadeo = self.detectar_parpadeo(ear_suave)
 
-            # Buffers temporales
-            self.buffer_ear.append((t, ear_suave))
-            self.buffer_parpadeos.append((t, es_parpadeo))
-            self.buffer_gaze.append((t, gaze_x, gaze_y))
-            self.buffer_timestamps.append(t)
+            # Historial temporal
+            self.historial.append((t, ear_suave, es_parpadeo, gaze_x, gaze_y))
 
-            temporales = self.calcular_metricas_temporales(t)
+            if self.calibracion_completa and self.recalibracion_continua:
+                self._refinar_calibracion(ear_suave, t)
 
-            return {
-                "timestamp": t,
-                "ear": ear_suave,
-                "ear_raw": ear,
-                "ear_base": self.ear_base,
-                "calibrado": self.calibracion_completa,
-                "mar": mar,
-                "apertura": apertura,
-                "yaw": yaw,
-                "pitch": pitch,
-                "roll": roll,
-                "gaze_x": gaze_x,
-                "gaze_y": gaze_y,
-                "es_parpadeo": es_parpadeo,
-                "es_bostezo": es_bostezo,
-                "total_parpadeos": self.total_parpadeos,
-                "total_bostezos": self.total_bostezos,
-                **temporales
-            }
+            resultado.update(
+                es_parpadeo=es_parpadeo,
+                es_bostezo=es_bostezo,
+                total_parpadeos=self.total_parpadeos,
+                total_bostezos=self.total_bostezos,
+            )
+
+            if "temporales" in metricas:
+                temporales = self.calcular_metricas_temporales(t)
+                if not usa_gaze:
+                    del temporales["gaze_focus"], temporales["gaze_dispersion"]
+                resultado.update(temporales)
+
+            return resultado
 
         except Exception as e:
             print("❌ ERROR en procesar_frame:", e)
             return self._fallback()
 
+    # ----------------------------------------------------------------------
+    # Frame sin inferencia (omitido porque ya había uno más nuevo)
+    # ----------------------------------------------------------------------
+
+    def registrar_frame_omitido(self, t):
+        """
+        Extiende las ventanas temporales hasta `t` repitiendo la última
+        observación (sin parpadeo), para que PERCLOS y la base de tiempo
+        sigan el ritmo real de la cámara aunque no se corra FaceMesh.
+        """
+        if len(self.historial) == 0:
+            return
+        ultimo = self.historial.last()
+        ear, gx, gy = float(ultimo["ear"]), float(ultimo["gaze_x"]), float(ultimo["gaze_y"])
+        if t <= float(ultimo["t"]):
+            return
+        self.historial.append((t, ear, 0, gx, gy))
+
     # ----------------------------------------------------------------------
     # MÉTRICAS TEMPORALES (PERCLOS, blinks/min, foco, dispersión)
     # ----------------------------------------------------------------------
 
+    @traced("calcular_metricas_temporales")
     def calcular_metricas_temporales(self, t):
         ventana = t - config.VENTANA_PERCLOS
 
         # PERCLOS
         umbral = self.ear_umbral_bajo if self.calibracion_completa else config.EAR_BAJO_MIN
-        recientes = [(ts, e) for ts, e in self.buffer_ear if ts > ventana]
+        recientes = self.historial.since(ventana)
 
-        if recientes:
-            cerrados = sum(1 for _, e in recientes if e < umbral)
+        if len(recientes):
+            cerrados = np.count_nonzero(recientes["ear"] < umbral)
             perclos = cerrados / len(recientes)
         else:
             perclos = 0.0
 
         # Parpadeos/min
-        blinks = [(ts, p) for ts, p in self.buffer_parpadeos if ts > ventana]
-        cantidad = sum(1 for _, p in blinks if p)
+        cantidad = int(np.count_nonzero(recientes["parpadeo"]))
 
-        if len(self.buffer_timestamps) > 1:
-            dt = t - self.buffer_timestamps[0]
+        if len(self.historial) > 1:
+            dt = t - float(self.historial.first()["t"])
             dt = max(min(dt, 60), 1)  # evitar dividir por 0
             parpadeos_min = (cantidad / dt) * 60
         else:
             parpadeos_min = 0
 
         # Mirada
-        gaze_1s = [(ts, x, y) for ts, x, y in self.buffer_gaze if ts > t - 1]
-        if gaze_1s:
-            xs = [x for _, x, _ in gaze_1s]
-            ys = [y for _, _, y in gaze_1s]
-            dispersion = (np.var(xs) + np.var(ys)) * 1000
+        gaze_1s = self.historial.since(t - 1)
+        if len(gaze_1s):
+            dispersion = float(np.var(gaze_1s["gaze_x"]) + np.var(gaze_1s["gaze_y"])) * 1000
             gaze_focus = 1 - min(dispersion / 300, 1)
         else:
             gaze_focus = 1.0
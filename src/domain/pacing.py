@@ -0,0 +1,309 @@
+"""
+================================================================================
+PACING.PY — Sugerencias de ritmo para los clientes
+================================================================================
+Cada respuesta de /process (y de /process/segment) puede traer `pacing`: el
+intervalo recomendado hasta el próximo frame, el ancho máximo y la calidad
+JPEG. Un cliente que las respeta baja su carga antes de que el servidor
+tenga que descartar frames.
+
+Controladores (config.PACING_CONTROLLER):
+- "fixed":    siempre el ritmo objetivo (SCHEDULER_TARGET_FPS, o
+              PACING_BASE_INTERVAL_MS si no hay tope de fps) y la máxima
+              resolución/calidad. Sirve de línea base.
+- "adaptive": alarga el intervalo y baja resolución/calidad según la presión
+              del nodo (ocupación de los workers y espera en cola del
+              planificador, más el costo de decodificar el frame), y alarga
+              el intervalo cuando la sesión está estable (mismo nivel, score
+              y pose de cabeza casi quietos) o sin rostro.
+- "off":      sin sugerencias.
+
+Pacer junta las señales (estabilidad por sesión + carga del planificador),
+le pide la decisión al controlador y lleva los contadores que expone
+GET /process/pacing.
+================================================================================
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, Optional
+
+from . import config
+
+
+@dataclass
+class PacingSignals:
+    target_fps: float
+    workers: int = 1
+    running: int = 0
+    queued: int = 0
+    utilization: float = 0.0         # fracción de los workers ocupada
+    queue_ms: float = 0.0            # espera media hasta el turno
+    cost_ms: Optional[float] = None  # costo por frame de la sesión
+    stage_ms: Dict[str, float] = field(default_factory=dict)   # etapas del último frame
+    face_detected: bool = True
+    steady_seconds: float = 0.0      # tiempo con nivel, score y pose estables
+
+
+@dataclass
+class PacingHint:
+    next_interval_ms: float
+    max_width: int
+    jpeg_quality: int
+    reason: str                      # normal | steady | no_face | load | overload
+
+
+def base_interval_ms(target_fps: float) -> float:
+    """Cadencia sin ajustes; sin tope de fps (target_fps <= 0), PACING_BASE_INTERVAL_MS."""
+    return 1000.0 / target_fps if target_fps > 0 else config.PACING_BASE_INTERVAL_MS
+
+
+class PacingController:
+    """Interfaz: `decide` recibe las señales y devuelve la sugerencia."""
+
+    name = "base"
+
+    def decide(self, signals: PacingSignals) -> PacingHint:
+        raise NotImplementedError
+
+
+class FixedPacingController(PacingController):
+
+    name = "fixed"
+
+    def decide(self, signals: PacingSignals) -> PacingHint:
+        return PacingHint(
+            next_interval_ms=base_interval_ms(signals.target_fps),
+            max_width=config.PACING_MAX_WIDTH,
+            jpeg_quality=config.PACING_JPEG_QUALITY,
+            reason="normal",
+        )
+
+
+class AdaptivePacingController(PacingController):
+
+    name = "adaptive"
+
+    def __init__(
+        self,
+        high_load: float = 0.8,
+        queue_budget_ms: float = 50.0,
+        decode_budget_ms: float = 8.0,
+        steady_seconds: float = 10.0,
+        steady_factor: float = 2.0,
+        no_face_factor: float = 1.5,
+        min_fps: float = 2.0,
+    ):
+        self.high_load = high_load
+        self.queue_budget_ms = queue_budget_ms
+        self.decode_budget_ms = decode_budget_ms
+        self.steady_seconds = steady_seconds
+        self.steady_factor = steady_factor
+        self.no_face_factor = no_face_factor
+        self.min_fps = min_fps
+
+    def pressure(self, s: PacingSignals) -> float:
+        """> 1: el nodo no da abasto con el ritmo actual."""
+        return max(
+            s.utilization / self.high_load,
+            s.queue_ms / self.queue_budget_ms,
+            s.queued / max(1, s.workers),
+        )
+
+    def decide(self, s: PacingSignals) -> PacingHint:
+        base = base_interval_ms(s.target_fps)
+        pressure = self.pressure(s)
+
+        # Cadencia: la carga manda; si no hay carga, la estabilidad de la sesión
+        factor, reason = 1.0, "normal"
+        if s.steady_seconds >= self.steady_seconds:
+            factor, reason = self.steady_factor, "steady"
+        elif not s.face_detected:
+            factor, reason = self.no_face_factor, "no_face"
+        if pressure > 1.0 and pressure >= factor:
+            factor, reason = pressure, ("overload" if pressure > 1.5 else "load")
+        interval = min(base * factor, 1000.0 / self.min_fps)
+
+        # Resolución y calidad: escalones por presión; decodificar caro
+        # también pide frames más chicos
+        width, quality = config.PACING_MAX_WIDTH, config.PACING_JPEG_QUALITY
+        if pressure > 1.5:
+            width, quality = config.PACING_MIN_WIDTH, config.PACING_MIN_JPEG_QUALITY
+        elif pressure > 1.0 or s.stage_ms.get("decode", 0.0) > self.decode_budget_ms:
+            width = (config.PACING_MAX_WIDTH + config.PACING_MIN_WIDTH) // 2
+            quality = (config.PACING_JPEG_QUALITY + config.PACING_MIN_JPEG_QUALITY) // 2
+
+        return PacingHint(
+            next_interval_ms=round(interval, 1),
+            max_width=int(width),
+            jpeg_quality=int(quality),
+            reason=reason,
+        )
+
+
+def build_pacing_controller(kind: Optional[str] = None) -> Optional[PacingController]:
+    """Crea el controlador indicado (por defecto config.PACING_CONTROLLER); None = "off"."""
+    kind = kind or config.PACING_CONTROLLER
+    if kind == "off":
+        return None
+    if kind == "fixed":
+        return FixedPacingController()
+    if kind == "adaptive":
+        return AdaptivePacingController(
+            high_load=config.PACING_HIGH_LOAD,
+            queue_budget_ms=config.PACING_QUEUE_BUDGET_MS,
+            decode_budget_ms=config.PACING_DECODE_BUDGET_MS,
+            steady_seconds=config.PACING_STEADY_SECONDS,
+            steady_factor=config.PACING_STEADY_FACTOR,
+            no_face_factor=config.PACING_NO_FACE_FACTOR,
+            min_fps=config.PACING_MIN_FPS,
+        )
+    raise ValueError(f"Controlador de ritmo desconocido: {kind}")
+
+
+# ==============================================================================
+# Estabilidad por sesión
+# ==============================================================================
+
+class _Stability:
+
+    __slots__ = ("level", "score", "yaw", "pitch", "since", "face", "last_seen", "last_hint")
+
+    def __init__(self):
+        self.level = None
+        self.score = self.yaw = self.pitch = None
+        self.since = 0.0          # desde cuándo está estable
+        self.face = True
+        self.last_seen = 0.0
+        self.last_hint: Optional[PacingHint] = None
+
+
+class Pacer:
+    """Señales por sesión + decisión del controlador + contadores."""
+
+    def __init__(
+        self,
+        controller: Optional[PacingController],
+        target_fps: float,
+        load: Optional[Callable[[Optional[str]], dict]] = None,
+        max_sessions: int = 1000,
+        score_tolerance: float = 0.1,
+        motion_degrees: float = 8.0,
+    ):
+        self.controller = controller
+        self.target_fps = target_fps
+        self.load = load
+        self.max_sessions = max_sessions
+        self.score_tolerance = score_tolerance
+        self.motion_degrees = motion_degrees
+
+        self._sessions: "OrderedDict[str, _Stability]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.decisions = 0
+        self.by_reason: Dict[str, int] = {}
+        self._interval_sum = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.controller is not None
+
+    def observe(self, session_id: Optional[str], result: dict, t: Optional[float] = None) -> None:
+        """
+        Registra el resultado de un frame procesado (campos de
+        ProcessFrameResponse). El estado estable se corta si cambia el
+        nivel, si el score se aleja más de `score_tolerance` o la cabeza
+        gira más de `motion_degrees` desde el inicio del tramo estable.
+        """
+        if not self.enabled or not session_id:
+            return
+        t = time.time() if t is None else t
+        with self._lock:
+            st = self._session(session_id)
+            st.last_seen = t
+            st.face = bool(result.get("face_detected"))
+            if not st.face:
+                st.level = None
+                st.since = t
+                return
+
+            level = result.get("attention_level")
+            score = result.get("attention_score") or 0.0
+            yaw = result.get("head_yaw") or 0.0
+            pitch = result.get("head_pitch") or 0.0
+            moved = (
+                st.level != level
+                or abs(score - st.score) > self.score_tolerance
+                or abs(yaw - st.yaw) > self.motion_degrees
+                or abs(pitch - st.pitch) > self.motion_degrees
+            ) if st.level is not None else True
+            if moved:
+                st.level, st.score, st.yaw, st.pitch = level, score, yaw, pitch
+                st.since = t
+
+    def hint(self, session_id: Optional[str], stage_ms: Optional[dict] = None,
+             t: Optional[float] = None) -> Optional[dict]:
+        """Sugerencia para el próximo frame de la sesión (dict) o None si está apagado."""
+        if not self.enabled:
+            return None
+        t = time.time() if t is None else t
+        load = self.load(session_id) if self.load is not None else {}
+
+        with self._lock:
+            st = self._sessions.get(session_id) if session_id else None
+            signals = PacingSignals(
+                target_fps=self.target_fps,
+                workers=load.get("workers", 1),
+                running=load.get("running", 0),
+                queued=load.get("queued", 0),
+                utilization=load.get("utilization", 0.0),
+                queue_ms=load.get("queue_ms", 0.0),
+                cost_ms=load.get("cost_ms"),
+                stage_ms=dict(stage_ms or {}),
+                face_detected=st.face if st is not None else True,
+                steady_seconds=(t - st.since) if st is not None and st.level is not None else 0.0,
+            )
+
+        decision = self.controller.decide(signals)
+
+        with self._lock:
+            self.decisions += 1
+            self.by_reason[decision.reason] = self.by_reason.get(decision.reason, 0) + 1
+            self._interval_sum += decision.next_interval_ms
+            if st is not None:
+                st.last_hint = decision
+        return asdict(decision)
+
+    def stats(self) -> dict:
+        load = self.load(None) if self.load is not None else {}
+        with self._lock:
+            sessions = {
+                sid: asdict(st.last_hint) for sid, st in self._sessions.items() if st.last_hint is not None
+            }
+            mean_interval = self._interval_sum / self.decisions if self.decisions else None
+            return {
+                "enabled": self.enabled,
+                "controller": self.controller.name if self.controller is not None else "off",
+                "target_fps": self.target_fps,
+                "decisions": self.decisions,
+                "by_reason": dict(self.by_reason),
+                "mean_interval_ms": mean_interval,
+                "mean_recommended_fps": 1000.0 / mean_interval if mean_interval else None,
+                "load": load,
+                "sessions": sessions,
+            }
+
+    def forget(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _session(self, session_id: str) -> _Stability:
+        st = self._sessions.get(session_id)
+        if st is None:
+            st = self._sessions[session_id] = _Stability()
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        return st
@@ -0,0 +1,82 @@
+"""
+================================================================================
+PIPELINE_PROFILES.PY — Perfiles de calidad/rendimiento del pipeline
+================================================================================
+Cada perfil fija cuánto trabajo hace un frame:
+
+- decode_scale:          reducción de la imagen de entrada (1, 2, 4 u 8); el
+                         JPEG se decodifica directamente reducido.
+- refine_landmarks:      refinamiento de iris en FaceMesh.
+- pose_solver:           "iterative" (solvePnP iterativo), "sqpnp" o "epnp".
+- metricas:              qué calcula MetricsCalculator.procesar_frame
+                         ("mar", "apertura", "pose", "gaze", "temporales";
+                         el EAR siempre se calcula: alimenta parpadeos,
+                         PERCLOS y la calibración).
+- detalle_clasificador:  "full" (detalles con descripción por métrica),
+                         "compact" (detalles sin descripción) o "minimal"
+                         (solo estado, flag y score).
+
+Se elige por despliegue (config.PIPELINE_PROFILE) o por sesión (campo
+`profile` de /process). Benchmark: python -m src.tools.benchmark_profiles.
+================================================================================
+"""
+
+from dataclasses import dataclass
+from typing import FrozenSet, Optional
+
+import cv2
+
+from . import config
+
+
+TODAS_LAS_METRICAS = frozenset({"mar", "apertura", "pose", "gaze", "temporales"})
+
+POSE_SOLVERS = {
+    "iterative": cv2.SOLVEPNP_ITERATIVE,
+    "sqpnp": cv2.SOLVEPNP_SQPNP,
+    "epnp": cv2.SOLVEPNP_EPNP,
+}
+
+
+@dataclass(frozen=True)
+class PipelineProfile:
+    name: str
+    decode_scale: int = 1
+    refine_landmarks: bool = True
+    pose_solver: str = "iterative"
+    metricas: FrozenSet[str] = TODAS_LAS_METRICAS
+    detalle_clasificador: str = "full"
+
+    @property
+    def gaze(self) -> bool:
+        return "gaze" in self.metricas and self.refine_landmarks
+
+
+PROFILES = {
+    "full": PipelineProfile("full"),
+    "balanced": PipelineProfile(
+        "balanced",
+        decode_scale=2,
+        pose_solver="sqpnp",
+        detalle_clasificador="compact",
+    ),
+    # Solo pose de cabeza + EAR y el flag concentrado/no concentrado. A 1/4 el
+    # ojo de una webcam de 640 px queda en pocos píxeles y el EAR se degrada
+    "lite": PipelineProfile(
+        "lite",
+        decode_scale=2,
+        refine_landmarks=False,
+        pose_solver="epnp",
+        metricas=frozenset({"pose", "temporales"}),
+        detalle_clasificador="minimal",
+    ),
+}
+
+
+def get_profile(name: Optional[str] = None) -> PipelineProfile:
+    """Perfil por nombre (por defecto config.PIPELINE_PROFILE)."""
+    name = name or config.PIPELINE_PROFILE
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Perfil de pipeline desconocido: {name}") from None
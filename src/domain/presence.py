@@ -0,0 +1,92 @@
+"""
+================================================================================
+PRESENCE.PY — Compuerta de presencia por sesión
+================================================================================
+Cuando el estudiante se va del escritorio, correr FaceMesh completo en cada
+frame solo sirve para responder face_detected=False.
+
+Tras PRESENCE_MISSES_TO_GATE frames seguidos sin rostro la sesión pasa a modo
+"ausente": cada frame se decodifica reducido y se evalúa con un chequeo barato
+("motion": diferencia media contra el último frame reducido; "detector":
+detector de rostros de corto alcance sobre el frame reducido). Solo si el
+chequeo indica un posible rostro se corre FaceMesh otra vez.
+
+Para acotar la latencia de regreso aunque el chequeo barato falle, se corre
+FaceMesh al menos cada PRESENCE_RECHECK_SECONDS.
+================================================================================
+"""
+
+import sys
+
+import cv2
+import numpy as np
+
+from . import config
+
+
+class PresenceGate:
+
+    __slots__ = ("misses", "last_full_check", "_prev", "gated_frames")
+
+    def __init__(self):
+        self.misses = 0               # frames seguidos sin rostro
+        self.last_full_check = 0.0    # instante del último FaceMesh
+        self._prev = None             # último frame reducido (gris)
+        self.gated_frames = 0         # frames resueltos sin FaceMesh
+
+    @property
+    def gated(self):
+        return self.misses >= config.PRESENCE_MISSES_TO_GATE
+
+    def needs_landmarks(self, small, t, detect=None):
+        """
+        Decide si vale la pena correr FaceMesh sobre el frame cuya versión
+        reducida (BGR) es `small`. `detect(small) -> bool` es el detector
+        barato (modo "detector").
+        """
+        if not self.gated:
+            return True
+
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        prev, self._prev = self._prev, gray
+
+        if t - self.last_full_check >= config.PRESENCE_RECHECK_SECONDS:
+            return True
+
+        if config.PRESENCE_CHECK == "detector" and detect is not None:
+            likely = detect(small)
+        else:
+            likely = (
+                prev is not None
+                and prev.shape == gray.shape
+                and float(cv2.absdiff(prev, gray).mean(dtype=np.float64)) > config.PRESENCE_MOTION_THRESHOLD
+            )
+
+        if not likely:
+            self.gated_frames += 1
+        return likely
+
+    def record(self, found, t):
+        """Resultado de FaceMesh sobre el frame."""
+        self.last_full_check = t
+        if found:
+            self.misses = 0
+            self._prev = None
+        else:
+            self.misses += 1
+
+    def memory_bytes(self):
+        """Bytes aproximados (el frame reducido de referencia domina)."""
+        return sys.getsizeof(self) + (self._prev.nbytes if self._prev is not None else 0)
+
+    def to_dict(self):
+        """Estado serializable (JSON) sin el frame de referencia."""
+        return {"misses": self.misses, "last_full_check": self.last_full_check, "gated_frames": self.gated_frames}
+
+    @classmethod
+    def from_dict(cls, data):
+        gate = cls()
+        gate.misses = int(data["misses"])
+        gate.last_full_check = float(data["last_full_check"])
+        gate.gated_frames = int(data["gated_frames"])
+        return gate
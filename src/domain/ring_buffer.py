@@ -0,0 +1,156 @@
+"""
+================================================================================
+RING_BUFFER.PY — Buffer circular columnar sobre un array estructurado de NumPy
+================================================================================
+Reemplaza a los deque(maxlen=N) de tuplas de Python: la memoria se reserva una
+sola vez (N filas × bytes por fila) y no hay un objeto float por valor.
+
+Las filas se escriben en `head`; la más antigua está en `tail`. Cuando el buffer
+está lleno cada append sobrescribe la más antigua.
+
+Las consultas por ventana de tiempo asumen que la columna de tiempo es no
+decreciente (los frames se agregan en orden) y usan búsqueda binaria sobre los
+(como mucho dos) tramos contiguos del buffer.
+================================================================================
+"""
+
+import numpy as np
+
+
+class RingBuffer:
+
+    __slots__ = ("_data", "_head", "_tail", "_size", "capacity", "total")
+
+    def __init__(self, capacity, dtype):
+        self.capacity = int(capacity)
+        self._data = np.zeros(self.capacity, dtype=dtype)
+        self._head = 0   # próxima posición a escribir
+        self._tail = 0   # fila más antigua
+        self._size = 0
+        self.total = 0   # filas agregadas desde la creación (para deltas)
+
+    # ----------------------------------------------------------------------
+    # Escritura
+    # ----------------------------------------------------------------------
+
+    def append(self, row):
+        """Agrega una fila (tupla en el orden de los campos, o escalar)."""
+        self._data[self._head] = row
+        self._head = (self._head + 1) % self.capacity
+
+        if self._size == self.capacity:
+            self._tail = self._head
+        else:
+            self._size += 1
+        self.total += 1
+
+    def extend(self, rows):
+        """Agrega varias filas (array del mismo dtype) en orden."""
+        for row in rows[-self.capacity:]:
+            self.append(row)
+        # las filas que no entraron igual cuentan como agregadas
+        self.total += max(len(rows) - self.capacity, 0)
+
+    def clear(self):
+        self._head = self._tail = self._size = 0
+
+    # ----------------------------------------------------------------------
+    # Lectura
+    # ----------------------------------------------------------------------
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def dtype(self):
+        return self._data.dtype
+
+    @property
+    def nbytes(self):
+        """Memoria reservada por el buffer (bytes)."""
+        return self._data.nbytes
+
+    def _segments(self):
+        """Vistas (sin copia) de los tramos contiguos, del más antiguo al más nuevo."""
+        if self._size == 0:
+            return ()
+        if self._tail < self._head:
+            return (self._data[self._tail:self._head],)
+        return (self._data[self._tail:], self._data[:self._head])
+
+    def values(self, field=None):
+        """Copia ordenada (más antigua → más nueva) del buffer o de un campo."""
+        segs = self._segments()
+        if field is not None:
+            segs = tuple(s[field] for s in segs)
+        if not segs:
+            dtype = self._data.dtype if field is None else self._data.dtype[field]
+            return np.empty(0, dtype=dtype)
+        if len(segs) == 1:
+            return segs[0].copy()
+        return np.concatenate(segs)
+
+    def first(self):
+        if self._size == 0:
+            raise IndexError("RingBuffer vacío")
+        return self._data[self._tail]
+
+    def last(self):
+        if self._size == 0:
+            raise IndexError("RingBuffer vacío")
+        return self._data[(self._head - 1) % self.capacity]
+
+    def since(self, t, field="t"):
+        """
+        Filas cuyo campo de tiempo es estrictamente mayor que `t`
+        (búsqueda binaria por tramo; solo se copia la ventana).
+        """
+        parts = []
+        for seg in self._segments():
+            start = np.searchsorted(seg[field], t, side="right")
+            if start < len(seg):
+                parts.append(seg[start:])
+
+        if not parts:
+            return np.empty(0, dtype=self._data.dtype)
+        if len(parts) == 1:
+            return parts[0].copy()
+        return np.concatenate(parts)
+
+    def mean(self, field=None):
+        """Media de un campo (o del buffer escalar) sin copiar."""
+        segs = self._segments()
+        if not segs:
+            return 0.0
+        if field is not None:
+            segs = tuple(s[field] for s in segs)
+        total = sum(float(s.sum(dtype=np.float64)) for s in segs)
+        return total / self._size
+
+    def tail(self, n):
+        """Copia de las últimas `n` filas (como mucho las que hay)."""
+        n = min(n, self._size)
+        if n <= 0:
+            return np.empty(0, dtype=self._data.dtype)
+        start = self._head - n
+        if start >= 0:
+            return self._data[start:self._head].copy()
+        return np.concatenate((self._data[start:], self._data[:self._head]))
+
+    # ----------------------------------------------------------------------
+    # Estado crudo (serialización)
+    # ----------------------------------------------------------------------
+
+    def to_bytes(self):
+        """Filas ordenadas como bytes compactos."""
+        return self.values().tobytes()
+
+    def load_bytes(self, raw, total=None):
+        """Restaura desde to_bytes() (conserva como mucho `capacity` filas)."""
+        rows = np.frombuffer(raw, dtype=self._data.dtype)[-self.capacity:]
+        n = len(rows)
+        self._data[:n] = rows
+        self._tail = 0
+        self._size = n
+        self._head = n % self.capacity
+        self.total = n if total is None else total
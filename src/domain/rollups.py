@@ -0,0 +1,222 @@
+"""
+================================================================================
+ROLLUPS.PY — Resúmenes compactos de la salida por frame
+================================================================================
+Los dashboards solo necesitan el estado de atención por segundo, pero /process
+devuelve una respuesta completa por frame. Dos modos de salida compacta, uno
+por sesión:
+
+- "rollup": agrega los frames en ventanas de `window` segundos (score medio,
+  histograma de niveles, parpadeos y bostezos) y emite un registro por ventana
+  cuando llega el primer frame de una ventana posterior.
+- "events": emite solo cuando cambia attention_level o hay un evento
+  (parpadeo, bostezo, inicio o fin de un período de desconcentración severa).
+
+Ambos reciben el registro del frame como dict con las claves de
+ProcessFrameResponse (face_detected, attention_level, attention_score,
+is_blink, is_yawn) y devuelven la lista (casi siempre vacía) de registros a
+reenviar.
+================================================================================
+"""
+
+import math
+from typing import Dict, List, Optional
+
+from . import config
+
+
+NIVEL_SEVERO = config.AttentionLevel.DESCONCENTRACION_SEVERA.value
+
+
+class WindowRollup:
+
+    def __init__(self, window=1.0):
+        self.window = float(window)
+        self._start = None   # inicio de la ventana abierta
+        self._reset()
+
+    def _reset(self):
+        self.frames = 0
+        self.face_frames = 0
+        self.score_sum = 0.0
+        self.levels: Dict[str, int] = {}
+        self.blinks = 0
+        self.yawns = 0
+
+    def add(self, t, frame) -> List[dict]:
+        start = math.floor(t / self.window) * self.window
+        emitted = []
+        if self._start is None:
+            self._start = start
+        elif start > self._start:
+            emitted.append(self._record())
+            self._reset()
+            self._start = start
+        # Un frame atrasado (start < ventana abierta) se suma a la ventana abierta
+
+        self.frames += 1
+        if frame.get("face_detected"):
+            self.face_frames += 1
+            self.score_sum += float(frame.get("attention_score") or 0.0)
+            level = frame.get("attention_level")
+            if level:
+                self.levels[level] = self.levels.get(level, 0) + 1
+        self.blinks += bool(frame.get("is_blink"))
+        self.yawns += bool(frame.get("is_yawn"))
+        return emitted
+
+    def flush(self) -> List[dict]:
+        """Cierra la ventana abierta (fin de sesión)."""
+        if self._start is None or self.frames == 0:
+            return []
+        record = self._record()
+        self._reset()
+        self._start = None
+        return [record]
+
+    def to_dict(self) -> dict:
+        """Estado serializable (JSON) de la ventana abierta."""
+        return {
+            "window": self.window,
+            "start": self._start,
+            "frames": self.frames,
+            "face_frames": self.face_frames,
+            "score_sum": self.score_sum,
+            "levels": dict(self.levels),
+            "blinks": self.blinks,
+            "yawns": self.yawns,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "WindowRollup":
+        rollup = cls(float(data["window"]))
+        rollup._start = _opt_float(data["start"])
+        rollup.frames = int(data["frames"])
+        rollup.face_frames = int(data["face_frames"])
+        rollup.score_sum = float(data["score_sum"])
+        rollup.levels = {str(k): int(v) for k, v in data["levels"].items()}
+        rollup.blinks = int(data["blinks"])
+        rollup.yawns = int(data["yawns"])
+        return rollup
+
+    def _record(self) -> dict:
+        return {
+            "type": "rollup",
+            "window_start": self._start,
+            "window_end": self._start + self.window,
+            "frames": self.frames,
+            "face_frames": self.face_frames,
+            "mean_score": self.score_sum / self.face_frames if self.face_frames else None,
+            "levels": dict(self.levels),
+            "blinks": self.blinks,
+            "yawns": self.yawns,
+        }
+
+
+class EventFilter:
+    """
+    Un período de desconcentración comienza cuando el nivel severo se
+    mantiene `min_distraction_seconds` (el evento lleva el instante en que
+    empezó) y termina con el primer frame no severo.
+    """
+
+    def __init__(self, min_distraction_seconds=1.0):
+        self.min_distraction_seconds = float(min_distraction_seconds)
+        self._last_t: Optional[float] = None
+        self._level: Optional[str] = None
+        self._severe_since: Optional[float] = None
+        self._in_distraction = False
+
+    def to_dict(self) -> dict:
+        """Estado serializable (JSON)."""
+        return {
+            "min_distraction_seconds": self.min_distraction_seconds,
+            "last_t": self._last_t,
+            "level": self._level,
+            "severe_since": self._severe_since,
+            "in_distraction": self._in_distraction,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "EventFilter":
+        events = cls(float(data["min_distraction_seconds"]))
+        events._last_t = _opt_float(data["last_t"])
+        events._level = None if data["level"] is None else str(data["level"])
+        events._severe_since = _opt_float(data["severe_since"])
+        events._in_distraction = bool(data["in_distraction"])
+        return events
+
+    def add(self, t, frame) -> List[dict]:
+        if self._last_t is not None and t < self._last_t:
+            # Ya se emitió el estado de un frame posterior
+            return []
+        first = self._last_t is None
+        self._last_t = t
+
+        level = frame.get("attention_level") if frame.get("face_detected") else None
+        events = []
+
+        if first or level != self._level:
+            events.append({
+                "type": "level_change",
+                "t": t,
+                "attention_level": level,
+                "previous_level": self._level,
+                "attention_score": frame.get("attention_score"),
+            })
+            self._level = level
+
+        if frame.get("is_blink"):
+            events.append({"type": "blink", "t": t})
+        if frame.get("is_yawn"):
+            events.append({"type": "yawn", "t": t})
+
+        if level == NIVEL_SEVERO:
+            if self._severe_since is None:
+                self._severe_since = t
+            if not self._in_distraction and t - self._severe_since >= self.min_distraction_seconds:
+                self._in_distraction = True
+                events.append({"type": "distraction_start", "t": self._severe_since})
+        else:
+            if self._in_distraction:
+                events.append({
+                    "type": "distraction_end",
+                    "t": t,
+                    "duration": t - self._severe_since,
+                })
+            self._severe_since = None
+            self._in_distraction = False
+
+        return events
+
+    def flush(self) -> List[dict]:
+        if not self._in_distraction:
+            return []
+        self._in_distraction = False
+        return [{
+            "type": "distraction_end",
+            "t": self._last_t,
+            "duration": self._last_t - self._severe_since,
+        }]
+
+
+def _opt_float(value) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+def emitter_from_dict(mode: str, data: dict):
+    """Reconstruye un emisor guardado con su to_dict()."""
+    if mode == "rollup":
+        return WindowRollup.from_dict(data)
+    if mode == "events":
+        return EventFilter.from_dict(data)
+    raise ValueError(f"Modo de salida desconocido: {mode}")
+
+
+def build_emitter(mode: str, window: Optional[float] = None):
+    """Emisor para el modo de salida pedido ("rollup" o "events")."""
+    if mode == "rollup":
+        return WindowRollup(window or config.ROLLUP_WINDOW_SECONDS)
+    if mode == "events":
+        return EventFilter(config.DISTRACTION_MIN_SECONDS)
+    raise ValueError(f"Modo de salida desconocido: {mode}")
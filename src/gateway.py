@@ -0,0 +1,708 @@
+"""
+gateway.py
+Gateway con afinidad de sesión delante de varios workers.
+
+El estado temporal de una sesión (ventanas de PERCLOS y parpadeos,
+calibración, suavizado, orden de frames) vive en el worker que la
+atiende. Un balanceador round-robin reparte los frames de una misma
+sesión entre workers y rompe ese estado. El gateway asigna cada
+session_id (o user_id) a un worker con hashing consistente con
+cargas acotadas (infrastructure/hash_ring.py) y le manda siempre a
+ese worker los requests de la sesión:
+
+    POST /process                 session_id / user_id del cuerpo JSON
+    POST /process/segment         session_id / user_id de la query
+    /sessions/{id}/...            el id de la ruta (incluye SSE)
+
+El resto de los requests va a cualquier worker sano (round-robin).
+
+Cuando entra o sale un worker se mueven solo las sesiones que el
+anillo reasigna. El estado de cada una se traspasa del worker
+anterior al nuevo (POST /sessions/{id}/state/export y PUT
+/sessions/{id}/state con HANDOFF_TOKEN, el formato de hibernación)
+antes de su próximo frame: el traspaso espera a que terminen los
+frames en curso hacia el worker anterior y retiene los nuevos hasta
+terminar. Si el worker anterior murió, la
+sesión empieza de cero en el nuevo (la calibración por usuario se
+conserva si el CALIBRATION_DB_PATH es compartido).
+
+Un worker que no responde GET / se saca del anillo y vuelve a entrar
+cuando se recupera.
+
+Los endpoints de traspaso (/sessions/{id}/state...) no se exponen: solo
+los usa el gateway, con HANDOFF_TOKEN, hablando directo con los workers.
+
+Administración (con X-Gateway-Token = GATEWAY_ADMIN_TOKEN):
+    GET    /gateway/stats
+    POST   /gateway/workers?url=http://host:puerto    alta
+    DELETE /gateway/workers?url=http://host:puerto    baja ordenada (traspasa y saca)
+
+Uso:
+    # Workers ya levantados
+    python -m src.gateway --workers http://127.0.0.1:8001,http://127.0.0.1:8002 --port 8000
+
+    # Cluster local: levanta 3 workers (uvicorn src.main:app) en 8001..8003
+    python -m src.gateway --spawn 3 --port 8000
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import queue
+import secrets
+import signal
+import subprocess
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, quote, urlparse
+
+from src.domain import config
+from src.infrastructure.hash_ring import HashRing, Move
+
+# Cabeceras que no se reenvían (por conexión, o que recalcula el servidor)
+HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te",
+    "trailer", "transfer-encoding", "upgrade", "host", "content-length",
+}
+# Credenciales del gateway y del traspaso: nunca se reenvían a los workers
+PRIVATE_HEADERS = {"x-handoff-token", "x-gateway-token"}
+
+
+class BackendUnavailable(RuntimeError):
+    """No se pudo hablar con el worker (conexión rechazada, caída o timeout)."""
+
+
+# ============================================================
+# 1. Conexiones a un worker
+# ============================================================
+
+class Backend:
+    """Un worker: conexiones keep-alive reutilizables y contadores."""
+
+    def __init__(self, url: str, pool_size: int = 32, timeout: float = 30.0):
+        parsed = urlparse(url)
+        if parsed.scheme != "http" or not parsed.hostname:
+            raise ValueError(f"URL de worker inválida (se espera http://host:puerto): {url}")
+        self.url = url.rstrip("/")
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue(maxsize=pool_size)
+
+        self.healthy = True
+        self.failures = 0        # chequeos fallidos seguidos
+        self.requests = 0
+        self.errors = 0
+
+    def _connect(self, timeout: Optional[float] = None) -> http.client.HTTPConnection:
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout or self.timeout)
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None,
+                headers: Optional[dict] = None, timeout: Optional[float] = None) -> Tuple[int, list, bytes]:
+        """(status, cabeceras, cuerpo). Lanza BackendUnavailable."""
+        self.requests += 1
+        for attempt in range(2):
+            try:
+                conn, reused = self._idle.get_nowait(), True
+            except queue.Empty:
+                conn, reused = self._connect(timeout), False
+            if timeout is not None and conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+                data = resp.read()
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                # Una conexión guardada que el worker ya cerró: reintentar con otra
+                if reused and attempt == 0 and not isinstance(e, TimeoutError):
+                    continue
+                self.errors += 1
+                raise BackendUnavailable(f"{self.url}: {type(e).__name__}: {e}") from e
+
+            if resp.will_close:
+                conn.close()
+            else:
+                if conn.sock is not None:
+                    conn.sock.settimeout(self.timeout)
+                try:
+                    self._idle.put_nowait(conn)
+                except queue.Full:
+                    conn.close()
+            return resp.status, resp.getheaders(), data
+        raise BackendUnavailable(self.url)
+
+    def stream(self, method: str, path: str, headers: Optional[dict] = None):
+        """Respuesta abierta (SSE) sobre una conexión propia; devuelve (status, cabeceras, chunks)."""
+        self.requests += 1
+        conn = self._connect(timeout=None)
+        conn.timeout = None
+        try:
+            conn.request(method, path, headers=headers or {})
+            resp = conn.getresponse()
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            self.errors += 1
+            raise BackendUnavailable(f"{self.url}: {type(e).__name__}: {e}") from e
+
+        def chunks() -> Iterator[bytes]:
+            try:
+                while True:
+                    data = resp.read1(65536)
+                    if not data:
+                        return
+                    yield data
+            except (OSError, http.client.HTTPException):
+                return
+            finally:
+                conn.close()
+
+        return resp.status, resp.getheaders(), chunks()
+
+    def check(self, timeout: float = 2.0) -> bool:
+        conn = self._connect(timeout)
+        try:
+            conn.request("GET", "/")
+            return conn.getresponse().status == 200
+        except (OSError, http.client.HTTPException):
+            return False
+        finally:
+            conn.close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+# ============================================================
+# 2. Ruteo por sesión y traspaso de estado
+# ============================================================
+
+class _Route:
+
+    __slots__ = ("node", "pending_from", "migrating", "inflight", "last_seen", "cond")
+
+    def __init__(self, node: str):
+        self.node = node
+        self.pending_from: Optional[str] = None   # worker que todavía tiene el estado
+        self.migrating = False
+        self.inflight = 0
+        self.last_seen = time.monotonic()
+        self.cond = threading.Condition()
+
+
+def session_key(method: str, path: str, query: str, body: bytes) -> Optional[str]:
+    """Clave de afinidad del request (la misma que usa AttentionProcessor) o None."""
+    if path.startswith("/sessions/"):
+        part = path.split("/")[2]
+        return part if part and part not in ("events", "timeline") else None
+
+    if path == "/process/segment":
+        params = parse_qs(query)
+        fields = {k: v[0] for k, v in params.items() if v}
+    elif path == "/process" and method == "POST" and body:
+        try:
+            fields = json.loads(body)
+        except ValueError:
+            return None
+        if not isinstance(fields, dict):
+            return None
+    else:
+        return None
+
+    session_id, user_id = fields.get("session_id"), fields.get("user_id")
+    if session_id:
+        return str(session_id)
+    return f"user:{user_id}" if user_id else None
+
+
+class SessionGateway:
+
+    def __init__(
+        self,
+        workers: List[str],
+        vnodes: int = 160,
+        load_factor: float = 1.25,
+        session_ttl: float = 600.0,
+        handoff_token: str = "",
+        timeout: float = 30.0,
+        pool_size: int = 32,
+        health_seconds: float = 2.0,
+    ):
+        self.ring = HashRing(vnodes=vnodes, load_factor=load_factor)
+        self.session_ttl = session_ttl
+        self.handoff_token = handoff_token
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.health_seconds = health_seconds
+
+        self.backends: Dict[str, Backend] = {}     # todos los conocidos (sanos o no)
+        self.routes: Dict[str, _Route] = {}
+        self._lock = threading.Lock()
+        self._rr = itertools.count()
+        self._stop = threading.Event()
+        self._health: Optional[threading.Thread] = None
+        self.counters = {"moves": 0, "handoffs": 0, "handoff_empty": 0, "handoff_failed": 0,
+                         "expired": 0, "retries": 0}
+
+        for url in workers:
+            self.add_worker(url)
+
+    # ---------------------------------------------------------
+    # Membresía
+    # ---------------------------------------------------------
+    def add_worker(self, url: str) -> int:
+        """Alta (o regreso) de un worker. Devuelve cuántas sesiones se le mueven."""
+        url = url.rstrip("/")
+        with self._lock:
+            backend = self.backends.get(url)
+            if backend is None:
+                backend = self.backends[url] = Backend(url, self.pool_size, self.timeout)
+            backend.healthy, backend.failures = True, 0
+            moves = self.ring.add_node(url)
+            self._record_moves(moves)
+        self._migrate_async(moves)
+        return len(moves)
+
+    def remove_worker(self, url: str, drain: bool = True) -> int:
+        """
+        Baja de un worker. Con `drain` el estado de sus sesiones se traspasa
+        antes de volver; si no (worker caído) se intenta en el próximo frame.
+        """
+        url = url.rstrip("/")
+        with self._lock:
+            backend = self.backends.get(url)
+            if backend is None:
+                return 0
+            backend.healthy = False
+            moves = self.ring.remove_node(url)
+            self._record_moves(moves)
+        if drain:
+            self._migrate(moves)
+            with self._lock:
+                if url not in self.ring.loads:
+                    self.backends.pop(url, None)
+            backend.close()
+        else:
+            self._migrate_async(moves)
+        return len(moves)
+
+    def _record_moves(self, moves: List[Move]) -> None:
+        """Apunta las rutas movidas a su worker nuevo (con self._lock)."""
+        for key, old, new in moves:
+            route = self.routes.get(key)
+            if route is None:
+                continue
+            if new is None:
+                # No quedan workers: la próxima vez se asigna de nuevo
+                del self.routes[key]
+                continue
+            with route.cond:
+                if route.pending_from is None:
+                    route.pending_from = old
+                elif route.pending_from == new:
+                    route.pending_from = None       # volvió a donde estaba el estado
+                route.node = new
+        self.counters["moves"] += len(moves)
+
+    def _migrate_async(self, moves: List[Move]) -> None:
+        if moves:
+            threading.Thread(target=self._migrate, args=(moves,), name="gateway-handoff", daemon=True).start()
+
+    def _migrate(self, moves: List[Move]) -> None:
+        for key, _, _ in moves:
+            with self._lock:
+                route = self.routes.get(key)
+            if route is not None:
+                with route.cond:
+                    self._settle(key, route)
+
+    # ---------------------------------------------------------
+    # Ruteo
+    # ---------------------------------------------------------
+    def _route(self, key: str) -> _Route:
+        with self._lock:
+            route = self.routes.get(key)
+            if route is None:
+                node = self.ring.assign(key)
+                if node is None:
+                    raise BackendUnavailable("No hay workers disponibles")
+                route = self.routes[key] = _Route(node)
+            route.last_seen = time.monotonic()
+            return route
+
+    def _settle(self, key: str, route: _Route) -> None:
+        """
+        Con route.cond tomado: si el estado de la sesión quedó en otro
+        worker, lo traspasa (una sola vez, esperando los frames en curso).
+        """
+        while route.pending_from is not None:
+            if route.migrating or route.inflight:
+                route.cond.wait(self.timeout)
+                continue
+            source, target = route.pending_from, route.node
+            route.migrating = True
+            route.cond.release()
+            try:
+                self._transfer(key, source, target)
+            finally:
+                route.cond.acquire()
+                route.migrating = False
+                if route.pending_from == source:
+                    route.pending_from = None
+                route.cond.notify_all()
+
+    def _transfer(self, key: str, source: str, target: str) -> None:
+        if source == target:
+            return
+        if not self.handoff_token:
+            self.counters["handoff_failed"] += 1
+            return
+        with self._lock:
+            src, dst = self.backends.get(source), self.backends.get(target)
+        path = f"/sessions/{quote(key, safe='')}/state"
+        headers = {"X-Handoff-Token": self.handoff_token}
+        try:
+            if src is None:
+                raise BackendUnavailable(f"{source} ya no está")
+            if dst is None:
+                # Sin destino no se exporta: el estado queda en el worker anterior
+                raise BackendUnavailable(f"{target} ya no está")
+            status, _, blob = src.request("POST", f"{path}/export", headers=headers, timeout=5.0)
+            if status == 404:
+                self.counters["handoff_empty"] += 1
+                return
+            if status != 200:
+                raise BackendUnavailable(f"{source} respondió {status} al exportar {key}")
+            status, _, detail = dst.request("PUT", path, body=blob,
+                                            headers={**headers, "Content-Type": "application/octet-stream"},
+                                            timeout=5.0)
+            if status != 204:
+                raise BackendUnavailable(f"{target} respondió {status} al importar {key}: {detail[:200]!r}")
+            self.counters["handoffs"] += 1
+        except BackendUnavailable as e:
+            # El estado se pierde: la sesión sigue de cero en el worker nuevo
+            print(f"⚠️ Traspaso fallido de {key} ({source} → {target}):", e)
+            self.counters["handoff_failed"] += 1
+
+    def _enter(self, key: str) -> Tuple[_Route, Backend]:
+        route = self._route(key)
+        with route.cond:
+            self._settle(key, route)
+            route.inflight += 1
+            backend = self.backends.get(route.node)
+        if backend is None:
+            self._leave(route)
+            raise BackendUnavailable(f"{route.node} ya no está")
+        return route, backend
+
+    @staticmethod
+    def _leave(route: _Route) -> None:
+        with route.cond:
+            route.inflight -= 1
+            if route.inflight == 0:
+                route.cond.notify_all()
+
+    def _any_backend(self) -> Backend:
+        with self._lock:
+            nodes = self.ring.nodes
+            if not nodes:
+                raise BackendUnavailable("No hay workers disponibles")
+            return self.backends[nodes[next(self._rr) % len(nodes)]]
+
+    def forward(self, method: str, path: str, query: str, headers: dict, body: bytes) -> Tuple[int, list, bytes]:
+        """Reenvía el request al worker de su sesión (o a cualquiera si no tiene)."""
+        target = path + (f"?{query}" if query else "")
+        key = session_key(method, path, query, body)
+        for attempt in range(2):
+            if key is None:
+                backend, route = self._any_backend(), None
+            else:
+                route, backend = self._enter(key)
+            try:
+                return backend.request(method, target, body=body or None, headers=headers)
+            except BackendUnavailable:
+                # Worker caído: se saca del anillo y se reintenta una vez en otro
+                if attempt == 1 or not self._mark_down(backend):
+                    raise
+                self.counters["retries"] += 1
+            finally:
+                if route is not None:
+                    self._leave(route)
+        raise BackendUnavailable(target)
+
+    def open_stream(self, path: str, query: str, headers: dict):
+        """Reenvía un GET de larga duración (SSE) al worker de la sesión."""
+        key = session_key("GET", path, query, b"")
+        if key is None:
+            backend = self._any_backend()
+        else:
+            # Como forward (traspaso pendiente incluido), pero el stream no
+            # cuenta como frame en curso: no debe frenar futuros traspasos
+            route, backend = self._enter(key)
+            self._leave(route)
+        return backend.stream("GET", path + (f"?{query}" if query else ""), headers=headers)
+
+    # ---------------------------------------------------------
+    # Salud y vencimientos
+    # ---------------------------------------------------------
+    def _mark_down(self, backend: Backend) -> bool:
+        """Saca del anillo a un worker que dejó de responder. True si estaba."""
+        if backend.check(timeout=1.0):
+            return False
+        with self._lock:
+            active = backend.url in self.ring.loads
+        if active:
+            print(f"⚠️ Worker sin respuesta, fuera del anillo: {backend.url}")
+            self.remove_worker(backend.url, drain=False)
+        return active
+
+    def start(self) -> None:
+        if self._health is None:
+            self._health = threading.Thread(target=self._health_loop, name="gateway-health", daemon=True)
+            self._health.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        for backend in list(self.backends.values()):
+            backend.close()
+
+    def _health_loop(self) -> None:
+        while not self._stop.wait(self.health_seconds):
+            for backend in list(self.backends.values()):
+                ok = backend.check(timeout=min(2.0, self.health_seconds))
+                with self._lock:
+                    active = backend.url in self.ring.loads
+                if ok and not active:
+                    print(f"✅ Worker de vuelta en el anillo: {backend.url}")
+                    self.add_worker(backend.url)
+                elif not ok and active:
+                    backend.failures += 1
+                    if backend.failures >= 2:
+                        print(f"⚠️ Worker sin respuesta, fuera del anillo: {backend.url}")
+                        self.remove_worker(backend.url, drain=False)
+                elif ok:
+                    backend.failures = 0
+            self._expire()
+
+    def _expire(self) -> None:
+        """Libera el lugar en el anillo de las sesiones sin requests hace session_ttl."""
+        now = time.monotonic()
+        with self._lock:
+            for key, route in list(self.routes.items()):
+                if now - route.last_seen < self.session_ttl:
+                    continue
+                with route.cond:
+                    if route.inflight or route.migrating or route.pending_from is not None:
+                        continue
+                del self.routes[key]
+                self.ring.release(key)
+                self.counters["expired"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            loads = dict(self.ring.loads)
+            workers = {
+                url: {
+                    "in_ring": url in loads,
+                    "healthy": b.healthy,
+                    "sessions": loads.get(url, 0),
+                    "requests": b.requests,
+                    "errors": b.errors,
+                }
+                for url, b in self.backends.items()
+            }
+            pending = sum(1 for r in self.routes.values() if r.pending_from is not None)
+            return {
+                "workers": workers,
+                "ring": self.ring.stats(),
+                "sessions": len(self.routes),
+                "pending_handoffs": pending,
+                "handoff_enabled": bool(self.handoff_token),
+                **self.counters,
+            }
+
+
+# ============================================================
+# 3. Aplicación ASGI
+# ============================================================
+
+def create_app(gateway: SessionGateway, admin_token: str = ""):
+    import hmac
+
+    from anyio import to_thread
+    from fastapi import FastAPI, Header, HTTPException, Request, Response
+    from fastapi.concurrency import run_in_threadpool
+    from fastapi.responses import StreamingResponse
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # Cada request reenviado ocupa un hilo mientras espera al worker
+        to_thread.current_default_thread_limiter().total_tokens = max(40, gateway.pool_size * 4)
+        gateway.start()
+        yield
+        gateway.stop()
+
+    app = FastAPI(title="Attention Monitor Gateway", lifespan=lifespan)
+
+    def check_admin(token: Optional[str]) -> None:
+        if not (admin_token and token is not None and hmac.compare_digest(token, admin_token)):
+            raise HTTPException(status_code=403, detail="Token inválido o administración deshabilitada")
+
+    @app.get("/gateway/stats")
+    def gateway_stats(x_gateway_token: Optional[str] = Header(None)):
+        check_admin(x_gateway_token)
+        return gateway.stats()
+
+    @app.post("/gateway/workers")
+    def add_worker(url: str, x_gateway_token: Optional[str] = Header(None)):
+        check_admin(x_gateway_token)
+        try:
+            return {"url": url, "moved": gateway.add_worker(url)}
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+    @app.delete("/gateway/workers")
+    def remove_worker(url: str, x_gateway_token: Optional[str] = Header(None)):
+        check_admin(x_gateway_token)
+        return {"url": url, "moved": gateway.remove_worker(url, drain=True)}
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS", "HEAD"])
+    async def proxy(path: str, request: Request):
+        path = "/" + path
+        if _is_handoff_path(path):
+            raise HTTPException(status_code=404, detail="Not Found")
+        query = request.url.query
+        headers = {
+            k: v for k, v in request.headers.items()
+            if k.lower() not in HOP_HEADERS and k.lower() not in PRIVATE_HEADERS
+        }
+        if request.client is not None:
+            headers["X-Forwarded-For"] = request.client.host
+
+        try:
+            if request.method == "GET" and path.startswith("/sessions/") and path.endswith("/events"):
+                status, resp_headers, chunks = await run_in_threadpool(gateway.open_stream, path, query, headers)
+                return StreamingResponse(chunks, status_code=status, headers=_response_headers(resp_headers))
+
+            body = await request.body()
+            status, resp_headers, data = await run_in_threadpool(
+                gateway.forward, request.method, path, query, headers, body
+            )
+        except BackendUnavailable as e:
+            raise HTTPException(status_code=502, detail=str(e))
+        return Response(content=data, status_code=status, headers=_response_headers(resp_headers))
+
+    return app
+
+
+def _is_handoff_path(path: str) -> bool:
+    """/sessions/{id}/state y lo que cuelgue de ahí (solo entre gateway y workers)."""
+    parts = [p for p in path.split("/") if p]
+    return len(parts) >= 3 and parts[0] == "sessions" and "state" in parts[2:]
+
+
+def _response_headers(headers: list) -> dict:
+    return {k: v for k, v in headers if k.lower() not in HOP_HEADERS and k.lower() != "content-encoding"}
+
+
+# ============================================================
+# 4. Cluster local y CLI
+# ============================================================
+
+def spawn_workers(count: int, base_port: int, host: str, env: dict) -> Tuple[List[subprocess.Popen], List[str]]:
+    """Levanta `count` workers uvicorn src.main:app en puertos consecutivos."""
+    procs, urls = [], []
+    for i in range(count):
+        port = base_port + i
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "src.main:app", "--host", host, "--port", str(port),
+             "--log-level", "warning"],
+            env=env,
+        ))
+        urls.append(f"http://{host}:{port}")
+    return procs, urls
+
+
+def wait_ready(urls: List[str], timeout: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout
+    pending = [Backend(u) for u in urls]
+    while pending:
+        if time.monotonic() > deadline:
+            raise TimeoutError("Workers sin responder: " + ", ".join(b.url for b in pending))
+        pending = [b for b in pending if not b.check(timeout=1.0)]
+        if pending:
+            time.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gateway con afinidad de sesión (hashing consistente)")
+    parser.add_argument("--workers", default=config.GATEWAY_WORKERS,
+                        help="URLs de los workers separadas por coma")
+    parser.add_argument("--spawn", type=int, default=0,
+                        help="Levantar N workers locales (uvicorn src.main:app)")
+    parser.add_argument("--worker-port", type=int, default=8001, help="Primer puerto de los workers locales")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--vnodes", type=int, default=config.GATEWAY_VNODES)
+    parser.add_argument("--load-factor", type=float, default=config.GATEWAY_LOAD_FACTOR)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    token = config.HANDOFF_TOKEN
+    procs: List[subprocess.Popen] = []
+    workers = [u.strip() for u in args.workers.split(",") if u.strip()]
+    if args.spawn:
+        # El cluster local comparte un token propio para traspasar sesiones
+        token = token or secrets.token_hex(16)
+        env = {**os.environ, "HANDOFF_TOKEN": token}
+        procs, spawned = spawn_workers(args.spawn, args.worker_port, "127.0.0.1", env)
+        workers += spawned
+        print(f"🚀 Levantando {args.spawn} workers: {', '.join(spawned)}")
+        try:
+            wait_ready(spawned)
+        except TimeoutError as e:
+            for p in procs:
+                p.terminate()
+            sys.exit(f"❌ {e}")
+    if not workers:
+        sys.exit("❌ Indicar --workers o --spawn")
+    if not token:
+        print("⚠️ HANDOFF_TOKEN vacío: las sesiones que cambien de worker empiezan de cero")
+    if not config.GATEWAY_ADMIN_TOKEN:
+        print("⚠️ GATEWAY_ADMIN_TOKEN vacío: /gateway/* deshabilitado")
+
+    gateway = SessionGateway(
+        workers,
+        vnodes=args.vnodes,
+        load_factor=args.load_factor,
+        session_ttl=config.GATEWAY_SESSION_TTL_SECONDS,
+        handoff_token=token,
+        timeout=config.GATEWAY_TIMEOUT_SECONDS,
+        pool_size=config.GATEWAY_POOL_SIZE,
+        health_seconds=config.GATEWAY_HEALTH_SECONDS,
+    )
+    print(f"🔀 Gateway en {args.host}:{args.port} → {len(workers)} workers")
+    try:
+        uvicorn.run(create_app(gateway, admin_token=config.GATEWAY_ADMIN_TOKEN), host=args.host, port=args.port, log_level="warning")
+    finally:
+        for p in procs:
+            p.send_signal(signal.SIGTERM)
+        for p in procs:
+            try:
+                p.wait(timeout=config.SUPERVISOR_GRACEFUL_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+calibration_store.py
+===========================================================
+Perfiles de calibración EAR persistentes por usuario.
+
+MetricsCalculator necesita EAR_CALIBRACION_FRAMES frames para
+personalizar sus umbrales; sin perfil, cada reconexión, recarga
+de página o reinicio del worker repite ese calentamiento.
+
+El perfil (ear_base + umbrales derivados) se guarda en memoria
+y, si se indica una ruta, en SQLite. Las escrituras a disco se
+hacen en un hilo de fondo para no bloquear el procesamiento de
+frames. Los perfiles vencen después de `ttl_seconds`.
+
+En memoria se guardan a lo sumo `max_profiles` (LRU). Con SQLite,
+el hilo de escritura además borra cada `prune_seconds` los perfiles
+vencidos de memoria y de disco.
+===========================================================
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+
+@dataclass
+class CalibrationProfile:
+    ear_base: float
+    ear_umbral_concentrado: float
+    ear_umbral_bajo: float
+    ear_umbral_severo: float
+    updated_at: float = 0.0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class CalibrationProfileStore:
+    """
+    Caché en memoria de perfiles con respaldo opcional en SQLite.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttl_seconds: float = 30 * 24 * 3600,
+        max_profiles: int = 10000,
+        prune_seconds: float = 3600.0,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_profiles = max_profiles
+        self.prune_seconds = prune_seconds
+
+        self._profiles: "OrderedDict[str, CalibrationProfile]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._conn = None
+        self._db_lock = threading.Lock()
+        self._writes: "queue.Queue" = queue.Queue()
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS calibration_profiles (
+                    user_id TEXT PRIMARY KEY,
+                    ear_base REAL NOT NULL,
+                    ear_umbral_concentrado REAL NOT NULL,
+                    ear_umbral_bajo REAL NOT NULL,
+                    ear_umbral_severo REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.commit()
+            threading.Thread(target=self._writer, name="calibration-writer", daemon=True).start()
+
+    # ---------------------------------------------------------
+    # Lectura
+    # ---------------------------------------------------------
+    def get(self, user_id: str) -> Optional[CalibrationProfile]:
+        """Perfil vigente del usuario o None (si no existe o venció)."""
+        with self._lock:
+            profile = self._profiles.get(user_id)
+            if profile is not None:
+                self._profiles.move_to_end(user_id)
+
+        if profile is None and self._conn is not None:
+            profile = self._load(user_id)
+            if profile is not None:
+                with self._lock:
+                    profile = self._profiles.setdefault(user_id, profile)
+                    self._evict()
+
+        if profile is None:
+            return None
+
+        if time.time() - profile.updated_at > self.ttl_seconds:
+            self.delete(user_id)
+            return None
+
+        return profile
+
+    def _load(self, user_id: str) -> Optional[CalibrationProfile]:
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT ear_base, ear_umbral_concentrado, ear_umbral_bajo, "
+                "ear_umbral_severo, updated_at FROM calibration_profiles WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+        return CalibrationProfile(*row) if row else None
+
+    # ---------------------------------------------------------
+    # Escritura
+    # ---------------------------------------------------------
+    def save(self, user_id: str, values: dict) -> CalibrationProfile:
+        """
+        Guarda el perfil en memoria de inmediato y lo encola para
+        persistirlo en SQLite (si hay respaldo).
+        """
+        profile = CalibrationProfile(
+            ear_base=float(values["ear_base"]),
+            ear_umbral_concentrado=float(values["ear_umbral_concentrado"]),
+            ear_umbral_bajo=float(values["ear_umbral_bajo"]),
+            ear_umbral_severo=float(values["ear_umbral_severo"]),
+            updated_at=time.time(),
+        )
+        with self._lock:
+            self._profiles[user_id] = profile
+            self._profiles.move_to_end(user_id)
+            self._evict()
+
+        if self._conn is not None:
+            self._writes.put((user_id, profile))
+        return profile
+
+    def _evict(self) -> None:
+        """Desaloja los perfiles menos usados que sobran (con _lock)."""
+        while len(self._profiles) > self.max_profiles:
+            self._profiles.popitem(last=False)
+
+    def delete(self, user_id: str) -> None:
+        with self._lock:
+            self._profiles.pop(user_id, None)
+        if self._conn is not None:
+            self._writes.put((user_id, None))
+
+    def flush(self) -> None:
+        """Espera a que se escriban los perfiles pendientes."""
+        if self._conn is not None:
+            self._writes.join()
+
+    def prune(self) -> int:
+        """Borra los perfiles vencidos de memoria y de SQLite. Devuelve cuántos había en memoria."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [user_id for user_id, p in self._profiles.items() if p.updated_at < cutoff]
+            for user_id in expired:
+                del self._profiles[user_id]
+        if self._conn is not None:
+            try:
+                with self._db_lock:
+                    self._conn.execute("DELETE FROM calibration_profiles WHERE updated_at < ?", (cutoff,))
+                    self._conn.commit()
+            except sqlite3.Error as e:
+                print("❌ ERROR borrando perfiles de calibración vencidos:", e)
+        return len(expired)
+
+    def _writer(self) -> None:
+        next_prune = time.monotonic() + self.prune_seconds
+        while True:
+            try:
+                item = self._writes.get(timeout=max(0.0, next_prune - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is not None:
+                try:
+                    self._write(*item)
+                finally:
+                    self._writes.task_done()
+            if time.monotonic() >= next_prune:
+                self.prune()
+                next_prune = time.monotonic() + self.prune_seconds
+
+    def _write(self, user_id: str, profile: Optional[CalibrationProfile]) -> None:
+        try:
+            with self._db_lock:
+                if profile is None:
+                    self._conn.execute(
+                        "DELETE FROM calibration_profiles WHERE user_id = ?", (user_id,)
+                    )
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO calibration_profiles VALUES (?, ?, ?, ?, ?, ?)",
+                        (
+                            user_id,
+                            profile.ear_base,
+                            profile.ear_umbral_concentrado,
+                            profile.ear_umbral_bajo,
+                            profile.ear_umbral_severo,
+                            profile.updated_at,
+                        ),
+                    )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print("❌ ERROR guardando perfil de calibración:", e)
@@ -1,56 +1,405 @@
-"""
-data_collector.py
-===========================================================
-Este módulo ha sido deshabilitado completamente porque
-el nuevo backend SOLO procesa frames en tiempo real y
-NO almacena datos, NO usa sesiones, NO guarda CSV, JSON
-ni SQLite, y NO recolecta landmarks.
-
-Se mantiene únicamente como stub para evitar errores
-en caso de que algún módulo legacy aún intente importarlo.
-===========================================================
-"""
-
-class DataCollector:
-    """
-    Stub vacío. Ninguna función realiza acciones.
-    Se conserva la firma mínima para compatibilidad.
-    """
-    def __init__(self, *args, **kwargs):
-        pass
-
-    def start(self):
-        pass
-
-    def collect(self, *args, **kwargs):
-        pass
-
-    def stop(self):
-        return {
-            "message": "DataCollector está deshabilitado en esta versión del backend."
-        }
-
-    def get_realtime_stats(self):
-        return {
-            "frames": 0,
-            "elapsed": 0,
-            "fps": 0,
-            "avg_score": 0,
-            "concentrated_pct": 0,
-            "blinks": 0,
-            "yawns": 0
-        }
-
-
-class LandmarkRecorder:
-    """
-    Stub vacío. Ninguna función realiza acciones.
-    """
-    def __init__(self, *args, **kwargs):
-        pass
-
-    def record(self, *args, **kwargs):
-        pass
-
-    def save(self):
-        return None
+"""
+data_collector.py
+===========================================================
+DataCollector sigue deshabilitado: el backend procesa frames
+en tiempo real y no guarda CSV, JSON ni SQLite por frame.
+
+LandmarkRecorder graba flujos reales de landmarks para
+reproducir problemas y medir el camino sin inferencia
+(MetricsCalculator + AttentionClassifier) sin MediaPipe.
+
+Formato .lmk (little-endian, solo se agrega al final):
+
+    cabecera   "<6sHB7x"  magia LMKREC, versión, bytes por coordenada (2/4)
+    bloque*    chunk de frames o metadatos, en orden de grabación
+    índice     "<QIdd" por bloque (offset, frames o bytes, t inicial, t final)
+    pie        "<QI4s" offset del índice, bloques, LIDX
+
+    chunk      "<4sIIdd4x" CHNK, frames, puntos por frame, t inicial, t final
+               t        f8[n]
+               results  f4[n, len(RESULT_FIELDS)]   (NaN = no calculado)
+               points   f2|f4[n, puntos, 3]        (normalizados, NaN sin rostro)
+               width    u2[n]
+               height   u2[n]
+               estado   i1[n]                      (-1 sin rostro)
+               flags    u1[n]                      (FLAG_STALE: omitido sin inferencia)
+               relleno hasta múltiplo de 8
+    metadatos  "<4sIIdd4x" META, bytes, 0, t, t + JSON, relleno hasta múltiplo de 8
+
+Los metadatos rigen desde el frame siguiente: el procesador graba al
+abrir la sesión su estado de métricas (calibración incluida) y el
+perfil de pipeline, y otra vez el perfil cuando cambia. Con eso y los
+frames omitidos, replay_landmarks reproduce la sesión tal cual.
+
+El índice se escribe al cerrar. Si el proceso murió antes, el
+lector recorre las cabeceras de los chunks (un chunk a medio
+escribir al final se ignora). Reabrir un archivo para grabar
+descarta el índice y lo reescribe al cerrar.
+
+LandmarkRecording mapea el archivo en memoria: cada chunk se
+expone como vistas NumPy sin copiar.
+===========================================================
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class DataCollector:
+    """
+    Stub vacío. Ninguna función realiza acciones.
+    Se conserva la firma mínima para compatibilidad.
+    """
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def start(self):
+        pass
+
+    def collect(self, *args, **kwargs):
+        pass
+
+    def stop(self):
+        return {
+            "message": "DataCollector está deshabilitado en esta versión del backend."
+        }
+
+    def get_realtime_stats(self):
+        return {
+            "frames": 0,
+            "elapsed": 0,
+            "fps": 0,
+            "avg_score": 0,
+            "concentrated_pct": 0,
+            "blinks": 0,
+            "yawns": 0
+        }
+
+
+# ============================================================
+# Formato .lmk
+# ============================================================
+
+_MAGIC = b"LMKREC"
+_VERSION = 2
+_FILE_HEADER = struct.Struct("<6sHB7x")
+_CHUNK_HEADER = struct.Struct("<4sIIdd4x")
+_INDEX_ENTRY = struct.Struct("<QIdd")
+_FOOTER = struct.Struct("<QI4s")
+
+# Resultados grabados junto a los landmarks (comparación golden)
+RESULT_FIELDS = ("ear", "perclos", "parpadeos_min", "yaw", "pitch", "gaze_focus", "mar", "score")
+ESTADOS = ("CONCENTRADO", "BAJA_ATENCION", "NO_CONCENTRADO")
+
+_POINT_DTYPES = {2: np.float16, 4: np.float32}
+
+# Columna flags: el frame no pasó por la inferencia, solo extendió las
+# ventanas temporales (MetricsCalculator.registrar_frame_omitido)
+FLAG_STALE = 1
+
+
+def _chunk_layout(n: int, n_points: int, itemsize: int):
+    """(nombre, dtype, forma, offset relativo) de cada array y tamaño total."""
+    fields = [
+        ("t", np.float64, (n,)),
+        ("results", np.float32, (n, len(RESULT_FIELDS))),
+        ("points", _POINT_DTYPES[itemsize], (n, n_points, 3)),
+        ("width", np.uint16, (n,)),
+        ("height", np.uint16, (n,)),
+        ("estado", np.int8, (n,)),
+        ("flags", np.uint8, (n,)),
+    ]
+    layout, offset = [], _CHUNK_HEADER.size
+    for name, dtype, shape in fields:
+        layout.append((name, dtype, shape, offset))
+        offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    size = (offset + 7) // 8 * 8
+    return layout, size
+
+
+def _block_size(tag: bytes, n: int, n_points: int, itemsize: int) -> int:
+    if tag == b"META":
+        return (_CHUNK_HEADER.size + n + 7) // 8 * 8
+    return _chunk_layout(n, n_points, itemsize)[1]
+
+
+class LandmarkRecorder:
+    """
+    Graba por frame: instante, tamaño, landmarks normalizados y los
+    resultados (métricas + score + estado) para compararlos al
+    reproducir. Los frames se acumulan en memoria y se escriben por
+    chunks de `chunk_frames`; `annotate` intercala metadatos.
+    """
+
+    def __init__(self, path: str, dtype: str = "float16", chunk_frames: int = 256):
+        self.path = path
+        self.itemsize = np.dtype(dtype).itemsize
+        if self.itemsize not in _POINT_DTYPES:
+            raise ValueError(f"dtype de landmarks no soportado: {dtype}")
+        self.chunk_frames = chunk_frames
+        self.frames = 0
+        # Metadatos vigentes (acumulados por annotate)
+        self.meta: dict = {}
+
+        self._lock = threading.Lock()
+        self._pending: List[tuple] = []
+        self._n_points: Optional[int] = None
+        self._index: List[tuple] = []
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._open()
+
+    def _open(self):
+        path = self.path
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            # Reabrir: conservar los chunks y descartar el índice viejo
+            recording = LandmarkRecording(path)
+            if recording.itemsize != self.itemsize:
+                recording.close()
+                raise ValueError(f"{path} usa {recording.itemsize} bytes por coordenada")
+            self._index = list(recording.index)
+            end = recording.data_end
+            recording.close()
+            self._file = open(path, "r+b")
+            self._file.truncate(end)
+            self._file.seek(end)
+        else:
+            self._file = open(path, "wb")
+            self._file.write(_FILE_HEADER.pack(_MAGIC, _VERSION, self.itemsize))
+
+    # ---------------------------------------------------------
+    def record(
+        self,
+        timestamp: float,
+        width: int,
+        height: int,
+        points: Optional[np.ndarray] = None,
+        metrics: Optional[dict] = None,
+        attention: Optional[dict] = None,
+        flags: int = 0,
+    ) -> None:
+        """
+        `points`: (N, 3) normalizados, o None si no hubo rostro.
+        `metrics` / `attention`: salida de MetricsCalculator y del
+        clasificador para ese frame (opcional).
+        `flags`: FLAG_STALE si el frame se omitió sin inferencia.
+        """
+        with self._lock:
+            if points is not None:
+                n_points = len(points)
+                if self._n_points is not None and n_points != self._n_points and self._pending:
+                    self._write_chunk()
+                self._n_points = n_points
+            self._pending.append((timestamp, width, height, points, metrics, attention, flags))
+            self.frames += 1
+            if len(self._pending) >= self.chunk_frames:
+                self._write_chunk()
+
+    def _write_chunk(self) -> None:
+        frames, self._pending = self._pending, []
+        if not frames:
+            return
+        n, n_points = len(frames), self._n_points or 0
+
+        layout, size = _chunk_layout(n, n_points, self.itemsize)
+        buf = bytearray(size)
+        t_first, t_last = float(frames[0][0]), float(frames[-1][0])
+        _CHUNK_HEADER.pack_into(buf, 0, b"CHNK", n, n_points, t_first, t_last)
+        arrays = {
+            name: np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset)
+            for name, dtype, shape, offset in layout
+        }
+
+        arrays["results"][:] = np.nan
+        arrays["points"][:] = np.nan
+        arrays["estado"][:] = -1
+        for i, (t, w, h, points, metrics, attention, flags) in enumerate(frames):
+            arrays["t"][i] = t
+            arrays["width"][i] = w
+            arrays["height"][i] = h
+            arrays["flags"][i] = flags
+            if points is not None and len(points) == n_points:
+                arrays["points"][i] = points
+            if metrics is not None:
+                for j, field in enumerate(RESULT_FIELDS[:-1]):
+                    if field in metrics:
+                        arrays["results"][i, j] = metrics[field]
+            if attention is not None:
+                arrays["results"][i, -1] = attention.get("score", np.nan)
+                estado = attention.get("estado")
+                arrays["estado"][i] = ESTADOS.index(estado) if estado in ESTADOS else -1
+
+        offset = self._file.tell()
+        self._file.write(buf)
+        self._file.flush()
+        self._index.append((offset, n, t_first, t_last))
+
+    def annotate(self, **meta) -> None:
+        """
+        Graba metadatos (valores JSON) que rigen desde el próximo frame,
+        p. ej. el estado inicial de las métricas o el perfil de pipeline.
+        """
+        with self._lock:
+            self._write_chunk()
+            raw = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+            buf = bytearray(_block_size(b"META", len(raw), 0, self.itemsize))
+            t = self._index[-1][3] if self._index else 0.0
+            _CHUNK_HEADER.pack_into(buf, 0, b"META", len(raw), 0, t, t)
+            buf[_CHUNK_HEADER.size:_CHUNK_HEADER.size + len(raw)] = raw
+
+            offset = self._file.tell()
+            self._file.write(buf)
+            self._file.flush()
+            self._index.append((offset, len(raw), t, t))
+            self.meta.update(meta)
+
+    def flush(self) -> None:
+        """Escribe los frames pendientes como un chunk."""
+        with self._lock:
+            self._write_chunk()
+
+    def save(self) -> Optional[str]:
+        """Cierra el archivo escribiendo el índice. Devuelve la ruta."""
+        with self._lock:
+            if self._file is None:
+                return self.path
+            self._write_chunk()
+            index_offset = self._file.tell()
+            for entry in self._index:
+                self._file.write(_INDEX_ENTRY.pack(*entry))
+            self._file.write(_FOOTER.pack(index_offset, len(self._index), b"LIDX"))
+            self._file.close()
+            self._file = None
+        return self.path
+
+    close = save
+
+
+class LandmarkRecording:
+    """
+    Lectura de un .lmk mapeado en memoria.
+
+    `recording[i]` devuelve los landmarks (N, 3) del frame i (NaN si no
+    hubo rostro), de modo que sirve directamente a ReplayBackend.
+    `meta` lista los metadatos como (frame desde el que rigen, dict).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.path.getsize(path)
+        if size < _FILE_HEADER.size:
+            self._file.close()
+            raise ValueError(f"{path} no es una grabación de landmarks")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, itemsize = _FILE_HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC or version != _VERSION or itemsize not in _POINT_DTYPES:
+            self.close()
+            raise ValueError(f"{path} no es una grabación de landmarks v{_VERSION}")
+        self.itemsize = itemsize
+
+        blocks = self._read_index(size)
+        if blocks is None:
+            blocks = self._scan(size)
+        self.index = [(b["offset"], b["frames"], b["t_first"], b["t_last"]) for b in blocks]
+        self.data_end = (
+            blocks[-1]["offset"] + _block_size(blocks[-1]["tag"], blocks[-1]["frames"], blocks[-1]["points"], itemsize)
+            if blocks else _FILE_HEADER.size
+        )
+        self.chunks, self.meta = [], []
+        frames = 0
+        for b in blocks:
+            if b["tag"] == b"META":
+                start = b["offset"] + _CHUNK_HEADER.size
+                raw = bytes(self._mmap[start:start + b["frames"]])
+                self.meta.append((frames, json.loads(raw.decode("utf-8"))))
+            else:
+                self.chunks.append(b)
+                frames += b["frames"]
+        self._starts = np.cumsum([0] + [c["frames"] for c in self.chunks])
+        self._arrays: Dict[int, Dict[str, np.ndarray]] = {}
+
+    def _read_index(self, size: int):
+        if size < _FILE_HEADER.size + _FOOTER.size:
+            return None
+        index_offset, count, tag = _FOOTER.unpack_from(self._mmap, size - _FOOTER.size)
+        if tag != b"LIDX" or index_offset + count * _INDEX_ENTRY.size + _FOOTER.size != size:
+            return None
+        blocks = []
+        for i in range(count):
+            offset, n, t_first, t_last = _INDEX_ENTRY.unpack_from(self._mmap, index_offset + i * _INDEX_ENTRY.size)
+            tag, _, n_points, _, _ = _CHUNK_HEADER.unpack_from(self._mmap, offset)
+            blocks.append({"tag": tag, "offset": offset, "frames": n, "points": n_points,
+                           "t_first": t_first, "t_last": t_last})
+        return blocks
+
+    def _scan(self, size: int):
+        """Sin índice (grabación cortada): recorrer las cabeceras."""
+        blocks, offset = [], _FILE_HEADER.size
+        while offset + _CHUNK_HEADER.size <= size:
+            tag, n, n_points, t_first, t_last = _CHUNK_HEADER.unpack_from(self._mmap, offset)
+            if tag not in (b"CHNK", b"META"):
+                break
+            block_size = _block_size(tag, n, n_points, self.itemsize)
+            if offset + block_size > size:
+                break
+            blocks.append({"tag": tag, "offset": offset, "frames": n, "points": n_points,
+                           "t_first": t_first, "t_last": t_last})
+            offset += block_size
+        return blocks
+
+    # ---------------------------------------------------------
+    def __len__(self) -> int:
+        return int(self._starts[-1])
+
+    def chunk(self, i: int) -> Dict[str, np.ndarray]:
+        """Vistas (sin copia) de los arrays del chunk i."""
+        arrays = self._arrays.get(i)
+        if arrays is None:
+            c = self.chunks[i]
+            layout, _ = _chunk_layout(c["frames"], c["points"], self.itemsize)
+            arrays = self._arrays[i] = {
+                name: np.ndarray(shape, dtype=dtype, buffer=self._mmap, offset=c["offset"] + offset)
+                for name, dtype, shape, offset in layout
+            }
+        return arrays
+
+    def iter_chunks(self):
+        for i in range(len(self.chunks)):
+            yield self.chunk(i)
+
+    def flags(self) -> np.ndarray:
+        """Columna flags de toda la grabación (copia)."""
+        if not self.chunks:
+            return np.empty(0, dtype=np.uint8)
+        return np.concatenate([c["flags"] for c in self.iter_chunks()])
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        if i < 0:
+            i += len(self)
+        c = int(np.searchsorted(self._starts, i, side="right")) - 1
+        points = self.chunk(c)["points"]
+        row = i - int(self._starts[c])
+        if points.shape[1] == 0:
+            return np.full((1, 3), np.nan, dtype=np.float32)
+        return points[row]
+
+    def close(self) -> None:
+        self._arrays.clear()
+        if getattr(self, "_mmap", None) is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Quedan vistas vivas fuera: se libera con el objeto
+                pass
+            self._mmap = None
+        self._file.close()
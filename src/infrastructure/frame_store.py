@@ -0,0 +1,223 @@
+"""
+frame_store.py
+===========================================================
+Almacenamiento columnar de resultados por frame.
+
+Una sesión se guarda como un directorio con un archivo .npy
+por columna y un meta.json con el número de filas y las
+categorías de las columnas de texto (guardadas como códigos
+int8). Así cada columna se puede leer por separado sin cargar
+el resto.
+
+    sesion/
+        meta.json
+        frame_number.npy
+        attention_score.npy
+        attention_level.npy   (códigos int8)
+        ...
+
+ColumnarSession abre la sesión mapeando en memoria solo las
+columnas que se piden y la recorre por bloques de filas, así
+una sesión de horas (o más grande que la RAM) se analiza sin
+armar objetos Python por frame. ColumnWriter escribe una sesión
+por bloques a medida que se producen, sin juntarla en memoria.
+===========================================================
+"""
+
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+
+META_FILE = "meta.json"
+
+# Filas por bloque al recorrer una sesión
+CHUNK_ROWS = 1 << 20
+
+# Cabecera .npy de largo fijo: ColumnWriter la reescribe al cerrar con
+# el número final de filas sin mover los datos
+_NPY_HEADER_SIZE = 128
+
+
+def write_columns(directory: str, columns: Dict[str, np.ndarray], meta: Optional[dict] = None) -> str:
+    """
+    Escribe `columns` (nombre → array 1D, todos del mismo largo) en
+    `directory`. Las columnas de texto se codifican como categorías.
+    Devuelve la ruta del directorio.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    lengths = {len(v) for v in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError(f"Columnas de distinto largo: {sorted(lengths)}")
+
+    categories = {}
+    for name, values in columns.items():
+        values = np.asarray(values)
+
+        if values.dtype.kind in ("U", "S", "O"):
+            cats, codes = np.unique(values.astype(str), return_inverse=True)
+            categories[name] = cats.tolist()
+            values = codes.astype(np.int8)
+
+        np.save(os.path.join(directory, f"{name}.npy"), values)
+
+    info = {
+        "rows": lengths.pop() if lengths else 0,
+        "columns": list(columns.keys()),
+        "categories": categories,
+        **(meta or {}),
+    }
+    with open(os.path.join(directory, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=2)
+
+    return directory
+
+
+def read_meta(directory: str) -> dict:
+    with open(os.path.join(directory, META_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_columns(directory: str, columns: Optional[Iterable[str]] = None, mmap: bool = False) -> Dict[str, np.ndarray]:
+    """
+    Lee las columnas pedidas (todas si `columns` es None). Las columnas
+    categóricas se devuelven ya decodificadas como texto. Con `mmap`
+    las numéricas se mapean en memoria en lugar de leerse.
+    """
+    meta = read_meta(directory)
+    names = list(columns) if columns is not None else meta["columns"]
+
+    out = {}
+    for name in names:
+        values = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None)
+        cats = meta["categories"].get(name)
+        if cats is not None:
+            values = np.asarray(cats, dtype=object)[values]
+        out[name] = values
+
+    return out
+
+
+# ============================================================
+# Lectura por bloques
+# ============================================================
+
+class ColumnarSession:
+    """
+    Sesión columnar abierta para lectura. Cada columna se mapea en
+    memoria la primera vez que se usa; las categóricas se entregan como
+    códigos int8 (ver `categories` / `code_of`).
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.meta = read_meta(directory)
+        self.rows = int(self.meta["rows"])
+        self.columns: List[str] = list(self.meta["columns"])
+        self._maps: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def column(self, name: str) -> np.ndarray:
+        values = self._maps.get(name)
+        if values is None:
+            if name not in self.columns:
+                raise KeyError(name)
+            values = self._maps[name] = np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode="r")
+        return values
+
+    def categories(self, name: str) -> List[str]:
+        return self.meta["categories"].get(name, [])
+
+    def code_of(self, name: str, value: str) -> int:
+        """Código de `value` en la columna categórica, o -1 si no aparece."""
+        cats = self.categories(name)
+        return cats.index(value) if value in cats else -1
+
+    def iter_chunks(self, columns: Iterable[str], chunk_rows: int = CHUNK_ROWS) -> Iterator[Dict[str, np.ndarray]]:
+        """Bloques {columna: vista} de hasta `chunk_rows` filas, en orden."""
+        maps = {name: self.column(name) for name in columns}
+        for start in range(0, self.rows, chunk_rows):
+            yield {name: values[start:start + chunk_rows] for name, values in maps.items()}
+
+
+# ============================================================
+# Escritura por bloques
+# ============================================================
+
+def _npy_header(dtype: np.dtype, rows: int) -> bytes:
+    header = repr({"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (rows,)})
+    prefix = b"\x93NUMPY\x01\x00"
+    body_len = _NPY_HEADER_SIZE - len(prefix) - 2
+    body = header.encode("latin1").ljust(body_len - 1) + b"\n"
+    return prefix + body_len.to_bytes(2, "little") + body
+
+
+class ColumnWriter:
+    """
+    Escribe una sesión columnar por bloques (mismo formato que
+    write_columns). Las categorías de las columnas de texto se asignan
+    en orden de aparición. `close` fija el número de filas en cada
+    archivo y escribe meta.json.
+    """
+
+    def __init__(self, directory: str, meta: Optional[dict] = None):
+        self.directory = directory
+        self.meta = dict(meta or {})
+        self.rows = 0
+        self._files: Dict[str, object] = {}
+        self._dtypes: Dict[str, np.dtype] = {}
+        self._categories: Dict[str, Dict[str, int]] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, columns: Dict[str, np.ndarray]) -> None:
+        lengths = {len(v) for v in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"Columnas de distinto largo: {sorted(lengths)}")
+        if self._files and set(columns) != set(self._files):
+            raise ValueError("Las columnas no coinciden con las ya escritas")
+
+        for name, values in columns.items():
+            values = np.asarray(values)
+            if values.dtype.kind in ("U", "S", "O") or name in self._categories:
+                values = self._encode(name, values)
+
+            f = self._files.get(name)
+            if f is None:
+                f = self._files[name] = open(os.path.join(self.directory, f"{name}.npy"), "wb")
+                self._dtypes[name] = values.dtype
+                f.write(_npy_header(values.dtype, 0))
+            elif values.dtype != self._dtypes[name]:
+                values = values.astype(self._dtypes[name])
+            f.write(np.ascontiguousarray(values).tobytes())
+
+        self.rows += lengths.pop() if lengths else 0
+
+    def _encode(self, name: str, values: np.ndarray) -> np.ndarray:
+        cats = self._categories.setdefault(name, {})
+        uniques, inverse = np.unique(values.astype(str), return_inverse=True)
+        codes = np.array([cats.setdefault(u, len(cats)) for u in uniques.tolist()], dtype=np.int8)
+        return codes[inverse]
+
+    def close(self) -> str:
+        for name, f in self._files.items():
+            f.seek(0)
+            f.write(_npy_header(self._dtypes[name], self.rows))
+            f.close()
+
+        info = {
+            "rows": self.rows,
+            "columns": list(self._files.keys()),
+            "categories": {name: list(cats) for name, cats in self._categories.items()},
+            **self.meta,
+        }
+        with open(os.path.join(self.directory, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(info, f, indent=2)
+        return self.directory
@@ -0,0 +1,170 @@
+"""
+hash_ring.py
+===========================================================
+Hashing consistente con cargas acotadas para asignar sesiones a
+workers (ver src/gateway.py).
+
+Cada worker ocupa `vnodes` puntos de un anillo de 64 bits. Una
+sesión nueva recorre el anillo desde el hash de su id y se queda
+con el primer worker cuya carga (sesiones asignadas) esté por
+debajo de la capacidad
+
+    ceil(load_factor * (sesiones + 1) / workers)
+
+("Consistent Hashing with Bounded Loads", Mirrokni et al.): ningún
+worker recibe más de `load_factor` veces la media, y sin
+desbalance cada sesión cae en su worker "natural" del anillo.
+
+La asignación es pegajosa: una sesión no cambia de worker mientras
+exista. Al cambiar el conjunto de workers se mueve lo mínimo:
+- alta: solo las sesiones cuyo tramo del anillo pasa al worker
+  nuevo (≈ 1/n) y mientras este tenga capacidad;
+- baja: solo las sesiones del worker que se va.
+add_node/remove_node devuelven esos movimientos para traspasar el
+estado.
+
+No es thread-safe: el gateway lo usa bajo su propio lock.
+===========================================================
+"""
+
+import bisect
+import hashlib
+import math
+from typing import Dict, Iterator, List, Optional, Tuple
+
+Move = Tuple[str, Optional[str], Optional[str]]     # (sesión, worker anterior, worker nuevo)
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+
+    def __init__(self, vnodes: int = 160, load_factor: float = 1.25):
+        if load_factor <= 1.0:
+            raise ValueError("load_factor debe ser mayor que 1")
+        self.vnodes = vnodes
+        self.load_factor = load_factor
+
+        self._points: List[int] = []         # hashes ordenados
+        self._owners: List[str] = []         # worker de cada punto
+        self.loads: Dict[str, int] = {}      # worker → sesiones asignadas
+        self.assigned: Dict[str, str] = {}   # sesión → worker
+
+    # ---------------------------------------------------------
+    # Anillo
+    # ---------------------------------------------------------
+    @property
+    def nodes(self) -> List[str]:
+        return list(self.loads)
+
+    def capacity(self) -> int:
+        if not self.loads:
+            return 0
+        return math.ceil(self.load_factor * (len(self.assigned) + 1) / len(self.loads))
+
+    def walk(self, key: str) -> Iterator[str]:
+        """Workers distintos en orden horario desde el hash de `key`."""
+        if not self._points:
+            return
+        start = bisect.bisect(self._points, _hash(key))
+        seen = set()
+        n = len(self._points)
+        for i in range(n):
+            owner = self._owners[(start + i) % n]
+            if owner not in seen:
+                seen.add(owner)
+                yield owner
+                if len(seen) == len(self.loads):
+                    return
+
+    def home(self, key: str) -> Optional[str]:
+        """Worker natural de `key` (sin tener en cuenta la carga)."""
+        return next(self.walk(key), None)
+
+    # ---------------------------------------------------------
+    # Sesiones
+    # ---------------------------------------------------------
+    def lookup(self, key: str) -> Optional[str]:
+        return self.assigned.get(key)
+
+    def assign(self, key: str) -> Optional[str]:
+        """Worker de la sesión; si es nueva, el primero con capacidad en el anillo."""
+        node = self.assigned.get(key)
+        if node is not None or not self.loads:
+            return node
+        node = self._bounded(key)
+        self.assigned[key] = node
+        self.loads[node] += 1
+        return node
+
+    def release(self, key: str) -> None:
+        node = self.assigned.pop(key, None)
+        if node is not None:
+            self.loads[node] -= 1
+
+    def _bounded(self, key: str) -> str:
+        cap = self.capacity()
+        for node in self.walk(key):
+            if self.loads[node] < cap:
+                return node
+        # No debería pasar: la capacidad siempre deja lugar a una sesión más
+        return min(self.loads, key=self.loads.__getitem__)
+
+    # ---------------------------------------------------------
+    # Cambios de membresía
+    # ---------------------------------------------------------
+    def add_node(self, node: str) -> List[Move]:
+        if node in self.loads:
+            return []
+        self.loads[node] = 0
+        for i in range(self.vnodes):
+            h = _hash(f"{node}#{i}")
+            j = bisect.bisect(self._points, h)
+            self._points.insert(j, h)
+            self._owners.insert(j, node)
+
+        moves = []
+        cap = self.capacity()
+        for key, old in list(self.assigned.items()):
+            if self.loads[node] >= cap:
+                break
+            if self.home(key) == node:
+                self.assigned[key] = node
+                self.loads[old] -= 1
+                self.loads[node] += 1
+                moves.append((key, old, node))
+        return moves
+
+    def remove_node(self, node: str) -> List[Move]:
+        if node not in self.loads:
+            return []
+        keep = [i for i, owner in enumerate(self._owners) if owner != node]
+        self._points = [self._points[i] for i in keep]
+        self._owners = [self._owners[i] for i in keep]
+
+        orphans = [key for key, owner in self.assigned.items() if owner == node]
+        for key in orphans:
+            del self.assigned[key]
+        del self.loads[node]
+
+        moves = []
+        if not self.loads:
+            return [(key, node, None) for key in orphans]
+        for key in orphans:
+            new = self.assign(key)
+            moves.append((key, node, new))
+        return moves
+
+    def stats(self) -> dict:
+        sessions = len(self.assigned)
+        mean = sessions / len(self.loads) if self.loads else 0.0
+        return {
+            "nodes": len(self.loads),
+            "sessions": sessions,
+            "capacity": self.capacity(),
+            "load_factor": self.load_factor,
+            "max_over_mean": (max(self.loads.values()) / mean) if mean else None,
+            "loads": dict(self.loads),
+        }
@@ -0,0 +1,322 @@
+"""
+profiling.py
+===========================================================
+Perfilado bajo demanda de requests individuales.
+
+Dos modos:
+
+- Determinista (cProfile): se pide explícitamente por request
+  con una cabecera privilegiada. Mide todas las llamadas.
+- Por muestreo: un hilo de fondo toma la pila del hilo del
+  request cada `interval` segundos. Es barato, así que se usa
+  para el modo de fondo (una fracción aleatoria de requests, o
+  todos los requests conservando solo los que superan un umbral
+  de latencia).
+
+Cada perfil se desglosa por etapas del pipeline
+(AttentionProcessor: decode / landmarks / resto,
+MetricsCalculator, AttentionClassifier) y se guarda en disco
+como JSON (+ .prof de pstats en modo determinista).
+===========================================================
+"""
+
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+# (etapa, archivo, función). El orden importa en el muestreo: gana la
+# primera etapa cuya función aparece en la pila.
+STAGE_FUNCTIONS = [
+    ("AttentionClassifier", "classifier.py", "clasificar"),
+    ("MetricsCalculator", "metrics.py", "procesar_frame"),
+    ("AttentionProcessor.landmarks", "landmark_backends.py", "detect"),
+    ("AttentionProcessor.decode", "attention_processor.py", "_decode_base64_image"),
+    ("AttentionProcessor.other", "attention_processor.py", "process_base64_frame"),
+]
+
+
+def _matches(filename: str, funcname: str, stage_file: str, stage_func: str) -> bool:
+    return funcname == stage_func and os.path.basename(filename) == stage_file
+
+
+# ============================================================
+# 1. Muestreo de pilas
+# ============================================================
+
+class StackSampler:
+    """
+    Un único hilo de fondo que muestrea las pilas de los hilos
+    registrados. Solo corre mientras hay algún hilo registrado.
+    """
+
+    def __init__(self, interval: float = 0.002, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._targets: Dict[int, Counter] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, thread_id: int) -> None:
+        with self._lock:
+            self._targets[thread_id] = Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def stop(self, thread_id: int) -> Counter:
+        with self._lock:
+            return self._targets.pop(thread_id, Counter())
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                targets = list(self._targets.items())
+            if not targets:
+                self._wakeup.clear()
+                self._wakeup.wait()
+                continue
+
+            frames = sys._current_frames()
+            for thread_id, counts in targets:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_name))
+                    frame = frame.f_back
+                counts[tuple(reversed(stack))] += 1
+
+            time.sleep(self.interval)
+
+
+def _stage_of_stack(stack: Tuple[Tuple[str, str], ...]) -> str:
+    for stage, stage_file, stage_func in STAGE_FUNCTIONS:
+        for filename, funcname in stack:
+            if _matches(filename, funcname, stage_file, stage_func):
+                return stage
+    return "other"
+
+
+def summarize_samples(counts: Counter, wall_ms: float, top: int = 40) -> dict:
+    total = sum(counts.values())
+    stages: Dict[str, float] = {}
+    for stack, n in counts.items():
+        stage = _stage_of_stack(stack)
+        stages[stage] = stages.get(stage, 0.0) + n
+
+    collapsed = [
+        (";".join(f"{os.path.basename(f)}:{fn}" for f, fn in stack), n)
+        for stack, n in counts.most_common(top)
+    ]
+    return {
+        "samples": total,
+        "stages_ms": {k: wall_ms * v / total for k, v in stages.items()} if total else {},
+        "stacks": [{"stack": s, "samples": n} for s, n in collapsed],
+    }
+
+
+# ============================================================
+# 2. Perfil determinista
+# ============================================================
+
+def summarize_cprofile(profile: cProfile.Profile, wall_ms: float, top: int = 40) -> dict:
+    stats = pstats.Stats(profile).stats
+
+    def cumulative(stage_file: str, stage_func: str) -> float:
+        return 1000 * sum(
+            ct for (filename, _, funcname), (_, _, _, ct, _) in stats.items()
+            if _matches(filename, funcname, stage_file, stage_func)
+        )
+
+    stages = {stage: cumulative(f, fn) for stage, f, fn in STAGE_FUNCTIONS}
+
+    # "other" del procesador = su tiempo total menos las sub-etapas
+    processor_total = stages["AttentionProcessor.other"]
+    stages["AttentionProcessor.other"] = max(
+        processor_total
+        - stages["AttentionProcessor.decode"]
+        - stages["AttentionProcessor.landmarks"]
+        - stages["MetricsCalculator"]
+        - stages["AttentionClassifier"],
+        0.0,
+    )
+    stages["other"] = max(wall_ms - processor_total, 0.0)
+
+    functions = sorted(stats.items(), key=lambda kv: kv[1][3], reverse=True)[:top]
+    return {
+        "stages_ms": stages,
+        "functions": [
+            {
+                "function": f"{os.path.basename(filename)}:{lineno}({funcname})",
+                "calls": nc,
+                "tottime_ms": tt * 1000,
+                "cumtime_ms": ct * 1000,
+            }
+            for (filename, lineno, funcname), (_, nc, tt, ct, _) in functions
+        ],
+    }
+
+
+# ============================================================
+# 3. Perfilador de requests
+# ============================================================
+
+class RequestProfiler:
+    """
+    Decide qué requests perfilar, ejecuta la función bajo el
+    perfilador elegido y guarda el resultado.
+    """
+
+    def __init__(
+        self,
+        token: str = "",
+        sample_rate: float = 0.0,
+        slow_ms: float = 0.0,
+        directory: str = "profiles",
+        max_stored: int = 200,
+        sample_interval: float = 0.002,
+    ):
+        self.token = token
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.directory = directory
+        self.max_stored = max_stored
+
+        self.sampler = StackSampler(interval=sample_interval)
+        self._index: "OrderedDict[str, dict]" = OrderedDict()
+        self._index_lock = threading.Lock()
+        # cProfile usa el hook de perfilado del hilo; uno por vez
+        self._cprofile_lock = threading.Lock()
+
+    @property
+    def background_enabled(self) -> bool:
+        return self.sample_rate > 0 or self.slow_ms > 0
+
+    def authorized(self, token: Optional[str]) -> bool:
+        return bool(self.token) and token is not None and hmac.compare_digest(token, self.token)
+
+    # ---------------------------------------------------------
+    def run(self, fn: Callable[[], Any], requested: bool = False,
+            meta: Optional[dict] = None) -> Tuple[Any, Optional[str]]:
+        """
+        Ejecuta `fn`. Devuelve (resultado, id del perfil o None).
+
+        - requested=True → cProfile (o muestreo si ya hay otro cProfile activo)
+        - muestreo de fondo según sample_rate / slow_ms
+        """
+        if requested:
+            if self._cprofile_lock.acquire(blocking=False):
+                try:
+                    return self._run_cprofile(fn, meta, reason="requested")
+                finally:
+                    self._cprofile_lock.release()
+            return self._run_sampled(fn, meta, reason="requested", keep_if_ms=0.0)
+
+        if not self.background_enabled:
+            return fn(), None
+
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return self._run_sampled(fn, meta, reason="sampled", keep_if_ms=0.0)
+        if self.slow_ms > 0:
+            return self._run_sampled(fn, meta, reason="slow", keep_if_ms=self.slow_ms)
+        return fn(), None
+
+    def _run_cprofile(self, fn, meta, reason):
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            result = fn()
+        finally:
+            profile.disable()
+        wall_ms = (time.perf_counter() - start) * 1000
+
+        summary = summarize_cprofile(profile, wall_ms)
+        profile_id = self._store("cprofile", reason, wall_ms, summary, meta, profile)
+        return result, profile_id
+
+    def _run_sampled(self, fn, meta, reason, keep_if_ms):
+        thread_id = threading.get_ident()
+        start = time.perf_counter()
+        self.sampler.start(thread_id)
+        try:
+            result = fn()
+        finally:
+            counts = self.sampler.stop(thread_id)
+        wall_ms = (time.perf_counter() - start) * 1000
+
+        if wall_ms < keep_if_ms:
+            return result, None
+
+        summary = summarize_samples(counts, wall_ms)
+        profile_id = self._store("sampling", reason, wall_ms, summary, meta)
+        return result, profile_id
+
+    # ---------------------------------------------------------
+    # Almacenamiento
+    # ---------------------------------------------------------
+    def _store(self, mode, reason, wall_ms, summary, meta, profile=None) -> str:
+        profile_id = uuid.uuid4().hex[:16]
+        record = {
+            "id": profile_id,
+            "created_at": time.time(),
+            "mode": mode,
+            "reason": reason,
+            "wall_ms": wall_ms,
+            **(meta or {}),
+            **summary,
+        }
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f"{profile_id}.json"), "w", encoding="utf-8") as f:
+                json.dump(record, f, indent=2)
+            if profile is not None:
+                profile.dump_stats(os.path.join(self.directory, f"{profile_id}.prof"))
+        except OSError as e:
+            print("❌ ERROR guardando perfil:", e)
+
+        brief = {k: record[k] for k in ("id", "created_at", "mode", "reason", "wall_ms")}
+        brief.update(meta or {})
+        with self._index_lock:
+            self._index[profile_id] = brief
+            while len(self._index) > self.max_stored:
+                old_id, _ = self._index.popitem(last=False)
+                self._delete_files(old_id)
+
+        return profile_id
+
+    def _delete_files(self, profile_id: str) -> None:
+        for ext in ("json", "prof"):
+            try:
+                os.remove(os.path.join(self.directory, f"{profile_id}.{ext}"))
+            except OSError:
+                pass
+
+    def list_profiles(self) -> List[dict]:
+        with self._index_lock:
+            return list(reversed(self._index.values()))
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        with self._index_lock:
+            if profile_id not in self._index:
+                return None
+        try:
+            with open(os.path.join(self.directory, f"{profile_id}.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except OSError:
+            return None
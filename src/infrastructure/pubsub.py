@@ -0,0 +1,127 @@
+"""
+pubsub.py
+===========================================================
+Difusión en proceso del estado de cada sesión a observadores
+(GET /sessions/{id}/events).
+
+El camino de procesamiento publica el último resultado de la
+sesión; cada suscriptor guarda solo el estado más reciente
+(coalescencia), así un consumidor lento recibe el último estado
+en lugar de acumular un buffer sin límite. El ritmo máximo de
+envío lo fija cada suscriptor.
+
+`publish` se llama desde los hilos del threadpool; los
+suscriptores viven en el event loop y se despiertan con
+call_soon_threadsafe (una vez por estado pendiente, no por
+publicación).
+===========================================================
+"""
+
+import asyncio
+import threading
+from typing import Dict, Optional, Set
+
+
+class Subscription:
+
+    def __init__(self, broker: "SessionBroker", session_id: str, loop: asyncio.AbstractEventLoop):
+        self.broker = broker
+        self.session_id = session_id
+        self.delivered = 0
+        self.coalesced = 0   # estados reemplazados antes de enviarse
+
+        self._loop = loop
+        self._event = asyncio.Event()
+        self._lock = threading.Lock()
+        self._latest: Optional[dict] = None
+        self._version = 0
+
+    def offer(self, state: dict, version: int) -> None:
+        """Reemplaza el estado pendiente (cualquier hilo)."""
+        with self._lock:
+            wake = self._latest is None
+            if not wake:
+                self.coalesced += 1
+            self._latest = state
+            self._version = version
+        if wake:
+            try:
+                self._loop.call_soon_threadsafe(self._event.set)
+            except RuntimeError:
+                # El loop ya cerró: el suscriptor no volverá a leer
+                self.broker.unsubscribe(self)
+
+    async def next(self, timeout: float):
+        """(versión, estado) más reciente, o None si no hubo nada en `timeout`."""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._event.clear()
+        with self._lock:
+            state, self._latest = self._latest, None
+            version = self._version
+        if state is None:
+            return None
+        self.delivered += 1
+        return version, state
+
+    def close(self) -> None:
+        self.broker.unsubscribe(self)
+
+
+class SessionBroker:
+
+    def __init__(self, max_subscribers: int = 1000):
+        self.max_subscribers = max_subscribers
+        self._subs: Dict[str, Set[Subscription]] = {}
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._count = 0
+        self.published = 0
+
+    def has_subscribers(self, session_id: str) -> bool:
+        return session_id in self._subs
+
+    def subscribe(self, session_id: str) -> Optional[Subscription]:
+        """Nueva suscripción ligada al event loop actual (None si se llegó al tope)."""
+        sub = Subscription(self, session_id, asyncio.get_running_loop())
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return None
+            self._subs.setdefault(session_id, set()).add(sub)
+            self._count += 1
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self._subs.get(sub.session_id)
+            if subs is None or sub not in subs:
+                return
+            subs.discard(sub)
+            self._count -= 1
+            if not subs:
+                del self._subs[sub.session_id]
+                self._versions.pop(sub.session_id, None)
+
+    def publish(self, session_id: str, state: dict) -> int:
+        """Entrega el estado a los suscriptores de la sesión; devuelve cuántos son."""
+        if session_id not in self._subs:
+            return 0
+        with self._lock:
+            subs = list(self._subs.get(session_id, ()))
+            version = self._versions.get(session_id, 0) + 1
+            self._versions[session_id] = version
+            self.published += 1
+        for sub in subs:
+            sub.offer(state, version)
+        return len(subs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._subs),
+                "subscribers": self._count,
+                "max_subscribers": self.max_subscribers,
+                "published": self.published,
+            }
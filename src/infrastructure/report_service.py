@@ -0,0 +1,301 @@
+"""
+report_service.py
+===========================================================
+Reportes con gráficos fuera de los hilos que atienden frames.
+
+Los reportes (analysis/report_charts.py) se dibujan en un pool de
+procesos propio, con prioridad baja (nice) y arrancados con
+"spawn": el proceso de la API no dibuja, no hace fork con hilos
+vivos y un reporte pesado no le quita el GIL a /process. El
+request solo hace stat() de los archivos de la sesión y lecturas
+de la caché.
+
+Caché: cada reporte se guarda en
+
+    {cache_dir}/{session_id}/{clave}.png
+    {cache_dir}/{session_id}/{clave}.json   (análisis + texto; se escribe último)
+
+con clave = versión del reporte + firma (tamaño y mtime) de los
+archivos de la sesión: si la sesión cambia o cambia el reporte,
+la clave cambia y se vuelve a dibujar. Pedidos simultáneos del
+mismo reporte comparten un solo trabajo. Al terminar un reporte con
+la clave vigente se borran los de claves anteriores de la sesión.
+===========================================================
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Dict, Optional
+
+# Cambiarlo invalida los reportes guardados (cambió el dibujo o el análisis)
+REPORT_VERSION = 1
+
+_SESSION_ID = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,127}$")
+
+
+class ReportQueueFull(RuntimeError):
+    """Demasiados reportes pendientes."""
+
+
+def _init_worker(nice: int) -> None:
+    if nice and hasattr(os, "nice"):
+        try:
+            os.nice(nice)
+        except OSError:
+            pass
+
+
+def _render(session_dir: str, png_path: str, json_path: str, points: int, dpi: int) -> None:
+    """Corre en el pool: dibuja y guarda el PNG y después el JSON."""
+    from src.analysis.report_charts import render_session_report
+
+    tmp_png = f"{png_path}.{os.getpid()}.tmp"
+    result = render_session_report(session_dir, tmp_png, points=points, dpi=dpi)
+    os.replace(tmp_png, png_path)
+
+    tmp_json = f"{json_path}.{os.getpid()}.tmp"
+    with open(tmp_json, "w", encoding="utf-8") as f:
+        json.dump(_clean(result), f, default=_json_default)
+    os.replace(tmp_json, json_path)
+
+
+def _clean(o):
+    """NaN/inf → None: el JSON de la respuesta tiene que ser estricto."""
+    if isinstance(o, float):
+        return o if math.isfinite(o) else None
+    if isinstance(o, dict):
+        return {k: _clean(v) for k, v in o.items()}
+    if isinstance(o, (list, tuple)):
+        return [_clean(v) for v in o]
+    if hasattr(o, "item"):
+        return _clean(o.item())
+    return o
+
+
+def _json_default(o):
+    if hasattr(o, "item"):
+        return o.item()
+    return str(o)
+
+
+class ReportService:
+
+    def __init__(
+        self,
+        sessions_dir: str,
+        cache_dir: str,
+        workers: int = 1,
+        max_pending: int = 32,
+        job_ttl: float = 600.0,
+        nice: int = 10,
+        points: int = 2000,
+        dpi: int = 100,
+    ):
+        self.sessions_dir = sessions_dir
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self.nice = nice
+        self.points = points
+        self.dpi = dpi
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, dict] = {}
+        self._inflight: Dict[str, str] = {}    # session_id/clave → job_id
+        self._lock = threading.Lock()
+        self.stats_counters = {"hits": 0, "rendered": 0, "failed": 0, "rejected": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.sessions_dir)
+
+    # ---------------------------------------------------------
+    # Sesiones y claves
+    # ---------------------------------------------------------
+    def session_dir(self, session_id: str) -> Optional[str]:
+        if not self.enabled or not _SESSION_ID.match(session_id):
+            return None
+        path = os.path.join(self.sessions_dir, session_id)
+        return path if os.path.isfile(os.path.join(path, "meta.json")) else None
+
+    @staticmethod
+    def artifact_key(session_dir: str) -> str:
+        h = hashlib.blake2b(digest_size=10)
+        for name in sorted(os.listdir(session_dir)):
+            if name == "meta.json" or name.endswith(".npy"):
+                st = os.stat(os.path.join(session_dir, name))
+                h.update(f"{name}:{st.st_size}:{st.st_mtime_ns};".encode())
+        return f"v{REPORT_VERSION}-{h.hexdigest()}"
+
+    def _paths(self, session_id: str, key: str):
+        base = os.path.join(self.cache_dir, session_id, key)
+        return base + ".png", base + ".json"
+
+    # ---------------------------------------------------------
+    # API
+    # ---------------------------------------------------------
+    def request(self, session_id: str) -> Optional[dict]:
+        """
+        Reporte listo ({"status": "ready", ...}) o trabajo encolado
+        ({"status": "pending", "job_id"}). None si la sesión no existe.
+        Lanza ReportQueueFull si hay demasiados pendientes.
+        """
+        session_dir = self.session_dir(session_id)
+        if session_dir is None:
+            return None
+        key = self.artifact_key(session_dir)
+
+        ready = self.cached(session_id, key)
+        if ready is not None:
+            with self._lock:
+                self.stats_counters["hits"] += 1
+            return ready
+
+        with self._lock:
+            self._expire()
+            inflight = self._inflight.get(f"{session_id}/{key}")
+            if inflight is not None:
+                return self._public(self._jobs[inflight])
+
+            pending = sum(1 for j in self._jobs.values() if j["status"] == "pending")
+            if pending >= self.max_pending:
+                self.stats_counters["rejected"] += 1
+                raise ReportQueueFull(f"{pending} reportes pendientes")
+
+            job = {
+                "job_id": uuid.uuid4().hex,
+                "session_id": session_id,
+                "key": key,
+                "status": "pending",
+                "error": None,
+                "submitted_at": time.time(),
+                "finished_at": None,
+            }
+            self._jobs[job["job_id"]] = job
+            self._inflight[f"{session_id}/{key}"] = job["job_id"]
+
+            png_path, json_path = self._paths(session_id, key)
+            os.makedirs(os.path.dirname(png_path), exist_ok=True)
+            args = (_render, session_dir, png_path, json_path, self.points, self.dpi)
+            try:
+                future = self._executor().submit(*args)
+            except BrokenProcessPool:
+                self._pool = None
+                future = self._executor().submit(*args)
+
+        future.add_done_callback(lambda f, job_id=job["job_id"]: self._finish(job_id, f))
+        return self._public(job)
+
+    def cached(self, session_id: str, key: str) -> Optional[dict]:
+        png_path, json_path = self._paths(session_id, key)
+        try:
+            with open(json_path, encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return {"status": "ready", "session_id": session_id, "key": key, "chart_path": png_path, **result}
+
+    def chart_path(self, session_id: str) -> Optional[str]:
+        """PNG del reporte vigente de la sesión, si ya se dibujó."""
+        session_dir = self.session_dir(session_id)
+        if session_dir is None:
+            return None
+        png_path, json_path = self._paths(session_id, self.artifact_key(session_dir))
+        return png_path if os.path.exists(json_path) else None
+
+    def job(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            return self._public(job) if job is not None else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_status: Dict[str, int] = {}
+            for j in self._jobs.values():
+                by_status[j["status"]] = by_status.get(j["status"], 0) + 1
+            return {
+                "enabled": self.enabled,
+                "workers": self.workers,
+                "jobs": by_status,
+                **self.stats_counters,
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # ---------------------------------------------------------
+    # Interno
+    # ---------------------------------------------------------
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.nice,),
+            )
+        return self._pool
+
+    def _finish(self, job_id: str, future: Future) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            self._inflight.pop(f"{job['session_id']}/{job['key']}", None)
+            job["finished_at"] = time.time()
+            error = None if future.cancelled() else future.exception()
+            if isinstance(error, BrokenProcessPool):
+                # Un worker murió (p. ej. sin memoria): el próximo pedido arma otro pool
+                self._pool = None
+            if future.cancelled() or error is not None:
+                job["status"] = "error"
+                job["error"] = "cancelado" if error is None else f"{type(error).__name__}: {error}"
+                self.stats_counters["failed"] += 1
+            else:
+                job["status"] = "done"
+                self.stats_counters["rendered"] += 1
+        if job["status"] == "done":
+            self._prune_cache(job["session_id"], job["key"])
+
+    def _prune_cache(self, session_id: str, key: str) -> None:
+        """Borra los reportes de la sesión con otra clave (ya no se van a servir)."""
+        session_dir = self.session_dir(session_id)
+        # Si la sesión cambió mientras se dibujaba, la vigente es otra clave
+        if session_dir is None or self.artifact_key(session_dir) != key:
+            return
+        cache = os.path.join(self.cache_dir, session_id)
+        try:
+            names = os.listdir(cache)
+        except OSError:
+            return
+        for name in names:
+            stem, ext = os.path.splitext(name)
+            if ext in (".png", ".json") and stem != key:
+                try:
+                    os.remove(os.path.join(cache, name))
+                except OSError:
+                    pass
+
+    def _expire(self) -> None:
+        now = time.time()
+        for job_id in [j for j, job in self._jobs.items()
+                       if job["finished_at"] is not None and now - job["finished_at"] > self.job_ttl]:
+            del self._jobs[job_id]
+
+    @staticmethod
+    def _public(job: dict) -> dict:
+        return {k: job[k] for k in ("job_id", "session_id", "status", "error", "submitted_at", "finished_at")}
@@ -0,0 +1,127 @@
+"""
+result_cache.py
+===========================================================
+Caché de idempotencia para frames retransmitidos.
+
+Los clientes móviles reintentan /process cuando hay timeout y
+reenvían exactamente el mismo image_base64. Cada reintento
+volvía a ejecutar todo el pipeline y además empujaba otra vez
+los buffers de parpadeo/PERCLOS.
+
+La clave es (sesión, frame_number, digest del payload) más
+lo que cambie la forma de la respuesta (output, perfil, ventana);
+se guardan las respuestas recientes con desalojo LRU acotado
+por número de entradas. Las respuestas que no representan un
+resultado final (frames omitidos) no se guardan.
+===========================================================
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+
+def payload_digest(payload: str) -> bytes:
+    """Digest corto (128 bits) del payload; barato incluso para imágenes grandes."""
+    return hashlib.blake2b(payload.encode("ascii", "ignore"), digest_size=16).digest()
+
+
+class FrameResultCache:
+    """
+    LRU thread-safe de resultados por frame.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(session: str, frame_number: int, payload: str, *variant: Hashable) -> Tuple:
+        """
+        `session`: clave de la sesión (session_id o "user:{id}"); sin sesión
+        no se cachea. `variant`: parámetros del request que cambian la respuesta.
+        """
+        return (session, frame_number, payload_digest(payload), *variant)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Any],
+        cacheable: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        Devuelve el resultado cacheado o lo calcula. Si un reintento llega
+        mientras el original todavía se procesa, espera ese resultado en
+        lugar de ejecutar el pipeline dos veces. Con `cacheable`, solo se
+        guardan los resultados para los que devuelve True.
+        """
+        while True:
+            with self._lock:
+                value = self._data.get(key)
+                if value is not None:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+
+                pending = self._inflight.get(key)
+                if pending is None:
+                    pending = self._inflight[key] = threading.Event()
+                    self.misses += 1
+                    break
+
+            # Otro hilo está calculando la misma clave
+            pending.wait()
+            # Si falló, el bucle vuelve a intentarlo
+
+        try:
+            value = compute()
+            if cacheable is None or cacheable(value):
+                self.put(key, value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            pending.set()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,349 @@
+"""
+scheduler.py
+===========================================================
+Planificación justa de frames entre sesiones.
+
+Con un único camino de procesamiento, un cliente a 60 fps se
+lleva cuatro veces la capacidad de uno a 15 fps y, con el nodo
+saturado, lo deja sin servicio. FairScheduler se pone delante
+de AttentionProcessor:
+
+- Cada sesión tiene su propia cola (profundidad `session_depth`):
+  un frame nuevo reemplaza al más viejo en espera (los frames
+  intermedios se descartan, gana el más reciente).
+- Las sesiones se atienden por deficit round-robin ponderado:
+  cada visita suma `quantum_ms × peso` al déficit y un frame
+  cuesta lo que la sesión tardó en promedio (EWMA), así el
+  reparto es por tiempo de CPU y no por cantidad de frames.
+  Como mucho un frame por sesión en proceso a la vez.
+- Cada sesión tiene un tope de fps (token bucket). Los frames por
+  encima del tope solo se atienden si no hay trabajo dentro del
+  tope; ante contención son los primeros en descartarse
+  (con `hard_cap` se descartan siempre).
+
+No hay hilos propios: `workers` es la cantidad de frames en proceso
+a la vez. `run` bloquea el hilo del request hasta que le toca turno
+(y entonces ejecuta el frame en ese mismo hilo, así el perfilado por
+request sigue viendo el pipeline) o hasta que se descarta. `stats`
+expone fps servidos por sesión, descartes y el índice de equidad de
+Jain; `load` resume la carga actual (ocupación de los workers y espera
+en cola, ambas con decaimiento exponencial) sin recorrer sesiones.
+===========================================================
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Optional, Tuple
+
+
+class _Job:
+
+    __slots__ = ("over_rate", "enqueued_at", "done", "status")
+
+    def __init__(self, over_rate: bool):
+        self.over_rate = over_rate
+        self.enqueued_at = time.monotonic()
+        self.done = threading.Event()
+        self.status = "queued"
+
+    def finish(self, status: str) -> None:
+        self.status = status
+        self.done.set()
+
+
+class _SessionQueue:
+
+    __slots__ = (
+        "key", "weight", "queue", "deficit", "busy", "tokens", "refilled_at",
+        "cost_ms", "served", "dropped", "served_at", "offered_at", "last_seen",
+    )
+
+    def __init__(self, key: str, weight: float, burst: float, initial_cost_ms: float):
+        self.key = key
+        self.weight = weight
+        self.queue: Deque[_Job] = deque()
+        self.deficit = 0.0
+        self.busy = False
+        self.tokens = burst
+        self.refilled_at = time.monotonic()
+        self.cost_ms = initial_cost_ms
+        self.served = 0
+        self.dropped = 0
+        self.served_at: Deque[float] = deque(maxlen=1024)
+        self.offered_at: Deque[float] = deque(maxlen=1024)
+        self.last_seen = self.refilled_at
+
+
+class FairScheduler:
+
+    def __init__(
+        self,
+        workers: int = 4,
+        target_fps: float = 15.0,
+        burst: float = 2.0,
+        session_depth: int = 1,
+        max_queued: int = 64,
+        quantum_ms: float = 10.0,
+        hard_cap: bool = False,
+        max_wait: float = 2.0,
+        stats_window: float = 5.0,
+        idle_seconds: float = 30.0,
+    ):
+        self.workers = workers
+        self.target_fps = target_fps
+        self.burst = burst
+        self.session_depth = max(1, session_depth)
+        self.max_queued = max_queued
+        self.quantum_ms = quantum_ms
+        self.hard_cap = hard_cap
+        self.max_wait = max_wait
+        self.stats_window = stats_window
+        self.idle_seconds = idle_seconds
+
+        self._sessions: "OrderedDict[str, _SessionQueue]" = OrderedDict()
+        self._active: Deque[_SessionQueue] = deque()   # sesiones con frames en cola
+        self._queued = 0
+        self._running = 0
+        self._busy_ms = 0.0          # tiempo de proceso con decaimiento (τ = stats_window)
+        self._busy_at = time.monotonic()
+        self._wait_ms = 0.0          # EWMA de la espera hasta el turno (decae sin turnos)
+        self._wait_at = self._busy_at
+        self._lock = threading.Lock()
+
+        self.dropped = {"superseded": 0, "over_rate": 0, "overload": 0, "timeout": 0}
+
+    # ---------------------------------------------------------
+    # API
+    # ---------------------------------------------------------
+    def run(self, key: str, fn: Callable[[], Any], weight: float = 1.0,
+            rate_limited: bool = True) -> Tuple[str, Any]:
+        """
+        Espera turno para la sesión `key` y ejecuta `fn`. Devuelve ("ok",
+        resultado) o (motivo del descarte, None).
+
+        Con rate_limited=False el trabajo no consume el tope de fps (frames
+        de un segmento de video, que llegan todos juntos) pero igual espera
+        su turno en la ronda.
+        """
+        with self._lock:
+            q = self._session(key, weight)
+            over_rate = rate_limited and not self._take_token(q)
+            if over_rate and self.hard_cap:
+                self._count_drop(q, "over_rate")
+                return "over_rate", None
+
+            # El frame nuevo reemplaza al más viejo en espera sin perder el
+            # lugar de la sesión en la ronda; si aquel estaba dentro del
+            # tope, hereda esa condición
+            if not q.queue:
+                self._active.append(q)
+            while len(q.queue) >= self.session_depth:
+                older = q.queue.popleft()
+                self._queued -= 1
+                if not older.over_rate:
+                    if over_rate:
+                        over_rate = False
+                    else:
+                        q.tokens = min(self.burst, q.tokens + 1.0)
+                self._count_drop(q, "superseded")
+                older.finish("superseded")
+            job = _Job(over_rate)
+            q.queue.append(job)
+            self._queued += 1
+
+            if self._queued > self.max_queued:
+                self._shed()
+            self._dispatch()
+
+        if not job.done.wait(self.max_wait):
+            with self._lock:
+                if job.status == "queued":
+                    self._drop(q, job, "timeout")
+            job.done.wait()
+
+        if job.status != "running":
+            return job.status, None
+
+        start = time.perf_counter()
+        try:
+            return "ok", fn()
+        finally:
+            self._release(q, (time.perf_counter() - start) * 1000)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            sessions = {}
+            for key, q in self._sessions.items():
+                served = sum(1 for t in q.served_at if now - t <= self.stats_window)
+                offered = sum(1 for t in q.offered_at if now - t <= self.stats_window)
+                sessions[key] = {
+                    "weight": q.weight,
+                    "offered_fps": offered / self.stats_window,
+                    "served_fps": served / self.stats_window,
+                    "served": q.served,
+                    "dropped": q.dropped,
+                    "queued": len(q.queue),
+                    "cost_ms": q.cost_ms,
+                }
+            queued, running = self._queued, self._running
+
+        # Equidad sobre lo que cada sesión podía recibir: su pedido hasta el tope
+        shares = []
+        for s in sessions.values():
+            demand = min(s["offered_fps"], self.target_fps) if self.target_fps > 0 else s["offered_fps"]
+            if demand > 0:
+                shares.append(s["served_fps"] / demand)
+        jain = (sum(shares) ** 2 / (len(shares) * sum(x * x for x in shares))) if any(shares) else None
+        return {
+            "workers": self.workers,
+            "target_fps": self.target_fps,
+            "running": running,
+            "queued": queued,
+            "dropped": dict(self.dropped),
+            "fairness_jain": jain,
+            **{k: v for k, v in self.load().items() if k in ("utilization", "queue_ms")},
+            "sessions": sessions,
+        }
+
+    def load(self, key: Optional[str] = None) -> dict:
+        """
+        Carga actual en O(1), para consultarla en cada frame. utilization
+        es la fracción de los workers ocupada en los últimos segundos
+        (puede pasar de 1 si el costo medido incluye esperas); cost_ms es
+        el costo por frame de la sesión `key`, si se conoce.
+        """
+        now = time.monotonic()
+        with self._lock:
+            busy = self._busy_ms * math.exp(-(now - self._busy_at) / self.stats_window)
+            wait = self._wait_ms * math.exp(-(now - self._wait_at) / self.stats_window)
+            q = self._sessions.get(key) if key is not None else None
+            return {
+                "workers": self.workers,
+                "running": self._running,
+                "queued": self._queued,
+                "utilization": busy / (self.stats_window * 1000.0 * self.workers),
+                "queue_ms": wait,
+                "cost_ms": q.cost_ms if q is not None else None,
+            }
+
+    # ---------------------------------------------------------
+    # Cola y descartes (con self._lock tomado)
+    # ---------------------------------------------------------
+    def _session(self, key: str, weight: float) -> _SessionQueue:
+        q = self._sessions.get(key)
+        if q is None:
+            q = self._sessions[key] = _SessionQueue(key, max(weight, 1e-3), self.burst, self.quantum_ms)
+        else:
+            q.weight = max(weight, 1e-3)
+            self._sessions.move_to_end(key)
+        q.last_seen = time.monotonic()
+        q.offered_at.append(q.last_seen)
+        self._expire(q.last_seen)
+        return q
+
+    def _take_token(self, q: _SessionQueue) -> bool:
+        if self.target_fps <= 0:
+            return True
+        now = time.monotonic()
+        q.tokens = min(self.burst, q.tokens + (now - q.refilled_at) * self.target_fps)
+        q.refilled_at = now
+        if q.tokens >= 1.0:
+            q.tokens -= 1.0
+            return True
+        return False
+
+    def _drop(self, q: _SessionQueue, job: _Job, reason: str) -> None:
+        """Saca `job` de la cola de `q` y lo resuelve como descartado."""
+        q.queue.remove(job)
+        self._queued -= 1
+        if not q.queue:
+            self._active.remove(q)
+            q.deficit = 0.0
+        self._count_drop(q, reason)
+        job.finish(reason)
+
+    def _count_drop(self, q: _SessionQueue, reason: str) -> None:
+        q.dropped += 1
+        self.dropped[reason] += 1
+
+    def _shed(self) -> None:
+        """Sobrecarga: descartar primero frames sobre el tope, luego el más viejo de la cola más larga."""
+        victim_q, victim = None, None
+        for q in self._active:
+            for job in q.queue:
+                if job.over_rate and (victim is None or job.enqueued_at < victim.enqueued_at):
+                    victim_q, victim = q, job
+        if victim is not None:
+            self._drop(victim_q, victim, "over_rate")
+            return
+        victim_q = max(self._active, key=lambda q: len(q.queue))
+        self._drop(victim_q, victim_q.queue[0], "overload")
+
+    def _expire(self, now: float) -> None:
+        """Olvida sesiones inactivas (sin cola ni frame en proceso)."""
+        while self._sessions:
+            key, q = next(iter(self._sessions.items()))
+            if q.queue or q.busy or now - q.last_seen < self.idle_seconds:
+                break
+            del self._sessions[key]
+
+    # ---------------------------------------------------------
+    # Turnos (con self._lock tomado salvo _release)
+    # ---------------------------------------------------------
+    def _dispatch(self) -> None:
+        """Da turno a frames en espera mientras haya lugar."""
+        while self._running < self.workers:
+            picked = self._pick()
+            if picked is None:
+                return
+            q, job = picked
+            q.busy = True
+            self._running += 1
+            now = time.monotonic()
+            self._wait_ms = (0.8 * self._wait_ms * math.exp(-(now - self._wait_at) / self.stats_window)
+                             + 0.2 * (now - job.enqueued_at) * 1000)
+            self._wait_at = now
+            job.finish("running")
+
+    def _release(self, q: _SessionQueue, cost_ms: float) -> None:
+        with self._lock:
+            self._running -= 1
+            q.busy = False
+            q.cost_ms = 0.8 * q.cost_ms + 0.2 * cost_ms
+            q.served += 1
+            now = time.monotonic()
+            q.served_at.append(now)
+            self._busy_ms = self._busy_ms * math.exp(-(now - self._busy_at) / self.stats_window) + cost_ms
+            self._busy_at = now
+            self._dispatch()
+
+    def _pick(self) -> Optional[Tuple[_SessionQueue, _Job]]:
+        """Deficit round-robin: primero frames dentro del tope, luego el resto."""
+        for allow_over_rate in (False, True):
+            candidates = [
+                q for q in self._active
+                if not q.busy and q.queue and (allow_over_rate or not q.queue[0].over_rate)
+            ]
+            if not candidates:
+                continue
+            while True:
+                q = self._active[0]
+                self._active.rotate(-1)
+                if q not in candidates:
+                    continue
+                if q.deficit < q.cost_ms:
+                    q.deficit += self.quantum_ms * q.weight
+                    if q.deficit < q.cost_ms:
+                        continue
+                q.deficit -= q.cost_ms
+                job = q.queue.popleft()
+                self._queued -= 1
+                if not q.queue:
+                    self._active.remove(q)
+                    q.deficit = 0.0
+                return q, job
+        return None
@@ -0,0 +1,201 @@
+"""
+session_hibernation.py
+===========================================================
+Sesiones hibernadas: el estado de una sesión fría, serializado y
+comprimido (SessionContext.hibernate, unos pocos KB), fuera de la
+tabla de sesiones vivas. El próximo frame de la sesión lo toma
+del almacén y la rehidrata con calibración, ventanas y contadores.
+
+Almacenes:
+- MemoryHibernationStore: en el proceso, con tope de bytes; si se
+  llena descarta las más viejas (su calibración ya se guardó al
+  hibernar).
+- DiskHibernationStore: un archivo por sesión en un directorio
+  local; sobrevive a un reinicio del proceso. Los archivos más
+  viejos que `ttl_seconds` se borran.
+
+Los blobs son binario + JSON (ver SessionContext.hibernate), sin
+pickle: un archivo dañado o ajeno se rechaza al rehidratar.
+===========================================================
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class HibernationStore:
+    """Protocolo: guardar, retirar (leer y borrar) y descartar blobs por sesión."""
+
+    kind = "base"
+
+    def put(self, session_id: str, blob: bytes) -> None:
+        raise NotImplementedError
+
+    def take(self, session_id: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def discard(self, session_id: str) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+class MemoryHibernationStore(HibernationStore):
+
+    kind = "memory"
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._blobs: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def put(self, session_id, blob):
+        with self._lock:
+            old = self._blobs.pop(session_id, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._blobs[session_id] = blob
+            self._bytes += len(blob)
+            while self._bytes > self.max_bytes and len(self._blobs) > 1:
+                _, dropped = self._blobs.popitem(last=False)
+                self._bytes -= len(dropped)
+                self.dropped += 1
+
+    def take(self, session_id):
+        with self._lock:
+            blob = self._blobs.pop(session_id, None)
+            if blob is not None:
+                self._bytes -= len(blob)
+            return blob
+
+    def discard(self, session_id):
+        self.take(session_id)
+
+    def stats(self):
+        with self._lock:
+            return {"kind": self.kind, "sessions": len(self._blobs), "bytes": self._bytes, "dropped": self.dropped}
+
+
+class DiskHibernationStore(HibernationStore):
+
+    kind = "disk"
+
+    def __init__(self, directory: str, ttl_seconds: float = 24 * 3600, sweep_seconds: float = 600.0):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.sweep_seconds = sweep_seconds
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._sizes: Dict[str, int] = {}     # archivo → bytes
+        self._last_sweep = 0.0
+        self.dropped = 0
+        self._sweep(time.time())
+
+    def _path(self, session_id: str) -> str:
+        # Los ids vienen del cliente: el nombre del archivo es su hash
+        name = hashlib.blake2b(session_id.encode("utf-8"), digest_size=16).hexdigest()
+        return os.path.join(self.directory, f"{name}.ses")
+
+    def put(self, session_id, blob):
+        path = self._path(session_id)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(blob)
+        os.replace(tmp, path)
+        now = time.time()
+        with self._lock:
+            self._sizes[path] = len(blob)
+            sweep = now - self._last_sweep >= self.sweep_seconds
+            if sweep:
+                self._last_sweep = now
+        if sweep:
+            self._sweep(now)
+
+    def take(self, session_id):
+        path = self._path(session_id)
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+            os.remove(path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._sizes.pop(path, None)
+        return blob
+
+    def discard(self, session_id):
+        path = self._path(session_id)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self._sizes.pop(path, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "sessions": len(self._sizes),
+                "bytes": sum(self._sizes.values()),
+                "dropped": self.dropped,
+            }
+
+    def _sweep(self, now: float) -> None:
+        """Reconstruye el índice desde el directorio y borra lo vencido."""
+        sizes, dropped = {}, 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".ses"):
+                continue
+            try:
+                st = entry.stat()
+                if now - st.st_mtime > self.ttl_seconds:
+                    os.remove(entry.path)
+                    dropped += 1
+                else:
+                    sizes[entry.path] = st.st_size
+            except FileNotFoundError:
+                continue
+        with self._lock:
+            self._sizes = sizes
+            self.dropped += dropped
+
+
+def build_hibernation_store(
+    kind: str,
+    directory: str = "",
+    max_bytes: int = 64 * 1024 * 1024,
+    ttl_seconds: float = 24 * 3600,
+) -> Optional[HibernationStore]:
+    """"off" → None (las sesiones frías se descartan), "memory" o "disk"."""
+    if kind == "off":
+        return None
+    if kind == "memory":
+        return MemoryHibernationStore(max_bytes=max_bytes)
+    if kind == "disk":
+        return DiskHibernationStore(directory, ttl_seconds=ttl_seconds)
+    raise ValueError(f"Almacén de hibernación desconocido: {kind}")
+
+
+def process_rss_bytes() -> Optional[int]:
+    """Memoria residente del proceso (Linux: /proc; si no, el pico de getrusage)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        import sys
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None
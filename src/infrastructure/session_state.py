@@ -0,0 +1,302 @@
+"""
+session_state.py
+===========================================================
+Estado temporal de sesiones fuera del proceso.
+
+Todo el estado temporal (parpadeos, ventanas de PERCLOS,
+calibración, suavizado de pose) vive en el MetricsCalculator de
+cada sesión. Detrás de un balanceador con varios workers/pods,
+cada frame cae en una réplica distinta; con un backend externo
+todas las réplicas leen y escriben el mismo estado.
+
+Backends:
+- InProcessSessionStateBackend: el estado solo vive en el proceso
+  (comportamiento histórico, costo cero).
+- KeyValueSessionStateBackend: estado en un almacén clave-valor.
+  Cada frame publica solo un delta (~200 bytes); cada
+  `snapshot_every` versiones se escribe un snapshot completo.
+  Las escrituras usan compare-and-swap sobre una clave de
+  metadatos versionada, así dos réplicas no pueden pisarse.
+
+Disposición de claves por sesión:
+    session:{id}:meta                → versión, versión del snapshot, punteros
+    session:{id}:s:{versión}:{nonce} → snapshot completo
+    session:{id}:d:{versión}:{nonce} → delta (versión-1 → versión) + puntero al anterior
+
+Las claves de datos son inmutables y únicas (nonce), así que un
+escritor que pierde el CAS nunca pisa datos del ganador.
+
+El protocolo KeyValueStore (get / set / delete / compare_and_set)
+se implementa en memoria y sobre SQLite (un archivo compartido por
+todos los workers de un host); en un cluster se mapea a Redis
+(GET/SET/DEL y CAS con WATCH/MULTI o un script Lua).
+===========================================================
+"""
+
+import os
+import sqlite3
+import struct
+import threading
+from typing import Dict, Optional
+
+
+# ============================================================
+# 1. Almacenes clave-valor
+# ============================================================
+
+class KeyValueStore:
+    """Protocolo mínimo que necesita KeyValueSessionStateBackend."""
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def compare_and_set(self, key: str, expected: Optional[bytes], value: bytes) -> bool:
+        """Escribe `value` solo si el valor actual es `expected` (None = no existe)."""
+        raise NotImplementedError
+
+
+class MemoryKeyValueStore(KeyValueStore):
+    """Sustituto local en memoria (un solo proceso; útil para pruebas)."""
+
+    def __init__(self):
+        self._data: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._data.get(key)
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def compare_and_set(self, key, expected, value):
+        with self._lock:
+            if self._data.get(key) != expected:
+                return False
+            self._data[key] = value
+            return True
+
+
+class SQLiteKeyValueStore(KeyValueStore):
+    """
+    Sustituto local compartido entre procesos: todos los workers de un
+    mismo host abren el mismo archivo (modo WAL).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def set(self, key, value):
+        self._conn().execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", (key, value))
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def compare_and_set(self, key, expected, value):
+        conn = self._conn()
+        if expected is None:
+            cur = conn.execute("INSERT OR IGNORE INTO kv (key, value) VALUES (?, ?)", (key, value))
+        else:
+            cur = conn.execute(
+                "UPDATE kv SET value = ? WHERE key = ? AND value = ?", (value, key, expected)
+            )
+        return cur.rowcount == 1
+
+
+# ============================================================
+# 2. Backends de estado de sesión
+# ============================================================
+
+class SessionStateBackend:
+    """
+    `sync` pone el MetricsCalculator al día con el estado compartido y
+    devuelve el token de versión vigente; `commit` publica los cambios
+    hechos sobre ese token y devuelve el nuevo, o None si otra réplica
+    avanzó primero (conflicto: hay que sincronizar y reintentar).
+    """
+
+    def sync(self, session_id: str, metrics, token: Optional[bytes]) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def commit(self, session_id: str, metrics, token: Optional[bytes], desde_total: int) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> None:
+        raise NotImplementedError
+
+
+class InProcessSessionStateBackend(SessionStateBackend):
+    """El estado vive solo en memoria del proceso (sin costo)."""
+
+    def sync(self, session_id, metrics, token):
+        return token
+
+    def commit(self, session_id, metrics, token, desde_total):
+        return token if token is not None else b""
+
+    def delete(self, session_id):
+        pass
+
+
+# meta: versión, versión del snapshot, nonce del delta cabeza, nonce del snapshot
+_META = struct.Struct("<qq8s8s")
+# prefijo de cada delta: nonce del delta anterior (vacío si el anterior es el snapshot)
+_DELTA_PREV = struct.Struct("<8s")
+_NO_NONCE = b"\0" * 8
+
+
+class KeyValueSessionStateBackend(SessionStateBackend):
+
+    def __init__(self, kv: KeyValueStore, snapshot_every: int = 300, max_attempts: int = 3):
+        self.kv = kv
+        self.snapshot_every = snapshot_every
+        self.max_attempts = max_attempts
+
+    # ---------------------------------------------------------
+    # Claves
+    # ---------------------------------------------------------
+    @staticmethod
+    def _meta_key(sid: str) -> str:
+        return f"session:{sid}:meta"
+
+    @staticmethod
+    def _snap_key(sid: str, version: int, nonce: bytes) -> str:
+        return f"session:{sid}:s:{version}:{nonce.hex()}"
+
+    @staticmethod
+    def _delta_key(sid: str, version: int, nonce: bytes) -> str:
+        return f"session:{sid}:d:{version}:{nonce.hex()}"
+
+    # ---------------------------------------------------------
+    # Lectura
+    # ---------------------------------------------------------
+    def sync(self, session_id, metrics, token):
+        for _ in range(self.max_attempts):
+            meta = self.kv.get(self._meta_key(session_id))
+            if meta is None or meta == token:
+                # Sin estado remoto (sesión nueva) o ya estamos al día
+                return meta
+            try:
+                self._catch_up(session_id, metrics, token, meta)
+                return meta
+            except (TypeError, ValueError, struct.error):
+                # Una compactación borró lo que estábamos leyendo: releer meta
+                token = None
+        raise RuntimeError(f"No se pudo sincronizar el estado de la sesión {session_id}")
+
+    def _catch_up(self, sid, metrics, token, meta):
+        version, snap_version, head_nonce, snap_nonce = _META.unpack(meta)
+        local_version = _META.unpack(token)[0] if token else -1
+
+        # Con el token local dentro del tramo de deltas alcanza con aplicarlos
+        desde = local_version if snap_version <= local_version < version else None
+        deltas = self._collect_deltas(sid, version, head_nonce, desde if desde is not None else snap_version)
+
+        if desde is None:
+            snapshot = self.kv.get(self._snap_key(sid, snap_version, snap_nonce))
+            if snapshot is None:
+                raise ValueError("snapshot ausente")
+            metrics.cargar_estado(snapshot)
+
+        for delta in deltas:
+            metrics.cargar_estado(delta)
+
+    def _collect_deltas(self, sid, version, nonce, hasta_version):
+        """Deltas (hasta_version, version], en orden de aplicación."""
+        deltas = []
+        while version > hasta_version:
+            blob = self.kv.get(self._delta_key(sid, version, nonce))
+            if blob is None:
+                raise ValueError("delta ausente")
+            (nonce,) = _DELTA_PREV.unpack_from(blob, 0)
+            deltas.append(blob[_DELTA_PREV.size:])
+            version -= 1
+        deltas.reverse()
+        return deltas
+
+    # ---------------------------------------------------------
+    # Escritura
+    # ---------------------------------------------------------
+    def commit(self, session_id, metrics, token, desde_total):
+        if token:
+            version, snap_version, head_nonce, snap_nonce = _META.unpack(token)
+        else:
+            version, snap_version, head_nonce, snap_nonce = 0, 0, _NO_NONCE, _NO_NONCE
+
+        new_version = version + 1
+        nonce = os.urandom(8)
+
+        if not token or new_version - snap_version >= self.snapshot_every:
+            key = self._snap_key(session_id, new_version, nonce)
+            self.kv.set(key, metrics.exportar_estado())
+            new_meta = _META.pack(new_version, new_version, _NO_NONCE, nonce)
+        else:
+            prev = head_nonce if version > snap_version else _NO_NONCE
+            key = self._delta_key(session_id, new_version, nonce)
+            self.kv.set(key, _DELTA_PREV.pack(prev) + metrics.exportar_delta(desde_total))
+            new_meta = _META.pack(new_version, snap_version, nonce, snap_nonce)
+
+        if not self.kv.compare_and_set(self._meta_key(session_id), token or None, new_meta):
+            self.kv.delete(key)  # clave única: solo borra lo nuestro
+            return None
+
+        if token and snap_version != _META.unpack(new_meta)[1]:
+            self._drop_chain(session_id, version, head_nonce, snap_version, snap_nonce)
+        return new_meta
+
+    def _drop_chain(self, sid, version, nonce, snap_version, snap_nonce):
+        """Borra el snapshot anterior y sus deltas tras compactar."""
+        while version > snap_version:
+            key = self._delta_key(sid, version, nonce)
+            blob = self.kv.get(key)
+            self.kv.delete(key)
+            if blob is None:
+                break
+            (nonce,) = _DELTA_PREV.unpack_from(blob, 0)
+            version -= 1
+        self.kv.delete(self._snap_key(sid, snap_version, snap_nonce))
+
+    def delete(self, session_id):
+        meta = self.kv.get(self._meta_key(session_id))
+        if meta is None:
+            return
+        version, snap_version, head_nonce, snap_nonce = _META.unpack(meta)
+        self.kv.delete(self._meta_key(session_id))
+        self._drop_chain(session_id, version, head_nonce, snap_version, snap_nonce)
+
+
+def build_session_state_backend(kind: str, path: str = "", snapshot_every: int = 300) -> SessionStateBackend:
+    """Crea el backend configurado: "memory" (en proceso) o "sqlite"."""
+    if kind in ("", "memory", "inprocess"):
+        return InProcessSessionStateBackend()
+    if kind == "sqlite":
+        return KeyValueSessionStateBackend(SQLiteKeyValueStore(path), snapshot_every=snapshot_every)
+    raise ValueError(f"Backend de estado de sesión desconocido: {kind}")
@@ -0,0 +1,537 @@
+"""
+timeline_store.py
+===========================================================
+Línea de tiempo de cada sesión para los dashboards: score, EAR,
+yaw y pitch indexados por tiempo, con consultas de tamaño fijo
+(GET /sessions/{id}/timeline).
+
+Cada frame procesado se agrega a:
+- un buffer circular con los últimos `raw_rows` frames tal cual;
+- una pirámide de tramos: el nivel 0 junta `base_seconds` (1 s) y
+  cada nivel siguiente `factor` (4) tramos del anterior. Un tramo
+  guarda por serie mínimo y máximo (con su instante), suma y
+  conteo.
+
+La pirámide se arma a medida que llegan los frames: el tramo
+abierto de cada nivel se cierra cuando llega uno posterior y se
+suma al abierto del nivel siguiente. Un frame atrasado se cuenta
+en el instante del último.
+
+Una consulta (desde, hasta, puntos) elige la fuente más fina que
+tenga a lo sumo `oversample × puntos` filas en el rango (búsqueda
+binaria por tiempo) y la reduce a `puntos`:
+- "lttb": Largest-Triangle-Three-Buckets (Steinarsson, 2013) sobre
+  los valores (o las medias de los tramos); conserva picos y
+  forma con un punto por tramo.
+- "minmax": el mínimo y el máximo de cada tramo de tiempo, en su
+  instante; ningún extremo queda afuera.
+El costo depende de `puntos`, no de la duración de la sesión. Los
+frames sin rostro no aportan puntos.
+
+La línea de tiempo vive en la memoria del proceso, con un tope de
+bytes: si se pasa, se descartan las sesiones actualizadas hace más
+tiempo. Se pierde al reiniciar el worker; en un traspaso de sesión
+viaja con el estado (export/install).
+===========================================================
+"""
+
+import json
+import math
+import struct
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..domain.ring_buffer import RingBuffer
+
+DEFAULT_FIELDS = ("attention_score", "ear", "head_yaw", "head_pitch")
+
+# Por serie, en un tramo abierto: mínimo, máximo, instante del mínimo,
+# instante del máximo, suma y conteo
+_SLOTS = 6
+
+
+def _bucket_dtype(fields: Sequence[str]) -> np.dtype:
+    cols = [("t0", "f8"), ("frames", "i4")]
+    for f in fields:
+        # Instantes de los extremos relativos al inicio del tramo
+        cols += [(f"{f}_min", "f4"), (f"{f}_max", "f4"), (f"{f}_tmin", "f4"), (f"{f}_tmax", "f4"),
+                 (f"{f}_sum", "f4"), (f"{f}_n", "i4")]
+    return np.dtype(cols)
+
+
+def _new_bucket(t0: float, nfields: int) -> list:
+    return [t0, 0] + [math.inf, -math.inf, 0.0, 0.0, 0.0, 0] * nfields
+
+
+def _add_frame(b: list, t: float, values: Sequence[Optional[float]]) -> None:
+    b[1] += 1
+    j = 2
+    for v in values:
+        if v is not None:
+            if v < b[j]:
+                b[j], b[j + 2] = v, t
+            if v > b[j + 1]:
+                b[j + 1], b[j + 3] = v, t
+            b[j + 4] += v
+            b[j + 5] += 1
+        j += _SLOTS
+
+
+def _merge(b: list, other: list) -> None:
+    b[1] += other[1]
+    for j in range(2, len(b), _SLOTS):
+        if other[j] < b[j]:
+            b[j], b[j + 2] = other[j], other[j + 2]
+        if other[j + 1] > b[j + 1]:
+            b[j + 1], b[j + 3] = other[j + 1], other[j + 3]
+        b[j + 4] += other[j + 4]
+        b[j + 5] += other[j + 5]
+
+
+def _bucket_row(b: list) -> tuple:
+    t0 = b[0]
+    row = [t0, b[1]]
+    for j in range(2, len(b), _SLOTS):
+        if b[j + 5]:
+            row += [b[j], b[j + 1], b[j + 2] - t0, b[j + 3] - t0, b[j + 4], b[j + 5]]
+        else:
+            row += [math.nan, math.nan, 0.0, 0.0, 0.0, 0]
+    return tuple(row)
+
+
+class _Level:
+
+    __slots__ = ("width", "rows", "n", "open")
+
+    def __init__(self, width: float, dtype: np.dtype):
+        self.width = width
+        self.rows = np.zeros(16, dtype=dtype)
+        self.n = 0
+        self.open: Optional[list] = None
+
+    def push(self, b: list) -> None:
+        if self.n == len(self.rows):
+            grown = np.zeros(2 * len(self.rows), dtype=self.rows.dtype)
+            grown[:self.n] = self.rows
+            self.rows = grown
+        self.rows[self.n] = _bucket_row(b)
+        self.n += 1
+
+    def start_of(self, t: float) -> float:
+        return math.floor(t / self.width) * self.width
+
+
+class SessionTimeline:
+    """Frames recientes + pirámide de tramos de una sesión."""
+
+    def __init__(
+        self,
+        fields: Sequence[str] = DEFAULT_FIELDS,
+        raw_rows: int = 2048,
+        base_seconds: float = 1.0,
+        factor: int = 4,
+        levels: int = 6,
+    ):
+        self.fields = tuple(fields)
+        self.raw = RingBuffer(raw_rows, [("t", "f8")] + [(f, "f4") for f in self.fields])
+        dtype = _bucket_dtype(self.fields)
+        self.levels = [_Level(base_seconds * factor ** k, dtype) for k in range(levels)]
+        self.first_t: Optional[float] = None
+        self.last_t: Optional[float] = None
+        self.frames = 0
+        self.lock = threading.Lock()
+
+    # ---------------------------------------------------------
+    # Escritura
+    # ---------------------------------------------------------
+    def add(self, t: float, values: Sequence[Optional[float]]) -> None:
+        """Agrega un frame (valores en el orden de `fields`; None = sin dato)."""
+        if self.last_t is not None and t < self.last_t:
+            t = self.last_t
+        if self.first_t is None:
+            self.first_t = t
+        self.last_t = t
+        self.frames += 1
+        self.raw.append((t, *(math.nan if v is None else v for v in values)))
+
+        level = self.levels[0]
+        start = level.start_of(t)
+        if level.open is not None and start > level.open[0]:
+            self._close(0)
+        if level.open is None:
+            level.open = _new_bucket(start, len(self.fields))
+        _add_frame(level.open, t, values)
+
+    def _close(self, k: int) -> None:
+        level = self.levels[k]
+        b, level.open = level.open, None
+        level.push(b)
+        if k + 1 == len(self.levels):
+            return
+        upper = self.levels[k + 1]
+        start = upper.start_of(b[0])
+        if upper.open is not None and start > upper.open[0]:
+            self._close(k + 1)
+        if upper.open is None:
+            upper.open = _new_bucket(start, len(self.fields))
+        _merge(upper.open, b)
+
+    @property
+    def nbytes(self) -> int:
+        return self.raw.nbytes + sum(level.rows.nbytes for level in self.levels)
+
+    # ---------------------------------------------------------
+    # Serialización (traspaso entre workers)
+    # ---------------------------------------------------------
+    def to_bytes(self) -> bytes:
+        """JSON con los escalares y tramos abiertos + filas crudas y cerradas."""
+        with self.lock:
+            meta = {
+                "fields": self.fields,
+                "widths": [level.width for level in self.levels],
+                "first_t": self.first_t,
+                "last_t": self.last_t,
+                "frames": self.frames,
+                "raw_total": self.raw.total,
+                "rows": [level.n for level in self.levels],
+                "open": [level.open for level in self.levels],
+            }
+            blocks = [self.raw.to_bytes()] + [level.rows[:level.n].tobytes() for level in self.levels]
+        parts = [json.dumps(meta).encode("utf-8")] + blocks
+        return b"".join(struct.pack("<I", len(p)) + p for p in parts)
+
+    def load_bytes(self, data: bytes) -> None:
+        """Inversa de to_bytes(); ValueError si no corresponde a esta configuración."""
+        parts, offset = [], 0
+        while offset < len(data):
+            (n,) = struct.unpack_from("<I", data, offset)
+            parts.append(data[offset + 4:offset + 4 + n])
+            offset += 4 + n
+        if len(parts) != 2 + len(self.levels):
+            raise ValueError("Línea de tiempo con otra cantidad de niveles")
+        meta = json.loads(parts[0].decode("utf-8"))
+        if tuple(meta["fields"]) != self.fields or meta["widths"] != [level.width for level in self.levels]:
+            raise ValueError("Línea de tiempo con otras series o tramos")
+
+        with self.lock:
+            self.raw.load_bytes(parts[1], total=int(meta["raw_total"]))
+            for level, n, b, raw in zip(self.levels, meta["rows"], meta["open"], parts[2:]):
+                rows = np.frombuffer(raw, dtype=level.rows.dtype)
+                if len(rows) != n:
+                    raise ValueError("Línea de tiempo truncada")
+                level.rows = np.zeros(max(16, n), dtype=level.rows.dtype)
+                level.rows[:n] = rows
+                level.n = n
+                level.open = None if b is None else [float(x) for x in b]
+            self.first_t = meta["first_t"]
+            self.last_t = meta["last_t"]
+            self.frames = int(meta["frames"])
+
+    # ---------------------------------------------------------
+    # Lectura
+    # ---------------------------------------------------------
+    def _pending(self, k: int) -> List[list]:
+        """Tramos de nivel k con lo que todavía no se cerró en los niveles 0..k."""
+        level = self.levels[k]
+        pending: Dict[float, list] = {}
+        for j in range(k, -1, -1):
+            b = self.levels[j].open
+            if b is None:
+                continue
+            start = level.start_of(b[0])
+            if start in pending:
+                _merge(pending[start], b)
+            else:
+                copy = list(b)
+                copy[0] = start
+                pending[start] = copy
+        return [pending[s] for s in sorted(pending)]
+
+    def _level_rows(self, k: int, t_from: float, t_to: float) -> np.ndarray:
+        """Tramos de nivel k que se superponen con [t_from, t_to] (copia)."""
+        level = self.levels[k]
+        t0 = level.rows["t0"][:level.n]
+        lo = np.searchsorted(t0, t_from - level.width, side="right")
+        hi = np.searchsorted(t0, t_to, side="right")
+        rows = level.rows[lo:hi]
+        tail = [_bucket_row(b) for b in self._pending(k)
+                if b[0] <= t_to and b[0] + level.width > t_from]
+        if tail:
+            rows = np.concatenate((rows, np.array(tail, dtype=rows.dtype)))
+        else:
+            rows = rows.copy()
+        return rows
+
+    def source(self, t_from: float, t_to: float, limit: int) -> Tuple[float, np.ndarray]:
+        """
+        La fuente más fina con a lo sumo `limit` filas en el rango:
+        (0.0, frames) o (ancho del tramo, tramos). Si ninguna entra,
+        el nivel más grueso.
+        """
+        with self.lock:
+            if len(self.raw) and (self.raw.first()["t"] <= t_from or self.raw.total == len(self.raw)):
+                rows = self.raw.since(np.nextafter(t_from, -math.inf))
+                rows = rows[rows["t"] <= t_to]
+                if len(rows) <= limit:
+                    return 0.0, rows
+            for k, level in enumerate(self.levels):
+                t0 = level.rows["t0"][:level.n]
+                count = (np.searchsorted(t0, t_to, side="right")
+                         - np.searchsorted(t0, t_from - level.width, side="right"))
+                if count + 2 <= limit or k == len(self.levels) - 1:
+                    return level.width, self._level_rows(k, t_from, t_to)
+        raise AssertionError("sin niveles")
+
+
+# ============================================================
+# Reducción a N puntos
+# ============================================================
+
+def lttb(t: np.ndarray, v: np.ndarray, points: int) -> np.ndarray:
+    """Índices elegidos por Largest-Triangle-Three-Buckets (incluye el primero y el último)."""
+    n = len(t)
+    if points >= n or n <= 2:
+        return np.arange(n)
+    if points < 3:
+        return np.array([0, n - 1][:points])
+
+    # Tramos [bounds[i], bounds[i+1]) para los points-2 puntos del medio;
+    # el tercer vértice de cada triángulo es el promedio del tramo siguiente
+    # (el del último es el punto final)
+    bounds = (np.arange(points - 1) * ((n - 2) / (points - 2))).astype(np.int64) + 1
+    bounds[-1] = n - 1
+    nxt = np.r_[bounds[1:], n]
+    span = np.diff(nxt).astype(np.float64)
+    avg_t = (np.add.reduceat(t, bounds[1:]) / span).tolist()
+    avg_v = (np.add.reduceat(v, bounds[1:]) / span).tolist()
+
+    tl, vl, bl = t.tolist(), v.tolist(), bounds.tolist()
+    chosen = [0]
+    a = 0
+    for i in range(points - 2):
+        ta, va = tl[a], vl[a]
+        dt, dv = ta - avg_t[i], avg_v[i] - va
+        best, best_area = bl[i], -1.0
+        for j in range(bl[i], bl[i + 1]):
+            area = abs(dt * (vl[j] - va) - (ta - tl[j]) * dv)
+            if area > best_area:
+                best, best_area = j, area
+        chosen.append(best)
+        a = best
+    chosen.append(n - 1)
+    return np.array(chosen)
+
+
+def minmax(t: np.ndarray, t_min: np.ndarray, v_min: np.ndarray, t_max: np.ndarray, v_max: np.ndarray,
+           t_from: float, t_to: float, points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mínimo y máximo (en su instante) de cada uno de points/2 tramos
+    iguales de [t_from, t_to]; `t` ubica cada fila en su tramo.
+    """
+    if len(t) == 0:
+        return np.empty(0), np.empty(0)
+    buckets = max(1, points // 2)
+    width = max(t_to - t_from, 1e-9) / buckets
+    ids = np.clip(((t - t_from) / width).astype(np.int64), 0, buckets - 1)
+
+    def pick(values):
+        order = np.lexsort((values, ids))
+        first = np.r_[True, ids[order][1:] != ids[order][:-1]]
+        return order[first]
+
+    lo, hi = pick(v_min), pick(-v_max)
+    out_t = np.concatenate((t_min[lo], t_max[hi]))
+    out_v = np.concatenate((v_min[lo], v_max[hi]))
+    order = np.lexsort((out_v, out_t))
+    out_t, out_v = out_t[order], out_v[order]
+    # Una sola fila en el tramo: el mínimo y el máximo son el mismo punto
+    keep = np.r_[True, (out_t[1:] != out_t[:-1]) | (out_v[1:] != out_v[:-1])]
+    return out_t[keep], out_v[keep]
+
+
+# ============================================================
+# Almacén de líneas de tiempo
+# ============================================================
+
+class TimelineStore:
+
+    def __init__(
+        self,
+        fields: Sequence[str] = DEFAULT_FIELDS,
+        raw_rows: int = 2048,
+        base_seconds: float = 1.0,
+        factor: int = 4,
+        levels: int = 6,
+        max_bytes: int = 128 * 1024 * 1024,
+        oversample: int = 4,
+    ):
+        self.fields = tuple(fields)
+        self.raw_rows = raw_rows
+        self.base_seconds = base_seconds
+        self.factor = factor
+        self.n_levels = levels
+        self.max_bytes = max_bytes
+        self.oversample = oversample
+
+        self._timelines: "OrderedDict[str, SessionTimeline]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.queries = 0
+
+    def add(self, session_id: Optional[str], t: float, result: dict) -> None:
+        """Agrega un frame procesado (campos de ProcessFrameResponse)."""
+        if not session_id:
+            return
+        values = [result.get(f) for f in self.fields] if result.get("face_detected") else [None] * len(self.fields)
+        with self._lock:
+            timeline = self._timelines.get(session_id)
+            if timeline is None:
+                timeline = self._timelines[session_id] = SessionTimeline(
+                    self.fields, self.raw_rows, self.base_seconds, self.factor, self.n_levels
+                )
+                self._evict()
+            else:
+                self._timelines.move_to_end(session_id)
+        with timeline.lock:
+            timeline.add(t, values)
+            check = timeline.frames % 1024 == 0
+        if check:
+            with self._lock:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Con self._lock: descarta las sesiones más viejas mientras se pase del tope."""
+        total = sum(tl.nbytes for tl in self._timelines.values())
+        while total > self.max_bytes and len(self._timelines) > 1:
+            _, dropped = self._timelines.popitem(last=False)
+            total -= dropped.nbytes
+            self.evicted += 1
+
+    def forget(self, session_id: str) -> None:
+        with self._lock:
+            self._timelines.pop(session_id, None)
+
+    def export(self, session_id: str) -> Optional[bytes]:
+        """Línea de tiempo serializada de la sesión, o None si no hay."""
+        with self._lock:
+            timeline = self._timelines.get(session_id)
+        return timeline.to_bytes() if timeline is not None else None
+
+    def install(self, session_id: str, data: bytes) -> None:
+        """Instala una línea de tiempo exportada por otro worker (reemplaza la local)."""
+        timeline = SessionTimeline(self.fields, self.raw_rows, self.base_seconds, self.factor, self.n_levels)
+        try:
+            timeline.load_bytes(data)
+        except (KeyError, TypeError, struct.error, UnicodeDecodeError) as e:
+            raise ValueError(f"Línea de tiempo inválida: {type(e).__name__}: {e}") from e
+        with self._lock:
+            self._timelines[session_id] = timeline
+            self._timelines.move_to_end(session_id)
+            self._evict()
+
+    def query(
+        self,
+        session_id: str,
+        t_from: Optional[float] = None,
+        t_to: Optional[float] = None,
+        points: int = 500,
+        method: str = "lttb",
+        fields: Optional[Iterable[str]] = None,
+    ) -> Optional[dict]:
+        """Series reducidas a `points` puntos como mucho; None si la sesión no existe."""
+        if method not in ("lttb", "minmax"):
+            raise ValueError(f"Método de reducción desconocido: {method}")
+        names = list(fields) if fields else list(self.fields)
+        unknown = [f for f in names if f not in self.fields]
+        if unknown:
+            raise ValueError(f"Series desconocidas: {', '.join(unknown)}")
+
+        with self._lock:
+            timeline = self._timelines.get(session_id)
+            self.queries += 1
+        if timeline is None or timeline.first_t is None:
+            return None
+
+        with timeline.lock:
+            first, last, frames = timeline.first_t, timeline.last_t, timeline.frames
+        t_from = first if t_from is None else max(t_from, first)
+        t_to = last if t_to is None else min(t_to, last)
+        points = max(2, points)
+
+        resolution, rows = (0.0, None) if t_to < t_from else timeline.source(
+            t_from, t_to, self.oversample * points
+        )
+        series = {}
+        for f in names:
+            if rows is None:
+                t, v = np.empty(0), np.empty(0)
+            elif resolution == 0.0:
+                t, v = self._raw_series(rows, f, t_from, t_to, points, method)
+            else:
+                t, v = self._bucket_series(rows, f, resolution, t_from, t_to, points, method)
+            series[f] = {"t": np.round(t, 3).tolist(), "v": np.round(v.astype(np.float64), 4).tolist()}
+
+        return {
+            "session_id": session_id,
+            "from": t_from,
+            "to": t_to,
+            "start": first,
+            "end": last,
+            "frames": frames,
+            "points": points,
+            "method": method,
+            "resolution_seconds": resolution,
+            "series": series,
+        }
+
+    @staticmethod
+    def _raw_series(rows, f, t_from, t_to, points, method):
+        ok = ~np.isnan(rows[f])
+        t, v = rows["t"][ok], rows[f][ok].astype(np.float64)
+        if len(t) <= points:
+            return t, v
+        if method == "minmax":
+            return minmax(t, t, v, t, v, t_from, t_to, points)
+        idx = lttb(t, v, points)
+        return t[idx], v[idx]
+
+    @staticmethod
+    def _bucket_series(rows, f, width, t_from, t_to, points, method):
+        rows = rows[rows[f"{f}_n"] > 0]
+        t0 = rows["t0"]
+        if method == "minmax":
+            v_min, v_max = rows[f"{f}_min"].astype(np.float64), rows[f"{f}_max"].astype(np.float64)
+            t_min, t_max = t0 + rows[f"{f}_tmin"], t0 + rows[f"{f}_tmax"]
+            if 2 * len(rows) <= points:
+                out_t = np.concatenate((t_min, t_max))
+                out_v = np.concatenate((v_min, v_max))
+                order = np.lexsort((out_v, out_t))
+                return out_t[order], out_v[order]
+            return minmax(t0 + width / 2, t_min, v_min, t_max, v_max, t_from, t_to, points)
+
+        # LTTB sobre el mínimo y el máximo de cada tramo, en su instante: los
+        # picos siguen siendo candidatos; si sobran puntos, la media por tramo
+        if len(rows) <= points:
+            return np.clip(t0 + width / 2, t_from, t_to), rows[f"{f}_sum"].astype(np.float64) / rows[f"{f}_n"]
+        t = np.concatenate((t0 + rows[f"{f}_tmin"], t0 + rows[f"{f}_tmax"]))
+        v = np.concatenate((rows[f"{f}_min"], rows[f"{f}_max"])).astype(np.float64)
+        order = np.argsort(t, kind="stable")
+        t, v = t[order], v[order]
+        idx = lttb(t, v, points)
+        return t[idx], v[idx]
+
+    def stats(self) -> dict:
+        with self._lock:
+            timelines = list(self._timelines.values())
+            return {
+                "sessions": len(timelines),
+                "bytes": sum(tl.nbytes for tl in timelines),
+                "max_bytes": self.max_bytes,
+                "frames": sum(tl.frames for tl in timelines),
+                "levels": [self.base_seconds * self.factor ** k for k in range(self.n_levels)],
+                "evicted": self.evicted,
+                "queries": self.queries,
+            }
@@ -0,0 +1,422 @@
+"""
+tracing.py
+===========================================================
+Trazas por request (spans) para explicar latencias aisladas.
+
+El request abre una traza (Tracer.start) y el pipeline marca
+sus etapas con `span("nombre")` o `@traced("nombre")`. Sin traza
+activa (no se muestrea y no hay umbral de lentitud) `span`
+devuelve un objeto vacío compartido: el costo es leer una
+ContextVar.
+
+Con TRACE_SLOW_MS > 0 se registran los spans de todos los
+requests (unos pocos µs) y solo se exportan los que superan el
+umbral; TRACE_SAMPLE_RATE exporta además una fracción al azar.
+Un `traceparent` entrante (W3C) aporta el trace-id y el span
+padre; si viene con la bandera de muestreo, el request se
+exporta siempre.
+
+Exportación en un hilo aparte (nunca en el hilo del request):
+- log local rotativo, una línea JSON por traza con el desglose
+  de spans (inicio relativo y duración en ms),
+- archivo OTLP/JSON (un ExportTraceServiceRequest por línea,
+  legible por el receptor otlpjsonfile de OpenTelemetry).
+Las últimas trazas exportadas quedan en memoria
+(GET /traces/{trace_id}).
+===========================================================
+"""
+
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, List, Optional
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+
+_TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start_ns", "end_ns", "attrs", "error")
+
+    def __init__(self, trace: "Trace", name: str, attrs: Optional[dict] = None):
+        self.trace = trace
+        self.name = name
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = None
+        self.start_ns = 0
+        self.end_ns = 0
+        self.attrs = attrs or {}
+        self.error = None
+
+    def __enter__(self):
+        stack = self.trace.stack
+        self.parent_id = stack[-1] if stack else self.trace.parent_id
+        stack.append(self.span_id)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.perf_counter_ns()
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        stack = self.trace.stack
+        if stack and stack[-1] == self.span_id:
+            stack.pop()
+        self.trace.add(self)
+        return False
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+
+class Trace:
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 max_spans: int, attrs: Optional[dict] = None):
+        self.trace_id = trace_id
+        self.parent_id = parent_id          # span remoto (traceparent), si vino
+        self.sampled = sampled
+        self.max_spans = max_spans
+        self.spans: List[Span] = []
+        self.stack: List[str] = []
+        self.dropped_spans = 0
+        self.wall_start_ns = time.time_ns()
+        self.perf_start_ns = time.perf_counter_ns()
+        self.root = Span(self, name, {k: v for k, v in (attrs or {}).items() if v is not None})
+        self._token = None
+
+    def set(self, **attrs) -> None:
+        """Atributos del request (span raíz); los None se omiten."""
+        self.root.set(**{k: v for k, v in attrs.items() if v is not None})
+
+    def fail(self, exc: BaseException) -> None:
+        self.root.error = f"{type(exc).__name__}: {exc}"
+
+    def add(self, span: Span) -> None:
+        if len(self.spans) < self.max_spans or span is self.root:
+            self.spans.append(span)
+        else:
+            self.dropped_spans += 1
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.root.end_ns or time.perf_counter_ns()
+        return (end - self.root.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        """Desglose legible: spans ordenados por inicio, en ms relativos a la raíz."""
+        t0 = self.root.start_ns
+        spans = sorted(self.spans, key=lambda s: s.start_ns)
+        depth = {self.root.span_id: 0}
+        out = []
+        for s in spans:
+            d = depth.get(s.parent_id, -1) + 1 if s is not self.root else 0
+            depth[s.span_id] = d
+            item = {
+                "name": s.name,
+                "span_id": s.span_id,
+                "parent_id": s.parent_id,
+                "depth": d,
+                "start_ms": round((s.start_ns - t0) / 1e6, 3),
+                "duration_ms": round((s.end_ns - s.start_ns) / 1e6, 3),
+            }
+            if s.attrs:
+                item["attrs"] = s.attrs
+            if s.error:
+                item["error"] = s.error
+            out.append(item)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "time": self.wall_start_ns / 1e9,
+            "duration_ms": round(self.duration_ms, 3),
+            "sampled": self.sampled,
+            "attrs": self.root.attrs,
+            "dropped_spans": self.dropped_spans,
+            "spans": out,
+        }
+
+    def to_otlp(self, service_name: str) -> dict:
+        """ExportTraceServiceRequest (OTLP/JSON) con todos los spans."""
+        def unix_ns(perf_ns: int) -> str:
+            return str(self.wall_start_ns + (perf_ns - self.perf_start_ns))
+
+        spans = []
+        for s in self.spans:
+            span = {
+                "traceId": self.trace_id,
+                "spanId": s.span_id,
+                "name": s.name,
+                "kind": 2 if s is self.root else 1,     # SERVER / INTERNAL
+                "startTimeUnixNano": unix_ns(s.start_ns),
+                "endTimeUnixNano": unix_ns(s.end_ns),
+                "attributes": [_otlp_attr(k, v) for k, v in s.attrs.items()],
+                "status": {"code": 2, "message": s.error} if s.error else {},
+            }
+            if s.parent_id:
+                span["parentSpanId"] = s.parent_id
+            spans.append(span)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attr("service.name", service_name)]},
+            "scopeSpans": [{"scope": {"name": "src.infrastructure.tracing"}, "spans": spans}],
+        }]}
+
+
+def _otlp_attr(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        v = {"boolValue": value}
+    elif isinstance(value, int):
+        v = {"intValue": str(value)}
+    elif isinstance(value, float):
+        v = {"doubleValue": value}
+    else:
+        v = {"stringValue": str(value)}
+    return {"key": key, "value": v}
+
+
+# ============================================================
+# API para el pipeline
+# ============================================================
+
+def span(name: str, **attrs):
+    """Context manager de un span; no hace nada si no hay traza activa."""
+    trace = _current.get()
+    if trace is None:
+        return _NOOP
+    return Span(trace, name, attrs)
+
+
+def traced(name: str):
+    """Decorador: la función entera es un span."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = _current.get()
+            if trace is None:
+                return fn(*args, **kwargs)
+            with Span(trace, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record_span(name: str, start_ns: int, end_ns: int, **attrs) -> None:
+    """Span ya medido (perf_counter_ns), p. ej. la espera en la cola."""
+    trace = _current.get()
+    if trace is None:
+        return
+    s = Span(trace, name, attrs)
+    s.parent_id = trace.stack[-1] if trace.stack else trace.parent_id
+    s.start_ns, s.end_ns = start_ns, end_ns
+    trace.add(s)
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current.get()
+    return trace.trace_id if trace is not None else None
+
+
+def parse_traceparent(header: Optional[str]):
+    """(trace_id, parent_id, muestreado) de un traceparent W3C válido, o None."""
+    if not header:
+        return None
+    m = _TRACEPARENT.match(header.strip().lower())
+    if m is None or m.group(1) == "ff" or m.group(2) == "0" * 32 or m.group(3) == "0" * 16:
+        return None
+    return m.group(2), m.group(3), bool(int(m.group(4), 16) & 1)
+
+
+# ============================================================
+# Tracer: muestreo, umbral y exportación
+# ============================================================
+
+class Tracer:
+
+    def __init__(
+        self,
+        sample_rate: float = 0.0,
+        slow_ms: float = 0.0,
+        log_path: str = "",
+        otlp_path: str = "",
+        max_bytes: int = 10 * 1024 * 1024,
+        backups: int = 5,
+        service_name: str = "attention-monitor-api",
+        max_spans: int = 512,
+        recent: int = 200,
+        queue_size: int = 1000,
+    ):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.log_path = log_path
+        self.otlp_path = otlp_path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.service_name = service_name
+        self.max_spans = max_spans
+
+        self._recent: "OrderedDict[str, dict]" = OrderedDict()
+        self._recent_max = recent
+        self._queue: "queue.Queue[Trace]" = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._loggers: Dict[str, logging.Logger] = {}
+        self.counters = {"traced": 0, "exported": 0, "slow": 0, "dropped": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or self.slow_ms > 0
+
+    def start(self, name: str, traceparent: Optional[str] = None, **attrs) -> Optional[Trace]:
+        """
+        Abre la traza del request en el contexto actual. Devuelve None
+        (sin costo posterior) si no hay nada que registrar.
+        """
+        parent = parse_traceparent(traceparent)
+        forced = parent is not None and parent[2]
+        sampled = forced or (self.sample_rate > 0 and random.random() < self.sample_rate)
+        if not sampled and self.slow_ms <= 0:
+            return None
+
+        trace_id, parent_id = (parent[0], parent[1]) if parent else (os.urandom(16).hex(), None)
+        trace = Trace(name, trace_id, parent_id, sampled, self.max_spans, attrs)
+        trace._token = _current.set(trace)
+        trace.root.__enter__()
+        return trace
+
+    def finish(self, trace: Optional[Trace]) -> None:
+        """Cierra la traza; la exporta si fue muestreada o superó el umbral."""
+        if trace is None:
+            return
+        trace.root.__exit__(None, None, None)
+        try:
+            _current.reset(trace._token)
+        except ValueError:
+            _current.set(None)     # cerrada desde otro contexto
+
+        slow = self.slow_ms > 0 and trace.duration_ms >= self.slow_ms
+        with self._lock:
+            self.counters["traced"] += 1
+            self.counters["slow"] += slow
+        if not (trace.sampled or slow):
+            return
+        trace.root.attrs["slow"] = slow
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            with self._lock:
+                self.counters["dropped"] += 1
+            return
+        self._ensure_writer()
+
+    def recent(self, limit: int = 50) -> List[dict]:
+        with self._lock:
+            items = list(self._recent.values())[-limit:]
+        return [{k: t[k] for k in ("trace_id", "name", "time", "duration_ms", "sampled", "attrs")}
+                for t in reversed(items)]
+
+    def get(self, trace_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._recent.get(trace_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "sample_rate": self.sample_rate,
+                "slow_ms": self.slow_ms,
+                "queued": self._queue.qsize(),
+                **self.counters,
+            }
+
+    def flush(self, timeout: float = 5.0) -> None:
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    # ---------------------------------------------------------
+    # Exportación (hilo propio)
+    # ---------------------------------------------------------
+    def _ensure_writer(self) -> None:
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            trace = self._queue.get()
+            try:
+                self._export(trace)
+            except Exception as e:
+                print("⚠️ No se pudo exportar la traza:", e)
+            finally:
+                self._queue.task_done()
+
+    def _export(self, trace: Trace) -> None:
+        summary = trace.to_dict()
+        with self._lock:
+            self._recent[trace.trace_id] = summary
+            while len(self._recent) > self._recent_max:
+                self._recent.popitem(last=False)
+            self.counters["exported"] += 1
+
+        if self.log_path:
+            self._logger(self.log_path).info(json.dumps(summary, default=str))
+        if self.otlp_path:
+            self._logger(self.otlp_path).info(json.dumps(trace.to_otlp(self.service_name), default=str))
+
+    def _logger(self, path: str) -> logging.Logger:
+        logger = self._loggers.get(path)
+        if logger is None:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            logger = logging.getLogger(f"{__name__}.{len(self._loggers)}")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            handler = RotatingFileHandler(path, maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            self._loggers[path] = logger
+        return logger
+
+
+def format_waterfall(summary: dict, width: int = 40) -> str:
+    """Cascada de texto de una traza exportada (to_dict)."""
+    total = summary["duration_ms"] or 1e-9
+    lines = [f"{summary['name']}  {summary['duration_ms']:.1f} ms  trace={summary['trace_id']}"]
+    for s in summary["spans"]:
+        start = int(s["start_ms"] / total * width)
+        length = max(1, int(s["duration_ms"] / total * width))
+        bar = " " * start + "█" * min(length, width - start)
+        name = "  " * s["depth"] + s["name"]
+        lines.append(f"{name:<44} {bar:<{width}} {s['start_ms']:8.2f} +{s['duration_ms']:.2f} ms")
+    return "\n".join(lines)
@@ -0,0 +1,223 @@
+"""
+video_segments.py
+===========================================================
+Decodificación de segmentos de video (WebM/MP4 de MediaRecorder)
+con ffmpeg, como generador de frames.
+
+ffmpeg recibe el segmento por stdin y escribe los frames por
+stdout como YUV4MPEG2 (I420: la mitad de bytes que BGR, y la
+cabecera trae ancho y alto, así no hace falta ffprobe); cada
+frame se lee en un buffer propio y pasa a BGR con un solo
+cvtColor. El filtro `fps` remuestrea a un ritmo fijo: el frame
+i está en `i / fps` segundos desde el inicio del segmento. Los
+frames se leen a medida que ffmpeg los produce; quien consume
+puede procesar el primero mientras el resto se decodifica.
+
+MediaRecorder con `timeslice` solo pone la cabecera WebM (EBML
++ pistas) en el primer fragmento. WebmInitCache guarda esa
+cabecera por sesión y la antepone a los fragmentos siguientes
+para que cada uno se pueda decodificar por separado.
+
+El tamaño en bytes no acota la duración (un WebM de bitrate bajo o
+con saltos de timestamps puede dar miles de frames): ffmpeg corta
+a `max_seconds` de salida y el generador nunca entrega más de
+`max_seconds × fps` frames. `timeout` es un plazo de reloj para
+todo el segmento (incluido el tiempo de quien consume): al
+vencer se mata ffmpeg y la lectura termina.
+===========================================================
+"""
+
+import math
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator, Optional
+
+import cv2
+import numpy as np
+
+
+class SegmentDecodeError(RuntimeError):
+    """ffmpeg no está disponible o no pudo decodificar el segmento."""
+
+
+_EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+_CLUSTER_ID = b"\x1f\x43\xb6\x75"
+
+
+def ffmpeg_available(binary: str = "ffmpeg") -> bool:
+    return shutil.which(binary) is not None
+
+
+def decode_segment(
+    data: bytes,
+    fps: float,
+    max_width: int = 640,
+    binary: str = "ffmpeg",
+    timeout: float = 30.0,
+    max_seconds: Optional[float] = None,
+) -> Iterator[np.ndarray]:
+    """
+    Genera los frames BGR (alto, ancho, 3) del segmento remuestreado a
+    `fps`, reducidos a `max_width` de ancho como máximo, hasta
+    `max_seconds` segundos de video.
+    Lanza SegmentDecodeError si ffmpeg falla o se vence `timeout` sin
+    producir frames; si ya entregó alguno, el segmento queda truncado.
+    """
+    if not ffmpeg_available(binary):
+        raise SegmentDecodeError(f"No se encontró {binary}")
+
+    max_frames = math.ceil(max_seconds * fps) if max_seconds else None
+    vf = f"fps={fps:g},scale='trunc(min({max_width},iw)/2)*2':-2"
+    limit = ["-t", f"{max_seconds:g}", "-frames:v", str(max_frames)] if max_frames else []
+    cmd = [
+        binary, "-hide_banner", "-loglevel", "error", "-nostdin",
+        "-i", "pipe:0",
+        "-an", "-vf", vf, *limit, "-pix_fmt", "yuv420p",
+        "-f", "yuv4mpegpipe", "pipe:1",
+    ]
+
+    stderr = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr)
+
+    # stdin en otro hilo: si ffmpeg llena stdout mientras se le escribe, se trabaría
+    def feed():
+        try:
+            proc.stdin.write(data)
+        except (BrokenPipeError, OSError):
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    writer = threading.Thread(target=feed, name="ffmpeg-feed", daemon=True)
+    writer.start()
+
+    # Plazo de reloj: una lectura bloqueada en stdout se destraba matando ffmpeg
+    deadline = time.monotonic() + timeout
+    expired = threading.Event()
+
+    def expire():
+        expired.set()
+        proc.kill()
+
+    watchdog = threading.Timer(timeout, expire)
+    watchdog.daemon = True
+    watchdog.start()
+
+    frames = 0
+    try:
+        size = _read_y4m_header(proc.stdout)
+        while size is not None and (max_frames is None or frames < max_frames):
+            if time.monotonic() >= deadline:
+                expire()
+            if expired.is_set():
+                break
+            frame = _read_y4m_frame(proc.stdout, *size)
+            if frame is None:
+                break
+            frames += 1
+            yield frame
+
+        if expired.is_set():
+            if frames == 0:
+                raise SegmentDecodeError("ffmpeg no terminó a tiempo")
+            return
+        if max_frames is not None and frames >= max_frames:
+            return
+        try:
+            proc.wait(timeout=max(deadline - time.monotonic(), 0.1))
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            raise SegmentDecodeError("ffmpeg no terminó a tiempo")
+        if proc.returncode != 0 and frames == 0:
+            stderr.seek(0)
+            detail = stderr.read().decode("utf-8", "replace").strip().splitlines()
+            raise SegmentDecodeError(detail[-1] if detail else f"ffmpeg terminó con código {proc.returncode}")
+    finally:
+        watchdog.cancel()
+        # Generador abandonado a mitad de camino: no dejar ffmpeg vivo
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+        writer.join(timeout=1.0)
+        stderr.close()
+
+
+def _read_y4m_header(stream) -> Optional[tuple]:
+    """(ancho, alto) de la cabecera YUV4MPEG2, o None si no hubo salida."""
+    line = stream.readline()
+    if not line:
+        return None
+    if not line.startswith(b"YUV4MPEG2"):
+        raise SegmentDecodeError("Salida inesperada de ffmpeg")
+    params = {p[:1]: p[1:] for p in line.split()[1:]}
+    if not params.get(b"C", b"420").startswith(b"420"):
+        raise SegmentDecodeError("Formato de color no soportado")
+    return int(params[b"W"]), int(params[b"H"])
+
+
+def _read_y4m_frame(stream, width: int, height: int) -> Optional[np.ndarray]:
+    if not stream.readline().startswith(b"FRAME"):
+        return None
+    yuv = np.empty((height * 3 // 2, width), dtype=np.uint8)
+    view = memoryview(yuv).cast("B")
+    read = 0
+    while read < len(view):
+        n = stream.readinto(view[read:])
+        if not n:
+            return None
+        read += n
+    return cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR_I420)
+
+
+class WebmInitCache:
+    """Cabecera WebM (todo lo anterior al primer Cluster) por sesión, LRU."""
+
+    def __init__(self, max_sessions: int = 1000):
+        self.max_sessions = max_sessions
+        self._headers: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def complete(self, session_id: Optional[str], data: bytes) -> bytes:
+        """Devuelve el segmento listo para decodificar por separado."""
+        if not session_id:
+            return data
+
+        with self._lock:
+            if data.startswith(_EBML_MAGIC):
+                cluster = data.find(_CLUSTER_ID)
+                if cluster > 0:
+                    self._headers[session_id] = data[:cluster]
+                    self._headers.move_to_end(session_id)
+                    while len(self._headers) > self.max_sessions:
+                        self._headers.popitem(last=False)
+                return data
+
+            header = self._headers.get(session_id)
+            if header is None:
+                return data
+            self._headers.move_to_end(session_id)
+        return header + data
+
+    def get(self, session_id: str) -> Optional[bytes]:
+        with self._lock:
+            return self._headers.get(session_id)
+
+    def put(self, session_id: str, header: bytes) -> None:
+        """Instala la cabecera de una sesión traspasada desde otro worker."""
+        with self._lock:
+            self._headers[session_id] = header
+            self._headers.move_to_end(session_id)
+            while len(self._headers) > self.max_sessions:
+                self._headers.popitem(last=False)
+
+    def forget(self, session_id: str) -> None:
+        with self._lock:
+            self._headers.pop(session_id, None)
@@ -1,15 +1,28 @@
 # backend/DESDECERO/src/main.py
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 # Solo usamos router_frames, porque las sesiones ya no existen
 from src.api.router_frames import router as frames_router
+from src.api.router_profiles import router as profiles_router
+from src.api.router_sessions import report_service, router as sessions_router
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # El pool de reportes son procesos aparte: no deben sobrevivir a la API
+    report_service.shutdown()
+
 
 app = FastAPI(
     title="Attention Monitor API",
     version="2.0.0",
-    description="Microservicio para procesar frames y calcular métricas de atención en tiempo real."
+    description="Microservicio para procesar frames y calcular métricas de atención en tiempo real.",
+    lifespan=lifespan,
 )
 
 # CORS para permitir conexión desde React
@@ -28,7 +41,7 @@ def root():
         "status": "online",
         "message": "Attention Monitor API running",
         "version": "2.0.0",
-        "endpoints": ["/process"]
+        "endpoints": ["/process", "/process/segment", "/process/cache", "/process/scheduler", "/process/pacing", "/process/memory", "/profiles", "/traces", "/sessions/{id}/events", "/sessions/{id}/timeline", "/sessions/{id}/report"]
     }
 
 
@@ -38,3 +51,17 @@ app.include_router(
     prefix="",                   # ✔ Sin slash final
     tags=["frames-processing"]
 )
+
+# Perfiles bajo demanda (requiere PROFILE_TOKEN)
+app.include_router(
+    profiles_router,
+    prefix="",
+    tags=["profiling"]
+)
+
+# Observadores del estado de una sesión (SSE)
+app.include_router(
+    sessions_router,
+    prefix="",
+    tags=["sessions"]
+)
@@ -0,0 +1,317 @@
+"""
+supervisor.py
+Supervisor prefork de workers uvicorn.
+
+`uvicorn --workers N` arranca cada worker desde cero: cada proceso
+vuelve a importar mediapipe, cv2, numpy, FastAPI y pydantic. El
+supervisor importa todo eso una sola vez, lee los modelos de
+MediaPipe (quedan en la caché de páginas), congela el GC
+(gc.freeze: el recolector no vuelve a escribir en esos objetos y
+las páginas siguen compartidas copy-on-write) y recién entonces
+hace fork de los workers, que atienden un mismo socket.
+
+Lo que tiene estado por proceso NO se importa antes del fork: el
+AttentionProcessor (SQLite y el hilo escritor de calibración) y los
+grafos de FaceMesh, que arrancan hilos propios y no sobreviven un
+fork. Cada worker importa src.main y crea su grafo en el primer
+frame.
+
+Un worker que muere se reinicia (con espera creciente si muere
+apenas arranca). Cada SUPERVISOR_REPORT_SECONDS se registra el RSS
+y el PSS (RSS con las páginas compartidas repartidas) de cada
+worker; con SUPERVISOR_STATUS_PATH también se escribe en JSON.
+
+Uso:
+    python -m src.supervisor --workers 4 --host 0.0.0.0 --port 8000
+"""
+
+import argparse
+import gc
+import importlib
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, Optional
+
+from src.domain import config
+
+# Módulos pesados y sin estado por proceso
+PRELOAD_MODULES = (
+    "numpy",
+    "cv2",
+    "mediapipe",
+    "mediapipe.python.solutions.face_mesh",
+    "mediapipe.python.solutions.face_detection",
+    "fastapi",
+    "starlette",
+    "pydantic",
+    "uvicorn",
+    "src.domain.metrics",
+    "src.domain.classifier",
+    "src.domain.landmark_backends",
+    "src.domain.pipeline_profiles",
+    "src.domain.rollups",
+    "src.domain.presence",
+    "src.api.schemas",
+)
+
+# Modelos de MediaPipe (relativos al paquete mediapipe)
+MODEL_DIRS = ("modules/face_landmark", "modules/face_detection")
+
+
+def preload() -> dict:
+    """Importa los módulos pesados y lee los modelos. Devuelve tiempos y bytes."""
+    start = time.perf_counter()
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+    imported = time.perf_counter()
+
+    model_bytes = 0
+    import mediapipe
+
+    base = os.path.dirname(mediapipe.__file__)
+    paths = [os.path.join(base, d) for d in MODEL_DIRS]
+    if config.LANDMARK_BACKEND == "tasks" and os.path.exists(config.LANDMARK_MODEL_PATH):
+        paths.append(config.LANDMARK_MODEL_PATH)
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith((".tflite", ".task"))]
+        else:
+            files = [path]
+        for f in files:
+            with open(f, "rb") as fh:
+                model_bytes += len(fh.read())
+
+    return {
+        "import_s": imported - start,
+        "models_s": time.perf_counter() - imported,
+        "model_bytes": model_bytes,
+    }
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def memory_of(pid: int) -> Dict[str, Optional[int]]:
+    """RSS, PSS y memoria compartida (kB) desde /proc (solo Linux)."""
+    fields = {"Rss": None, "Pss": None, "Shared_Clean": None, "Shared_Dirty": None}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in fields:
+                    fields[key] = int(rest.split()[0])
+    except (OSError, ValueError):
+        pass
+    shared = None
+    if fields["Shared_Clean"] is not None:
+        shared = fields["Shared_Clean"] + (fields["Shared_Dirty"] or 0)
+    return {"rss_kb": fields["Rss"], "pss_kb": fields["Pss"], "shared_kb": shared}
+
+
+class Supervisor:
+
+    def __init__(self, sock: socket.socket, workers: int, log_level: str = "info"):
+        self.sock = sock
+        self.workers = workers
+        self.log_level = log_level
+
+        self.children: Dict[int, dict] = {}     # pid → {"slot", "started"}
+        self._backoff: Dict[int, float] = {}     # slot → espera antes del próximo arranque
+        self._pending: Dict[int, float] = {}     # slot → instante del próximo arranque
+        self._restarts: Dict[int, int] = {}
+        self._stopping = False
+
+    # ---------------------------------------------------------
+    # Workers
+    # ---------------------------------------------------------
+    def spawn(self, slot: int) -> int:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker(slot)   # no vuelve
+        self.children[pid] = {"slot": slot, "started": time.monotonic()}
+        print(f"▶ worker {slot} pid={pid}")
+        return pid
+
+    def _run_worker(self, slot: int) -> None:
+        code = 0
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+            import uvicorn
+            from src.main import app
+
+            server = uvicorn.Server(uvicorn.Config(app, log_level=self.log_level, access_log=False))
+            server.run(sockets=[self.sock])
+        except BaseException as e:
+            print(f"❌ ERROR en worker {slot}:", e)
+            code = 1
+        finally:
+            os._exit(code)
+
+    def _reap(self) -> None:
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            child = self.children.pop(pid, None)
+            if child is None or self._stopping:
+                continue
+
+            slot = child["slot"]
+            uptime = time.monotonic() - child["started"]
+            if uptime < config.SUPERVISOR_MIN_UPTIME_SECONDS:
+                backoff = min(max(self._backoff.get(slot, 0.5) * 2, 1.0), config.SUPERVISOR_MAX_BACKOFF_SECONDS)
+            else:
+                backoff = 0.0
+            self._backoff[slot] = backoff
+            self._restarts[slot] = self._restarts.get(slot, 0) + 1
+            self._pending[slot] = time.monotonic() + backoff
+            print(f"⚠️  worker {slot} pid={pid} terminó ({_describe(status)}) tras {uptime:.1f}s; "
+                  f"reinicio en {backoff:.1f}s")
+
+    def _start_pending(self) -> None:
+        now = time.monotonic()
+        for slot, at in list(self._pending.items()):
+            if at <= now:
+                del self._pending[slot]
+                self.spawn(slot)
+
+    # ---------------------------------------------------------
+    # Reporte de memoria
+    # ---------------------------------------------------------
+    def status(self) -> dict:
+        workers = []
+        for pid, child in sorted(self.children.items(), key=lambda kv: kv[1]["slot"]):
+            workers.append({
+                "slot": child["slot"],
+                "pid": pid,
+                "uptime_s": round(time.monotonic() - child["started"], 1),
+                "restarts": self._restarts.get(child["slot"], 0),
+                **memory_of(pid),
+            })
+        return {
+            "supervisor": {"pid": os.getpid(), **memory_of(os.getpid())},
+            "workers": workers,
+            "pss_total_kb": sum(w["pss_kb"] or 0 for w in workers),
+            "rss_total_kb": sum(w["rss_kb"] or 0 for w in workers),
+        }
+
+    def report(self) -> None:
+        status = self.status()
+        for w in status["workers"]:
+            print(f"📊 worker {w['slot']} pid={w['pid']} rss={_mb(w['rss_kb'])} "
+                  f"pss={_mb(w['pss_kb'])} compartida={_mb(w['shared_kb'])} reinicios={w['restarts']}")
+        if config.SUPERVISOR_STATUS_PATH:
+            tmp = config.SUPERVISOR_STATUS_PATH + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"time": time.time(), **status}, f, indent=2)
+            os.replace(tmp, config.SUPERVISOR_STATUS_PATH)
+
+    # ---------------------------------------------------------
+    # Ciclo principal
+    # ---------------------------------------------------------
+    def run(self) -> int:
+        def stop(signum, frame):
+            self._stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        for slot in range(self.workers):
+            self.spawn(slot)
+
+        next_report = time.monotonic() + config.SUPERVISOR_REPORT_SECONDS
+        while not self._stopping:
+            time.sleep(0.5)
+            self._reap()
+            if not self._stopping:
+                self._start_pending()
+            if time.monotonic() >= next_report:
+                self.report()
+                next_report = time.monotonic() + config.SUPERVISOR_REPORT_SECONDS
+
+        return self.shutdown()
+
+    def shutdown(self) -> int:
+        print("⏹ deteniendo workers ...")
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        deadline = time.monotonic() + config.SUPERVISOR_GRACEFUL_TIMEOUT
+        while self.children and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                time.sleep(0.1)
+            else:
+                self.children.pop(pid, None)
+
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.sock.close()
+        return 0
+
+
+def _describe(status: int) -> str:
+    if os.WIFSIGNALED(status):
+        return f"señal {os.WTERMSIG(status)}"
+    return f"código {os.WEXITSTATUS(status)}"
+
+
+def _mb(kb: Optional[int]) -> str:
+    return f"{kb / 1024:.0f}MB" if kb is not None else "-"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Supervisor prefork de workers uvicorn para src.main:app.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=config.SUPERVISOR_WORKERS)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    if not hasattr(os, "fork"):
+        parser.error("El supervisor prefork necesita os.fork (Linux/macOS)")
+    sys.stdout.reconfigure(line_buffering=True)
+
+    loaded = preload()
+    print(f"📦 módulos en {loaded['import_s']:.2f}s, modelos ({loaded['model_bytes'] / 1e6:.1f}MB) "
+          f"en {loaded['models_s']:.2f}s")
+
+    sock = bind_socket(args.host, args.port)
+    gc.collect()
+    gc.freeze()
+
+    print(f"🚀 {args.workers} workers en {args.host}:{args.port}")
+    return Supervisor(sock, args.workers, args.log_level).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
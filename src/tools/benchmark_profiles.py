@@ -0,0 +1,160 @@
+"""
+benchmark_profiles.py
+Benchmark de los perfiles de pipeline (full / balanced / lite).
+
+Corre los mismos frames por cada perfil en un solo hilo (un núcleo) y
+reporta el costo por etapa, los frames por segundo por núcleo, cuántas
+sesiones entran por núcleo al fps indicado y cuánto se aleja cada perfil
+del perfil full (concordancia de nivel y diferencia de score).
+
+Uso:
+    python -m src.tools.benchmark_profiles --video clase.mp4 --frames 300
+    python -m src.tools.benchmark_profiles --image rostro.jpg --profiles full,lite
+"""
+
+import argparse
+import json
+import sys
+import time
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+from src.domain.pipeline_profiles import PROFILES
+from src.tools.load_test import _encode, _percentiles, load_frames
+
+
+def run_profile(name: str, frames: List[str], fps: float, warmup: int = 5) -> dict:
+    """Procesa `frames` con el perfil `name` en un AttentionProcessor nuevo."""
+    from src.domain.attention_processor import AttentionProcessor
+    from src.domain.classifier import nivel_desde_estado
+
+    # Calentar grafos en una sesión aparte; se mide sobre la sesión por defecto
+    processor = AttentionProcessor()
+    for i in range(min(warmup, len(frames))):
+        processor.process_base64_frame(frames[i], session_id="warmup", capture_ts=i / fps, profile=name)
+
+    totals, stages, levels, scores = [], {}, [], []
+    for i, frame in enumerate(frames):
+        timings: Dict[str, float] = {}
+        start = time.perf_counter()
+        result = processor.process_base64_frame(frame, timings=timings, capture_ts=i / fps, profile=name)
+        totals.append((time.perf_counter() - start) * 1000)
+        for stage, ms in timings.items():
+            stages.setdefault(stage, []).append(ms)
+
+        if result is None:
+            levels.append(None)
+            scores.append(np.nan)
+        else:
+            attention = result["attention_result"]
+            levels.append(nivel_desde_estado(attention.get("estado")))
+            scores.append(float(attention.get("score", 0.0)))
+
+    mean_ms = float(np.mean(totals))
+    return {
+        "profile": name,
+        "frames": len(frames),
+        "face_rate": sum(lv is not None for lv in levels) / len(levels),
+        "total_ms": {"mean": mean_ms, **_percentiles(totals)},
+        "stages_ms": {k: float(np.mean(v)) for k, v in stages.items()},
+        "fps_per_core": 1000.0 / mean_ms if mean_ms else 0.0,
+        "streams_per_core": 1000.0 / mean_ms / fps if mean_ms else 0.0,
+        "_levels": levels,
+        "_scores": scores,
+    }
+
+
+def compare_to(reference: dict, result: dict) -> None:
+    """Concordancia de nivel y diferencia media de score contra `reference`."""
+    pares = [
+        (a, b) for a, b in zip(reference["_levels"], result["_levels"])
+        if a is not None and b is not None
+    ]
+    result["level_agreement"] = sum(a == b for a, b in pares) / len(pares) if pares else None
+    diff = np.abs(np.asarray(reference["_scores"]) - np.asarray(result["_scores"]))
+    result["score_mae"] = float(np.nanmean(diff)) if np.any(~np.isnan(diff)) else None
+
+
+def format_report(results: List[dict], fps: float) -> str:
+    lines = ["=" * 78, "⚙️  PERFILES DEL PIPELINE — costo por frame (1 núcleo)", "=" * 78]
+    stage_names = []
+    for r in results:
+        stage_names += [s for s in r["stages_ms"] if s not in stage_names]
+
+    header = f"  {'perfil':<10}{'media ms':>10}{'p95 ms':>9}" + "".join(f"{s[:9]:>10}" for s in stage_names)
+    lines.append(header)
+    for r in results:
+        lines.append(
+            f"  {r['profile']:<10}{r['total_ms']['mean']:>10.2f}{r['total_ms']['p95']:>9.2f}"
+            + "".join(f"{r['stages_ms'].get(s, 0.0):>10.2f}" for s in stage_names)
+        )
+
+    lines.append("")
+    lines.append(f"  {'perfil':<10}{'fps/núcleo':>11}{f'sesiones@{fps:.0f}fps':>16}"
+                 f"{'rostro %':>10}{'nivel = full':>14}{'|Δscore|':>10}")
+    for r in results:
+        agreement = r.get("level_agreement")
+        mae = r.get("score_mae")
+        lines.append(
+            f"  {r['profile']:<10}{r['fps_per_core']:>11.1f}{r['streams_per_core']:>16.1f}"
+            f"{r['face_rate'] * 100:>10.1f}"
+            f"{(f'{agreement * 100:.1f}%' if agreement is not None else '-'):>14}"
+            f"{(f'{mae:.2f}' if mae is not None else '-'):>10}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de los perfiles de pipeline.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--video", help="Tomar frames de un video (con un rostro)")
+    source.add_argument("--frames-dir", help="Tomar frames de un directorio de imágenes")
+    source.add_argument("--image", help="Repetir una sola imagen")
+
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="Perfiles a comparar")
+    parser.add_argument("--frames", type=int, default=300, help="Frames por perfil")
+    parser.add_argument("--fps", type=float, default=15.0, help="fps por sesión para estimar sesiones/núcleo")
+    parser.add_argument("--width", type=int, default=640, help="Ancho de los frames")
+    parser.add_argument("--quality", type=int, default=80, help="Calidad JPEG")
+    parser.add_argument("--json", help="Guardar el reporte en JSON")
+    args = parser.parse_args(argv)
+
+    if args.image:
+        image = cv2.imread(args.image)
+        if image is None:
+            parser.error(f"No se pudo leer {args.image}")
+        if image.shape[1] != args.width:
+            scale = args.width / image.shape[1]
+            image = cv2.resize(image, (args.width, int(image.shape[0] * scale)))
+        frames = [_encode(image, args.quality)] * args.frames
+    else:
+        frames = load_frames(args.video, args.frames_dir, count=args.frames,
+                             width=args.width, quality=args.quality)
+
+    names = [n for n in args.profiles.split(",") if n]
+    for name in names:
+        if name not in PROFILES:
+            parser.error(f"Perfil desconocido: {name}")
+
+    results = []
+    for name in names:
+        print(f"▶ perfil {name} ({len(frames)} frames) ...", file=sys.stderr)
+        results.append(run_profile(name, frames, args.fps))
+
+    reference = next((r for r in results if r["profile"] == "full"), None)
+    for r in results:
+        if reference is not None and r is not reference:
+            compare_to(reference, r)
+
+    print(format_report(results, args.fps))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([{k: v for k, v in r.items() if not k.startswith("_")} for r in results], f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
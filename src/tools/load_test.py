@@ -0,0 +1,615 @@
+"""
+load_test.py
+Generador de carga y reporte de latencia (SLO) para /process,
+/process/segment y /sessions/{id}/events.
+
+Simula N clientes (sesiones) que envían frames a un fps configurable con
+jitter realista, contra un servidor local/remoto (HTTP) o dentro del mismo
+proceso (llamando al router directamente, sin red).
+
+Escenarios (--scenario):
+- process: un POST /process por frame (JSON + JPEG en base64).
+- segment: un POST /process/segment cada --segment-seconds con los frames
+  de ese lapso como video (WebM VP8 si hay ffmpeg, si no AVI MJPEG).
+- events:  como process, más un observador SSE por sesión que mide el
+  retraso entre el envío de un frame y su llegada por /events y cuántos
+  estados se coalescen (solo con --url).
+
+El reporte incluye p50/p95/p99 de extremo a extremo y por etapa (a partir
+de la cabecera Server-Timing), fps logrado por sesión, tasa de frames
+descartados y, con --ramp, una curva de saturación.
+
+Uso:
+    # Contra un servidor ya levantado
+    python -m src.tools.load_test --url http://localhost:8000 --clients 8 --fps 30
+
+    # En proceso, con frames de un video y rampa de 1 a 32 clientes
+    python -m src.tools.load_test --in-process --video clase.mp4 --ramp 1,2,4,8,16,32
+
+    # Segmentos de 2 s y observadores SSE
+    python -m src.tools.load_test --url http://localhost:8000 --scenario segment --segment-seconds 2
+    python -m src.tools.load_test --url http://localhost:8000 --scenario events --fps 15
+"""
+
+import argparse
+import base64
+import glob
+import http.client
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+from urllib.parse import urlencode, urlparse
+
+import cv2
+import numpy as np
+
+
+# ============================================================
+# 1. Fuentes de frames (se codifican una sola vez)
+# ============================================================
+
+def _encode(frame: np.ndarray, quality: int) -> str:
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("No se pudo codificar el frame a JPEG")
+    return "data:image/jpeg;base64," + base64.b64encode(buf.tobytes()).decode("ascii")
+
+
+def load_images(
+    video: Optional[str] = None,
+    frames_dir: Optional[str] = None,
+    count: int = 90,
+    width: int = 640,
+) -> List[np.ndarray]:
+    """
+    Devuelve `count` frames BGR de `width` de ancho tomados de un video, de
+    un directorio de imágenes o, si no se indica ninguno, sintéticos.
+    """
+    images = []
+
+    if video:
+        cap = cv2.VideoCapture(video)
+        while len(images) < count:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            images.append(frame)
+        cap.release()
+
+    elif frames_dir:
+        paths = sorted(glob.glob(os.path.join(frames_dir, "*.jp*g")) +
+                       glob.glob(os.path.join(frames_dir, "*.png")))
+        for path in paths[:count]:
+            frame = cv2.imread(path)
+            if frame is not None:
+                images.append(frame)
+
+    else:
+        # Ruido suave con movimiento: mismo tamaño y costo de decode que una webcam
+        rng = np.random.default_rng(0)
+        h = int(width * 3 / 4)
+        base = cv2.GaussianBlur(rng.integers(0, 255, (h, width, 3), dtype=np.uint8), (31, 31), 0)
+        for i in range(count):
+            images.append(np.roll(base, i * 4, axis=1))
+
+    if not images:
+        raise ValueError("No se obtuvo ningún frame de la fuente indicada")
+
+    out = []
+    for frame in images:
+        if frame.shape[1] != width:
+            scale = width / frame.shape[1]
+            # Alto par: lo piden los códecs de video
+            frame = cv2.resize(frame, (width, int(frame.shape[0] * scale) // 2 * 2))
+        out.append(frame)
+    return out
+
+
+def load_frames(
+    video: Optional[str] = None,
+    frames_dir: Optional[str] = None,
+    count: int = 90,
+    width: int = 640,
+    quality: int = 80,
+) -> List[str]:
+    """Frames de load_images() como JPEG en base64."""
+    return [_encode(frame, quality) for frame in load_images(video, frames_dir, count, width)]
+
+
+def _encode_video(frames: List[np.ndarray], fps: float, ffmpeg: str) -> bytes:
+    h, w = frames[0].shape[:2]
+    if shutil.which(ffmpeg):
+        # WebM VP8 autocontenido, como un MediaRecorder reiniciado por segmento
+        cmd = [
+            ffmpeg, "-hide_banner", "-loglevel", "error", "-nostdin",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{w}x{h}", "-r", f"{fps:g}", "-i", "pipe:0",
+            "-c:v", "libvpx", "-b:v", "600k", "-deadline", "realtime", "-f", "webm", "pipe:1",
+        ]
+        proc = subprocess.run(cmd, input=b"".join(f.tobytes() for f in frames), capture_output=True)
+        if proc.returncode == 0 and proc.stdout:
+            return proc.stdout
+
+    # Sin ffmpeg (o sin libvpx): AVI MJPEG, que ffmpeg también lee desde un pipe
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "segment.avi")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (w, h))
+        for frame in frames:
+            writer.write(frame)
+        writer.release()
+        with open(path, "rb") as f:
+            return f.read()
+
+
+def load_segments(images: List[np.ndarray], fps: float, seconds: float, ffmpeg: str = "ffmpeg") -> List[bytes]:
+    """
+    Segmentos de `seconds` segundos a `fps` armados con `images` (en ciclo),
+    codificados una sola vez. Cada uno trae round(fps × seconds) frames.
+    """
+    per_segment = max(1, round(fps * seconds))
+    count = max(1, len(images) // per_segment)
+    segments = []
+    for k in range(count):
+        chunk = [images[(k * per_segment + i) % len(images)] for i in range(per_segment)]
+        segments.append(_encode_video(chunk, fps, ffmpeg))
+    return segments
+
+
+# ============================================================
+# 2. Transportes: HTTP o en proceso
+# ============================================================
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """'decode;dur=1.2, landmarks;dur=9.8' → {'decode': 1.2, 'landmarks': 9.8}"""
+    stages = {}
+    if not header:
+        return stages
+    for part in header.split(","):
+        name, _, rest = part.strip().partition(";")
+        if rest.startswith("dur="):
+            try:
+                stages[name] = float(rest[4:])
+            except ValueError:
+                pass
+    return stages
+
+
+class HttpTransport:
+    """Una conexión HTTP persistente por cliente simulado."""
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        parsed = urlparse(url)
+        conn_cls = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+        self.conn = conn_cls(parsed.hostname, parsed.port, timeout=timeout)
+        self.base = parsed.path.rstrip("/") or ""
+        self.path = self.base + "/process"
+
+    def send(self, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        return self._post(self.path, data, "application/json")
+
+    def send_segment(self, params: dict, data: bytes):
+        query = urlencode({k: v for k, v in params.items() if v is not None})
+        return self._post(f"{self.base}/process/segment?{query}", data, "application/octet-stream")
+
+    def _post(self, path: str, data: bytes, content_type: str):
+        self.conn.request("POST", path, body=data, headers={"Content-Type": content_type})
+        resp = self.conn.getresponse()
+        payload = resp.read()
+        result = json.loads(payload) if resp.status == 200 else {}
+        return resp.status, result, resp.getheader("Server-Timing")
+
+    def close(self):
+        self.conn.close()
+
+
+class InProcessTransport:
+    """Llama directamente al endpoint, sin red ni servidor."""
+
+    def __init__(self):
+        from fastapi import HTTPException, Request, Response
+
+        from src.api.router_frames import _process_segment, process_frame
+        from src.api.schemas import ProcessFrameRequest, ProcessSegmentParams
+
+        self._endpoint = process_frame
+        self._segment = _process_segment
+        self._request_cls = ProcessFrameRequest
+        self._segment_params_cls = ProcessSegmentParams
+        self._response_cls = Response
+        self._request = Request({"type": "http", "headers": [], "query_string": b""})
+        self._http_exception = HTTPException
+
+    def send(self, body: dict):
+        response = self._response_cls()
+        try:
+            result = self._endpoint(self._request_cls(**body), response, self._request)
+        except self._http_exception as e:
+            return e.status_code, {}, None
+        data = result.model_dump() if hasattr(result, "model_dump") else result.dict()
+        return response.status_code or 200, data, response.headers.get("server-timing")
+
+    def send_segment(self, params: dict, data: bytes):
+        # Sin el endpoint async: la misma función que corre en el threadpool
+        try:
+            result = self._segment(data, self._segment_params_cls(**params))
+        except self._http_exception as e:
+            return e.status_code, {}, None
+        except Exception:
+            return 422, {}, None
+        return 200, result.model_dump(), None
+
+    def close(self):
+        pass
+
+
+# ============================================================
+# 3. Cliente simulado
+# ============================================================
+
+# Respuestas que indican que el servidor descartó el frame por carga
+SHED_STATUS = (429, 503)
+
+
+class SimulatedClient(threading.Thread):
+    """
+    Envía frames a `fps` con jitter gaussiano. Si una respuesta tarda más
+    que el intervalo, el siguiente frame sale de inmediato (como una
+    webcam que descarta frames), así que el fps logrado cae con la carga.
+
+    Con `segments` manda un segmento de video cada `segment_seconds` en
+    lugar de un frame por request; sent/ok/shed siguen contando frames.
+    """
+
+    def __init__(self, transport, frames: List[str], fps: float, jitter_ms: float,
+                 duration: float, session_id: str,
+                 segments: Optional[List[bytes]] = None, segment_seconds: float = 2.0):
+        super().__init__(daemon=True)
+        self.transport = transport
+        self.frames = frames
+        self.fps = fps
+        self.segments = segments
+        self.segment_frames = max(1, round(fps * segment_seconds))
+        self.interval = segment_seconds if segments else 1.0 / fps
+        self.jitter = jitter_ms / 1000.0
+        self.duration = duration
+        self.session_id = session_id
+
+        self.latencies: List[float] = []
+        self.stages: Dict[str, List[float]] = {}
+        self.sent = 0
+        self.ok = 0
+        self.shed = 0
+        self.errors = 0
+        self.elapsed = 0.0
+        # frame_number → instante de envío (perf_counter), para el observador SSE
+        self.sent_at: Dict[int, float] = {}
+
+    def run(self):
+        rng = random.Random(self.session_id)
+        start = time.perf_counter()
+        next_send = start + rng.uniform(0, self.interval)  # desfasar clientes
+        frame_number = 0
+
+        try:
+            while True:
+                now = time.perf_counter()
+                if now - start >= self.duration:
+                    break
+                if next_send > now:
+                    time.sleep(next_send - now)
+
+                t0 = time.perf_counter()
+                if self.segments:
+                    n = self.segment_frames
+                    status, result, timing = self._send_segment(frame_number)
+                else:
+                    n = 1
+                    self.sent_at[frame_number] = t0
+                    status, result, timing = self._send_frame(frame_number)
+                latency = (time.perf_counter() - t0) * 1000
+
+                self.sent += n
+                frame_number += n
+                if status == 200:
+                    skipped = self._skipped(result, n)
+                    self.ok += n - skipped
+                    self.shed += skipped
+                    if skipped < n:
+                        self.latencies.append(latency)
+                        for name, ms in parse_server_timing(timing).items():
+                            self.stages.setdefault(name, []).append(ms)
+                elif status in SHED_STATUS:
+                    self.shed += n
+                else:
+                    self.errors += n
+
+                next_send = max(next_send + self.interval + rng.gauss(0, self.jitter),
+                                time.perf_counter())
+        finally:
+            self.elapsed = time.perf_counter() - start
+            self.transport.close()
+
+    def _send_frame(self, frame_number: int):
+        body = {
+            "frame_number": frame_number,
+            "image_base64": self.frames[frame_number % len(self.frames)],
+            "session_id": self.session_id,
+        }
+        try:
+            return self.transport.send(body)
+        except Exception:
+            return -1, {}, None
+
+    def _send_segment(self, frame_number: int):
+        params = {
+            "session_id": self.session_id,
+            "segment_number": frame_number // self.segment_frames,
+            "first_frame_number": frame_number,
+            "start_ts": time.time(),
+            "sample_fps": self.fps,
+        }
+        data = self.segments[(frame_number // self.segment_frames) % len(self.segments)]
+        try:
+            return self.transport.send_segment(params, data)
+        except Exception:
+            return -1, {}, None
+
+    def _skipped(self, result: dict, n: int) -> int:
+        """Frames del request que el servidor no procesó."""
+        if not self.segments:
+            return 1 if result.get("skipped") else 0
+        # Un segmento puede traer menos frames que los enviados (fps del códec)
+        done = sum(1 for r in result.get("results", []) if not r.get("skipped"))
+        return max(0, n - done)
+
+
+class SseObserver(threading.Thread):
+    """
+    Sigue /sessions/{id}/events y mide, para cada estado recibido, cuánto
+    pasó desde que su frame salió del cliente (`client.sent_at`).
+    """
+
+    def __init__(self, url: str, client: SimulatedClient, max_rate: Optional[float], duration: float):
+        super().__init__(daemon=True)
+        parsed = urlparse(url)
+        conn_cls = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+        # Timeout corto: el keepalive del servidor llega cada pocos segundos
+        self.conn = conn_cls(parsed.hostname, parsed.port, timeout=5.0)
+        query = urlencode({"max_rate": max_rate}) if max_rate else ""
+        self.path = f"{parsed.path.rstrip('/')}/sessions/{client.session_id}/events" + (f"?{query}" if query else "")
+        self.client = client
+        self.duration = duration
+
+        self.lags: List[float] = []
+        self.received = 0
+        self.errors = 0
+
+    def run(self):
+        deadline = time.perf_counter() + self.duration
+        try:
+            self.conn.request("GET", self.path, headers={"Accept": "text/event-stream"})
+            resp = self.conn.getresponse()
+            if resp.status != 200:
+                self.errors += 1
+                return
+            event = None
+            while time.perf_counter() < deadline:
+                line = resp.fp.readline()
+                if not line:
+                    break
+                line = line.decode("utf-8").rstrip("\r\n")
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:") and event == "state":
+                    self._on_state(json.loads(line[5:]), time.perf_counter())
+                elif not line:
+                    event = None
+        except Exception:
+            # Fin del escalón (timeout de lectura) o conexión cortada
+            pass
+        finally:
+            self.conn.close()
+
+    def _on_state(self, state: dict, arrived: float) -> None:
+        self.received += 1
+        sent = self.client.sent_at.get(state.get("frame_number"))
+        if sent is not None:
+            self.lags.append((arrived - sent) * 1000)
+
+
+# ============================================================
+# 4. Ejecución y reporte
+# ============================================================
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    arr = np.asarray(values)
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "max": float(arr.max())}
+
+
+def run_step(make_transport, frames: List[str], clients: int, fps: float,
+             jitter_ms: float, duration: float, segments: Optional[List[bytes]] = None,
+             segment_seconds: float = 2.0, observe_url: Optional[str] = None,
+             max_rate: Optional[float] = None) -> dict:
+    """
+    Ejecuta un escalón de carga con `clients` sesiones concurrentes (con
+    `segments`, por /process/segment; con `observe_url`, más un observador
+    SSE por sesión).
+    """
+    run_id = uuid.uuid4().hex[:8]
+    sims = [
+        SimulatedClient(make_transport(), frames, fps, jitter_ms, duration, f"load-{run_id}-{i}",
+                        segments=segments, segment_seconds=segment_seconds)
+        for i in range(clients)
+    ]
+    observers = [SseObserver(observe_url, sim, max_rate, duration + 1.0) for sim in sims] if observe_url else []
+    for obs in observers:
+        obs.start()
+    if observers:
+        time.sleep(0.2)   # suscritos antes del primer frame
+    for sim in sims:
+        sim.start()
+    for sim in sims:
+        sim.join()
+    for obs in observers:
+        obs.join()
+
+    latencies = [x for s in sims for x in s.latencies]
+    stage_names = sorted({name for s in sims for name in s.stages})
+    stages = {
+        name: _percentiles([x for s in sims for x in s.stages.get(name, [])])
+        for name in stage_names
+    }
+    fps_per_session = [s.ok / s.elapsed if s.elapsed else 0.0 for s in sims]
+    sent = sum(s.sent for s in sims)
+    shed = sum(s.shed for s in sims)
+
+    return {
+        "clients": clients,
+        "target_fps": fps,
+        "sent": sent,
+        "ok": sum(s.ok for s in sims),
+        "errors": sum(s.errors for s in sims),
+        "shed_rate": shed / sent if sent else 0.0,
+        "end_to_end_ms": _percentiles(latencies),
+        "stages_ms": stages,
+        "fps_per_session": {
+            "mean": float(np.mean(fps_per_session)) if fps_per_session else 0.0,
+            "min": float(np.min(fps_per_session)) if fps_per_session else 0.0,
+        },
+        "throughput_fps": sum(s.ok for s in sims) / duration,
+        "observers": _observer_report(observers, sims, duration) if observers else None,
+    }
+
+
+def _observer_report(observers: List[SseObserver], sims: List[SimulatedClient], duration: float) -> dict:
+    received = sum(o.received for o in observers)
+    ok = sum(s.ok for s in sims)
+    return {
+        "received": received,
+        "errors": sum(o.errors for o in observers),
+        "events_per_session_per_s": received / len(observers) / duration,
+        # Estados procesados que el observador nunca vio (reemplazados por uno más nuevo)
+        "coalesced_rate": max(0.0, 1 - received / ok) if ok else 0.0,
+        "lag_ms": _percentiles([x for o in observers for x in o.lags]),
+    }
+
+
+def format_report(steps: List[dict], scenario: str = "process") -> str:
+    title = {"process": "/process", "segment": "/process/segment", "events": "/process + /sessions/{id}/events"}
+    lines = ["=" * 78, f"📈 LOAD TEST — {title[scenario]}", "=" * 78]
+
+    for step in steps:
+        e2e = step["end_to_end_ms"]
+        lines.append("")
+        lines.append(f"{step['clients']} clientes @ {step['target_fps']:.0f} fps "
+                     f"→ {step['throughput_fps']:.1f} fps totales, "
+                     f"{step['fps_per_session']['mean']:.1f} fps/sesión "
+                     f"(mín {step['fps_per_session']['min']:.1f}), "
+                     f"descartados {step['shed_rate'] * 100:.1f}%, errores {step['errors']}")
+        lines.append(f"  {'etapa':<12}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+        lines.append(f"  {'end-to-end':<12}{e2e['p50']:>10.1f}{e2e['p95']:>10.1f}"
+                     f"{e2e['p99']:>10.1f}{e2e['max']:>10.1f}")
+        for name, p in step["stages_ms"].items():
+            lines.append(f"  {name:<12}{p['p50']:>10.1f}{p['p95']:>10.1f}"
+                         f"{p['p99']:>10.1f}{p['max']:>10.1f}")
+        obs = step.get("observers")
+        if obs:
+            lag = obs["lag_ms"]
+            lines.append(f"  {'SSE':<12}{lag['p50']:>10.1f}{lag['p95']:>10.1f}"
+                         f"{lag['p99']:>10.1f}{lag['max']:>10.1f}  "
+                         f"({obs['events_per_session_per_s']:.1f} eventos/s por sesión, "
+                         f"coalescidos {obs['coalesced_rate'] * 100:.1f}%, errores {obs['errors']})")
+
+    if len(steps) > 1:
+        lines.append("")
+        lines.append("Curva de saturación:")
+        lines.append(f"  {'clientes':>9}{'fps total':>11}{'fps/sesión':>12}{'p95 ms':>10}{'desc.%':>9}")
+        for step in steps:
+            lines.append(f"  {step['clients']:>9}{step['throughput_fps']:>11.1f}"
+                         f"{step['fps_per_session']['mean']:>12.1f}"
+                         f"{step['end_to_end_ms']['p95']:>10.1f}"
+                         f"{step['shed_rate'] * 100:>9.1f}")
+
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generador de carga para /process, /process/segment y SSE.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="URL base del servidor (p. ej. http://localhost:8000)")
+    target.add_argument("--in-process", action="store_true", help="Llamar al endpoint sin red")
+
+    parser.add_argument("--scenario", choices=("process", "segment", "events"), default="process",
+                        help="process: frame por request; segment: video por request; events: process + SSE")
+    parser.add_argument("--clients", type=int, default=4, help="Sesiones concurrentes")
+    parser.add_argument("--ramp", help="Lista de clientes por escalón, p. ej. 1,2,4,8")
+    parser.add_argument("--fps", type=float, default=30.0, help="fps objetivo por sesión")
+    parser.add_argument("--jitter-ms", type=float, default=5.0, help="Desvío del intervalo entre frames")
+    parser.add_argument("--duration", type=float, default=20.0, help="Segundos por escalón")
+
+    parser.add_argument("--video", help="Tomar frames de un video")
+    parser.add_argument("--frames-dir", help="Tomar frames de un directorio de imágenes")
+    parser.add_argument("--width", type=int, default=640, help="Ancho de los frames enviados")
+    parser.add_argument("--quality", type=int, default=80, help="Calidad JPEG")
+    parser.add_argument("--segment-seconds", type=float, default=2.0, help="Duración de cada segmento (segment)")
+    parser.add_argument("--ffmpeg", default="ffmpeg", help="Binario para codificar los segmentos en WebM")
+    parser.add_argument("--max-rate", type=float, help="max_rate de los observadores SSE (events)")
+
+    parser.add_argument("--slo-p95-ms", type=float, help="Falla (exit 1) si algún p95 lo supera")
+    parser.add_argument("--json", help="Guardar el reporte en JSON")
+    args = parser.parse_args(argv)
+    if args.scenario == "events" and args.in_process:
+        parser.error("--scenario events necesita --url (SSE corre en el event loop del servidor)")
+
+    images = load_images(args.video, args.frames_dir, width=args.width)
+    frames = [_encode(frame, args.quality) for frame in images]
+    segments = None
+    if args.scenario == "segment":
+        segments = load_segments(images, args.fps, args.segment_seconds, args.ffmpeg)
+        print(f"▶ {len(segments)} segmentos de {args.segment_seconds:g}s, "
+              f"{np.mean([len(x) for x in segments]) / 1024:.0f} KB de media", file=sys.stderr)
+
+    if args.in_process:
+        make_transport = InProcessTransport
+    else:
+        make_transport = lambda: HttpTransport(args.url)  # noqa: E731
+
+    ramp = [int(x) for x in args.ramp.split(",")] if args.ramp else [args.clients]
+
+    steps = []
+    for clients in ramp:
+        print(f"▶ {clients} clientes durante {args.duration:.0f}s ...", file=sys.stderr)
+        steps.append(run_step(
+            make_transport, frames, clients, args.fps, args.jitter_ms, args.duration,
+            segments=segments, segment_seconds=args.segment_seconds,
+            observe_url=args.url if args.scenario == "events" else None, max_rate=args.max_rate,
+        ))
+
+    print(format_report(steps, args.scenario))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(steps, f, indent=2)
+
+    if args.slo_p95_ms is not None:
+        worst = max(s["end_to_end_ms"]["p95"] for s in steps)
+        if worst > args.slo_p95_ms:
+            print(f"❌ SLO incumplido: p95 {worst:.1f} ms > {args.slo_p95_ms:.1f} ms", file=sys.stderr)
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())